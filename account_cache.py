@@ -0,0 +1,275 @@
+"""account_cache.py — Per-user subscription and wallet snapshots.
+
+Every authenticated solve read the subscription (and, before reservations,
+the wallet) from Postgres, and /billing/me and /payments/me read both again.
+Both change rarely and only through payments_store / billing_store, so they
+are cached here: per-worker LocalCache first, then Redis.
+
+Consistency:
+- Each user has a version counter (`acct:ver:{user_id}` in Redis, a dict
+  when Redis is off). Every mutation calls `invalidate(user_id)` *after* its
+  transaction commits: the counter goes up and the L1/Redis entries are
+  dropped (L1 on every worker via the LocalCache broadcast).
+- A snapshot carries the version read *before* the DB query that produced
+  it. `put` re-reads the counter and drops the write if it moved (a
+  mutation raced the read). Every hit, L1 or Redis, is checked against the
+  current counter too, so an entry written just after an invalidation (the
+  race `put` can't see) is ignored and dropped instead of served. An L1
+  hit therefore still costs one Redis GET, but no DB query.
+- Snapshots also carry `valid_until` (subscription expiry, wallet cycle
+  end): past that the owner must re-read (and, for wallets, reset).
+
+Values are dicts; datetimes survive the Redis round-trip. Async callers
+use `aget`/`aput`/`aversion`/`ainvalidate` (redis.asyncio), which share
+everything but the I/O with the sync functions.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+import redis_store
+from config import ACCOUNT_CACHE_MAX_BYTES, ACCOUNT_CACHE_REDIS_TTL_SECONDS, ACCOUNT_CACHE_TTL_SECONDS
+from local_cache import LocalCache, apublish
+
+logger = logging.getLogger("knoweasy.account_cache")
+
+KINDS = ("sub", "wallet")
+
+_CACHE = LocalCache("account", ACCOUNT_CACHE_MAX_BYTES, ACCOUNT_CACHE_TTL_SECONDS)
+_STATS: Dict[str, int] = {"hits": 0, "misses": 0, "stale": 0, "invalidations": 0, "writes_skipped": 0}
+
+# Version counters when Redis is off (per worker, like everything else then)
+_LOCAL_VERSIONS: Dict[int, int] = {}
+_LOCAL_LOCK = threading.Lock()
+
+_VERSION_TTL_SECONDS = 7 * 86400
+
+
+def _key(kind: str, user_id: int) -> str:
+    return f"{kind}:{int(user_id)}"
+
+
+def _redis_key(kind: str, user_id: int) -> str:
+    return f"acct:{kind}:{int(user_id)}"
+
+
+def _version_key(user_id: int) -> str:
+    return f"acct:ver:{int(user_id)}"
+
+
+def version(user_id: int) -> Optional[int]:
+    """Current version; None when it can't be read (then nothing is cached)."""
+    r = redis_store.get_redis()
+    if r is None:
+        return _local_version(user_id)
+    try:
+        return int(r.get(_version_key(user_id)) or 0)
+    except Exception as e:
+        logger.debug("account version read failed: %s", e)
+        return None
+
+
+async def aversion(user_id: int) -> Optional[int]:
+    """version() for async callers."""
+    r = redis_store.get_aredis()
+    if r is None:
+        return _local_version(user_id)
+    try:
+        return int(await r.get(_version_key(user_id)) or 0)
+    except Exception as e:
+        logger.debug("account version read failed: %s", e)
+        return None
+
+
+def _local_version(user_id: int) -> int:
+    with _LOCAL_LOCK:
+        return _LOCAL_VERSIONS.get(int(user_id), 0)
+
+
+def _restore(entry: Dict[str, Any]) -> Dict[str, Any]:
+    value = dict(entry.get("value") or {})
+    for k in entry.get("dt") or ():
+        v = value.get(k)
+        if isinstance(v, str):
+            try:
+                value[k] = datetime.fromisoformat(v)
+            except ValueError:
+                pass
+    return value
+
+
+def _redis_get(kind: str, user_id: int) -> Tuple[Optional[int], Optional[Dict[str, Any]]]:
+    """(current version, Redis entry); used on an L1 miss, one round-trip."""
+    rb = redis_store.get_redis_bytes()
+    if rb is None or ACCOUNT_CACHE_REDIS_TTL_SECONDS <= 0:
+        return version(user_id), None
+    try:
+        pipe = rb.pipeline(transaction=False)
+        pipe.get(_version_key(user_id))
+        pipe.get(_redis_key(kind, user_id))
+        raw_ver, blob = pipe.execute()
+        return int(raw_ver or 0), (redis_store.decode_value(blob) if blob is not None else None)
+    except Exception as e:
+        logger.debug("account cache redis read failed: %s", e)
+        return None, None
+
+
+async def _aredis_get(kind: str, user_id: int) -> Tuple[Optional[int], Optional[Dict[str, Any]]]:
+    rb = redis_store.get_aredis_bytes()
+    if rb is None or ACCOUNT_CACHE_REDIS_TTL_SECONDS <= 0:
+        return await aversion(user_id), None
+    try:
+        pipe = rb.pipeline(transaction=False)
+        pipe.get(_version_key(user_id))
+        pipe.get(_redis_key(kind, user_id))
+        raw_ver, blob = await pipe.execute()
+        return int(raw_ver or 0), (redis_store.decode_value(blob) if blob is not None else None)
+    except Exception as e:
+        logger.debug("account cache redis read failed: %s", e)
+        return None, None
+
+
+def _accept(key: str, entry: Any, ver: Optional[int], from_redis: bool) -> Optional[Dict[str, Any]]:
+    """The snapshot when `entry` is current at version `ver`, else None (and drop it)."""
+    if entry is None:
+        _STATS["misses"] += 1
+        return None
+    if ver is None or not isinstance(entry, dict) or int(entry.get("v") or 0) != ver:
+        # Written under an older version (or the counter can't be read)
+        _STATS["stale"] += 1
+        _STATS["misses"] += 1
+        if not from_redis:
+            _CACHE.delete(key, broadcast=False)
+        return None
+    until = entry.get("until")
+    if until is not None and time.time() >= float(until):
+        _CACHE.delete(key, broadcast=False)
+        _STATS["misses"] += 1
+        return None
+    if from_redis:
+        _CACHE.set(key, entry, broadcast=False)
+    _STATS["hits"] += 1
+    return _restore(entry)
+
+
+def get(kind: str, user_id: int) -> Optional[Dict[str, Any]]:
+    """Cached snapshot (a fresh dict) or None when the caller must read the DB."""
+    key = _key(kind, user_id)
+    entry = _CACHE.get(key)
+    if entry is not None:
+        return _accept(key, entry, version(user_id), from_redis=False)
+    ver, entry = _redis_get(kind, user_id)
+    return _accept(key, entry, ver, from_redis=True)
+
+
+async def aget(kind: str, user_id: int) -> Optional[Dict[str, Any]]:
+    """get() for async callers."""
+    key = _key(kind, user_id)
+    entry = _CACHE.get(key)
+    if entry is not None:
+        return _accept(key, entry, await aversion(user_id), from_redis=False)
+    ver, entry = await _aredis_get(kind, user_id)
+    return _accept(key, entry, ver, from_redis=True)
+
+
+def _entry(ver: int, value: Dict[str, Any], valid_until: Optional[datetime]) -> Optional[Dict[str, Any]]:
+    until = valid_until.timestamp() if isinstance(valid_until, datetime) else None
+    if until is not None and until <= time.time():
+        return None
+    return {
+        "v": int(ver),
+        "until": until,
+        "value": dict(value),
+        "dt": [k for k, v in value.items() if isinstance(v, datetime)],
+    }
+
+
+def _redis_ttl(entry: Dict[str, Any]) -> int:
+    ttl = ACCOUNT_CACHE_REDIS_TTL_SECONDS
+    if entry["until"] is not None:
+        ttl = max(1, min(ttl, int(entry["until"] - time.time())))
+    return ttl
+
+
+def put(kind: str, user_id: int, ver: Optional[int], value: Dict[str, Any], valid_until: Optional[datetime] = None) -> bool:
+    """Cache `value` read under version `ver`. False when a mutation raced the read."""
+    if ver is None or version(user_id) != ver:
+        _STATS["writes_skipped"] += 1
+        return False
+    entry = _entry(ver, value, valid_until)
+    if entry is None:
+        return False
+    _CACHE.set(_key(kind, user_id), entry, broadcast=False)
+    if ACCOUNT_CACHE_REDIS_TTL_SECONDS > 0:
+        redis_store.setex_packed(_redis_key(kind, user_id), _redis_ttl(entry), entry)
+    return True
+
+
+async def aput(kind: str, user_id: int, ver: Optional[int], value: Dict[str, Any], valid_until: Optional[datetime] = None) -> bool:
+    """put() for async callers."""
+    if ver is None or await aversion(user_id) != ver:
+        _STATS["writes_skipped"] += 1
+        return False
+    entry = _entry(ver, value, valid_until)
+    if entry is None:
+        return False
+    _CACHE.set(_key(kind, user_id), entry, broadcast=False)
+    if ACCOUNT_CACHE_REDIS_TTL_SECONDS > 0:
+        await redis_store.asetex_packed(_redis_key(kind, user_id), _redis_ttl(entry), entry)
+    return True
+
+
+def _invalidate_local(user_id: int, broadcast: bool = True) -> None:
+    _STATS["invalidations"] += 1
+    with _LOCAL_LOCK:
+        _LOCAL_VERSIONS[int(user_id)] = _LOCAL_VERSIONS.get(int(user_id), 0) + 1
+    for kind in KINDS:
+        _CACHE.delete(_key(kind, user_id), broadcast=broadcast)
+
+
+def invalidate(user_id: int) -> None:
+    """Call after a committed write to the user's subscription or wallet."""
+    _invalidate_local(user_id)
+    r = redis_store.get_redis()
+    if r is None:
+        return
+    try:
+        pipe = r.pipeline(transaction=False)
+        pipe.incr(_version_key(user_id))
+        pipe.expire(_version_key(user_id), _VERSION_TTL_SECONDS)
+        pipe.delete(*[_redis_key(kind, user_id) for kind in KINDS])
+        pipe.execute()
+    except Exception as e:
+        # Entries still age out after ACCOUNT_CACHE_REDIS_TTL_SECONDS
+        logger.warning("account cache invalidation failed for user %s: %s", user_id, e)
+
+
+async def ainvalidate(user_id: int) -> None:
+    """invalidate() for async callers."""
+    _invalidate_local(user_id, broadcast=False)
+    await apublish(_CACHE.namespace, *[_key(kind, user_id) for kind in KINDS])
+    r = redis_store.get_aredis()
+    if r is None:
+        return
+    try:
+        pipe = r.pipeline(transaction=False)
+        pipe.incr(_version_key(user_id))
+        pipe.expire(_version_key(user_id), _VERSION_TTL_SECONDS)
+        pipe.delete(*[_redis_key(kind, user_id) for kind in KINDS])
+        await pipe.execute()
+    except Exception as e:
+        logger.warning("account cache invalidation failed for user %s: %s", user_id, e)
+
+
+def stats() -> Dict[str, Any]:
+    lookups = _STATS["hits"] + _STATS["misses"]
+    return {
+        **_STATS,
+        "hit_ratio": round(_STATS["hits"] / lookups, 4) if lookups else 0.0,
+        "l1": _CACHE.stats(),
+    }
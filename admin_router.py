@@ -9,7 +9,8 @@ Security posture:
 
 Read-only: does not modify user state.
 
-Queries ai_usage_logs directly.
+Queries ai_usage_logs directly; /admin/latency reads the orchestrator's
+in-memory latency histograms (per worker).
 """
 
 from __future__ import annotations
@@ -202,3 +203,23 @@ def cost_top_users(
             status_code=200,
             content={"ok": False, "error": "QUERY_FAILED", "message": str(ex)},
         )
+
+
+@router.get("/latency")
+def latency_histograms(
+    buckets: bool = Query(default=False),
+    x_admin_key: Optional[str] = Header(default=None, alias="X-Admin-Key"),
+):
+    """Provider/writer latency histograms of this worker and the timeouts derived from them."""
+    try:
+        _require_admin(x_admin_key)
+    except PermissionError as e:
+        code = str(e)
+        if code == "ADMIN_DISABLED":
+            return JSONResponse(status_code=404, content={"ok": False, "error": "NOT_FOUND"})
+        return JSONResponse(status_code=403, content={"ok": False, "error": "FORBIDDEN"})
+
+    from orchestrator import latency_snapshot
+
+    out: Dict[str, Any] = {"ok": True, "pid": os.getpid(), **latency_snapshot(with_buckets=buckets)}
+    return JSONResponse(status_code=200, content=jsonable_encoder(out))
@@ -4,37 +4,62 @@ We use SQLAlchemy Core + raw SQL for:
 - minimal dependencies
 - no migration framework required
 - safe CREATE TABLE IF NOT EXISTS
+
+Session lookups are the highest-QPS query in the app, so `session_user`
+answers from a cache keyed by the token hash (per-worker LocalCache, then
+Redis). Cached entries carry the session's expires_at and are re-checked on
+every hit; `delete_session` drops them everywhere. `last_seen_at` is only
+written once per AUTH_SESSION_TOUCH_SECONDS per session.
 """
 
 from __future__ import annotations
 
+import asyncio
 import os
 import logging
+import threading
+import time
 from datetime import datetime, timedelta, timezone
 from typing import Any, Dict, Optional, Tuple
 
 from sqlalchemy import text
 from shared_engine import get_engine as _shared_get_engine
+from shared_engine import get_async_engine
 from sqlalchemy.exc import SQLAlchemyError
 
 from auth_utils import hash_value, constant_time_equal
+import redis_store
+import schema_ready
+from config import (
+    AUTH_SESSION_CACHE_MAX_BYTES,
+    AUTH_SESSION_CACHE_TTL_SECONDS,
+    AUTH_SESSION_REDIS_TTL_SECONDS,
+    AUTH_SESSION_TOUCH_SECONDS,
+)
+from local_cache import LocalCache
 
 logger = logging.getLogger("knoweasy-engine-api.auth")
 
-_TABLES_READY: bool = False
-
-
 def _get_engine():
     return _shared_get_engine()
 
 def ensure_tables() -> None:
-    global _TABLES_READY
-    if _TABLES_READY:
+    if schema_ready.is_ready("auth"):
         return
-    eng = _get_engine()
-    if eng is None:
+    if _get_engine() is None:
         raise RuntimeError("DATABASE_URL not configured")
+    if not schema_ready.ensure("auth", _create_tables):
+        raise RuntimeError("auth schema not ready")
+
+
+async def aensure_tables() -> None:
+    """ensure_tables() for async callers: a dict lookup once the schema is in."""
+    if schema_ready.is_ready("auth"):
+        return
+    await asyncio.to_thread(ensure_tables)
 
+
+def _create_tables(conn) -> None:
     # Minimal schema. We can extend in Phase-2.2+.
     ddl = [
         """
@@ -74,11 +99,8 @@ def ensure_tables() -> None:
         """CREATE INDEX IF NOT EXISTS idx_sessions_user ON sessions(user_id, expires_at);""",
     ]
 
-    with eng.begin() as conn:
-        for stmt in ddl:
-            conn.execute(text(stmt))
-
-    _TABLES_READY = True
+    for stmt in ddl:
+        conn.execute(text(stmt))
 
 # -------------------------
 # OTP rules
@@ -257,6 +279,177 @@ def create_session(user_id: int, token_hash: str) -> None:
             {"user_id": user_id, "token_hash": token_hash, "expires_at": expires_at, "now": now},
         )
 
+_SESSION_LOOKUP_SQL = """
+    SELECT u.id AS user_id, u.email, u.role, s.expires_at
+    FROM sessions s
+    JOIN users u ON u.id = s.user_id
+    WHERE s.token_hash = :token_hash
+    LIMIT 1
+"""
+_SESSION_DELETE_SQL = """DELETE FROM sessions WHERE token_hash=:token_hash"""
+_SESSION_TOUCH_SQL = """UPDATE sessions SET last_seen_at=:now WHERE token_hash=:token_hash"""
+
+
+def _session_expired(row: Dict[str, Any], now: datetime) -> bool:
+    expires_at = row["expires_at"]
+    if expires_at.tzinfo is None:
+        expires_at = expires_at.replace(tzinfo=timezone.utc)
+    return now > expires_at
+
+
+# -------------------------
+# Session cache
+# -------------------------
+_SESSIONS = LocalCache("session", AUTH_SESSION_CACHE_MAX_BYTES, AUTH_SESSION_CACHE_TTL_SECONDS)
+_SESSION_STATS: Dict[str, int] = {"hits": 0, "misses": 0, "touches": 0, "touches_skipped": 0}
+
+_LAST_TOUCH: Dict[str, float] = {}
+_LAST_TOUCH_LOCK = threading.Lock()
+_LAST_TOUCH_MAX = 100_000
+
+
+def _session_redis_key(token_h: str) -> str:
+    return f"sess:{token_h}"
+
+
+def _session_from_entry(token_h: str, entry: Any, now: datetime) -> Optional[Dict[str, Any]]:
+    if not isinstance(entry, dict):
+        _SESSION_STATS["misses"] += 1
+        return None
+    if now.timestamp() > float(entry.get("expires_at") or 0):
+        # Let the DB path delete the row.
+        _SESSIONS.delete(token_h, broadcast=False)
+        _SESSION_STATS["misses"] += 1
+        return None
+    _SESSION_STATS["hits"] += 1
+    return {"user_id": int(entry["user_id"]), "email": entry.get("email"), "role": entry.get("role")}
+
+
+def _promote_session(token_h: str, entry: Any, now: datetime) -> None:
+    """Keep a Redis hit in L1 until the session expires."""
+    if isinstance(entry, dict):
+        remaining = float(entry.get("expires_at") or 0) - now.timestamp()
+        if remaining > 0:
+            _SESSIONS.set(token_h, entry, ttl_s=int(remaining) or 1, broadcast=False)
+
+
+def _cached_session(token_h: str, now: datetime) -> Optional[Dict[str, Any]]:
+    """User dict for a cached, unexpired session; None means "ask the DB"."""
+    entry = _SESSIONS.get(token_h)
+    if entry is None and AUTH_SESSION_REDIS_TTL_SECONDS > 0:
+        entry = redis_store.get_packed(_session_redis_key(token_h))
+        _promote_session(token_h, entry, now)
+    return _session_from_entry(token_h, entry, now)
+
+
+async def _acached_session(token_h: str, now: datetime) -> Optional[Dict[str, Any]]:
+    """_cached_session() with the Redis read on the async client."""
+    entry = _SESSIONS.get(token_h)
+    if entry is None and AUTH_SESSION_REDIS_TTL_SECONDS > 0:
+        entry = await redis_store.aget_packed(_session_redis_key(token_h))
+        _promote_session(token_h, entry, now)
+    return _session_from_entry(token_h, entry, now)
+
+
+def _session_entry(token_h: str, row: Dict[str, Any], now: datetime) -> Optional[Tuple[Dict[str, Any], int]]:
+    """Store the session in L1; returns (entry, Redis TTL) or None if it should not be kept."""
+    expires_at = row["expires_at"]
+    if expires_at.tzinfo is None:
+        expires_at = expires_at.replace(tzinfo=timezone.utc)
+    remaining = (expires_at - now).total_seconds()
+    if remaining <= 0:
+        return None
+    entry = {
+        "user_id": int(row["user_id"]),
+        "email": row["email"],
+        "role": row["role"],
+        "expires_at": expires_at.timestamp(),
+    }
+    _SESSIONS.set(token_h, entry, ttl_s=int(remaining) or 1, broadcast=False)
+    if AUTH_SESSION_REDIS_TTL_SECONDS <= 0:
+        return None
+    return entry, max(1, min(int(remaining), AUTH_SESSION_REDIS_TTL_SECONDS))
+
+
+def _cache_session(token_h: str, row: Dict[str, Any], now: datetime) -> None:
+    stored = _session_entry(token_h, row, now)
+    if stored is not None:
+        redis_store.setex_packed(_session_redis_key(token_h), stored[1], stored[0])
+
+
+async def _acache_session(token_h: str, row: Dict[str, Any], now: datetime) -> None:
+    stored = _session_entry(token_h, row, now)
+    if stored is not None:
+        await redis_store.asetex_packed(_session_redis_key(token_h), stored[1], stored[0])
+
+
+def _forget_session(token_h: str) -> None:
+    _SESSIONS.delete(token_h)
+    with _LAST_TOUCH_LOCK:
+        _LAST_TOUCH.pop(token_h, None)
+    r = redis_store.get_redis()
+    if r:
+        try:
+            r.delete(_session_redis_key(token_h), f"sess:touch:{token_h}")
+        except Exception:
+            pass
+
+
+def _touch_due_local(token_h: str) -> bool:
+    interval = AUTH_SESSION_TOUCH_SECONDS
+    now_m = time.monotonic()
+    with _LAST_TOUCH_LOCK:
+        last = _LAST_TOUCH.get(token_h)
+        if last is not None and now_m - last < interval:
+            _SESSION_STATS["touches_skipped"] += 1
+            return False
+        _LAST_TOUCH[token_h] = now_m
+        if len(_LAST_TOUCH) > _LAST_TOUCH_MAX:
+            for k in [k for k, t in _LAST_TOUCH.items() if now_m - t >= interval]:
+                del _LAST_TOUCH[k]
+    return True
+
+
+def _touch_claimed(claimed: bool) -> bool:
+    if not claimed:
+        # Another worker touched it within the interval.
+        _SESSION_STATS["touches_skipped"] += 1
+        return False
+    _SESSION_STATS["touches"] += 1
+    return True
+
+
+def _touch_due(token_h: str) -> bool:
+    """True at most once per AUTH_SESSION_TOUCH_SECONDS per session (across workers with Redis)."""
+    interval = AUTH_SESSION_TOUCH_SECONDS
+    if interval <= 0:
+        return True
+    if not _touch_due_local(token_h):
+        return False
+    claimed = redis_store.get_redis() is None or redis_store.setnx_ex(f"sess:touch:{token_h}", interval)
+    return _touch_claimed(claimed)
+
+
+async def _atouch_due(token_h: str) -> bool:
+    """_touch_due() with the cross-worker claim on the async client."""
+    interval = AUTH_SESSION_TOUCH_SECONDS
+    if interval <= 0:
+        return True
+    if not _touch_due_local(token_h):
+        return False
+    claimed = redis_store.get_aredis() is None or await redis_store.asetnx_ex(f"sess:touch:{token_h}", interval)
+    return _touch_claimed(claimed)
+
+
+def session_cache_stats() -> Dict[str, Any]:
+    lookups = _SESSION_STATS["hits"] + _SESSION_STATS["misses"]
+    return {
+        **_SESSION_STATS,
+        "hit_ratio": round(_SESSION_STATS["hits"] / lookups, 4) if lookups else 0.0,
+        "l1": _SESSIONS.stats(),
+    }
+
+
 def session_user(token_plain: str) -> Optional[Dict[str, Any]]:
     ensure_tables()
     eng = _get_engine()
@@ -266,37 +459,71 @@ def session_user(token_plain: str) -> Optional[Dict[str, Any]]:
         return None
 
     now = datetime.now(timezone.utc)
+    cached = _cached_session(token_h, now)
+    if cached is not None:
+        if _touch_due(token_h):
+            try:
+                with eng.begin() as conn:
+                    conn.execute(text(_SESSION_TOUCH_SQL), {"now": now, "token_hash": token_h})
+            except SQLAlchemyError:
+                logger.warning("session touch failed", exc_info=True)
+        return cached
+
     with eng.begin() as conn:
-        row = conn.execute(
-            text("""
-                SELECT u.id AS user_id, u.email, u.role, s.expires_at
-                FROM sessions s
-                JOIN users u ON u.id = s.user_id
-                WHERE s.token_hash = :token_hash
-                LIMIT 1
-            """),
-            {"token_hash": token_h},
-        ).mappings().first()
+        row = conn.execute(text(_SESSION_LOOKUP_SQL), {"token_hash": token_h}).mappings().first()
 
         if not row:
             return None
 
-        expires_at = row["expires_at"]
-        if expires_at.tzinfo is None:
-            expires_at = expires_at.replace(tzinfo=timezone.utc)
-
-        if now > expires_at:
+        if _session_expired(row, now):
             # Expired: cleanup
-            conn.execute(text("""DELETE FROM sessions WHERE token_hash=:token_hash"""), {"token_hash": token_h})
+            conn.execute(text(_SESSION_DELETE_SQL), {"token_hash": token_h})
             return None
 
-        # Touch last seen
-        conn.execute(
-            text("""UPDATE sessions SET last_seen_at=:now WHERE token_hash=:token_hash"""),
-            {"now": now, "token_hash": token_h},
-        )
+        # Touch last seen (debounced)
+        if _touch_due(token_h):
+            conn.execute(text(_SESSION_TOUCH_SQL), {"now": now, "token_hash": token_h})
+
+    _cache_session(token_h, row, now)
+    return {"user_id": int(row["user_id"]), "email": row["email"], "role": row["role"]}
+
+
+async def asession_user(token_plain: str) -> Optional[Dict[str, Any]]:
+    """session_user() for async callers (asyncpg; thread fallback)."""
+    aeng = get_async_engine()
+    if aeng is None:
+        return await asyncio.to_thread(session_user, token_plain)
+    await aensure_tables()
+    token_h = hash_value(token_plain)
+    if not token_h:
+        return None
+
+    now = datetime.now(timezone.utc)
+    cached = await _acached_session(token_h, now)
+    if cached is not None:
+        if await _atouch_due(token_h):
+            try:
+                async with aeng.begin() as conn:
+                    await conn.execute(text(_SESSION_TOUCH_SQL), {"now": now, "token_hash": token_h})
+            except SQLAlchemyError:
+                logger.warning("session touch failed", exc_info=True)
+        return cached
+
+    async with aeng.begin() as conn:
+        row = (await conn.execute(text(_SESSION_LOOKUP_SQL), {"token_hash": token_h})).mappings().first()
+
+        if not row:
+            return None
+
+        if _session_expired(row, now):
+            await conn.execute(text(_SESSION_DELETE_SQL), {"token_hash": token_h})
+            return None
+
+        if await _atouch_due(token_h):
+            await conn.execute(text(_SESSION_TOUCH_SQL), {"now": now, "token_hash": token_h})
 
-        return {"user_id": int(row["user_id"]), "email": row["email"], "role": row["role"]}
+    await _acache_session(token_h, row, now)
+    return {"user_id": int(row["user_id"]), "email": row["email"], "role": row["role"]}
 
 def delete_session(token_plain: str) -> None:
     ensure_tables()
@@ -306,4 +533,5 @@ def delete_session(token_plain: str) -> None:
     if not token_h:
         return
     with eng.begin() as conn:
-        conn.execute(text("""DELETE FROM sessions WHERE token_hash=:token_hash"""), {"token_hash": token_h})
+        conn.execute(text(_SESSION_DELETE_SQL), {"token_hash": token_h})
+    _forget_session(token_h)
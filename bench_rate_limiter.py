@@ -0,0 +1,121 @@
+"""bench_rate_limiter.py — Round-trips and latency per rate-limit check.
+
+Compares the legacy fixed-window counter (`incr_with_ttl` per key: INCR+TTL
+pipeline, plus EXPIRE on a new window) with rate_limiter.check (GCRA in one
+EVALSHA for all keys), for 1 key (IP) and 3 keys (IP + user + route class).
+
+Usage:
+    python bench_rate_limiter.py                         # REDIS_URL from env
+    python bench_rate_limiter.py --url redis://localhost:6379/0 -n 5000
+    python bench_rate_limiter.py --memory                # in-worker token bucket only
+
+Round-trips are counted at the connection (one per command, one per
+pipeline). Keys are random per run; nothing else in Redis is touched.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import time
+import uuid
+from typing import Callable, List
+
+import redis
+
+import rate_limiter
+import redis_store
+
+
+class _Counter:
+    """Counts writes to the socket: one per command or pipeline."""
+
+    def __init__(self) -> None:
+        self.n = 0
+
+    def install(self, client: redis.Redis) -> None:
+        pool = client.connection_pool
+        get_connection = pool.get_connection
+        counter = self
+
+        def counted(*args, **kwargs):
+            conn = get_connection(*args, **kwargs)
+            if not getattr(conn, "_bench_counted", False):
+                send = conn.send_packed_command
+
+                def send_packed_command(command, check_health=True):
+                    counter.n += 1
+                    return send(command, check_health)
+
+                conn.send_packed_command = send_packed_command
+                conn._bench_counted = True
+            return conn
+
+        pool.get_connection = counted
+
+
+def _measure(name: str, fn: Callable[[], object], n: int, counter: _Counter) -> None:
+    fn()  # warm up (loads the script)
+    samples: List[float] = []
+    before = counter.n
+    for _ in range(n):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1e6)
+    rtt = (counter.n - before) / n
+    samples.sort()
+    p50 = statistics.median(samples)
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    print(f"{name:38} {rtt:>8.2f} {p50:>9.1f} {p99:>9.1f}")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--url", default=os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+    ap.add_argument("-n", type=int, default=2000, help="checks per measurement")
+    ap.add_argument("--memory", action="store_true", help="benchmark the in-worker fallback only")
+    args = ap.parse_args()
+
+    # Generous limits: we measure the check, not refusals
+    os.environ.setdefault("RATE_LIMIT_PER_MINUTE", "1000000")
+    os.environ.setdefault("RATE_LIMIT_USER_PER_MINUTE", "1000000")
+    os.environ.setdefault("RATE_LIMIT_STREAM_PER_MINUTE", "1000000")
+
+    run = uuid.uuid4().hex[:8]
+    ip, user = f"bench-{run}", 10**9
+    counter = _Counter()
+
+    if args.memory:
+        redis_store.get_redis = lambda: None  # type: ignore[assignment]
+        rate_limiter.get_redis = lambda: None  # type: ignore[assignment]
+    else:
+        client = redis.Redis.from_url(args.url, decode_responses=True)
+        client.ping()
+        counter.install(client)
+        redis_store.get_redis = lambda: client  # type: ignore[assignment]
+        rate_limiter.get_redis = lambda: client  # type: ignore[assignment]
+
+    def legacy(keys: int) -> Callable[[], object]:
+        def fn() -> object:
+            bucket = int(time.time() // 60)
+            names = [f"rl:{ip}:{bucket}", f"rl:u:{user}:{bucket}", f"rl:s:{user}:{bucket}"][:keys]
+            return [redis_store.incr_with_ttl(k, 60) for k in names]
+        return fn
+
+    one = rate_limiter.limits_for(ip)
+    three = rate_limiter.limits_for(ip, user, "stream")
+
+    print(f"{'check':38} {'rtt/chk':>8} {'p50 µs':>9} {'p99 µs':>9}")
+    if not args.memory:
+        _measure("legacy fixed window, 1 key", legacy(1), args.n, counter)
+        _measure("legacy fixed window, 3 keys", legacy(3), args.n, counter)
+    _measure("rate_limiter.check, 1 key", lambda: rate_limiter.check(one), args.n, counter)
+    _measure("rate_limiter.check, 3 keys", lambda: rate_limiter.check(three), args.n, counter)
+
+    if not args.memory:
+        client.delete(*[lim.key for lim in three], *client.scan_iter(f"rl:*{ip}*"), *client.scan_iter(f"rl:*:{user}:*"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""bench_redis_codec.py — Bytes and µs per encode/decode for cached answers.
+
+Compares the legacy `setex_json` format (UTF-8 JSON text) with the packed
+codec in redis_store (orjson + zstd, zlib fallback).
+
+Usage:
+    python bench_redis_codec.py                  # synthetic mastery-size answer
+    python bench_redis_codec.py --file out.json  # a real SolveResponse dump
+    python bench_redis_codec.py -n 2000
+
+No Redis needed: this measures serialization only.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import time
+import zlib
+from typing import Any, Callable, Dict, List, Tuple
+
+import redis_store
+
+
+_VOCAB = (
+    "photosynthesis plants sunlight water carbon dioxide glucose oxygen chlorophyll "
+    "chloroplast energy light reaction stage leaf stomata absorb release convert food "
+    "process cell membrane enzyme molecule atom equation balanced reactant product "
+    "example diagram exam marks define explain important note step therefore because"
+).split()
+
+
+def _synthetic_answer(sections: int = 12) -> Dict[str, Any]:
+    rng = random.Random(7)
+
+    def para() -> str:
+        return " ".join(rng.choice(_VOCAB) for _ in range(120)) + "."
+
+    secs = [
+        {"type": "concept", "title": f"Section {i + 1}", "content": para()}
+        for i in range(sections)
+    ]
+    cards = [
+        {"card_type": "concept", "title": s["title"], "content": s["content"], "reveal_min": "basic", "visual": None}
+        for s in secs
+    ]
+    return {
+        "final_answer": "\n\n".join(f"## {s['title']}\n{s['content']}" for s in secs),
+        "steps": [f"Step {i}: {para()}" for i in range(6)],
+        "assumptions": [],
+        "confidence": 0.9,
+        "flags": ["GEMINI", "HIGH", "AI_GEMINI", "AI_OPENAI"],
+        "safe_note": None,
+        "blueprint": {"title": "Photosynthesis", "why_this_matters": para(), "cards": cards},
+        "learning_object": {
+            "title": "Photosynthesis",
+            "explanation_blocks": [{"title": s["title"], "content": s["content"]} for s in secs],
+            "key_points": [para()[:80] for _ in range(4)],
+            "common_mistakes": ["Confusing respiration with photosynthesis"],
+        },
+        "meta": {
+            "engine": "knoweasy-orchestrator-v2",
+            "request_id": "bench",
+            "providers_used": ["gemini", "openai"],
+            "sections": [s["title"] for s in secs],
+            "verified": True,
+        },
+    }
+
+
+def _bench(fn: Callable[[], Any], n: int) -> float:
+    fn()  # warm up
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - t0) / n * 1e6
+
+
+def _formats(value: Dict[str, Any]) -> List[Tuple[str, Callable[[], bytes], Callable[[bytes], Any]]]:
+    out: List[Tuple[str, Callable[[], bytes], Callable[[bytes], Any]]] = [
+        (
+            "legacy json (setex_json)",
+            lambda: json.dumps(value, ensure_ascii=False).encode("utf-8"),
+            lambda b: json.loads(b.decode("utf-8")),
+        ),
+        (
+            "packed (redis_store codec)",
+            lambda: redis_store.encode_value(value),
+            redis_store.decode_value,
+        ),
+        (
+            "json + zlib (no optional deps)",
+            lambda: b"\x03" + zlib.compress(json.dumps(value, ensure_ascii=False).encode("utf-8"), 6),
+            lambda b: json.loads(zlib.decompress(b[1:])),
+        ),
+    ]
+    if redis_store.orjson is not None:
+        oj = redis_store.orjson
+        out.append(("orjson, uncompressed", lambda: oj.dumps(value), oj.loads))
+    return out
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--file", help="JSON file with a SolveResponse to encode")
+    ap.add_argument("-n", type=int, default=1000, help="iterations per measurement")
+    args = ap.parse_args()
+
+    if args.file:
+        with open(args.file, "r", encoding="utf-8") as f:
+            value = json.load(f)
+    else:
+        value = _synthetic_answer()
+
+    print(f"orjson: {'yes' if redis_store.orjson else 'no'}  zstandard: {'yes' if redis_store.zstandard else 'no'}")
+    print(f"{'format':34} {'bytes':>9} {'ratio':>6} {'enc µs':>9} {'dec µs':>9}")
+    base = None
+    for name, enc, dec in _formats(value):
+        blob = enc()
+        assert dec(blob) == json.loads(json.dumps(value)), name
+        base = base or len(blob)
+        enc_us = _bench(enc, args.n)
+        dec_us = _bench(lambda: dec(blob), args.n)
+        print(f"{name:34} {len(blob):>9} {len(blob) / base:>6.2f} {enc_us:>9.1f} {dec_us:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
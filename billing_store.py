@@ -6,6 +6,12 @@ This module is designed for production stability:
 - No migrations; we use CREATE TABLE IF NOT EXISTS.
 - Best-effort: if DATABASE_URL is missing/unavailable, functions return safe defaults.
 - Atomic credit consumption via SELECT ... FOR UPDATE inside a transaction.
+- Wallet reads go through account_cache; every write below invalidates it
+  after commit.
+- AI solves use reservations: `reserve_credits` holds the planned units at
+  admission (one statement, cycle reset included), `settle_reservation`
+  charges what was used and refunds the rest (one statement). Holds that are
+  never settled are released by `release_expired_reservations`.
 
 Terminology
 -----------
@@ -15,22 +21,24 @@ Terminology
 
 from __future__ import annotations
 
+import asyncio
 import json
 import logging
 import os
+import uuid
 from datetime import datetime, timedelta, timezone
 from typing import Any, Dict, Optional, Tuple
 
 from sqlalchemy import text
 
+import account_cache
 import payments_store
+import schema_ready
+from config import CREDIT_RESERVATION_TTL_SECONDS
+from shared_engine import get_async_engine
 
 logger = logging.getLogger("knoweasy-engine-api.billing")
 
-# Cache: avoid running DDL on every request per process.
-_TABLES_ENSURED: bool = False
-
-
 # -----------------------------
 # Plan credit allowances (v1)
 # -----------------------------
@@ -74,13 +82,10 @@ def _cycle_length_days() -> int:
 
 def ensure_tables() -> None:
     """Ensure billing tables exist (best-effort)."""
-    global _TABLES_ENSURED
-    if _TABLES_ENSURED:
-        return
-    eng = payments_store.get_engine_safe()
-    if eng is None:
-        return
+    schema_ready.ensure("billing", _create_tables)
 
+
+def _create_tables(conn) -> None:
     ddl = [
         """
         CREATE TABLE IF NOT EXISTS credit_wallets (
@@ -118,6 +123,24 @@ def ensure_tables() -> None:
         );
         """,
         "CREATE INDEX IF NOT EXISTS idx_booster_packs_active ON booster_packs(active);",
+        """
+        CREATE TABLE IF NOT EXISTS credit_reservations (
+            id BIGSERIAL PRIMARY KEY,
+            reservation_id TEXT NOT NULL UNIQUE,
+            user_id INT NOT NULL,
+            units INT NOT NULL,
+            from_included INT NOT NULL DEFAULT 0,
+            from_booster INT NOT NULL DEFAULT 0,
+            units_used INT,
+            status TEXT NOT NULL DEFAULT 'held',
+            meta_json TEXT,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            expires_at TIMESTAMPTZ NOT NULL,
+            settled_at TIMESTAMPTZ
+        );
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_credit_reservations_held ON credit_reservations(expires_at) WHERE status='held';",
+        "CREATE INDEX IF NOT EXISTS idx_credit_reservations_created ON credit_reservations(created_at);",
     ]
 
     repairs = [
@@ -130,148 +153,281 @@ def ensure_tables() -> None:
         "ALTER TABLE IF EXISTS booster_packs ADD COLUMN IF NOT EXISTS active BOOLEAN NOT NULL DEFAULT TRUE;",
     ]
 
-    try:
-        with eng.begin() as conn:
-            for stmt in ddl:
+    for stmt in ddl:
+        conn.execute(text(stmt))
+    for stmt in repairs:
+        try:
+            with conn.begin_nested():
                 conn.execute(text(stmt))
-            for stmt in repairs:
-                try:
-                    with conn.begin_nested():
-                        conn.execute(text(stmt))
-                except Exception:
-                    logger.debug("billing_store schema repair skipped: %s", stmt, exc_info=True)
-
-            # Seed booster packs (idempotent)
-            seeds = [
-                ("BOOST_MINI", 500, 4900),
-                ("BOOST_SMART", 2000, 14900),
-                ("BOOST_POWER", 5000, 29900),
-            ]
-            for sku, units, price in seeds:
-                conn.execute(
-                    text(
-                        """
-                        INSERT INTO booster_packs (sku, credits_units, price_paise, active)
-                        VALUES (:sku, :units, :price, TRUE)
-                        ON CONFLICT (sku) DO UPDATE SET
-                            credits_units=EXCLUDED.credits_units,
-                            price_paise=EXCLUDED.price_paise,
-                            active=TRUE
-                        """
-                    ),
-                    {"sku": sku, "units": int(units), "price": int(price)},
-                )
-        _TABLES_ENSURED = True
-    except Exception:
-        logger.exception("billing_store.ensure_tables failed (non-fatal)")
+        except Exception:
+            logger.debug("billing_store schema repair skipped: %s", stmt, exc_info=True)
+
+    # Seed booster packs (idempotent)
+    seeds = [
+        ("BOOST_MINI", 500, 4900),
+        ("BOOST_SMART", 2000, 14900),
+        ("BOOST_POWER", 5000, 29900),
+    ]
+    for sku, units, price in seeds:
+        conn.execute(
+            text(
+                """
+                INSERT INTO booster_packs (sku, credits_units, price_paise, active)
+                VALUES (:sku, :units, :price, TRUE)
+                ON CONFLICT (sku) DO UPDATE SET
+                    credits_units=EXCLUDED.credits_units,
+                    price_paise=EXCLUDED.price_paise,
+                    active=TRUE
+                """
+            ),
+            {"sku": sku, "units": int(units), "price": int(price)},
+        )
+
+
+def _wallet_payload(included_balance: int, booster_balance: int, cycle_start, cycle_end, allowance: int) -> Dict[str, Any]:
+    """Return a backward+forward compatible wallet payload.
+
+    Frontend compatibility:
+    - Newer UI reads *_credits_balance + cycle_* fields.
+    - Older UI expects included_total / included_remaining / booster_remaining / resets_on.
+    We return both so we can evolve the UI without breaking production.
+    """
+    return {
+        # Canonical v1 fields
+        "included_credits_balance": int(included_balance),
+        "booster_credits_balance": int(booster_balance),
+        "cycle_start_at": cycle_start,
+        "cycle_end_at": cycle_end,
+
+        # Back-compat convenience fields
+        "included_total": int(allowance),
+        "included_remaining": int(included_balance),
+        "booster_remaining": int(booster_balance),
+        "resets_on": cycle_end,
+    }
+
+
+def _default_wallet(plan: str) -> Dict[str, Any]:
+    allowance = _included_allowance(plan)
+    cs = _now_utc()
+    ce = cs + timedelta(days=_cycle_length_days())
+    return _wallet_payload(allowance, 0, cs, ce, allowance)
 
 
-def get_wallet(user_id: int, plan: str) -> Dict[str, Any]:
-    """Return wallet; auto-create and auto-reset cycle if needed."""
-    ensure_tables()
-    eng = payments_store.get_engine_safe()
+_WALLET_SELECT_SQL = """
+    SELECT user_id, included_credits_balance, booster_credits_balance, cycle_start_at, cycle_end_at
+    FROM credit_wallets
+    WHERE user_id=:user_id
+    LIMIT 1
+"""
 
-    def _wallet_payload(included_balance: int, booster_balance: int, cycle_start, cycle_end, allowance: int) -> Dict[str, Any]:
-        """Return a backward+forward compatible wallet payload.
+_WALLET_CREATE_SQL = """
+    INSERT INTO credit_wallets (user_id, included_credits_balance, booster_credits_balance, cycle_start_at, cycle_end_at, updated_at)
+    VALUES (:user_id, :included, 0, :cs, :ce, NOW())
+    ON CONFLICT (user_id) DO NOTHING
+"""
 
-        Frontend compatibility:
-        - Newer UI reads *_credits_balance + cycle_* fields.
-        - Older UI expects included_total / included_remaining / booster_remaining / resets_on.
-        We return both so we can evolve the UI without breaking production.
-        """
-        return {
-            # Canonical v1 fields
-            "included_credits_balance": int(included_balance),
-            "booster_credits_balance": int(booster_balance),
-            "cycle_start_at": cycle_start,
-            "cycle_end_at": cycle_end,
-
-            # Back-compat convenience fields
-            "included_total": int(allowance),
-            "included_remaining": int(included_balance),
-            "booster_remaining": int(booster_balance),
-            "resets_on": cycle_end,
-        }
-    if eng is None:
-        # safe defaults when DB missing
-        allowance = _included_allowance(plan)
-        cs = _now_utc()
-        ce = cs + timedelta(days=_cycle_length_days())
-        return _wallet_payload(allowance, 0, cs, ce, allowance)
+_WALLET_RESET_SQL = """
+    UPDATE credit_wallets
+    SET included_credits_balance=:included,
+        cycle_start_at=:cs,
+        cycle_end_at=:ce,
+        updated_at=NOW()
+    WHERE user_id=:user_id
+"""
+
+_WALLET_LOCK_SQL = """
+    SELECT included_credits_balance, booster_credits_balance
+    FROM credit_wallets
+    WHERE user_id=:user_id
+    FOR UPDATE
+"""
+
+_WALLET_SET_BALANCES_SQL = """
+    UPDATE credit_wallets
+    SET included_credits_balance=:included,
+        booster_credits_balance=:booster,
+        updated_at=NOW()
+    WHERE user_id=:user_id
+"""
+
+_WALLET_CYCLE_SQL = "SELECT cycle_start_at, cycle_end_at FROM credit_wallets WHERE user_id=:user_id"
 
+_LEDGER_INSERT_SQL = """
+    INSERT INTO credit_ledger(user_id, event_type, source, units, included_after, booster_after, meta_json)
+    VALUES (:user_id, :event_type, :source, :units, :included_after, :booster_after, :meta_json)
+"""
+
+
+def _wallet_step(row: Optional[Dict[str, Any]], user_id: int, plan: str) -> Tuple[Dict[str, Any], Optional[Tuple[str, Dict[str, Any], Tuple[Any, ...]]]]:
+    """Decide what get_wallet must do for the current row.
+
+    Returns (payload, write) where write is None or
+    (sql, params, ledger_args) to run before returning the payload.
+    """
     now = _now_utc()
     cycle_days = _cycle_length_days()
     allowance = _included_allowance(plan)
 
+    if not row:
+        cycle_start = now
+        cycle_end = now + timedelta(days=cycle_days)
+        write = (
+            _WALLET_CREATE_SQL,
+            {"user_id": int(user_id), "included": int(allowance), "cs": cycle_start, "ce": cycle_end},
+            ("reset", "plan", int(allowance), int(allowance), 0, {"reason": "wallet_created"}),
+        )
+        return _wallet_payload(int(allowance), 0, cycle_start, cycle_end, allowance), write
+
+    included = int(row.get("included_credits_balance") or 0)
+    booster = int(row.get("booster_credits_balance") or 0)
+    cs = row.get("cycle_start_at")
+    ce = row.get("cycle_end_at")
+
+    # Normalize tz
+    if cs and cs.tzinfo is None:
+        cs = cs.replace(tzinfo=timezone.utc)
+    if ce and ce.tzinfo is None:
+        ce = ce.replace(tzinfo=timezone.utc)
+
+    # If cycle missing or ended, reset included credits
+    if (not cs) or (not ce) or (ce <= now):
+        cycle_start = now
+        cycle_end = now + timedelta(days=cycle_days)
+        included = int(allowance)
+        write = (
+            _WALLET_RESET_SQL,
+            {"user_id": int(user_id), "included": int(included), "cs": cycle_start, "ce": cycle_end},
+            ("reset", "plan", int(included), int(included), int(booster), {"reason": "cycle_reset"}),
+        )
+        return _wallet_payload(int(included), int(booster), cycle_start, cycle_end, allowance), write
+
+    return _wallet_payload(int(included), int(booster), cs, ce, allowance), None
+
+
+def _consume_step(row: Optional[Dict[str, Any]], user_id: int, units: int, meta: Dict[str, Any]) -> Tuple[Dict[str, Any], Tuple[Any, ...], Dict[str, Any]]:
+    """Split `units` across included/booster for a locked wallet row.
+
+    Returns (update params, ledger args, partial result). Raises ValueError.
+    """
+    if not row:
+        raise ValueError("WALLET_MISSING")
+
+    included = int(row.get("included_credits_balance") or 0)
+    booster = int(row.get("booster_credits_balance") or 0)
+    total = included + booster
+
+    if total < int(units):
+        raise ValueError("INSUFFICIENT_CREDITS")
+
+    consume_from_included = min(included, int(units))
+    remaining = int(units) - consume_from_included
+    consume_from_booster = remaining
+
+    included_after = included - consume_from_included
+    booster_after = booster - consume_from_booster
+
+    params = {"user_id": int(user_id), "included": int(included_after), "booster": int(booster_after)}
+    meta2 = {**meta, "ts": _now_utc().isoformat(), "units": int(units), "from_included": int(consume_from_included), "from_booster": int(consume_from_booster)}
+    ledger = ("consume", "ai", -int(units), int(included_after), int(booster_after), meta2)
+    result = {
+        "ok": True,
+        "consumed": int(units),
+        "included_credits_balance": int(included_after),
+        "booster_credits_balance": int(booster_after),
+    }
+    return params, ledger, result
+
+
+def _cached_wallet(user_id: int, plan: str) -> Optional[Dict[str, Any]]:
+    return _wallet_from_snapshot(account_cache.get("wallet", user_id), plan)
+
+
+async def _acached_wallet(user_id: int, plan: str) -> Optional[Dict[str, Any]]:
+    return _wallet_from_snapshot(await account_cache.aget("wallet", user_id), plan)
+
+
+def _wallet_from_snapshot(snap: Optional[Dict[str, Any]], plan: str) -> Optional[Dict[str, Any]]:
+    # The snapshot holds balances + cycle only; the plan allowance is applied on read.
+    if snap is None:
+        return None
+    return _wallet_payload(
+        int(snap.get("included_credits_balance") or 0),
+        int(snap.get("booster_credits_balance") or 0),
+        snap.get("cycle_start_at"),
+        snap.get("cycle_end_at"),
+        _included_allowance(plan),
+    )
+
+
+def _wallet_snapshot(payload: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: payload.get(k) for k in ("included_credits_balance", "booster_credits_balance", "cycle_start_at", "cycle_end_at")}
+
+
+def _cache_wallet(user_id: int, ver: Optional[int], payload: Dict[str, Any]) -> Dict[str, Any]:
+    snap = _wallet_snapshot(payload)
+    # Valid until the cycle ends: after that get_wallet must reset it.
+    account_cache.put("wallet", user_id, ver, snap, valid_until=snap.get("cycle_end_at"))
+    return payload
+
+
+async def _acache_wallet(user_id: int, ver: Optional[int], payload: Dict[str, Any]) -> Dict[str, Any]:
+    snap = _wallet_snapshot(payload)
+    await account_cache.aput("wallet", user_id, ver, snap, valid_until=snap.get("cycle_end_at"))
+    return payload
+
+
+def get_wallet(user_id: int, plan: str) -> Dict[str, Any]:
+    """Return wallet; auto-create and auto-reset cycle if needed."""
+    cached = _cached_wallet(user_id, plan)
+    if cached is not None:
+        return cached
+    ensure_tables()
+    eng = payments_store.get_engine_safe()
+    if eng is None:
+        # safe defaults when DB missing
+        return _default_wallet(plan)
+
     try:
+        ver = account_cache.version(user_id)
         with eng.begin() as conn:
-            row = conn.execute(
-                text(
-                    """
-                    SELECT user_id, included_credits_balance, booster_credits_balance, cycle_start_at, cycle_end_at
-                    FROM credit_wallets
-                    WHERE user_id=:user_id
-                    LIMIT 1
-                    """
-                ),
-                {"user_id": int(user_id)},
-            ).mappings().first()
+            row = conn.execute(text(_WALLET_SELECT_SQL), {"user_id": int(user_id)}).mappings().first()
+            payload, write = _wallet_step(row, user_id, plan)
+            if write is not None:
+                sql, params, ledger = write
+                conn.execute(text(sql), params)
+                _append_ledger(conn, user_id, *ledger)
+        return _cache_wallet(user_id, ver, payload)
 
-            if not row:
-                cycle_start = now
-                cycle_end = now + timedelta(days=cycle_days)
-                conn.execute(
-                    text(
-                        """
-                        INSERT INTO credit_wallets (user_id, included_credits_balance, booster_credits_balance, cycle_start_at, cycle_end_at, updated_at)
-                        VALUES (:user_id, :included, 0, :cs, :ce, NOW())
-                        ON CONFLICT (user_id) DO NOTHING
-                        """
-                    ),
-                    {"user_id": int(user_id), "included": int(allowance), "cs": cycle_start, "ce": cycle_end},
-                )
-                _append_ledger(conn, user_id, "reset", "plan", int(allowance), int(allowance), 0, {"reason": "wallet_created"})
-                return _wallet_payload(int(allowance), 0, cycle_start, cycle_end, allowance)
+    except Exception:
+        logger.exception("get_wallet failed")
+        return _default_wallet(plan)
 
-            included = int(row.get("included_credits_balance") or 0)
-            booster = int(row.get("booster_credits_balance") or 0)
-            cs = row.get("cycle_start_at")
-            ce = row.get("cycle_end_at")
-
-            # Normalize tz
-            if cs and cs.tzinfo is None:
-                cs = cs.replace(tzinfo=timezone.utc)
-            if ce and ce.tzinfo is None:
-                ce = ce.replace(tzinfo=timezone.utc)
-
-            # If cycle missing or ended, reset included credits
-            if (not cs) or (not ce) or (ce <= now):
-                cycle_start = now
-                cycle_end = now + timedelta(days=cycle_days)
-                included = int(allowance)
-                conn.execute(
-                    text(
-                        """
-                        UPDATE credit_wallets
-                        SET included_credits_balance=:included,
-                            cycle_start_at=:cs,
-                            cycle_end_at=:ce,
-                            updated_at=NOW()
-                        WHERE user_id=:user_id
-                        """
-                    ),
-                    {"user_id": int(user_id), "included": int(included), "cs": cycle_start, "ce": cycle_end},
-                )
-                _append_ledger(conn, user_id, "reset", "plan", int(included), int(included), int(booster), {"reason": "cycle_reset"})
-                return _wallet_payload(int(included), int(booster), cycle_start, cycle_end, allowance)
 
-            return _wallet_payload(int(included), int(booster), cs, ce, allowance)
+async def aget_wallet(user_id: int, plan: str) -> Dict[str, Any]:
+    """get_wallet() for async callers (asyncpg; thread fallback)."""
+    aeng = get_async_engine()
+    if aeng is None:
+        return await asyncio.to_thread(get_wallet, user_id, plan)
+    cached = await _acached_wallet(user_id, plan)
+    if cached is not None:
+        return cached
+    ensure_tables()
+
+    try:
+        ver = await account_cache.aversion(user_id)
+        async with aeng.begin() as conn:
+            row = (await conn.execute(text(_WALLET_SELECT_SQL), {"user_id": int(user_id)})).mappings().first()
+            payload, write = _wallet_step(row, user_id, plan)
+            if write is not None:
+                sql, params, ledger = write
+                await conn.execute(text(sql), params)
+                await _aappend_ledger(conn, user_id, *ledger)
+        return await _acache_wallet(user_id, ver, payload)
 
     except Exception:
-        logger.exception("get_wallet failed")
-        cs = now
-        ce = now + timedelta(days=cycle_days)
-        return _wallet_payload(allowance, 0, cs, ce, allowance)
+        logger.exception("aget_wallet failed")
+        return _default_wallet(plan)
 
 
 def consume_credits(user_id: int, plan: str, units: int, meta: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
@@ -287,81 +443,422 @@ def consume_credits(user_id: int, plan: str, units: int, meta: Optional[Dict[str
         return {"ok": True, "consumed": int(units), **w}
 
     meta = meta or {}
-    now = _now_utc()
 
     try:
         with eng.begin() as conn:
             # Ensure wallet exists and cycle is current
             _ = get_wallet(user_id, plan)
 
-            row = conn.execute(
-                text(
-                    """
-                    SELECT included_credits_balance, booster_credits_balance
-                    FROM credit_wallets
-                    WHERE user_id=:user_id
-                    FOR UPDATE
-                    """
-                ),
-                {"user_id": int(user_id)},
-            ).mappings().first()
+            row = conn.execute(text(_WALLET_LOCK_SQL), {"user_id": int(user_id)}).mappings().first()
+            params, ledger, result = _consume_step(row, user_id, units, meta)
 
-            if not row:
-                raise ValueError("WALLET_MISSING")
+            conn.execute(text(_WALLET_SET_BALANCES_SQL), params)
+            _append_ledger(conn, user_id, *ledger)
 
-            included = int(row.get("included_credits_balance") or 0)
-            booster = int(row.get("booster_credits_balance") or 0)
-            total = included + booster
+            # fetch cycle fields
+            cycle = conn.execute(text(_WALLET_CYCLE_SQL), {"user_id": int(user_id)}).mappings().first() or {}
+
+        account_cache.invalidate(user_id)
+        return {**result, "cycle_start_at": cycle.get("cycle_start_at"), "cycle_end_at": cycle.get("cycle_end_at")}
+    except ValueError:
+        raise
+    except Exception:
+        logger.exception("consume_credits failed")
+        # Fail-safe: do not block learning due to DB issue
+        w = get_wallet(user_id, plan)
+        return {"ok": True, "consumed": int(units), **w}
 
-            if total < int(units):
-                raise ValueError("INSUFFICIENT_CREDITS")
 
-            consume_from_included = min(included, int(units))
-            remaining = int(units) - consume_from_included
-            consume_from_booster = remaining
+async def aconsume_credits(user_id: int, plan: str, units: int, meta: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """consume_credits() for async callers (asyncpg; thread fallback)."""
+    aeng = get_async_engine()
+    if aeng is None:
+        return await asyncio.to_thread(consume_credits, user_id, plan, units, meta)
+    ensure_tables()
+    if units <= 0:
+        return {"ok": True, "consumed": 0, **(await aget_wallet(user_id, plan))}
 
-            included_after = included - consume_from_included
-            booster_after = booster - consume_from_booster
+    meta = meta or {}
 
-            conn.execute(
-                text(
-                    """
-                    UPDATE credit_wallets
-                    SET included_credits_balance=:included,
-                        booster_credits_balance=:booster,
-                        updated_at=NOW()
-                    WHERE user_id=:user_id
-                    """
-                ),
-                {"user_id": int(user_id), "included": int(included_after), "booster": int(booster_after)},
-            )
+    try:
+        # Ensure wallet exists and cycle is current
+        _ = await aget_wallet(user_id, plan)
 
-            meta2 = {**meta, "ts": now.isoformat(), "units": int(units), "from_included": int(consume_from_included), "from_booster": int(consume_from_booster)}
-            _append_ledger(conn, user_id, "consume", "ai", -int(units), int(included_after), int(booster_after), meta2)
+        async with aeng.begin() as conn:
+            row = (await conn.execute(text(_WALLET_LOCK_SQL), {"user_id": int(user_id)})).mappings().first()
+            params, ledger, result = _consume_step(row, user_id, units, meta)
 
-            # fetch cycle fields
-            cycle = conn.execute(
-                text("SELECT cycle_start_at, cycle_end_at FROM credit_wallets WHERE user_id=:user_id"),
-                {"user_id": int(user_id)},
-            ).mappings().first() or {}
+            await conn.execute(text(_WALLET_SET_BALANCES_SQL), params)
+            await _aappend_ledger(conn, user_id, *ledger)
 
-            return {
-                "ok": True,
-                "consumed": int(units),
-                "included_credits_balance": int(included_after),
-                "booster_credits_balance": int(booster_after),
-                "cycle_start_at": cycle.get("cycle_start_at"),
-                "cycle_end_at": cycle.get("cycle_end_at"),
-            }
+            cycle = (await conn.execute(text(_WALLET_CYCLE_SQL), {"user_id": int(user_id)})).mappings().first() or {}
+
+        await account_cache.ainvalidate(user_id)
+        return {**result, "cycle_start_at": cycle.get("cycle_start_at"), "cycle_end_at": cycle.get("cycle_end_at")}
     except ValueError:
         raise
     except Exception:
-        logger.exception("consume_credits failed")
+        logger.exception("aconsume_credits failed")
         # Fail-safe: do not block learning due to DB issue
-        w = get_wallet(user_id, plan)
+        w = await aget_wallet(user_id, plan)
         return {"ok": True, "consumed": int(units), **w}
 
 
+# -----------------------------
+# Reservations (admission hold -> settle)
+# -----------------------------
+
+# One statement: lock the wallet row, fold in the cycle reset, take `units`
+# (included first, then booster) and record the hold. `cur` always returns
+# the wallet when it exists; `upd` only when the balance covers the hold.
+_RESERVE_SQL = """
+    WITH cur AS (
+        SELECT user_id,
+               (cycle_start_at IS NULL OR cycle_end_at IS NULL OR cycle_end_at <= CAST(:now AS TIMESTAMPTZ)) AS reset,
+               CASE WHEN cycle_start_at IS NULL OR cycle_end_at IS NULL OR cycle_end_at <= CAST(:now AS TIMESTAMPTZ)
+                    THEN CAST(:allowance AS INTEGER)
+                    ELSE included_credits_balance END AS inc,
+               booster_credits_balance AS boo
+        FROM credit_wallets
+        WHERE user_id=:user_id
+        FOR UPDATE
+    ),
+    upd AS (
+        UPDATE credit_wallets w
+        SET included_credits_balance = cur.inc - LEAST(cur.inc, CAST(:units AS INTEGER)),
+            booster_credits_balance = cur.boo - (CAST(:units AS INTEGER) - LEAST(cur.inc, CAST(:units AS INTEGER))),
+            cycle_start_at = CASE WHEN cur.reset THEN CAST(:now AS TIMESTAMPTZ) ELSE w.cycle_start_at END,
+            cycle_end_at = CASE WHEN cur.reset THEN CAST(:cycle_end AS TIMESTAMPTZ) ELSE w.cycle_end_at END,
+            updated_at = NOW()
+        FROM cur
+        WHERE w.user_id = cur.user_id
+          AND cur.inc + cur.boo >= CAST(:units AS INTEGER)
+        RETURNING w.user_id, w.included_credits_balance, w.booster_credits_balance,
+                  w.cycle_start_at, w.cycle_end_at,
+                  LEAST(cur.inc, CAST(:units AS INTEGER)) AS from_included
+    ),
+    reset_ledger AS (
+        INSERT INTO credit_ledger(user_id, event_type, source, units, included_after, booster_after, meta_json)
+        SELECT cur.user_id, 'reset', 'plan', cur.inc, cur.inc, cur.boo, CAST(:reset_meta AS TEXT)
+        FROM cur JOIN upd ON upd.user_id = cur.user_id
+        WHERE cur.reset
+    ),
+    held AS (
+        INSERT INTO credit_reservations(reservation_id, user_id, units, from_included, from_booster, status, meta_json, expires_at)
+        SELECT CAST(:reservation_id AS TEXT), upd.user_id, CAST(:units AS INTEGER), upd.from_included,
+               CAST(:units AS INTEGER) - upd.from_included, 'held', CAST(:meta_json AS TEXT), CAST(:expires_at AS TIMESTAMPTZ)
+        FROM upd
+    )
+    SELECT cur.inc, cur.boo, upd.included_credits_balance, upd.booster_credits_balance,
+           upd.cycle_start_at, upd.cycle_end_at, upd.from_included
+    FROM cur LEFT JOIN upd ON upd.user_id = cur.user_id
+"""
+
+# One statement: close the hold, refund what was not used (to the bucket it
+# came from) and write the consume ledger row. A hold that is no longer
+# 'held' (settled twice, or already expired) matches nothing.
+_SETTLE_SQL = """
+    WITH r AS (
+        UPDATE credit_reservations
+        SET status = CAST(:status AS TEXT),
+            units_used = LEAST(units, CAST(:used AS INTEGER)),
+            settled_at = NOW()
+        WHERE reservation_id = CAST(:reservation_id AS TEXT) AND status = 'held'
+        RETURNING user_id, from_included, from_booster, units_used
+    ),
+    wal AS (
+        UPDATE credit_wallets w
+        SET included_credits_balance = w.included_credits_balance
+                + (r.from_included - LEAST(r.from_included, r.units_used)),
+            booster_credits_balance = w.booster_credits_balance
+                + (r.from_booster - (r.units_used - LEAST(r.from_included, r.units_used))),
+            updated_at = NOW()
+        FROM r
+        WHERE w.user_id = r.user_id
+        RETURNING w.user_id, w.included_credits_balance, w.booster_credits_balance,
+                  w.cycle_start_at, w.cycle_end_at,
+                  r.units_used AS consumed, LEAST(r.from_included, r.units_used) AS from_included
+    ),
+    l AS (
+        INSERT INTO credit_ledger(user_id, event_type, source, units, included_after, booster_after, meta_json)
+        SELECT user_id, 'consume', 'ai', -consumed, included_credits_balance, booster_credits_balance,
+               CAST(CAST(:meta_json AS JSONB) || jsonb_build_object(
+                   'units', consumed,
+                   'from_included', from_included,
+                   'from_booster', consumed - from_included
+               ) AS TEXT)
+        FROM wal
+        WHERE consumed > 0
+    )
+    SELECT * FROM wal
+"""
+
+# Holds whose request died without settling (worker killed, client gone
+# before the finally ran). SKIP LOCKED lets every worker run the sweep.
+_EXPIRE_SQL = """
+    WITH r AS (
+        UPDATE credit_reservations
+        SET status = 'expired', units_used = 0, settled_at = NOW()
+        WHERE id IN (
+            SELECT id FROM credit_reservations
+            WHERE status = 'held' AND expires_at < NOW()
+            ORDER BY expires_at
+            LIMIT :limit
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING user_id, from_included, from_booster
+    ),
+    agg AS (
+        SELECT user_id, SUM(from_included) AS inc, SUM(from_booster) AS boo, COUNT(*) AS n
+        FROM r
+        GROUP BY user_id
+    ),
+    wal AS (
+        UPDATE credit_wallets w
+        SET included_credits_balance = w.included_credits_balance + agg.inc,
+            booster_credits_balance = w.booster_credits_balance + agg.boo,
+            updated_at = NOW()
+        FROM agg
+        WHERE w.user_id = agg.user_id
+        RETURNING w.user_id
+    )
+    SELECT user_id, n FROM agg
+"""
+
+_PURGE_RESERVATIONS_SQL = """
+    DELETE FROM credit_reservations
+    WHERE status <> 'held' AND created_at < NOW() - make_interval(days => :days)
+"""
+
+
+def _new_reservation_id() -> str:
+    return uuid.uuid4().hex
+
+
+def _reserve_params(reservation_id: str, user_id: int, plan: str, units: int, meta: Dict[str, Any], ttl_s: Optional[int]) -> Dict[str, Any]:
+    now = _now_utc()
+    ttl = int(ttl_s if ttl_s is not None else CREDIT_RESERVATION_TTL_SECONDS)
+    return {
+        "reservation_id": reservation_id,
+        "user_id": int(user_id),
+        "units": int(units),
+        "allowance": int(_included_allowance(plan)),
+        "now": now,
+        "cycle_end": now + timedelta(days=_cycle_length_days()),
+        "expires_at": now + timedelta(seconds=max(1, ttl)),
+        "reset_meta": json.dumps({"reason": "cycle_reset"}),
+        "meta_json": json.dumps(meta or {}, ensure_ascii=False),
+    }
+
+
+def _reserve_result(row: Optional[Dict[str, Any]], reservation_id: str, units: int, plan: str) -> Optional[Dict[str, Any]]:
+    """None: wallet missing. Raises ValueError when the balance can't cover `units`."""
+    if not row:
+        return None
+    if row.get("included_credits_balance") is None:
+        raise ValueError("INSUFFICIENT_CREDITS")
+    from_included = int(row.get("from_included") or 0)
+    return {
+        "ok": True,
+        "reservation_id": reservation_id,
+        "reserved": int(units),
+        "from_included": from_included,
+        "from_booster": int(units) - from_included,
+        **_wallet_payload(
+            int(row["included_credits_balance"]),
+            int(row.get("booster_credits_balance") or 0),
+            row.get("cycle_start_at"),
+            row.get("cycle_end_at"),
+            _included_allowance(plan),
+        ),
+    }
+
+
+def _unreserved(user_id: int, plan: str, units: int) -> Dict[str, Any]:
+    # DB missing: allow but don't track (same policy as consume_credits)
+    return {"ok": True, "reservation_id": None, "reserved": int(units), **_default_wallet(plan)}
+
+
+def reserve_credits(
+    user_id: int,
+    plan: str,
+    units: int,
+    meta: Optional[Dict[str, Any]] = None,
+    ttl_s: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Hold `units` credits for an in-flight request.
+
+    Returns the post-hold wallet plus `reservation_id` (None when the DB is
+    unavailable: the request goes through untracked). Raises ValueError on
+    insufficient credits. Pair with settle_reservation / release_reservation.
+    """
+    ensure_tables()
+    eng = payments_store.get_engine_safe()
+    if eng is None or int(units) <= 0:
+        return _unreserved(user_id, plan, units)
+
+    rid = _new_reservation_id()
+    try:
+        for _ in range(2):
+            with eng.begin() as conn:
+                row = conn.execute(
+                    text(_RESERVE_SQL), _reserve_params(rid, user_id, plan, units, meta or {}, ttl_s)
+                ).mappings().first()
+            out = _reserve_result(row, rid, units, plan)
+            if out is not None:
+                account_cache.invalidate(user_id)
+                return out
+            # First paid request for this user: create the wallet, then retry once
+            get_wallet(user_id, plan)
+        raise RuntimeError("wallet missing after create")
+    except ValueError:
+        raise
+    except Exception:
+        logger.exception("reserve_credits failed")
+        return _unreserved(user_id, plan, units)
+
+
+async def areserve_credits(
+    user_id: int,
+    plan: str,
+    units: int,
+    meta: Optional[Dict[str, Any]] = None,
+    ttl_s: Optional[int] = None,
+) -> Dict[str, Any]:
+    """reserve_credits() for async callers (asyncpg; thread fallback)."""
+    aeng = get_async_engine()
+    if aeng is None:
+        return await asyncio.to_thread(reserve_credits, user_id, plan, units, meta, ttl_s)
+    ensure_tables()
+    if int(units) <= 0:
+        return _unreserved(user_id, plan, units)
+
+    rid = _new_reservation_id()
+    try:
+        for _ in range(2):
+            async with aeng.begin() as conn:
+                row = (
+                    await conn.execute(text(_RESERVE_SQL), _reserve_params(rid, user_id, plan, units, meta or {}, ttl_s))
+                ).mappings().first()
+            out = _reserve_result(row, rid, units, plan)
+            if out is not None:
+                await account_cache.ainvalidate(user_id)
+                return out
+            await aget_wallet(user_id, plan)
+        raise RuntimeError("wallet missing after create")
+    except ValueError:
+        raise
+    except Exception:
+        logger.exception("areserve_credits failed")
+        return _unreserved(user_id, plan, units)
+
+
+def _settle_params(reservation_id: str, used_units: int, meta: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    used = max(0, int(used_units or 0))
+    return {
+        "reservation_id": str(reservation_id),
+        "used": used,
+        "status": "committed" if used > 0 else "released",
+        "meta_json": json.dumps({**(meta or {}), "ts": _now_utc().isoformat(), "reservation_id": str(reservation_id)}, ensure_ascii=False),
+    }
+
+
+def _settle_result(row: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    if not row:
+        # Already settled, or the sweeper expired it first: nothing charged here
+        return {"ok": False, "consumed": 0}
+    return {
+        "ok": True,
+        "consumed": int(row.get("consumed") or 0),
+        "included_credits_balance": int(row.get("included_credits_balance") or 0),
+        "booster_credits_balance": int(row.get("booster_credits_balance") or 0),
+        "cycle_start_at": row.get("cycle_start_at"),
+        "cycle_end_at": row.get("cycle_end_at"),
+    }
+
+
+def settle_reservation(reservation_id: Optional[str], used_units: int, meta: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Charge `used_units` (capped at the hold) and refund the rest.
+
+    `ok` is False when there was nothing to settle (no reservation id, the
+    hold was already settled or expired, or the DB failed).
+    """
+    if not reservation_id:
+        return {"ok": False, "consumed": 0}
+    ensure_tables()
+    eng = payments_store.get_engine_safe()
+    if eng is None:
+        return {"ok": False, "consumed": 0}
+    try:
+        with eng.begin() as conn:
+            row = conn.execute(text(_SETTLE_SQL), _settle_params(reservation_id, used_units, meta)).mappings().first()
+        if row:
+            account_cache.invalidate(int(row["user_id"]))
+        return _settle_result(row)
+    except Exception:
+        logger.exception("settle_reservation failed")
+        return {"ok": False, "consumed": 0}
+
+
+async def asettle_reservation(reservation_id: Optional[str], used_units: int, meta: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """settle_reservation() for async callers (asyncpg; thread fallback)."""
+    if not reservation_id:
+        return {"ok": False, "consumed": 0}
+    aeng = get_async_engine()
+    if aeng is None:
+        return await asyncio.to_thread(settle_reservation, reservation_id, used_units, meta)
+    ensure_tables()
+    try:
+        async with aeng.begin() as conn:
+            row = (await conn.execute(text(_SETTLE_SQL), _settle_params(reservation_id, used_units, meta))).mappings().first()
+        if row:
+            await account_cache.ainvalidate(int(row["user_id"]))
+        return _settle_result(row)
+    except Exception:
+        logger.exception("asettle_reservation failed")
+        return {"ok": False, "consumed": 0}
+
+
+def release_reservation(reservation_id: Optional[str], meta: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Give the whole hold back (request failed or produced nothing)."""
+    return settle_reservation(reservation_id, 0, meta)
+
+
+async def arelease_reservation(reservation_id: Optional[str], meta: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    return await asettle_reservation(reservation_id, 0, meta)
+
+
+def release_expired_reservations(limit: int = 500) -> Dict[str, Any]:
+    """Release holds past expires_at. Safe to run from every worker."""
+    ensure_tables()
+    eng = payments_store.get_engine_safe()
+    if eng is None:
+        return {"released": 0, "users": 0}
+    try:
+        with eng.begin() as conn:
+            rows = conn.execute(text(_EXPIRE_SQL), {"limit": int(limit)}).mappings().all()
+        for r in rows:
+            account_cache.invalidate(int(r["user_id"]))
+        return {"released": sum(int(r["n"]) for r in rows), "users": len(rows)}
+    except Exception:
+        logger.exception("release_expired_reservations failed")
+        return {"released": 0, "users": 0}
+
+
+def purge_reservations(days: int = 7) -> int:
+    """Delete settled/expired holds older than `days` (the ledger keeps the charge)."""
+    ensure_tables()
+    eng = payments_store.get_engine_safe()
+    if eng is None:
+        return 0
+    try:
+        with eng.begin() as conn:
+            return int(conn.execute(text(_PURGE_RESERVATIONS_SQL), {"days": int(days)}).rowcount or 0)
+    except Exception:
+        logger.exception("purge_reservations failed")
+        return 0
+
+
 def grant_booster_credits(user_id: int, plan: str, units: int, meta: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     ensure_tables()
     eng = payments_store.get_engine_safe()
@@ -405,13 +902,15 @@ def grant_booster_credits(user_id: int, plan: str, units: int, meta: Optional[Di
                 text("SELECT cycle_start_at, cycle_end_at FROM credit_wallets WHERE user_id=:user_id"),
                 {"user_id": int(user_id)},
             ).mappings().first() or {}
-            return {
+            out = {
                 "ok": True,
                 "included_credits_balance": int(included),
                 "booster_credits_balance": int(booster_after),
                 "cycle_start_at": cycle.get("cycle_start_at"),
                 "cycle_end_at": cycle.get("cycle_end_at"),
             }
+        account_cache.invalidate(user_id)
+        return out
     except Exception:
         logger.exception("grant_booster_credits failed")
         return {"ok": True, **get_wallet(user_id, plan)}
@@ -473,12 +972,13 @@ def reset_included_credits(user_id: int, plan: str, reason: str = "plan_change")
             )
             _append_ledger(conn, user_id, "reset", "plan", int(allowance), int(allowance), int(booster), {"reason": reason})
 
-            return {
-                "included_credits_balance": int(allowance),
-                "booster_credits_balance": int(booster),
-                "cycle_start_at": cs,
-                "cycle_end_at": ce,
-            }
+        account_cache.invalidate(user_id)
+        return {
+            "included_credits_balance": int(allowance),
+            "booster_credits_balance": int(booster),
+            "cycle_start_at": cs,
+            "cycle_end_at": ce,
+        }
     except Exception:
         logger.exception("reset_included_credits failed")
         return get_wallet(user_id, plan)
@@ -534,6 +1034,18 @@ def get_booster_pack(sku: str) -> Optional[Dict[str, Any]]:
         return None
 
 
+def _ledger_params(user_id: int, event_type: str, source: str, units: int, included_after: int, booster_after: int, meta: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "user_id": int(user_id),
+        "event_type": str(event_type),
+        "source": str(source),
+        "units": int(units),
+        "included_after": int(included_after),
+        "booster_after": int(booster_after),
+        "meta_json": json.dumps(meta or {}, ensure_ascii=False),
+    }
+
+
 def _append_ledger(conn, user_id: int, event_type: str, source: str, units: int, included_after: int, booster_after: int, meta: Dict[str, Any]) -> None:
     """Best-effort credit ledger write.
 
@@ -546,22 +1058,21 @@ def _append_ledger(conn, user_id: int, event_type: str, source: str, units: int,
         # If the ledger insert fails, only the savepoint is rolled back.
         with conn.begin_nested():
             conn.execute(
-                text(
-                    """
-                    INSERT INTO credit_ledger(user_id, event_type, source, units, included_after, booster_after, meta_json)
-                    VALUES (:user_id, :event_type, :source, :units, :included_after, :booster_after, :meta_json)
-                    """
-                ),
-                {
-                    "user_id": int(user_id),
-                    "event_type": str(event_type),
-                    "source": str(source),
-                    "units": int(units),
-                    "included_after": int(included_after),
-                    "booster_after": int(booster_after),
-                    "meta_json": json.dumps(meta or {}, ensure_ascii=False),
-                },
+                text(_LEDGER_INSERT_SQL),
+                _ledger_params(user_id, event_type, source, units, included_after, booster_after, meta),
             )
     except Exception:
         # ledger must never break business flow
         logger.debug("credit ledger append failed (ignored)", exc_info=True)
+
+
+async def _aappend_ledger(conn, user_id: int, event_type: str, source: str, units: int, included_after: int, booster_after: int, meta: Dict[str, Any]) -> None:
+    """Async twin of _append_ledger (same SAVEPOINT isolation)."""
+    try:
+        async with conn.begin_nested():
+            await conn.execute(
+                text(_LEDGER_INSERT_SQL),
+                _ledger_params(user_id, event_type, source, units, included_after, booster_after, meta),
+            )
+    except Exception:
+        logger.debug("credit ledger append failed (ignored)", exc_info=True)
@@ -103,6 +103,39 @@ CLAUDE_API_KEY = _env("CLAUDE_API_KEY", _env("ANTHROPIC_API_KEY", ""))
 CLAUDE_MODEL = _env("CLAUDE_MODEL", _env("CLAUDE_PRIMARY_MODEL", "claude-3-5-sonnet-latest"))
 CLAUDE_WRITER_MODEL = _env("CLAUDE_WRITER_MODEL", _env("CLAUDE_DEEP_MODEL", CLAUDE_MODEL))
 
+# Writer hedging: if the writer hasn't answered by its observed p90 latency
+# (WRITER_HEDGE_DELAY_S until enough samples), a backup call goes to the next
+# model; first valid JSON wins. The difficulty timeout is the overall budget.
+WRITER_HEDGE_ENABLED = _env_bool("WRITER_HEDGE_ENABLED", True)
+WRITER_HEDGE_DELAY_S = _env_float("WRITER_HEDGE_DELAY_S", 12.0)
+WRITER_HEDGE_MIN_DELAY_S = _env_float("WRITER_HEDGE_MIN_DELAY_S", 2.0)
+WRITER_HEDGE_QUANTILE = _env_float("WRITER_HEDGE_QUANTILE", 0.9)
+
+# Adaptive timeouts: once a model (and answer mode) has enough samples in
+# its latency histogram, its timeout is quantile x factor, clamped; until
+# then the difficulty buckets apply. Histograms cover 1-2 windows.
+LATENCY_HISTOGRAM_WINDOW_S = _env_int("LATENCY_HISTOGRAM_WINDOW_S", 900)
+ADAPTIVE_TIMEOUT_ENABLED = _env_bool("ADAPTIVE_TIMEOUT_ENABLED", True)
+ADAPTIVE_TIMEOUT_QUANTILE = _env_float("ADAPTIVE_TIMEOUT_QUANTILE", 0.99)
+ADAPTIVE_TIMEOUT_FACTOR = _env_float("ADAPTIVE_TIMEOUT_FACTOR", 1.5)
+ADAPTIVE_TIMEOUT_MIN_S = _env_int("ADAPTIVE_TIMEOUT_MIN_S", 8)
+ADAPTIVE_TIMEOUT_MAX_S = _env_int("ADAPTIVE_TIMEOUT_MAX_S", 120)
+ADAPTIVE_TIMEOUT_MIN_SAMPLES = _env_int("ADAPTIVE_TIMEOUT_MIN_SAMPLES", 50)
+
+# Pipelined verification (competitive HARD/EXTREME): sections are verified
+# while the writer streams and only flagged sections are regenerated.
+# Sections go to the verifier in groups of PIPELINED_VERIFY_GROUP_SIZE (one
+# call per group), so a long answer costs a few calls, not one per section.
+PIPELINED_VERIFY_ENABLED = _env_bool("PIPELINED_VERIFY_ENABLED", True)
+PIPELINED_VERIFY_CONCURRENCY = _env_int("PIPELINED_VERIFY_CONCURRENCY", 4)
+PIPELINED_VERIFY_GROUP_SIZE = _env_int("PIPELINED_VERIFY_GROUP_SIZE", 3)
+# Verifier verdicts, keyed by a hash of the draft and its context; a
+# draft identical to one already checked skips the verifier call.
+VERDICT_CACHE_ENABLED = _env_bool("VERDICT_CACHE_ENABLED", True)
+VERDICT_CACHE_TTL_SECONDS = _env_int("VERDICT_CACHE_TTL_SECONDS", 30 * 86400)
+VERDICT_L1_MAX_BYTES = _env_int("VERDICT_L1_MAX_BYTES", 4 * 1024 * 1024)
+VERDICT_L1_TTL_SECONDS = _env_int("VERDICT_L1_TTL_SECONDS", 3600)
+
 # Confidence / output shaping (safe defaults)
 LOW_CONFIDENCE_THRESHOLD = _env_float("LOW_CONFIDENCE_THRESHOLD", 0.35)
 MAX_STEPS = _env_int("MAX_STEPS", 12)
@@ -120,8 +153,115 @@ RATE_LIMIT_BURST = _env_int("RATE_LIMIT_BURST", 10)
 # -----------------------------
 # cache / redis (names expected by repo)
 # -----------------------------
+# SOLVE_CACHE_TTL_SECONDS is the soft TTL (fresh); stale answers are served
+# and refreshed in the background until the hard TTL.
 SOLVE_CACHE_TTL_SECONDS = _env_int("SOLVE_CACHE_TTL_SECONDS", 3600)
+SOLVE_CACHE_HARD_TTL_SECONDS = _env_int("SOLVE_CACHE_HARD_TTL_SECONDS", 6 * 3600)
+SOLVE_CACHE_XFETCH_BETA = _env_float("SOLVE_CACHE_XFETCH_BETA", 1.0)
+# near-duplicate question matching (SimHash); off until tuned on real traffic
+SEMANTIC_CACHE_ENABLED = _env_bool("SEMANTIC_CACHE_ENABLED", False)
+SEMANTIC_CACHE_MAX_HAMMING = _env_int("SEMANTIC_CACHE_MAX_HAMMING", 3)
+SEMANTIC_CACHE_MIN_TOKENS = _env_int("SEMANTIC_CACHE_MIN_TOKENS", 3)
+# in-process tier in front of Redis (per uvicorn worker)
+SOLVE_L1_MAX_BYTES = _env_int("SOLVE_L1_MAX_BYTES", 32 * 1024 * 1024)
+SOLVE_L1_TTL_SECONDS = _env_int("SOLVE_L1_TTL_SECONDS", 600)
 REDIS_URL = _env("REDIS_URL", _env("REDIS_TLS_URL", ""))
+# Redis client: fail fast instead of stalling requests on a slow Redis.
+# Timeouts are per command; pools are per worker (one text, one bytes).
+REDIS_CONNECT_TIMEOUT_S = _env_float("REDIS_CONNECT_TIMEOUT_S", 0.5)
+REDIS_SOCKET_TIMEOUT_S = _env_float("REDIS_SOCKET_TIMEOUT_S", 1.0)
+REDIS_MAX_CONNECTIONS = _env_int("REDIS_MAX_CONNECTIONS", 64)
+# Wait at most this long for a free pooled connection
+REDIS_POOL_TIMEOUT_S = _env_float("REDIS_POOL_TIMEOUT_S", 0.25)
+REDIS_HEALTH_CHECK_INTERVAL_S = _env_int("REDIS_HEALTH_CHECK_INTERVAL_S", 30)
+# Circuit breaker: after N consecutive connection/timeout errors every Redis
+# call is skipped (treated as "Redis disabled") for the cool-down.
+REDIS_CB_FAILURE_THRESHOLD = _env_int("REDIS_CB_FAILURE_THRESHOLD", 5)
+REDIS_CB_COOLDOWN_S = _env_float("REDIS_CB_COOLDOWN_S", 10.0)
+# packed values (solve cache, idempotency): compress above this size
+REDIS_CODEC_COMPRESS_MIN_BYTES = _env_int("REDIS_CODEC_COMPRESS_MIN_BYTES", 1024)
+REDIS_CODEC_ZSTD_LEVEL = _env_int("REDIS_CODEC_ZSTD_LEVEL", 3)
+
+# single-flight: coalesce identical in-flight solves across workers.
+# The leader renews its lease every third of SINGLEFLIGHT_LEASE_SECONDS while
+# it works, for at most SINGLEFLIGHT_HOLD_MAX_SECONDS: the writer chain, the
+# verifier and one repair can each take up to ADAPTIVE_TIMEOUT_MAX_S.
+SINGLEFLIGHT_LEASE_SECONDS = _env_int("SINGLEFLIGHT_LEASE_SECONDS", 90)
+SINGLEFLIGHT_HOLD_MAX_SECONDS = 3 * ADAPTIVE_TIMEOUT_MAX_S + 120
+SINGLEFLIGHT_RESULT_SECONDS = _env_int("SINGLEFLIGHT_RESULT_SECONDS", 60)
+SINGLEFLIGHT_WAIT_SECONDS = _env_int("SINGLEFLIGHT_WAIT_SECONDS", 90)
+
+# client request_id idempotency: the lock is renewed while the owner works;
+# duplicates wait (up to IDEMPOTENCY_WAIT_SECONDS) for the stored response.
+IDEMPOTENCY_LOCK_SECONDS = _env_int("IDEMPOTENCY_LOCK_SECONDS", 30)
+IDEMPOTENCY_WAIT_SECONDS = _env_int("IDEMPOTENCY_WAIT_SECONDS", 90)
+IDEMPOTENCY_RESULT_SECONDS = _env_int("IDEMPOTENCY_RESULT_SECONDS", 600)
+
+
+# -----------------------------
+# schema readiness (schema_ready.py)
+# -----------------------------
+# A failed DDL run is retried at most this often (not on every request).
+SCHEMA_RETRY_SECONDS = _env_int("SCHEMA_RETRY_SECONDS", 30)
+
+
+# -----------------------------
+# auth session cache (auth_store.session_user)
+# -----------------------------
+# Per-worker tier, then Redis (0 disables the Redis tier). Expiry is always
+# checked against the session's own expires_at; logout invalidates both.
+AUTH_SESSION_CACHE_TTL_SECONDS = _env_int("AUTH_SESSION_CACHE_TTL_SECONDS", 60)
+AUTH_SESSION_CACHE_MAX_BYTES = _env_int("AUTH_SESSION_CACHE_MAX_BYTES", 4 * 1024 * 1024)
+AUTH_SESSION_REDIS_TTL_SECONDS = _env_int("AUTH_SESSION_REDIS_TTL_SECONDS", 300)
+# sessions.last_seen_at is written at most once per interval per session
+AUTH_SESSION_TOUCH_SECONDS = _env_int("AUTH_SESSION_TOUCH_SECONDS", 300)
+
+
+# -----------------------------
+# subscription / wallet snapshots (account_cache)
+# -----------------------------
+# Per-worker tier, then Redis (0 disables the Redis tier). Every billing and
+# subscription write bumps a per-user version, so these are upper bounds.
+ACCOUNT_CACHE_TTL_SECONDS = _env_int("ACCOUNT_CACHE_TTL_SECONDS", 30)
+ACCOUNT_CACHE_MAX_BYTES = _env_int("ACCOUNT_CACHE_MAX_BYTES", 4 * 1024 * 1024)
+ACCOUNT_CACHE_REDIS_TTL_SECONDS = _env_int("ACCOUNT_CACHE_REDIS_TTL_SECONDS", 600)
+
+
+# -----------------------------
+# event ingestion (/events/track, /events/batch)
+# -----------------------------
+EVENTS_BATCH_MAX_ITEMS = _env_int("EVENTS_BATCH_MAX_ITEMS", 200)
+# Client timestamps older than this (or in the future) are replaced by server time.
+EVENTS_CLIENT_TS_MAX_AGE_SECONDS = _env_int("EVENTS_CLIENT_TS_MAX_AGE_SECONDS", 24 * 3600)
+# Redis fallback only; with a DB the unique index dedupes.
+EVENTS_DEDUPE_TTL_SECONDS = _env_int("EVENTS_DEDUPE_TTL_SECONDS", 24 * 3600)
+# Only used once events is partitioned (python events_maintenance.py partition):
+# partitions created ahead, and raw-event retention in months (0 = keep all).
+EVENTS_PARTITION_MONTHS_AHEAD = _env_int("EVENTS_PARTITION_MONTHS_AHEAD", 3)
+EVENTS_RETENTION_MONTHS = _env_int("EVENTS_RETENTION_MONTHS", 0)
+
+
+# -----------------------------
+# write-behind (telemetry/history inserts)
+# -----------------------------
+WRITE_BEHIND_BATCH_ROWS = _env_int("WRITE_BEHIND_BATCH_ROWS", 200)
+WRITE_BEHIND_FLUSH_MS = _env_int("WRITE_BEHIND_FLUSH_MS", 500)
+WRITE_BEHIND_MAX_ROWS = _env_int("WRITE_BEHIND_MAX_ROWS", 20000)
+
+
+# -----------------------------
+# credit reservations (solve admission holds)
+# -----------------------------
+# A hold must outlive the slowest solve: the writer chain (hedged, one
+# deadline), the verifier and one repair can each take up to
+# ADAPTIVE_TIMEOUT_MAX_S, plus admission and streaming overhead. Shorter
+# values are raised to that floor; a hold that still expires is charged
+# directly when the solve settles.
+CREDIT_RESERVATION_TTL_SECONDS = max(
+    _env_int("CREDIT_RESERVATION_TTL_SECONDS", 900),
+    3 * ADAPTIVE_TIMEOUT_MAX_S + 120,
+)
+CREDIT_RESERVATION_SWEEP_SECONDS = _env_int("CREDIT_RESERVATION_SWEEP_SECONDS", 60)
 
 
 # -----------------------------
@@ -129,6 +269,17 @@ REDIS_URL = _env("REDIS_URL", _env("REDIS_TLS_URL", ""))
 # -----------------------------
 CB_FAILURE_THRESHOLD = _env_int("CB_FAILURE_THRESHOLD", 3)
 CB_COOLDOWN_S = _env_int("CB_COOLDOWN_S", 20)
+# Per (provider, model) breakers for the orchestrator (model_health.py),
+# shared across workers through Redis. Error rate and latency are EWMAs.
+MODEL_HEALTH_ENABLED = _env_bool("MODEL_HEALTH_ENABLED", True)
+MODEL_HEALTH_EWMA_ALPHA = _env_float("MODEL_HEALTH_EWMA_ALPHA", 0.2)
+MODEL_HEALTH_REFRESH_S = _env_float("MODEL_HEALTH_REFRESH_S", 2.0)
+MODEL_CB_ERROR_RATE = _env_float("MODEL_CB_ERROR_RATE", 0.5)
+MODEL_CB_MIN_SAMPLES = _env_int("MODEL_CB_MIN_SAMPLES", 10)
+# MIN_SAMPLES counts calls in the current window, not since the model was first seen
+MODEL_CB_WINDOW_S = _env_int("MODEL_CB_WINDOW_S", 300)
+MODEL_CB_CONSECUTIVE_FAILURES = _env_int("MODEL_CB_CONSECUTIVE_FAILURES", CB_FAILURE_THRESHOLD)
+MODEL_CB_COOLDOWN_S = _env_float("MODEL_CB_COOLDOWN_S", float(CB_COOLDOWN_S))
 
 
 # -----------------------------
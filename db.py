@@ -9,14 +9,19 @@ PHASE-1C / C-1 hardening:
 
 from __future__ import annotations
 
+import asyncio
 import os
 import logging
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 from sqlalchemy import text
 from sqlalchemy.engine import Engine
 from sqlalchemy.exc import SQLAlchemyError
 from shared_engine import get_engine, db_health  # noqa: F401
+from shared_engine import get_async_engine
+
+import schema_ready
+import write_behind
 
 
 logger = logging.getLogger(__name__)
@@ -77,11 +82,17 @@ def _get_engine():
 
 
 def db_init() -> Dict[str, Any]:
-    """Create DB tables used by the API (best-effort)."""
+    """Create DB tables used by the API (best-effort, once per process)."""
     engine = _get_engine()
     if engine is None:
         return {"ok": True, "enabled": False, "reason": "DB disabled or DATABASE_URL missing/invalid"}
+    if schema_ready.ensure("db", _create_tables):
+        return {"ok": True, "enabled": True}
+    st = schema_ready.status()["modules"].get("db") or {}
+    return {"ok": False, "enabled": True, "reason": st.get("error") or "schema not ready"}
 
+
+def _create_tables(conn) -> None:
     create_ask_logs_sql = """
     CREATE TABLE IF NOT EXISTS ask_logs (
         id SERIAL PRIMARY KEY,
@@ -158,29 +169,24 @@ def db_init() -> Dict[str, Any]:
     );
     """
 
-    try:
-        with engine.begin() as conn:
-            conn.execute(text(create_ask_logs_sql))
-            conn.execute(text(create_ai_usage_sql))
-            conn.execute(text(create_chat_history_sql))
-            conn.execute(text(create_learning_memory_sql))
-        # FIX: Add critical missing indexes for scale
-        indexes = [
-            "CREATE INDEX IF NOT EXISTS idx_ask_logs_created ON ask_logs(created_at DESC);",
-            "CREATE INDEX IF NOT EXISTS idx_chat_history_user ON chat_history(user_id, created_at DESC);",
-            "CREATE INDEX IF NOT EXISTS idx_ai_usage_user_created ON ai_usage_logs(user_id, created_at DESC);",
-            "CREATE INDEX IF NOT EXISTS idx_ai_usage_created ON ai_usage_logs(created_at DESC);",
-            "CREATE INDEX IF NOT EXISTS idx_learning_memory_user ON learning_memory_cards(user_id);",
-        ]
-        for idx_sql in indexes:
-            try:
+    conn.execute(text(create_ask_logs_sql))
+    conn.execute(text(create_ai_usage_sql))
+    conn.execute(text(create_chat_history_sql))
+    conn.execute(text(create_learning_memory_sql))
+    # FIX: Add critical missing indexes for scale
+    indexes = [
+        "CREATE INDEX IF NOT EXISTS idx_ask_logs_created ON ask_logs(created_at DESC);",
+        "CREATE INDEX IF NOT EXISTS idx_chat_history_user ON chat_history(user_id, created_at DESC);",
+        "CREATE INDEX IF NOT EXISTS idx_ai_usage_user_created ON ai_usage_logs(user_id, created_at DESC);",
+        "CREATE INDEX IF NOT EXISTS idx_ai_usage_created ON ai_usage_logs(created_at DESC);",
+        "CREATE INDEX IF NOT EXISTS idx_learning_memory_user ON learning_memory_cards(user_id);",
+    ]
+    for idx_sql in indexes:
+        try:
+            with conn.begin_nested():
                 conn.execute(text(idx_sql))
-            except Exception:
-                pass  # Index creation is best-effort
-        return {"ok": True, "enabled": True}
-    except Exception as e:
-        logger.exception("db_init failed")
-        return {"ok": False, "enabled": True, "reason": str(e)}
+        except Exception:
+            pass  # Index creation is best-effort
 
 
 def db_cleanup_expired():
@@ -254,6 +260,84 @@ def _coerce_mapping(obj: Any) -> Dict[str, Any]:
         return {}
 
 
+# -----------------------------
+# Batched inserts (write-behind)
+# -----------------------------
+
+_INSERT_COLUMNS: Dict[str, Tuple[str, ...]] = {
+    "ask_logs": ("board", "class_level", "subject", "question", "answer", "latency_ms", "error"),
+    "ai_usage_logs": (
+        "user_id", "role", "plan",
+        "request_type", "credit_bucket", "credits_charged",
+        "model_primary", "model_escalated", "cache_hit",
+        "tokens_in", "tokens_out", "estimated_cost_usd", "estimated_cost_inr",
+        "latency_ms", "status", "question_len", "answer_len", "error",
+    ),
+    "chat_history": ("user_id", "surface", "question", "learning_object_json", "mode", "language"),
+    # phase1_store events (/events/track, /events/batch)
+    "events": ("user_id", "event_type", "meta_json", "duration_sec", "value_num", "client_event_id", "created_at"),
+}
+
+# Appended to the INSERT; client retries of the same event are dropped here.
+# No conflict target: the dedupe index is (user_id, client_event_id), or
+# (user_id, client_event_id, created_at) once events is partitioned.
+_INSERT_SUFFIX: Dict[str, str] = {
+    "events": " ON CONFLICT DO NOTHING",
+}
+
+# Postgres only: the INSERT runs inside this statement ({insert}).
+# New events bump phase1_store's daily rollups in the same statement;
+# RETURNING only yields rows that were really inserted, so deduped
+# retries are not counted twice.
+_INSERT_WRAP: Dict[str, str] = {
+    "events": """
+        WITH ins AS (
+            {insert}
+            RETURNING user_id, event_type, created_at, duration_sec, value_num
+        )
+        INSERT INTO event_rollups_daily AS r
+            (user_id, day, event_type, count, duration_sum, value_sum, value_count, updated_at)
+        SELECT user_id, (created_at AT TIME ZONE 'UTC')::date, event_type,
+               COUNT(*), COALESCE(SUM(duration_sec), 0), COALESCE(SUM(value_num), 0), COUNT(value_num), NOW()
+        FROM ins
+        GROUP BY 1, 2, 3
+        ON CONFLICT (user_id, day, event_type) DO UPDATE SET
+            count = r.count + EXCLUDED.count,
+            duration_sum = r.duration_sum + EXCLUDED.duration_sum,
+            value_sum = r.value_sum + EXCLUDED.value_sum,
+            value_count = r.value_count + EXCLUDED.value_count,
+            updated_at = NOW()
+    """,
+}
+
+_INSERT_CHUNK_ROWS = 500
+
+
+def db_insert_rows(table: str, rows: List[Dict[str, Any]]) -> None:
+    """Multi-row INSERT (one statement per 500 rows). Raises on DB errors.
+
+    Used by write_behind for batches and by the db_* loggers inline.
+    """
+    engine = _get_engine()
+    if engine is None or not rows:
+        return
+    cols = _INSERT_COLUMNS[table]
+    suffix = _INSERT_SUFFIX.get(table, "")
+    with engine.begin() as conn:
+        wrap = _INSERT_WRAP.get(table) if conn.dialect.name == "postgresql" else None
+        for start in range(0, len(rows), _INSERT_CHUNK_ROWS):
+            values = []
+            params: Dict[str, Any] = {}
+            for i, row in enumerate(rows[start:start + _INSERT_CHUNK_ROWS]):
+                values.append("(" + ", ".join(f":{c}_{i}" for c in cols) + ")")
+                for c in cols:
+                    params[f"{c}_{i}"] = row.get(c)
+            sql = f"INSERT INTO {table} ({', '.join(cols)}) VALUES {', '.join(values)}{suffix}"
+            if wrap:
+                sql = wrap.replace("{insert}", sql)
+            conn.execute(text(sql), params)
+
+
 def db_log_solve(req: Any, out: Any, latency_ms: int, error: Optional[str]) -> None:
     """Best-effort insert into ask_logs. Never raises."""
     engine = _get_engine()
@@ -273,25 +357,20 @@ def db_log_solve(req: Any, out: Any, latency_ms: int, error: Optional[str]) -> N
     answer = out_d.get("answer") or out_d.get("text") or out_d.get("output") or ""
     answer = answer if isinstance(answer, str) else str(answer)
 
-    insert_sql = """
-    INSERT INTO ask_logs (board, class_level, subject, question, answer, latency_ms, error)
-    VALUES (:board, :class_level, :subject, :question, :answer, :latency_ms, :error);
-    """
+    row = {
+        "board": board,
+        "class_level": class_level,
+        "subject": subject,
+        "question": question,
+        "answer": answer,
+        "latency_ms": int(latency_ms) if latency_ms is not None else None,
+        "error": error,
+    }
+    if write_behind.enqueue("ask_logs", row):
+        return
 
     try:
-        with engine.begin() as conn:
-            conn.execute(
-                text(insert_sql),
-                {
-                    "board": board,
-                    "class_level": class_level,
-                    "subject": subject,
-                    "question": question,
-                    "answer": answer,
-                    "latency_ms": int(latency_ms) if latency_ms is not None else None,
-                    "error": error,
-                },
-            )
+        db_insert_rows("ask_logs", [row])
     except Exception:
         logger.exception("db_log_solve failed")
         return
@@ -328,53 +407,37 @@ def db_log_ai_usage(event: dict) -> None:
 
     d = event or {}
 
-    insert_sql = """
-    INSERT INTO ai_usage_logs (
-        user_id, role, plan,
-        request_type, credit_bucket, credits_charged,
-        model_primary, model_escalated, cache_hit,
-        tokens_in, tokens_out, estimated_cost_usd, estimated_cost_inr,
-        latency_ms, status, question_len, answer_len, error
-    ) VALUES (
-        :user_id, :role, :plan,
-        :request_type, :credit_bucket, :credits_charged,
-        :model_primary, :model_escalated, :cache_hit,
-        :tokens_in, :tokens_out, :estimated_cost_usd, :estimated_cost_inr,
-        :latency_ms, :status, :question_len, :answer_len, :error
-    );
-    """
+    row = {
+        "user_id": _safe_int(d.get("user_id")),
+        "role": (d.get("role") or None),
+        "plan": (d.get("plan") or None),
+        "request_type": (d.get("request_type") or None),
+        "credit_bucket": _safe_int(d.get("credit_bucket")),
+        "credits_charged": _safe_int(d.get("credits_charged")),
+        "model_primary": (d.get("model_primary") or None),
+        "model_escalated": (d.get("model_escalated") or None),
+        "cache_hit": bool(d.get("cache_hit")) if d.get("cache_hit") is not None else None,
+        "tokens_in": _safe_int(d.get("tokens_in")),
+        "tokens_out": _safe_int(d.get("tokens_out")),
+        "estimated_cost_usd": d.get("estimated_cost_usd"),
+        "estimated_cost_inr": d.get("estimated_cost_inr"),
+        "latency_ms": _safe_int(d.get("latency_ms")),
+        "status": (d.get("status") or None),
+        "question_len": _safe_int(d.get("question_len")),
+        "answer_len": _safe_int(d.get("answer_len")),
+        "error": (d.get("error") or None),
+    }
+    if write_behind.enqueue("ai_usage_logs", row):
+        return
 
     try:
-        with engine.begin() as conn:
-            conn.execute(
-                text(insert_sql),
-                {
-                    "user_id": _safe_int(d.get("user_id")),
-                    "role": (d.get("role") or None),
-                    "plan": (d.get("plan") or None),
-                    "request_type": (d.get("request_type") or None),
-                    "credit_bucket": _safe_int(d.get("credit_bucket")),
-                    "credits_charged": _safe_int(d.get("credits_charged")),
-                    "model_primary": (d.get("model_primary") or None),
-                    "model_escalated": (d.get("model_escalated") or None),
-                    "cache_hit": bool(d.get("cache_hit")) if d.get("cache_hit") is not None else None,
-                    "tokens_in": _safe_int(d.get("tokens_in")),
-                    "tokens_out": _safe_int(d.get("tokens_out")),
-                    "estimated_cost_usd": d.get("estimated_cost_usd"),
-                    "estimated_cost_inr": d.get("estimated_cost_inr"),
-                    "latency_ms": _safe_int(d.get("latency_ms")),
-                    "status": (d.get("status") or None),
-                    "question_len": _safe_int(d.get("question_len")),
-                    "answer_len": _safe_int(d.get("answer_len")),
-                    "error": (d.get("error") or None),
-                },
-            )
+        db_insert_rows("ai_usage_logs", [row])
     except Exception:
         logger.exception("db_log_ai_usage failed")
         return
 
 
-__all__ = ["db_init", "db_health", "db_log_solve", "db_log_ai_usage"]
+__all__ = ["db_init", "db_health", "db_log_solve", "db_log_ai_usage", "db_insert_rows"]
 
 
 
@@ -382,6 +445,28 @@ __all__ = ["db_init", "db_health", "db_log_solve", "db_log_ai_usage"]
 # Chat History (chat_history)
 # -----------------------------
 
+def _chat_history_row(
+    user_id: int,
+    surface: str,
+    question: str,
+    learning_object: dict | None,
+    mode: str | None,
+    language: str | None,
+) -> Dict[str, Any]:
+    lo_json = None
+    if learning_object is not None:
+        import json as _json
+        lo_json = _json.dumps(learning_object, ensure_ascii=False)
+    return {
+        "user_id": int(user_id),
+        "surface": (surface or "chat_ai")[:20],
+        "question": str(question or "")[:4000],
+        "learning_object_json": lo_json,
+        "mode": (mode or "")[:40] or None,
+        "language": (language or "")[:10] or None,
+    }
+
+
 def db_add_chat_history(
     user_id: int,
     surface: str,
@@ -395,31 +480,77 @@ def db_add_chat_history(
     if engine is None:
         return
     try:
-        lo_json = None
-        if learning_object is not None:
-            import json as _json
-            lo_json = _json.dumps(learning_object, ensure_ascii=False)
-        with engine.begin() as conn:
-            conn.execute(
-                text(
-                    """
-                    INSERT INTO chat_history (user_id, surface, question, learning_object_json, mode, language)
-                    VALUES (:user_id, :surface, :question, :lo, :mode, :language)
-                    """
-                ),
-                {
-                    "user_id": int(user_id),
-                    "surface": (surface or "chat_ai")[:20],
-                    "question": str(question or "")[:4000],
-                    "lo": lo_json,
-                    "mode": (mode or "")[:40] or None,
-                    "language": (language or "")[:10] or None,
-                },
-            )
+        row = _chat_history_row(user_id, surface, question, learning_object, mode, language)
+        if write_behind.enqueue("chat_history", row):
+            return
+        db_insert_rows("chat_history", [row])
     except Exception:
         logger.exception("db_add_chat_history failed")
 
 
+async def adb_add_chat_history(
+    user_id: int,
+    surface: str,
+    question: str,
+    learning_object: dict | None,
+    mode: str | None,
+    language: str | None,
+) -> None:
+    """db_add_chat_history() for async callers. Never raises."""
+    if _get_engine() is None:
+        return
+    try:
+        row = _chat_history_row(user_id, surface, question, learning_object, mode, language)
+        if write_behind.enqueue("chat_history", row):
+            return
+        aeng = get_async_engine()
+        if aeng is None:
+            await asyncio.to_thread(db_insert_rows, "chat_history", [row])
+            return
+        cols = _INSERT_COLUMNS["chat_history"]
+        async with aeng.begin() as conn:
+            await conn.execute(
+                text(f"INSERT INTO chat_history ({', '.join(cols)}) VALUES ({', '.join(':' + c for c in cols)})"),
+                row,
+            )
+    except Exception:
+        logger.exception("adb_add_chat_history failed")
+
+
+_CHAT_HISTORY_LIST_SQL = """
+    SELECT id, created_at, surface, question, learning_object_json, mode, language
+    FROM chat_history
+    WHERE user_id = :user_id
+    ORDER BY created_at DESC
+    LIMIT :limit
+"""
+
+
+def _chat_history_items(rows) -> list[dict]:
+    out = []
+    import json as _json
+    for r in rows:
+        lo = None
+        raw = r.get("learning_object_json")
+        if raw:
+            try:
+                lo = _json.loads(raw)
+            except Exception:
+                lo = None
+        out.append(
+            {
+                "id": int(r["id"]),
+                "created_at": str(r["created_at"]),
+                "surface": r.get("surface"),
+                "question": r.get("question"),
+                "learning_object": lo,
+                "mode": r.get("mode"),
+                "language": r.get("language"),
+            }
+        )
+    return out
+
+
 def db_list_chat_history(user_id: int, limit: int = 30) -> list[dict]:
     """Return most recent chat history rows for user. Best-effort."""
     engine = _get_engine()
@@ -429,44 +560,33 @@ def db_list_chat_history(user_id: int, limit: int = 30) -> list[dict]:
         limit = max(1, min(int(limit), 100))
         with engine.connect() as conn:
             rows = conn.execute(
-                text(
-                    """
-                    SELECT id, created_at, surface, question, learning_object_json, mode, language
-                    FROM chat_history
-                    WHERE user_id = :user_id
-                    ORDER BY created_at DESC
-                    LIMIT :limit
-                    """
-                ),
+                text(_CHAT_HISTORY_LIST_SQL),
                 {"user_id": int(user_id), "limit": limit},
             ).mappings().all()
-        out = []
-        import json as _json
-        for r in rows:
-            lo = None
-            raw = r.get("learning_object_json")
-            if raw:
-                try:
-                    lo = _json.loads(raw)
-                except Exception:
-                    lo = None
-            out.append(
-                {
-                    "id": int(r["id"]),
-                    "created_at": str(r["created_at"]),
-                    "surface": r.get("surface"),
-                    "question": r.get("question"),
-                    "learning_object": lo,
-                    "mode": r.get("mode"),
-                    "language": r.get("language"),
-                }
-            )
-        return out
+        return _chat_history_items(rows)
     except Exception:
         logger.exception("db_list_chat_history failed")
         return []
 
 
+async def adb_list_chat_history(user_id: int, limit: int = 30) -> list[dict]:
+    """db_list_chat_history() for async callers (asyncpg; thread fallback)."""
+    aeng = get_async_engine()
+    if aeng is None:
+        return await asyncio.to_thread(db_list_chat_history, user_id, limit)
+    try:
+        limit = max(1, min(int(limit), 100))
+        async with aeng.connect() as conn:
+            rows = (await conn.execute(
+                text(_CHAT_HISTORY_LIST_SQL),
+                {"user_id": int(user_id), "limit": limit},
+            )).mappings().all()
+        return _chat_history_items(rows)
+    except Exception:
+        logger.exception("adb_list_chat_history failed")
+        return []
+
+
 def db_clear_chat_history(user_id: int) -> None:
     engine = _get_engine()
     if engine is None:
@@ -510,45 +630,61 @@ def db_upsert_memory_card(user_id: int, card_key: str, card_json: dict, expires_
         logger.exception("db_upsert_memory_card failed")
 
 
+_MEMORY_CARDS_SQL = """
+    SELECT card_key, card_json, updated_at, expires_at
+    FROM learning_memory_cards
+    WHERE user_id = :user_id
+    ORDER BY updated_at DESC
+"""
+
+
+def _memory_card_items(rows) -> list[dict]:
+    import json as _json
+    out = []
+    for r in rows:
+        cj = {}
+        try:
+            cj = _json.loads(r.get("card_json") or "{}")
+        except Exception:
+            cj = {}
+        out.append(
+            {
+                "card_key": r.get("card_key"),
+                "card": cj,
+                "updated_at": str(r.get("updated_at")),
+                "expires_at": str(r.get("expires_at")) if r.get("expires_at") else None,
+            }
+        )
+    return out
+
+
 def db_get_memory_cards(user_id: int) -> list[dict]:
     engine = _get_engine()
     if engine is None:
         return []
     try:
-        import json as _json
         with engine.connect() as conn:
-            rows = conn.execute(
-                text(
-                    """
-                    SELECT card_key, card_json, updated_at, expires_at
-                    FROM learning_memory_cards
-                    WHERE user_id = :user_id
-                    ORDER BY updated_at DESC
-                    """
-                ),
-                {"user_id": int(user_id)},
-            ).mappings().all()
-        out = []
-        for r in rows:
-            cj = {}
-            try:
-                cj = _json.loads(r.get("card_json") or "{}")
-            except Exception:
-                cj = {}
-            out.append(
-                {
-                    "card_key": r.get("card_key"),
-                    "card": cj,
-                    "updated_at": str(r.get("updated_at")),
-                    "expires_at": str(r.get("expires_at")) if r.get("expires_at") else None,
-                }
-            )
-        return out
+            rows = conn.execute(text(_MEMORY_CARDS_SQL), {"user_id": int(user_id)}).mappings().all()
+        return _memory_card_items(rows)
     except Exception:
         logger.exception("db_get_memory_cards failed")
         return []
 
 
+async def adb_get_memory_cards(user_id: int) -> list[dict]:
+    """db_get_memory_cards() for async callers (asyncpg; thread fallback)."""
+    aeng = get_async_engine()
+    if aeng is None:
+        return await asyncio.to_thread(db_get_memory_cards, user_id)
+    try:
+        async with aeng.connect() as conn:
+            rows = (await conn.execute(text(_MEMORY_CARDS_SQL), {"user_id": int(user_id)})).mappings().all()
+        return _memory_card_items(rows)
+    except Exception:
+        logger.exception("adb_get_memory_cards failed")
+        return []
+
+
 def db_reset_memory_cards(user_id: int) -> None:
     engine = _get_engine()
     if engine is None:
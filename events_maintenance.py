@@ -0,0 +1,334 @@
+"""events_maintenance.py — Indexes and monthly partitions for the events table.
+
+`events` is append-only and grows with every tracked interaction. Every
+analytics read filters `user_id = ? AND created_at >= ?` (sometimes with
+event_type), so:
+
+- `indexes` builds (user_id, created_at DESC) and
+  (user_id, event_type, created_at) CONCURRENTLY, printing the EXPLAIN
+  plans of the analytics queries before and after. phase1_store's schema
+  step creates the same indexes (IF NOT EXISTS), so on a big table run
+  this first to keep the boot-time DDL a no-op.
+- `partition` (optional, offline) converts events into a table
+  partitioned by month on created_at: events_pYYYYMM partitions plus an
+  events_default catch-all. The old table is kept as events_legacy.
+  Postgres requires unique indexes to include the partition key, so the
+  client_event_id dedupe index becomes (user_id, client_event_id,
+  created_at): retries are still dropped because phase1_store gives every
+  retry the created_at of its first sighting (pinned in Redis), or, with
+  Redis off, when the client resends the same `ts`.
+- `maintain` creates the next EVENTS_PARTITION_MONTHS_AHEAD partitions and,
+  with EVENTS_RETENTION_MONTHS > 0, drops partitions older than that.
+  The app runs it from its 6-hourly cleanup task; it is a no-op while
+  events is not partitioned.
+- `explain` just prints the plans.
+
+Usage:
+    python events_maintenance.py explain [--user-id 42] [--analyze]
+    python events_maintenance.py indexes
+    python events_maintenance.py partition [--drop-legacy]
+    python events_maintenance.py maintain [--retention-months 13]
+
+Needs DATABASE_URL (Postgres).
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import re
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+
+from config import EVENTS_PARTITION_MONTHS_AHEAD, EVENTS_RETENTION_MONTHS
+from shared_engine import get_engine
+
+logger = logging.getLogger("knoweasy.events_maintenance")
+
+_PARTITION_RE = re.compile(r"^events_p(\d{4})(\d{2})$")
+
+INDEXES: List[Tuple[str, str]] = [
+    ("ix_events_user_created", "ON events (user_id, created_at DESC)"),
+    ("ix_events_user_type_created", "ON events (user_id, event_type, created_at)"),
+]
+
+# The parent dashboard's reads (phase1_store.analytics_summary), plus the
+# raw-table aggregates it used before rollups (still used by ad-hoc queries).
+_EXPLAIN_QUERIES: List[Tuple[str, str]] = [
+    (
+        "recent activity",
+        "SELECT event_type, created_at, meta_json FROM events WHERE user_id = :user_id "
+        "ORDER BY created_at DESC LIMIT 25",
+    ),
+    (
+        "time spent 7d",
+        "SELECT COALESCE(SUM(duration_sec), 0) FROM events WHERE user_id = :user_id AND created_at >= :since_7d",
+    ),
+    (
+        "tests 30d",
+        "SELECT COUNT(*), AVG(value_num) FROM events WHERE user_id = :user_id "
+        "AND event_type = 'test_submitted' AND created_at >= :since_30d",
+    ),
+    (
+        "rollups 30d",
+        "SELECT day, event_type, count, duration_sum, value_sum, value_count FROM event_rollups_daily "
+        "WHERE user_id = :user_id AND day >= :since_30d_day",
+    ),
+]
+
+
+def _month_start(d: date) -> date:
+    return date(d.year, d.month, 1)
+
+
+def _add_months(d: date, n: int) -> date:
+    m = d.month - 1 + n
+    return date(d.year + m // 12, m % 12 + 1, 1)
+
+
+def _partition_name(month: date) -> str:
+    return f"events_p{month.year:04d}{month.month:02d}"
+
+
+def is_partitioned(conn) -> bool:
+    kind = conn.execute(
+        text("SELECT c.relkind FROM pg_class c WHERE c.oid = to_regclass('events')")
+    ).scalar()
+    return kind == "p"
+
+
+def _partitions(conn) -> List[str]:
+    rows = conn.execute(
+        text(
+            """
+            SELECT c.relname
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = to_regclass('events')
+            ORDER BY c.relname
+            """
+        )
+    ).scalars().all()
+    return list(rows)
+
+
+def _create_partition(conn, month: date) -> bool:
+    name = _partition_name(month)
+    if conn.execute(text("SELECT to_regclass(:n)"), {"n": name}).scalar():
+        return False
+    conn.execute(
+        text(
+            f"CREATE TABLE {name} PARTITION OF events "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_add_months(month, 1).isoformat()}')"
+        )
+    )
+    return True
+
+
+# -------------------------
+# Plans
+# -------------------------
+
+def explain(conn, user_id: Optional[int] = None, analyze: bool = False) -> Dict[str, List[str]]:
+    """EXPLAIN each analytics query for one user. {query name: plan lines}."""
+    if user_id is None:
+        user_id = conn.execute(text("SELECT user_id FROM events ORDER BY id DESC LIMIT 1")).scalar() or 0
+    now = datetime.now(timezone.utc)
+    params: Dict[str, Any] = {
+        "user_id": int(user_id),
+        "since_7d": now - timedelta(days=7),
+        "since_30d": now - timedelta(days=30),
+        "since_30d_day": now.date() - timedelta(days=29),
+    }
+    has_rollups = bool(conn.execute(text("SELECT to_regclass('event_rollups_daily')")).scalar())
+    prefix = "EXPLAIN (ANALYZE, BUFFERS)" if analyze else "EXPLAIN"
+    out: Dict[str, List[str]] = {}
+    for name, sql in _EXPLAIN_QUERIES:
+        if "event_rollups_daily" in sql and not has_rollups:
+            continue
+        out[name] = list(conn.execute(text(f"{prefix} {sql}"), params).scalars().all())
+    return out
+
+
+def _print_plans(title: str, plans: Dict[str, List[str]]) -> None:
+    print(f"== {title} ==")
+    for name, lines in plans.items():
+        print(f"-- {name}")
+        for line in lines:
+            print(f"   {line}")
+
+
+# -------------------------
+# Indexes
+# -------------------------
+
+def create_indexes(engine) -> List[str]:
+    """CREATE INDEX CONCURRENTLY for the composite indexes. Returns those created."""
+    created = []
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        partitioned = is_partitioned(conn)
+        for name, spec in INDEXES:
+            if conn.execute(text("SELECT to_regclass(:n)"), {"n": name}).scalar():
+                continue
+            # Partitioned parents can't be indexed CONCURRENTLY; convert() already built them.
+            how = "" if partitioned else "CONCURRENTLY "
+            conn.execute(text(f"CREATE INDEX {how}IF NOT EXISTS {name} {spec}"))
+            created.append(name)
+    return created
+
+
+# -------------------------
+# Partitioning
+# -------------------------
+
+def convert_to_partitioned(engine, drop_legacy: bool = False) -> Dict[str, Any]:
+    """Rewrite events as a monthly range-partitioned table (one transaction).
+
+    Takes an ACCESS EXCLUSIVE lock on events and copies every row: run it in
+    a maintenance window. Ids and the id sequence are preserved.
+    """
+    with engine.begin() as conn:
+        if is_partitioned(conn):
+            return {"ok": True, "converted": False, "reason": "already partitioned"}
+        conn.execute(text("LOCK TABLE events IN ACCESS EXCLUSIVE MODE"))
+        first = conn.execute(text("SELECT MIN(created_at) FROM events")).scalar()
+        seq = conn.execute(text("SELECT pg_get_serial_sequence('events', 'id')")).scalar()
+
+        conn.execute(text("ALTER TABLE events RENAME TO events_legacy"))
+        # Index and constraint names are schema-wide: move the old ones aside.
+        conn.execute(text("ALTER TABLE events_legacy RENAME CONSTRAINT events_pkey TO events_legacy_pkey"))
+        for name in [n for n, _ in INDEXES] + ["uq_events_user_client_event", "ix_events_user_id", "ix_events_event_type"]:
+            conn.execute(text(f"ALTER INDEX IF EXISTS {name} RENAME TO {name}_legacy"))
+        if seq:
+            conn.execute(text(f"ALTER SEQUENCE {seq} OWNED BY NONE"))
+        conn.execute(
+            text(
+                f"""
+                CREATE TABLE events (
+                    id BIGINT NOT NULL {f"DEFAULT nextval('{seq}')" if seq else "GENERATED BY DEFAULT AS IDENTITY"},
+                    user_id BIGINT NOT NULL,
+                    event_type VARCHAR(64) NOT NULL,
+                    meta_json TEXT NOT NULL DEFAULT '{{}}',
+                    duration_sec INTEGER,
+                    value_num INTEGER,
+                    client_event_id VARCHAR(64),
+                    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                    PRIMARY KEY (id, created_at)
+                ) PARTITION BY RANGE (created_at)
+                """
+            )
+        )
+        if seq:
+            conn.execute(text(f"ALTER SEQUENCE {seq} OWNED BY events.id"))
+        conn.execute(text("CREATE TABLE events_default PARTITION OF events DEFAULT"))
+
+        this_month = _month_start(datetime.now(timezone.utc).date())
+        month = _month_start(first.date()) if first else this_month
+        created = 0
+        while month <= _add_months(this_month, max(1, EVENTS_PARTITION_MONTHS_AHEAD)):
+            created += int(_create_partition(conn, month))
+            month = _add_months(month, 1)
+
+        for name, spec in INDEXES:
+            conn.execute(text(f"CREATE INDEX {name} {spec}"))
+        conn.execute(text("CREATE INDEX ix_events_event_type ON events (event_type)"))
+        conn.execute(
+            text(
+                "CREATE UNIQUE INDEX uq_events_user_client_event ON events (user_id, client_event_id, created_at) "
+                "WHERE client_event_id IS NOT NULL"
+            )
+        )
+
+        copied = conn.execute(
+            text(
+                """
+                INSERT INTO events (id, user_id, event_type, meta_json, duration_sec, value_num, client_event_id, created_at)
+                SELECT id, user_id, event_type, COALESCE(meta_json, '{}'), duration_sec, value_num, client_event_id, created_at
+                FROM events_legacy
+                """
+            )
+        ).rowcount
+        if drop_legacy:
+            conn.execute(text("DROP TABLE events_legacy"))
+    logger.info("events partitioned: %s partitions, %s rows copied", created, copied)
+    return {"ok": True, "converted": True, "partitions": created, "rows": int(copied or 0), "legacy_kept": not drop_legacy}
+
+
+def maintain_partitions(engine=None, retention_months: Optional[int] = None) -> Dict[str, Any]:
+    """Create upcoming monthly partitions and drop expired ones. No-op if not partitioned."""
+    engine = engine or get_engine()
+    if engine is None:
+        return {"ok": False, "reason": "DB not available"}
+    retention = EVENTS_RETENTION_MONTHS if retention_months is None else int(retention_months)
+    with engine.begin() as conn:
+        if conn.dialect.name != "postgresql" or not is_partitioned(conn):
+            return {"ok": True, "partitioned": False}
+        this_month = _month_start(datetime.now(timezone.utc).date())
+        created = [
+            _partition_name(m)
+            for m in (_add_months(this_month, i) for i in range(0, max(1, EVENTS_PARTITION_MONTHS_AHEAD) + 1))
+            if _create_partition(conn, m)
+        ]
+        dropped = []
+        if retention > 0:
+            cutoff = _add_months(this_month, -retention)
+            for name in _partitions(conn):
+                m = _PARTITION_RE.match(name)
+                if m and date(int(m.group(1)), int(m.group(2)), 1) < cutoff:
+                    conn.execute(text(f"DROP TABLE {name}"))
+                    dropped.append(name)
+        default_rows = 0
+        if conn.execute(text("SELECT to_regclass('events_default')")).scalar():
+            default_rows = conn.execute(text("SELECT COUNT(*) FROM (SELECT 1 FROM events_default LIMIT 1000) d")).scalar()
+    if default_rows:
+        logger.warning("events_default holds %s+ rows: a monthly partition is missing", default_rows)
+    if created or dropped:
+        logger.info("events partitions: created=%s dropped=%s", created, dropped)
+    return {"ok": True, "partitioned": True, "created": created, "dropped": dropped, "default_rows": int(default_rows or 0)}
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p_explain = sub.add_parser("explain", help="print plans of the analytics queries")
+    p_idx = sub.add_parser("indexes", help="create composite indexes CONCURRENTLY (plans before/after)")
+    p_part = sub.add_parser("partition", help="convert events to monthly partitions (plans before/after)")
+    p_part.add_argument("--drop-legacy", action="store_true", help="drop events_legacy after the copy")
+    p_maint = sub.add_parser("maintain", help="create upcoming / drop expired partitions")
+    p_maint.add_argument("--retention-months", type=int, default=None)
+    for p in (p_explain, p_idx, p_part):
+        p.add_argument("--user-id", type=int, default=None, help="user to EXPLAIN for (default: latest event's user)")
+        p.add_argument("--analyze", action="store_true", help="EXPLAIN ANALYZE (runs the queries)")
+    args = ap.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    engine = get_engine()
+    if engine is None or engine.dialect.name != "postgresql":
+        raise SystemExit("DATABASE_URL must point at Postgres")
+
+    def plans(title: str) -> None:
+        with engine.connect() as conn:
+            _print_plans(title, explain(conn, args.user_id, args.analyze))
+
+    if args.cmd == "explain":
+        plans("plans")
+    elif args.cmd == "indexes":
+        plans("before")
+        print("created:", create_indexes(engine) or "nothing (already present)")
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text("ANALYZE events"))
+        plans("after")
+    elif args.cmd == "partition":
+        plans("before")
+        print(convert_to_partitioned(engine, drop_legacy=args.drop_legacy))
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text("ANALYZE events"))
+        plans("after")
+    else:
+        print(maintain_partitions(engine, retention_months=args.retention_months))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""idempotency.py — Client request_id handling for /solve.
+
+Mobile clients retry with the same `request_id` when a response is slow.
+Previously a duplicate that found the lock taken slept 350 ms, looked for
+the stored response once and then ran (and billed) the whole solve again.
+
+Now:
+- `begin(request_id)` returns the stored response if there is one, or a
+  `Claim` if this request gets the lock (SET NX with a random token).
+- If another request holds the lock, `begin` waits: it re-checks the stored
+  response and retries the lock with backoff, for at most
+  IDEMPOTENCY_WAIT_SECONDS. Duplicates in the same worker are woken as soon
+  as the owner finishes instead of on the next poll.
+- The owner renews the lock (compare-and-expire) every third of its TTL
+  while it works, so a long solve never lets a duplicate in. If the owner
+  dies the lock expires and a waiter takes over.
+- `Claim.complete(response)` stores the response and releases the lock;
+  `Claim.release()` releases it without one (the waiter then runs the solve
+  itself).
+
+Without Redis only the in-worker part applies. Never raises on Redis errors.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+import uuid
+from typing import Any, Dict, Optional, Set, Tuple
+
+import redis_store
+from config import IDEMPOTENCY_LOCK_SECONDS, IDEMPOTENCY_RESULT_SECONDS, IDEMPOTENCY_WAIT_SECONDS
+
+logger = logging.getLogger("knoweasy.idempotency")
+
+_POLL_MIN_S = 0.05
+_POLL_MAX_S = 1.0
+
+_STATS: Dict[str, int] = {"claimed": 0, "replayed": 0, "waited": 0, "renewals": 0, "wait_timeout": 0}
+
+# request_id -> owning Claim in this worker
+_LOCAL: Dict[str, "Claim"] = {}
+_TASKS: Set[asyncio.Task] = set()
+
+def _count_renewal() -> None:
+    _STATS["renewals"] += 1
+
+
+def _result_key(request_id: str) -> str:
+    return f"rid:solve:{request_id}"
+
+
+def _lock_key(request_id: str) -> str:
+    return f"lock:rid:solve:{request_id}"
+
+
+def _usable(res: Any) -> bool:
+    return isinstance(res, dict) and bool(res.get("final_answer"))
+
+
+class Claim:
+    """The lock on one request_id, held by the request that runs the solve."""
+
+    def __init__(self, request_id: str, token: Optional[str]) -> None:
+        self.request_id = request_id
+        self._token = token  # None: Redis off, local lock only
+        self._done = asyncio.Event()
+        self.result: Optional[Dict[str, Any]] = None
+        self._renewer: Optional[asyncio.Task] = None
+        if token:
+            # Bounded, in case an owner is lost without complete()/release()
+            self._renewer = asyncio.get_running_loop().create_task(
+                redis_store.akeep_lease(
+                    _lock_key(request_id),
+                    token,
+                    int(IDEMPOTENCY_LOCK_SECONDS),
+                    max(IDEMPOTENCY_RESULT_SECONDS, IDEMPOTENCY_WAIT_SECONDS),
+                    _count_renewal,
+                )
+            )
+
+    def _close(self, result: Optional[Dict[str, Any]]) -> Optional[str]:
+        """Stop renewing and wake local waiters; returns the token to release."""
+        if self._renewer is not None:
+            self._renewer.cancel()
+            self._renewer = None
+        if _LOCAL.get(self.request_id) is self:
+            _LOCAL.pop(self.request_id, None)
+        if result is not None:
+            self.result = result
+        self._done.set()
+        token, self._token = self._token, None
+        return token
+
+    async def complete(self, response: Dict[str, Any]) -> None:
+        """Store the response for duplicates, then release the lock."""
+        if _usable(response):
+            await redis_store.asetex_packed(_result_key(self.request_id), IDEMPOTENCY_RESULT_SECONDS, response)
+        token = self._close(response if _usable(response) else None)
+        await _release(self.request_id, token)
+
+    async def release(self) -> None:
+        """No response to share (error, cache hit, out of credits)."""
+        await _release(self.request_id, self._close(None))
+
+    def release_later(self) -> None:
+        """release() from a cancelled context (client disconnect)."""
+        token = self._close(None)
+        if not token:
+            return
+        try:
+            task = asyncio.get_running_loop().create_task(_release(self.request_id, token))
+        except RuntimeError:
+            return  # no loop: the lock expires on its own
+        _TASKS.add(task)
+        task.add_done_callback(_TASKS.discard)
+
+
+async def _release(request_id: str, token: Optional[str]) -> None:
+    # Worst case the lock expires within IDEMPOTENCY_LOCK_SECONDS
+    if token:
+        await redis_store.arelease_lease(_lock_key(request_id), token)
+
+
+async def _try_claim(request_id: str) -> Optional[Claim]:
+    if request_id in _LOCAL:
+        return None
+    r = redis_store.get_aredis()
+    token = None
+    if r:
+        token = uuid.uuid4().hex
+        try:
+            if not await r.set(_lock_key(request_id), token, nx=True, ex=int(IDEMPOTENCY_LOCK_SECONDS)):
+                return None
+        except Exception as e:
+            logger.warning("idempotency lock failed (local only): %s", e)
+            token = None
+    claim = Claim(request_id, token)
+    _LOCAL[request_id] = claim
+    _STATS["claimed"] += 1
+    return claim
+
+
+async def begin(request_id: str) -> Tuple[Optional[Dict[str, Any]], Optional[Claim]]:
+    """(stored response, None), (None, claim) or, after waiting too long, (None, None)."""
+    deadline = time.monotonic() + max(1, IDEMPOTENCY_WAIT_SECONDS)
+    delay = _POLL_MIN_S
+    waited = False
+    while True:
+        prior = await redis_store.aget_packed(_result_key(request_id))
+        if _usable(prior):
+            _STATS["replayed"] += 1
+            return prior, None
+        claim = await _try_claim(request_id)
+        if claim is not None:
+            return None, claim
+        if not waited:
+            waited = True
+            _STATS["waited"] += 1
+        now = time.monotonic()
+        if now >= deadline:
+            _STATS["wait_timeout"] += 1
+            return None, None
+        owner = _LOCAL.get(request_id)
+        if owner is not None:
+            # Same worker: wake up the moment the owner is done
+            try:
+                await asyncio.wait_for(owner._done.wait(), timeout=max(0.0, deadline - now))
+            except asyncio.TimeoutError:
+                continue
+            if _usable(owner.result):
+                _STATS["replayed"] += 1
+                return owner.result, None
+            continue
+        await asyncio.sleep(min(delay, max(0.0, deadline - now)))
+        delay = min(_POLL_MAX_S, delay * 1.6)
+
+
+def stats() -> Dict[str, Any]:
+    return {**_STATS, "held_local": len(_LOCAL)}
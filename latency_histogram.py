@@ -0,0 +1,132 @@
+"""latency_histogram.py — HDR-style latency histograms (per worker).
+
+Each histogram counts milliseconds in log-linear buckets: exact below 16 ms,
+then 16 linear sub-buckets per power of two, so any recorded value is off by
+at most ~6% (HdrHistogram with one significant digit and a bit). Recording
+is an index computation and an increment; quantiles walk at most a few
+hundred buckets.
+
+`LatencyRecorder` keeps two histograms per name, the current window and
+the previous one, and rotates them every `window_s`. Quantiles read both,
+so they cover between one and two windows of traffic and follow a model
+that gets slower (or recovers) within minutes.
+"""
+
+from __future__ import annotations
+
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+_SUB_BITS = 4
+_SUB = 1 << _SUB_BITS  # 16 sub-buckets per power of two
+_MAX_MS = (1 << 18) - 1  # ~262 s; slower calls are counted here
+
+
+def _index(ms: float) -> int:
+    v = min(_MAX_MS, max(0, int(ms)))
+    if v < _SUB:
+        return v
+    shift = v.bit_length() - 1 - _SUB_BITS
+    return _SUB * (shift + 1) + ((v >> shift) - _SUB)
+
+
+def _upper(idx: int) -> int:
+    """Highest value (ms) that lands in bucket `idx`."""
+    if idx < _SUB:
+        return idx
+    shift = idx // _SUB - 1
+    top = _SUB + idx % _SUB
+    return ((top + 1) << shift) - 1
+
+
+_N_BUCKETS = _index(_MAX_MS) + 1
+
+
+class Histogram:
+    """Counts of latencies (ms) in log-linear buckets."""
+
+    __slots__ = ("counts", "count", "max_ms")
+
+    def __init__(self) -> None:
+        self.counts: List[int] = [0] * _N_BUCKETS
+        self.count = 0
+        self.max_ms = 0.0
+
+    def record(self, ms: float) -> None:
+        self.counts[_index(ms)] += 1
+        self.count += 1
+        if ms > self.max_ms:
+            self.max_ms = float(ms)
+
+    def buckets(self) -> List[Tuple[int, int]]:
+        """Non-empty buckets as (upper bound ms, count)."""
+        return [(_upper(i), c) for i, c in enumerate(self.counts) if c]
+
+
+def quantile(hists: List[Histogram], q: float) -> Optional[float]:
+    """q-quantile (ms, bucket upper bound) over several histograms; None if empty."""
+    total = sum(h.count for h in hists)
+    if not total:
+        return None
+    rank = max(1, int(round(min(1.0, max(0.0, q)) * total)))
+    seen = 0
+    for i in range(_N_BUCKETS):
+        seen += sum(h.counts[i] for h in hists)
+        if seen >= rank:
+            return float(min(_upper(i), max(h.max_ms for h in hists)))
+    return max(h.max_ms for h in hists)
+
+
+class LatencyRecorder:
+    """Named histograms over a rotating two-window horizon."""
+
+    def __init__(self, window_s: float) -> None:
+        self.window_s = max(1.0, float(window_s))
+        # name -> [current, previous, current window start (monotonic)]
+        self._hists: Dict[str, List[Any]] = {}
+
+    def _pair(self, name: str) -> Tuple[Histogram, Histogram]:
+        now = time.monotonic()
+        entry = self._hists.get(name)
+        if entry is None:
+            entry = self._hists[name] = [Histogram(), Histogram(), now]
+        elif now - entry[2] >= self.window_s:
+            # Rotate; after a long idle gap the old current is stale as well
+            entry[1] = entry[0] if now - entry[2] < 2 * self.window_s else Histogram()
+            entry[0] = Histogram()
+            entry[2] = now
+        return entry[0], entry[1]
+
+    def record(self, name: str, seconds: float) -> None:
+        self._pair(name)[0].record(max(0.0, float(seconds)) * 1000.0)
+
+    def count(self, name: str) -> int:
+        if name not in self._hists:
+            return 0
+        cur, prev = self._pair(name)
+        return cur.count + prev.count
+
+    def quantile_s(self, name: str, q: float) -> Optional[float]:
+        if name not in self._hists:
+            return None
+        ms = quantile(list(self._pair(name)), q)
+        return None if ms is None else ms / 1000.0
+
+    def snapshot(self, with_buckets: bool = False) -> Dict[str, Any]:
+        out: Dict[str, Any] = {}
+        for name in sorted(self._hists):
+            hists = list(self._pair(name))
+            n = sum(h.count for h in hists)
+            if not n:
+                continue
+            row: Dict[str, Any] = {"count": n, "max_ms": round(max(h.max_ms for h in hists), 1)}
+            for label, q in (("p50_ms", 0.5), ("p90_ms", 0.9), ("p99_ms", 0.99)):
+                row[label] = quantile(hists, q)
+            if with_buckets:
+                merged: Dict[int, int] = {}
+                for h in hists:
+                    for upper, c in h.buckets():
+                        merged[upper] = merged.get(upper, 0) + c
+                row["buckets"] = sorted(merged.items())
+            out[name] = row
+        return out
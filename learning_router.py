@@ -10,11 +10,14 @@ Frontend contract (core.js / chat.js):
   - meta: { providers_used, ai_strategy, verified, request_id, ... }
 """
 
+import json
+
 from fastapi import APIRouter
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 from typing import Optional, Dict, Any, List
 
-from orchestrator import RequestContext, generate_learning_answer
+from orchestrator import RequestContext, agenerate_learning_answer, stream_generate
 
 router = APIRouter()
 
@@ -52,9 +55,8 @@ class AnswerRequest(BaseModel):
     class Config:
         allow_population_by_field_name = True
 
-@router.post("/v1/ai/answer")
-def answer(req: AnswerRequest) -> Dict[str, Any]:
-    ctx = RequestContext(
+def _context_from(req: AnswerRequest) -> RequestContext:
+    return RequestContext(
         request_id=req.request_id or "",
         question=req.question or "",
         board=req.board or "",
@@ -67,7 +69,37 @@ def answer(req: AnswerRequest) -> Dict[str, Any]:
         answer_mode=req.answer_mode or "tutor",
     )
 
-    ans = generate_learning_answer(ctx) or {}
+@router.post("/v1/ai/answer")
+async def answer(req: AnswerRequest) -> Dict[str, Any]:
+    ctx = _context_from(req)
+    ans = await agenerate_learning_answer(ctx) or {}
+    return _answer_response(ctx, ans)
+
+@router.post("/v1/ai/answer/stream")
+async def answer_stream(req: AnswerRequest):
+    """SSE twin of /v1/ai/answer.
+
+    Streams orchestrator events (`start`, `delta`, `header`, `section`,
+    `restart`) as they happen; the final `done` event carries exactly the
+    payload /v1/ai/answer would have returned.
+    """
+    ctx = _context_from(req)
+
+    async def _events():
+        async for ev in stream_generate(ctx):
+            name = ev.get("event") or "message"
+            data = ev.get("data") or {}
+            if name == "done":
+                data = _answer_response(ctx, data)
+            yield f"event: {name}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+    return StreamingResponse(
+        _events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def _answer_response(ctx: RequestContext, ans: Dict[str, Any]) -> Dict[str, Any]:
     sections = ans.get("sections") if isinstance(ans, dict) else []
     meta = ans.get("meta") if isinstance(ans, dict) and isinstance(ans.get("meta"), dict) else {}
     providers_used = ans.get("providers_used") if isinstance(ans, dict) else []
@@ -0,0 +1,223 @@
+"""local_cache.py — In-process LRU/TTL cache bounded by bytes.
+
+Sits in front of Redis for hot, read-mostly blobs (solved answers, later
+sessions/wallets). Each uvicorn worker has its own copy, so writes and
+deletes are broadcast on a Redis pub/sub channel and every other worker
+drops its local entry for that key.
+
+Notes:
+- Values are shared between requests: callers must treat them as read-only.
+- Size is the caller-supplied byte length (usually the serialized size), so
+  the bound tracks real memory far better than an entry count would.
+- If Redis is disabled the cache is still usable, just per-worker TTL only.
+- Never raises on Redis errors.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import redis_store
+
+logger = logging.getLogger("knoweasy.local_cache")
+
+INVALIDATION_CHANNEL = "lc:invalidate"
+
+# Identifies this process so it can ignore its own broadcasts.
+_ORIGIN = uuid.uuid4().hex[:12]
+
+_REGISTRY: Dict[str, "LocalCache"] = {}
+_REGISTRY_LOCK = threading.Lock()
+_listener: Optional[threading.Thread] = None
+
+
+def _approx_size(value: Any) -> int:
+    try:
+        return len(json.dumps(value, ensure_ascii=False, default=str).encode("utf-8"))
+    except Exception:
+        return 1024
+
+
+class LocalCache:
+    """Byte-bounded LRU with per-entry TTL and cross-worker invalidation."""
+
+    def __init__(self, namespace: str, max_bytes: int, default_ttl_s: int) -> None:
+        self.namespace = namespace
+        self.max_bytes = max(0, int(max_bytes))
+        self.default_ttl_s = max(1, int(default_ttl_s))
+        self._data: "OrderedDict[str, Tuple[Any, float, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "sets": 0, "evictions": 0, "expired": 0, "invalidations": 0, "too_large": 0}
+        with _REGISTRY_LOCK:
+            _REGISTRY[namespace] = self
+        _ensure_listener()
+
+    # ---- core ops -------------------------------------------------------
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self._stats["misses"] += 1
+                return None
+            value, expires_at, size = item
+            if expires_at <= now:
+                del self._data[key]
+                self._bytes -= size
+                self._stats["expired"] += 1
+                self._stats["misses"] += 1
+                return None
+            self._data.move_to_end(key)
+            self._stats["hits"] += 1
+            return value
+
+    def set(self, key: str, value: Any, ttl_s: Optional[int] = None, size: Optional[int] = None, broadcast: bool = True) -> None:
+        """Store locally; with `broadcast`, other workers drop their copy."""
+        if self.max_bytes <= 0:
+            return
+        size = int(size) if size else _approx_size(value)
+        ttl = self.default_ttl_s if ttl_s is None else max(1, min(int(ttl_s), self.default_ttl_s))
+        if size > self.max_bytes // 4:
+            # One giant blob should not flush the whole tier.
+            with self._lock:
+                self._stats["too_large"] += 1
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._data[key] = (value, time.monotonic() + ttl, size)
+            self._bytes += size
+            self._stats["sets"] += 1
+            while self._bytes > self.max_bytes and self._data:
+                _, (_, _, sz) = self._data.popitem(last=False)
+                self._bytes -= sz
+                self._stats["evictions"] += 1
+        if broadcast:
+            _publish(self.namespace, key)
+
+    def delete(self, key: str, broadcast: bool = True) -> None:
+        self._drop(key)
+        if broadcast:
+            _publish(self.namespace, key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def _drop(self, key: str) -> None:
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+                self._stats["invalidations"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hit_ratio": round(self._stats["hits"] / lookups, 4) if lookups else 0.0,
+            }
+
+
+# ---- cross-worker invalidation ---------------------------------------------
+
+def _message(namespace: str, key: str) -> str:
+    return json.dumps({"ns": namespace, "key": key, "origin": _ORIGIN})
+
+
+def _publish(namespace: str, key: str) -> None:
+    r = redis_store.get_redis()
+    if not r:
+        return
+    try:
+        r.publish(INVALIDATION_CHANNEL, _message(namespace, key))
+    except Exception as e:
+        logger.debug("local cache invalidation publish failed: %s", e)
+
+
+async def apublish(namespace: str, *keys: str) -> None:
+    """Broadcast invalidations on the async client, for event-loop callers
+    that did set()/delete() with broadcast=False. One round-trip for all keys."""
+    r = redis_store.get_aredis()
+    if not r or not keys:
+        return
+    try:
+        pipe = r.pipeline(transaction=False)
+        for key in keys:
+            pipe.publish(INVALIDATION_CHANNEL, _message(namespace, key))
+        await pipe.execute()
+    except Exception as e:
+        logger.debug("local cache invalidation publish failed: %s", e)
+
+
+def _handle_message(raw: Any) -> None:
+    try:
+        msg = json.loads(raw)
+    except Exception:
+        return
+    if not isinstance(msg, dict) or msg.get("origin") == _ORIGIN:
+        return
+    cache = _REGISTRY.get(str(msg.get("ns") or ""))
+    if cache is not None:
+        cache._drop(str(msg.get("key") or ""))
+
+
+def _clear_all() -> None:
+    with _REGISTRY_LOCK:
+        caches = list(_REGISTRY.values())
+    for c in caches:
+        c.clear()
+
+
+def _listen_forever() -> None:
+    backoff = 1.0
+    while True:
+        # Dedicated client: no read timeout while idle, not behind the breaker
+        r = redis_store.get_redis_pubsub()
+        if not r:
+            return
+        try:
+            ps = r.pubsub(ignore_subscribe_messages=True)
+            ps.subscribe(INVALIDATION_CHANNEL)
+            # Invalidations may have been missed while disconnected.
+            _clear_all()
+            backoff = 1.0
+            for m in ps.listen():
+                if m and m.get("type") == "message":
+                    _handle_message(m.get("data"))
+        except Exception as e:
+            logger.warning("local cache invalidation listener reconnecting: %s", e)
+            _clear_all()
+            time.sleep(backoff)
+            backoff = min(30.0, backoff * 2)
+
+
+def _ensure_listener() -> None:
+    global _listener
+    with _REGISTRY_LOCK:
+        if _listener is not None and _listener.is_alive():
+            return
+        if not redis_store.get_redis_pubsub():
+            return
+        _listener = threading.Thread(target=_listen_forever, name="local-cache-invalidator", daemon=True)
+        _listener.start()
+
+
+def all_stats() -> Dict[str, Any]:
+    with _REGISTRY_LOCK:
+        caches = dict(_REGISTRY)
+    return {ns: c.stats() for ns, c in caches.items()}
@@ -22,9 +22,15 @@ from billing_router import router as billing_router
 from admin_router import router as admin_router
 from learning_router import router as learning_router
 import phase1_store
+import redis_store
 from redis_store import redis_health
-from db import db_init, db_cleanup_expired
-from shared_engine import db_health
+from db import db_init, db_cleanup_expired, db_insert_rows
+import write_behind
+import events_maintenance
+import billing_store
+from shared_engine import db_health, dispose_async_engine
+import schema_ready
+from config import CREDIT_RESERVATION_SWEEP_SECONDS
 
 logger = logging.getLogger("knoweasy-engine-api")
 
@@ -51,6 +57,7 @@ except Exception:
 
 # FIX: Background cleanup task for expired sessions/OTPs
 _cleanup_task = None
+_sweeper_task = None
 
 async def _periodic_cleanup():
     """Run cleanup every 6 hours to remove expired OTPs and sessions."""
@@ -60,6 +67,25 @@ async def _periodic_cleanup():
             loop = asyncio.get_event_loop()
             result = await loop.run_in_executor(None, db_cleanup_expired)
             logger.info("Periodic cleanup result: %s", result)
+            result = await loop.run_in_executor(None, events_maintenance.maintain_partitions)
+            logger.info("Events partition maintenance: %s", result)
+            result = await loop.run_in_executor(None, billing_store.purge_reservations)
+            logger.info("Purged %s settled credit reservations", result)
+        except asyncio.CancelledError:
+            break
+        except Exception:
+            logger.exception("Periodic cleanup error")
+
+
+async def _reservation_sweeper():
+    """Release credit holds whose request never settled (killed worker, lost client)."""
+    while True:
+        try:
+            await asyncio.sleep(max(5, CREDIT_RESERVATION_SWEEP_SECONDS))
+            loop = asyncio.get_event_loop()
+            result = await loop.run_in_executor(None, billing_store.release_expired_reservations)
+            if result.get("released"):
+                logger.info("Released expired credit reservations: %s", result)
         except asyncio.CancelledError:
             break
         except Exception:
@@ -68,7 +94,7 @@ async def _periodic_cleanup():
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Modern lifespan handler (replaces deprecated on_event)."""
-    global _cleanup_task
+    global _cleanup_task, _sweeper_task
     # Startup
     try:
         phase1_store.ensure_tables()
@@ -80,23 +106,38 @@ async def lifespan(app: FastAPI):
         pass
     try:
         import payments_store
-        import billing_store
         payments_store.ensure_tables()
         billing_store.ensure_tables()
     except Exception:
         pass
+    # Telemetry/history rows are batched off the request path from here on
+    write_behind.start(db_insert_rows)
     _cleanup_task = asyncio.create_task(_periodic_cleanup())
+    _sweeper_task = asyncio.create_task(_reservation_sweeper())
     logger.info("KnowEasy Engine API started (workers=%s)", os.getenv("UVICORN_WORKERS", "4"))
     yield
     # Shutdown — graceful drain
     logger.info("Shutting down — draining in-flight requests...")
-    if _cleanup_task:
-        _cleanup_task.cancel()
-        try:
-            await _cleanup_task
-        except asyncio.CancelledError:
-            pass
+    for task in (_cleanup_task, _sweeper_task):
+        if task:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
     await asyncio.sleep(2)
+    try:
+        await asyncio.to_thread(write_behind.stop)
+    except Exception:
+        logger.exception("write-behind flush on shutdown failed")
+    try:
+        await dispose_async_engine()
+    except Exception:
+        logger.exception("async engine dispose failed")
+    try:
+        await redis_store.aclose_redis()
+    except Exception:
+        logger.exception("async redis close failed")
     logger.info("Shutdown complete.")
 
 app = FastAPI(title=SERVICE_NAME, version=str(SERVICE_VERSION), lifespan=lifespan)
@@ -320,6 +361,11 @@ def health():
     except Exception as e:
         db_info = {"enabled": True, "connected": False, "reason": str(e)}
 
+    try:
+        schema_info = schema_ready.status()
+    except Exception as e:
+        schema_info = {"ready": False, "reason": str(e)}
+
     # Auth readiness (AUTH_SECRET_KEY + email provider)
     auth_cfg = False
     email_cfg = False
@@ -390,6 +436,7 @@ def health():
         "deps": {
             "redis": redis_info,
             "db": db_info,
+            "schema": schema_info,
         },
         "subsystems": {
             "auth": {
@@ -0,0 +1,311 @@
+"""model_health.py — Circuit breakers and health scores per (provider, model).
+
+models.py has one in-process breaker for the legacy GeminiClient; the live
+orchestrator path had none, so a degraded model kept eating full timeouts
+on every request that routed to it.
+
+Per (provider, model) we keep, in one Redis hash (`mh:{provider}:{model}`)
+updated atomically by a Lua script so every worker sees the same state:
+- `err`: EWMA of failures (1) and successes (0), a rolling error rate;
+- `lat`: EWMA of successful call latency (ms);
+- `fails`: consecutive failures; `open_until`: breaker open until (ms);
+- `n`: calls since `win`, the start of the current MODEL_CB_WINDOW_S window.
+
+The breaker opens after MODEL_CB_CONSECUTIVE_FAILURES failures in a row, or
+when the error rate reaches MODEL_CB_ERROR_RATE over at least
+MODEL_CB_MIN_SAMPLES calls in the current window (a lifetime count would
+stop gating after the first few minutes). It stays open for MODEL_CB_COOLDOWN_S; then one
+probe call per worker and cool-down is let through (half-open). A success
+closes it, a failure re-opens it.
+
+Reads are synchronous and local: `refresh()` (awaited once per solve,
+throttled to MODEL_HEALTH_REFRESH_S) pulls every known model in one
+pipeline, and `allow`/`pick` read that snapshot. `record()` updates the
+local snapshot at once and Redis in the background. Without Redis the same
+logic runs per worker.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import statistics
+import time
+from typing import Any, Dict, List, Optional, Sequence, Set
+
+import redis_store
+from config import (
+    MODEL_CB_CONSECUTIVE_FAILURES,
+    MODEL_CB_COOLDOWN_S,
+    MODEL_CB_ERROR_RATE,
+    MODEL_CB_MIN_SAMPLES,
+    MODEL_CB_WINDOW_S,
+    MODEL_HEALTH_ENABLED,
+    MODEL_HEALTH_EWMA_ALPHA,
+    MODEL_HEALTH_REFRESH_S,
+)
+
+logger = logging.getLogger("knoweasy.model_health")
+
+_KEYS_SET = "mh:keys"
+_TTL_SECONDS = 7 * 86400
+
+# KEYS[1]: health hash. ARGV: ok, latency_ms, alpha, error_rate, min_samples,
+# consecutive_failures, cooldown_ms, ttl_s, window_ms. Returns the new state.
+_RECORD_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local h = redis.call('HMGET', KEYS[1], 'n', 'err', 'lat', 'fails', 'open_until', 'win')
+local n = tonumber(h[1]) or 0
+local err = tonumber(h[2]) or 0
+local lat = tonumber(h[3]) or -1
+local fails = tonumber(h[4]) or 0
+local open_until = tonumber(h[5]) or 0
+local win = tonumber(h[6]) or 0
+local alpha = tonumber(ARGV[3])
+if now - win >= tonumber(ARGV[9]) then
+  n = 0
+  win = now
+end
+n = n + 1
+if tonumber(ARGV[1]) == 1 then
+  err = err - alpha * err
+  local ms = tonumber(ARGV[2])
+  if lat < 0 then lat = ms else lat = lat + alpha * (ms - lat) end
+  fails = 0
+  open_until = 0
+else
+  err = err + alpha * (1 - err)
+  fails = fails + 1
+  if open_until > 0 or fails >= tonumber(ARGV[6])
+     or (n >= tonumber(ARGV[5]) and err >= tonumber(ARGV[4])) then
+    if open_until <= now then open_until = now + tonumber(ARGV[7]) end
+  end
+end
+redis.call('HSET', KEYS[1], 'n', n, 'err', tostring(err), 'lat', tostring(lat), 'fails', fails, 'open_until', open_until, 'win', win)
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[8]))
+return {n, tostring(err), tostring(lat), fails, open_until, win}
+"""
+
+# "provider:model" -> {"n", "err", "lat", "fails", "open_until", "win"}
+_SNAPSHOT: Dict[str, Dict[str, float]] = {}
+_probe_at: Dict[str, float] = {}
+_refreshed_at = 0.0
+_TASKS: Set[asyncio.Task] = set()
+_STATS: Dict[str, int] = {"recorded": 0, "trips": 0, "skipped": 0, "probes": 0, "rerouted": 0}
+
+
+def _name(provider: str, model: str) -> str:
+    return f"{provider}:{model}"
+
+
+def _redis_key(name: str) -> str:
+    return f"mh:{name}"
+
+
+def _now_ms() -> float:
+    return time.time() * 1000.0
+
+
+def _parse(raw: Sequence[Any]) -> Dict[str, float]:
+    n, err, lat, fails, open_until, win = raw
+    return {
+        "n": int(n),
+        "err": float(err),
+        "lat": float(lat),
+        "fails": int(fails),
+        "open_until": float(open_until),
+        "win": float(win or 0),
+    }
+
+
+def _apply_local(state: Optional[Dict[str, float]], ok: bool, latency_ms: float) -> Dict[str, float]:
+    """_RECORD_LUA for when Redis is off."""
+    st = dict(state or {"n": 0, "err": 0.0, "lat": -1.0, "fails": 0, "open_until": 0.0})
+    alpha, now = MODEL_HEALTH_EWMA_ALPHA, _now_ms()
+    if now - float(st.get("win") or 0) >= MODEL_CB_WINDOW_S * 1000.0:
+        st["n"], st["win"] = 0, now
+    st["n"] += 1
+    if ok:
+        st["err"] -= alpha * st["err"]
+        st["lat"] = latency_ms if st["lat"] < 0 else st["lat"] + alpha * (latency_ms - st["lat"])
+        st["fails"], st["open_until"] = 0, 0.0
+    else:
+        st["err"] += alpha * (1 - st["err"])
+        st["fails"] += 1
+        if (
+            st["open_until"] > 0
+            or st["fails"] >= MODEL_CB_CONSECUTIVE_FAILURES
+            or (st["n"] >= MODEL_CB_MIN_SAMPLES and st["err"] >= MODEL_CB_ERROR_RATE)
+        ):
+            if st["open_until"] <= now:
+                st["open_until"] = now + MODEL_CB_COOLDOWN_S * 1000.0
+    return st
+
+
+def _set_state(name: str, state: Dict[str, float]) -> None:
+    before = _SNAPSHOT.get(name) or {}
+    if state.get("open_until", 0) > _now_ms() and float(before.get("open_until") or 0) <= _now_ms():
+        _STATS["trips"] += 1
+        logger.warning("model circuit open: %s (err=%.2f, fails=%s)", name, state["err"], int(state["fails"]))
+    _SNAPSHOT[name] = state
+
+
+async def _record_redis(name: str, ok: bool, latency_ms: float) -> None:
+    r = redis_store.get_aredis()
+    if r is None:
+        return
+    try:
+        pipe = r.pipeline(transaction=False)
+        pipe.eval(
+            _RECORD_LUA, 1, _redis_key(name),
+            1 if ok else 0, int(latency_ms), MODEL_HEALTH_EWMA_ALPHA, MODEL_CB_ERROR_RATE,
+            MODEL_CB_MIN_SAMPLES, MODEL_CB_CONSECUTIVE_FAILURES, int(MODEL_CB_COOLDOWN_S * 1000), _TTL_SECONDS,
+            int(MODEL_CB_WINDOW_S * 1000),
+        )
+        pipe.sadd(_KEYS_SET, name)
+        raw, _ = await pipe.execute()
+        _set_state(name, _parse(raw))
+    except Exception as e:
+        logger.debug("model health update failed for %s: %s", name, e)
+
+
+def record(provider: str, model: str, ok: bool, latency_s: float) -> None:
+    """One finished provider call (cancelled calls are not recorded)."""
+    if not MODEL_HEALTH_ENABLED or not model:
+        return
+    _STATS["recorded"] += 1
+    name = _name(provider, model)
+    latency_ms = max(0.0, float(latency_s) * 1000.0)
+    _set_state(name, _apply_local(_SNAPSHOT.get(name), ok, latency_ms))
+    try:
+        task = asyncio.get_running_loop().create_task(_record_redis(name, ok, latency_ms))
+    except RuntimeError:
+        return
+    _TASKS.add(task)
+    task.add_done_callback(_TASKS.discard)
+
+
+async def refresh(force: bool = False) -> None:
+    """Pull the shared state of every known model (throttled)."""
+    global _refreshed_at
+    if not MODEL_HEALTH_ENABLED:
+        return
+    now = time.monotonic()
+    if not force and now - _refreshed_at < MODEL_HEALTH_REFRESH_S:
+        return
+    _refreshed_at = now
+    r = redis_store.get_aredis()
+    if r is None:
+        return
+    try:
+        names = sorted(set(await r.smembers(_KEYS_SET)) | set(_SNAPSHOT))
+        if not names:
+            return
+        pipe = r.pipeline(transaction=False)
+        for name in names:
+            pipe.hmget(_redis_key(name), "n", "err", "lat", "fails", "open_until", "win")
+        rows = await pipe.execute()
+    except Exception as e:
+        logger.debug("model health refresh failed: %s", e)
+        return
+    for name, raw in zip(names, rows):
+        if raw and raw[0] is not None:
+            _SNAPSHOT[name] = _parse(raw)
+
+
+def _state(name: str) -> str:
+    open_until = float((_SNAPSHOT.get(name) or {}).get("open_until") or 0)
+    if open_until <= 0:
+        return "closed"
+    return "open" if _now_ms() < open_until else "half_open"
+
+
+def is_open(provider: str, model: str) -> bool:
+    """True while the breaker is open (no probe is due); does not use up a probe."""
+    return MODEL_HEALTH_ENABLED and _state(_name(provider, model)) == "open"
+
+
+def allow(provider: str, model: str) -> bool:
+    """False while the model's breaker is open; half-open lets one probe through."""
+    if not MODEL_HEALTH_ENABLED:
+        return True
+    name = _name(provider, model)
+    state = _state(name)
+    if state == "closed":
+        return True
+    if state == "open":
+        return False
+    # Half-open: one probe per worker per cool-down
+    now = _now_ms()
+    if now - _probe_at.get(name, 0.0) < MODEL_CB_COOLDOWN_S * 1000.0:
+        return False
+    _probe_at[name] = now
+    _STATS["probes"] += 1
+    return True
+
+
+def score(provider: str, model: str) -> Optional[float]:
+    """Lower is healthier: latency EWMA inflated by the error rate; None if never measured."""
+    st = _SNAPSHOT.get(_name(provider, model))
+    if not st:
+        return None
+    if st["lat"] < 0:
+        return float("inf")  # only failures so far
+    return st["lat"] * (1.0 + 4.0 * st["err"])
+
+
+def _ranked(provider: str, models: Sequence[str]) -> List[str]:
+    """Healthiest first. A never-measured model counts as the median of the
+    measured ones and goes after measured models with the same score, so an
+    idle alias is tried when it is likely no worse, not ahead of good ones."""
+    scores = {m: score(provider, m) for m in models}
+    known = [s for s in scores.values() if s is not None and s != float("inf")]
+    median = statistics.median(known) if known else 0.0
+    return sorted(models, key=lambda m: (median if scores[m] is None else scores[m], scores[m] is None))
+
+
+def pick(provider: str, candidates: Sequence[str]) -> str:
+    """First choice if it is healthy, else the healthiest candidate that is up.
+
+    `candidates` are interchangeable models in order of preference. If every
+    breaker is open the first one is returned (the caller's fallbacks apply).
+    """
+    models = [m for m in dict.fromkeys(candidates) if m]
+    if not models:
+        return ""
+    first = models[0]
+    if not MODEL_HEALTH_ENABLED:
+        return first
+    first_state = _state(_name(provider, first))
+    err = float((_SNAPSHOT.get(_name(provider, first)) or {}).get("err") or 0)
+    if first_state == "closed" and err < MODEL_CB_ERROR_RATE / 2:
+        return first
+    if first_state == "half_open" and allow(provider, first):
+        return first
+    up = [m for m in models if _state(_name(provider, m)) == "closed"]
+    if not up:
+        up = [m for m in models[1:] if allow(provider, m)]
+    if not up:
+        _STATS["skipped"] += 1
+        return first
+    best = _ranked(provider, up)[0]
+    if best != first:
+        _STATS["rerouted"] += 1
+    return best
+
+
+def snapshot() -> Dict[str, Any]:
+    now = _now_ms()
+    models: Dict[str, Any] = {}
+    for name, st in sorted(_SNAPSHOT.items()):
+        open_until = float(st.get("open_until") or 0)
+        models[name] = {
+            "state": _state(name),
+            "error_rate": round(float(st["err"]), 4),
+            "latency_ms": round(float(st["lat"]), 1) if st["lat"] >= 0 else None,
+            "window_calls": int(st["n"]),
+            "consecutive_failures": int(st["fails"]),
+            "open_for_s": round(max(0.0, open_until - now) / 1000.0, 1),
+        }
+    return {**_STATS, "enabled": bool(MODEL_HEALTH_ENABLED), "models": models}
@@ -17,15 +17,18 @@ No external side effects here (no DB writes).
 from __future__ import annotations
 
 import asyncio
+import hashlib
 import json
 import logging
+import math
 import os
 import re
 import time
 import uuid
+from collections import OrderedDict
 from dataclasses import dataclass
 from enum import Enum
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
 import google.generativeai as genai
 from openai import AsyncOpenAI
@@ -48,10 +51,32 @@ from config import (
     CLAUDE_MODEL,
     CLAUDE_WRITER_MODEL,
     AI_TIMEOUT_SECONDS,
+    WRITER_HEDGE_DELAY_S,
+    WRITER_HEDGE_ENABLED,
+    WRITER_HEDGE_MIN_DELAY_S,
+    WRITER_HEDGE_QUANTILE,
+    LATENCY_HISTOGRAM_WINDOW_S,
+    ADAPTIVE_TIMEOUT_ENABLED,
+    ADAPTIVE_TIMEOUT_QUANTILE,
+    ADAPTIVE_TIMEOUT_FACTOR,
+    ADAPTIVE_TIMEOUT_MIN_S,
+    ADAPTIVE_TIMEOUT_MAX_S,
+    ADAPTIVE_TIMEOUT_MIN_SAMPLES,
+    PIPELINED_VERIFY_ENABLED,
+    PIPELINED_VERIFY_CONCURRENCY,
+    PIPELINED_VERIFY_GROUP_SIZE,
 )
 
+import model_health
+import verdict_cache
+from latency_histogram import LatencyRecorder
+
 logger = logging.getLogger("knoweasy.orchestrator")
 
+# Successful call latency: "{provider}:{model}" for every provider call,
+# "writer:{model}" and "writer:{model}:{mode}" for writer drafts.
+_LATENCY = LatencyRecorder(LATENCY_HISTOGRAM_WINDOW_S)
+
 
 # -----------------------------
 # Enums / Context
@@ -150,6 +175,89 @@ def _json_extract(text: str) -> Dict[str, Any]:
             raise ValueError("Model did not return JSON.")
         return json.loads(m.group(0))
 
+_SECTIONS_ARRAY_RE = re.compile(r'"sections"\s*:\s*\[')
+_TOP_STRING_RE = r'"%s"\s*:\s*"((?:[^"\\]|\\.)*)"'
+
+class _SectionStreamParser:
+    """Incrementally extract completed `sections[]` objects from partial writer JSON.
+
+    Feed raw text deltas; every object in the top-level `sections` array is
+    returned exactly once, as soon as its closing brace arrives. Tracks string
+    and escape state so braces inside content never confuse the scanner.
+    """
+
+    def __init__(self) -> None:
+        self.buf = ""
+        self._pos = -1          # scan cursor inside buf (-1 = array not found yet)
+        self._depth = 0
+        self._in_str = False
+        self._esc = False
+        self._obj_start = -1
+        self._closed = False
+        self._header_sent = False
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        self.buf += chunk or ""
+        found: List[Dict[str, Any]] = []
+        if self._closed:
+            return found
+        if self._pos < 0:
+            m = _SECTIONS_ARRAY_RE.search(self.buf)
+            if not m:
+                return found
+            self._pos = m.end()
+        buf = self.buf
+        i = self._pos
+        while i < len(buf):
+            ch = buf[i]
+            if self._in_str:
+                if self._esc:
+                    self._esc = False
+                elif ch == "\\":
+                    self._esc = True
+                elif ch == '"':
+                    self._in_str = False
+            elif ch == '"':
+                self._in_str = True
+            elif ch in "{[":
+                if self._depth == 0 and ch == "{":
+                    self._obj_start = i
+                self._depth += 1
+            elif ch in "}]":
+                if self._depth == 0:
+                    # end of the sections array itself
+                    self._closed = True
+                    i += 1
+                    break
+                self._depth -= 1
+                if self._depth == 0 and ch == "}" and self._obj_start >= 0:
+                    try:
+                        obj = json.loads(buf[self._obj_start:i + 1])
+                    except Exception:
+                        obj = None
+                    if isinstance(obj, dict):
+                        found.append(obj)
+                    self._obj_start = -1
+            i += 1
+        self._pos = i
+        return found
+
+    def header(self) -> Optional[Dict[str, str]]:
+        """Return {title, why_this_matters} once, when both precede `sections`."""
+        if self._header_sent or self._pos < 0:
+            return None
+        head = self.buf[: _SECTIONS_ARRAY_RE.search(self.buf).start()]
+        out: Dict[str, str] = {}
+        for key in ("title", "why_this_matters"):
+            m = re.search(_TOP_STRING_RE % key, head)
+            if m:
+                try:
+                    out[key] = json.loads('"' + m.group(1) + '"')
+                except Exception:
+                    out[key] = m.group(1)
+        self._header_sent = True
+        return out or None
+
 
 # -----------------------------
 # Prompting (sections schema)
@@ -242,26 +350,70 @@ def _user_prompt(ctx: RequestContext) -> str:
 # Providers
 # -----------------------------
 
-async def _gemini_generate(model_name: str, system: str, user: str, timeout_s: int) -> str:
+_GEMINI_GENERATION_CONFIG = {
+    "temperature": 0.2,
+    "max_output_tokens": 4096,
+}
+
+# GenerativeModel instances are cached per (model_name, system prompt hash).
+# Building one per request re-parses the system instruction and, with the
+# old to_thread() transport, pinned a default-executor thread per call.
+_GEMINI_MODEL_CACHE_MAX = 64
+_gemini_models: "OrderedDict[Tuple[str, str], Any]" = OrderedDict()
+
+def _gemini_model(model_name: str, system: str):
     global _gemini_configured
     if not GEMINI_API_KEY:
         raise RuntimeError("GEMINI_API_KEY missing.")
     if not _gemini_configured:
         genai.configure(api_key=GEMINI_API_KEY)
         _gemini_configured = True
+    key = (model_name, hashlib.sha256((system or "").encode("utf-8")).hexdigest()[:16])
+    model = _gemini_models.get(key)
+    if model is not None:
+        _gemini_models.move_to_end(key)
+        return model
     model = genai.GenerativeModel(model_name=model_name, system_instruction=system)
+    _gemini_models[key] = model
+    while len(_gemini_models) > _GEMINI_MODEL_CACHE_MAX:
+        _gemini_models.popitem(last=False)
+    return model
+
+async def _tracked(provider: str, model: str, aw):
+    """Await a provider call and record its outcome in model_health."""
+    started = time.monotonic()
+    try:
+        out = await aw
+    except Exception:
+        model_health.record(provider, model, False, time.monotonic() - started)
+        raise
+    elapsed = time.monotonic() - started
+    model_health.record(provider, model, True, elapsed)
+    _LATENCY.record(f"{provider}:{model}", elapsed)
+    return out
 
-    def _call():
-        resp = model.generate_content(
-            user,
-            generation_config={
-                "temperature": 0.2,
-                "max_output_tokens": 4096,
-            },
-        )
-        return (resp.text or "").strip()
+async def _tracked_stream(provider: str, model: str, agen: AsyncIterator[str]) -> AsyncIterator[str]:
+    """_tracked for a token stream (a consumer closing it early is not recorded)."""
+    started = time.monotonic()
+    try:
+        async for chunk in agen:
+            yield chunk
+    except Exception:
+        model_health.record(provider, model, False, time.monotonic() - started)
+        raise
+    elapsed = time.monotonic() - started
+    model_health.record(provider, model, True, elapsed)
+    _LATENCY.record(f"{provider}:{model}", elapsed)
 
-    return await asyncio.wait_for(asyncio.to_thread(_call), timeout=timeout_s)
+async def _gemini_generate(model_name: str, system: str, user: str, timeout_s: int) -> str:
+    # Native async (grpc.aio) call on the SDK's shared channel: no executor
+    # thread per request, so concurrency is bounded by _SOLVE_SEM only.
+    model = _gemini_model(model_name, system)
+    resp = await _tracked("gemini", model_name, asyncio.wait_for(
+        model.generate_content_async(user, generation_config=_GEMINI_GENERATION_CONFIG),
+        timeout=timeout_s,
+    ))
+    return (resp.text or "").strip()
 
 async def _openai_json(model: str, system: str, user: str, timeout_s: int) -> str:
     global _openai_client
@@ -280,7 +432,7 @@ async def _openai_json(model: str, system: str, user: str, timeout_s: int) -> st
             {"role": "user", "content": user},
         ],
     )
-    resp = await asyncio.wait_for(coro, timeout=timeout_s)
+    resp = await _tracked("openai", model, asyncio.wait_for(coro, timeout=timeout_s))
     return (resp.choices[0].message.content or "").strip()
 
 async def _claude_json(model: str, system: str, user: str, timeout_s: int) -> str:
@@ -297,7 +449,7 @@ async def _claude_json(model: str, system: str, user: str, timeout_s: int) -> st
         system=system,
         messages=[{"role": "user", "content": user}],
     )
-    resp = await asyncio.wait_for(coro, timeout=timeout_s)
+    resp = await _tracked("claude", model, asyncio.wait_for(coro, timeout=timeout_s))
     # anthropic SDK returns list content blocks
     txt = ""
     for b in (resp.content or []):
@@ -306,6 +458,71 @@ async def _claude_json(model: str, system: str, user: str, timeout_s: int) -> st
     return (txt or "").strip()
 
 
+# -----------------------------
+# Streaming providers (token deltas)
+# -----------------------------
+
+async def _iter_with_deadline(
+    agen: AsyncIterator[str], deadline: float, stall_s: float = float("inf")
+) -> AsyncIterator[str]:
+    """Re-yield an async iterator, enforcing one overall deadline (monotonic)
+    and at most `stall_s` of silence before each chunk (the first included)."""
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise asyncio.TimeoutError()
+        try:
+            chunk = await asyncio.wait_for(agen.__anext__(), timeout=min(remaining, stall_s))
+        except StopAsyncIteration:
+            return
+        yield chunk
+
+async def _gemini_stream_raw(model_name: str, system: str, user: str) -> AsyncIterator[str]:
+    model = _gemini_model(model_name, system)
+    resp = await model.generate_content_async(
+        user,
+        generation_config=_GEMINI_GENERATION_CONFIG,
+        stream=True,
+    )
+    async for chunk in resp:
+        try:
+            txt = chunk.text or ""
+        except Exception:
+            # Chunks without text parts (safety/finish metadata) are skipped.
+            txt = ""
+        if txt:
+            yield txt
+
+async def _claude_stream_raw(model: str, system: str, user: str) -> AsyncIterator[str]:
+    global _anthropic_client
+    if not CLAUDE_API_KEY:
+        raise RuntimeError("CLAUDE_API_KEY missing.")
+    if _anthropic_client is None:
+        _anthropic_client = AsyncAnthropic(api_key=CLAUDE_API_KEY)
+    async with _anthropic_client.messages.stream(
+        model=model,
+        max_tokens=4096,
+        temperature=0.2,
+        system=system,
+        messages=[{"role": "user", "content": user}],
+    ) as stream:
+        async for txt in stream.text_stream:
+            if txt:
+                yield txt
+
+def _gemini_stream(
+    model_name: str, system: str, user: str, timeout_s: int, stall_s: float = float("inf")
+) -> AsyncIterator[str]:
+    deltas = _iter_with_deadline(_gemini_stream_raw(model_name, system, user), time.monotonic() + timeout_s, stall_s)
+    return _tracked_stream("gemini", model_name, deltas)
+
+def _claude_stream(
+    model: str, system: str, user: str, timeout_s: int, stall_s: float = float("inf")
+) -> AsyncIterator[str]:
+    deltas = _iter_with_deadline(_claude_stream_raw(model, system, user), time.monotonic() + timeout_s, stall_s)
+    return _tracked_stream("claude", model, deltas)
+
+
 # -----------------------------
 # Verification loop (OpenAI)
 # -----------------------------
@@ -333,12 +550,66 @@ def _checker_user(draft_json: Dict[str, Any], ctx: RequestContext) -> str:
         ensure_ascii=False,
     )
 
+def _section_checker_user(group: List[Tuple[int, Dict[str, Any]]], title: str, ctx: RequestContext) -> str:
+    return json.dumps(
+        {
+            "question": ctx.question,
+            "answer_title": title,
+            "sections": [{"index": i, "section": sec} for i, sec in group],
+            "context": {
+                "subject": ctx.subject,
+                "class_level": ctx.class_level,
+                "exam_mode": ctx.exam_mode,
+                "board": ctx.board,
+                "mode": ctx.answer_mode,
+            },
+            "instruction": (
+                "Verify these sections of a longer answer for correctness and exam-safety. "
+                "Be strict, but do not flag content that other sections would cover."
+            ),
+        },
+        ensure_ascii=False,
+    )
+
+def _section_repair_user(sections: List[Dict[str, Any]], fix: List[str]) -> str:
+    return json.dumps(
+        {
+            "sections": sections,
+            "fix_instructions": fix,
+            "instruction": (
+                "Regenerate ONLY these sections, corrected, as JSON {\"sections\": [...]} "
+                "with the same number of sections, in the same order and with the same keys."
+            ),
+        },
+        ensure_ascii=False,
+    )
+
 
 # -----------------------------
 # Plan / Routing
 # -----------------------------
 
-def _timeout_for(difficulty: Difficulty) -> int:
+def _adaptive_timeout(name: str, static: int) -> int:
+    """quantile x factor of histogram `name` (clamped), or `static` without enough samples."""
+    if not ADAPTIVE_TIMEOUT_ENABLED or _LATENCY.count(name) < max(1, ADAPTIVE_TIMEOUT_MIN_SAMPLES):
+        return static
+    q = _LATENCY.quantile_s(name, ADAPTIVE_TIMEOUT_QUANTILE)
+    if q is None:
+        return static
+    return int(min(ADAPTIVE_TIMEOUT_MAX_S, max(ADAPTIVE_TIMEOUT_MIN_S, math.ceil(q * ADAPTIVE_TIMEOUT_FACTOR))))
+
+def _timeout_for(difficulty: Difficulty, model: str = "", mode: Optional[Mode] = None) -> int:
+    """Writer budget: learned from `model` (per answer mode first) once the
+    histogram has enough samples, else the static difficulty bucket."""
+    static = _static_timeout(difficulty)
+    if model:
+        names = ([f"writer:{model}:{mode.value}"] if mode else []) + [f"writer:{model}"]
+        for name in names:
+            if _LATENCY.count(name) >= max(1, ADAPTIVE_TIMEOUT_MIN_SAMPLES):
+                return _adaptive_timeout(name, static)
+    return static
+
+def _static_timeout(difficulty: Difficulty) -> int:
     base = int(AI_TIMEOUT_SECONDS or 25)
     if difficulty == Difficulty.EASY:
         return min(base, 20)
@@ -349,12 +620,16 @@ def _timeout_for(difficulty: Difficulty) -> int:
     return max(base, 45)
 
 def _gemini_model_for(mode: Mode, difficulty: Difficulty) -> str:
-    # Prefer 2.5 Flash-Lite for ultra fast, 2.5 Flash for most, 2.5 Pro for hard/mastery
+    # Prefer 2.5 Flash-Lite for ultra fast, 2.5 Flash for most, 2.5 Pro for hard/mastery.
+    # A model with an open circuit (or a bad error rate) yields to the
+    # healthiest model of the same group.
+    primary = GEMINI_PRIMARY_MODEL or "gemini-2.5-flash"
+    mastery = os.getenv("GEMINI_MASTERY_MODEL", "gemini-2.5-pro")
     if mode == Mode.LITE and difficulty in {Difficulty.EASY, Difficulty.MEDIUM}:
-        return os.getenv("GEMINI_LITE_MODEL", "gemini-2.5-flash-lite")
+        return model_health.pick("gemini", [os.getenv("GEMINI_LITE_MODEL", "gemini-2.5-flash-lite"), primary])
     if mode == Mode.MASTERY or difficulty in {Difficulty.HARD, Difficulty.EXTREME}:
-        return os.getenv("GEMINI_MASTERY_MODEL", "gemini-2.5-pro")
-    return GEMINI_PRIMARY_MODEL or "gemini-2.5-flash"
+        return model_health.pick("gemini", [mastery, primary])
+    return model_health.pick("gemini", [primary, mastery])
 
 def _should_verify(profile: AcademicProfile, mode: Mode, difficulty: Difficulty) -> bool:
     if profile != AcademicProfile.COMPETITIVE_MENTOR:
@@ -387,45 +662,50 @@ def _guess_reveal_min(section_type: str) -> str:
         return "R2"
     return "R1"
 
+def _card(card_type: str, card_title: str, content: str, reveal_min: str = "R1", visual: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    return {
+        "id": str(uuid.uuid4())[:8],
+        "type": card_type,
+        "title": card_title or "",
+        "content": content or "",
+        "reveal_min": reveal_min,
+        "visual": visual
+    }
+
+def _section_card(s: Dict[str, Any]) -> Dict[str, Any]:
+    """Blueprint card for one writer section (shared by batch + streaming paths)."""
+    stype = (s.get("type") or "explanation")
+    stitle = (s.get("title") or "").strip() or stype.replace("_"," ").title()
+    content = (s.get("content") or "").strip()
+    reveal = _guess_reveal_min(stype)
+    visual = None
+    if stype.lower() == "diagram":
+        # treat content as mermaid if it looks like it; else plain text
+        if re.search(r"^(graph|flowchart|sequenceDiagram|mindmap)\b", content.strip()):
+            visual = {"kind":"mermaid","code":content.strip()}
+            content = ""
+        else:
+            visual = {"kind":"text","text":content}
+            content = ""
+    return _card(stype.lower(), stitle, content, reveal_min=reveal, visual=visual)
+
 def _build_blueprint(out: Dict[str, Any], ctx: RequestContext) -> Dict[str, Any]:
     title = str(out.get("title") or "").strip()
     why = str(out.get("why_this_matters") or "").strip()
     cards = []
-    def add_card(card_type, card_title, content, reveal_min="R1", visual=None):
-        cards.append({
-            "id": str(uuid.uuid4())[:8],
-            "type": card_type,
-            "title": card_title or "",
-            "content": content or "",
-            "reveal_min": reveal_min,
-            "visual": visual
-        })
 
     # Title & Why as cards
     if title:
-        add_card("title", "Title", title, "R0")
+        cards.append(_card("title", "Title", title, "R0"))
     if why:
-        add_card("why", "Why it matters", why, "R0")
+        cards.append(_card("why", "Why it matters", why, "R0"))
 
     # Assumptions (v1.1): always present as a card for exam safety
     assumptions_text = _assumptions_text_from_sections(out.get("sections") or [])
-    add_card("assumptions", "Assumptions", assumptions_text, "R1")
+    cards.append(_card("assumptions", "Assumptions", assumptions_text, "R1"))
 
     for s in (out.get("sections") or []):
-        stype = (s.get("type") or "explanation")
-        stitle = (s.get("title") or "").strip() or stype.replace("_"," ").title()
-        content = (s.get("content") or "").strip()
-        reveal = _guess_reveal_min(stype)
-        visual = None
-        if stype.lower() == "diagram":
-            # treat content as mermaid if it looks like it; else plain text
-            if re.search(r"^(graph|flowchart|sequenceDiagram|mindmap)\b", content.strip()):
-                visual = {"kind":"mermaid","code":content.strip()}
-                content = ""
-            else:
-                visual = {"kind":"text","text":content}
-                content = ""
-        add_card(stype.lower(), stitle, content, reveal_min=reveal, visual=visual)
+        cards.append(_section_card(s))
 
     blueprint = {
         "schema_version": "1.1",
@@ -479,112 +759,458 @@ def _assumptions_text_from_sections(sections: list[dict] | None) -> str:
     return "No special assumptions beyond the information given (and standard textbook conventions) are required."
 
 
-async def _generate(ctx: RequestContext) -> Dict[str, Any]:
-    rid = ctx.request_id or str(uuid.uuid4())
-    # v1.1 Refusal & Redirection (trust-first)
-    refusal_reason = _should_refuse(ctx.question)
-    if refusal_reason:
-        out = {
-            "title": "Let’s do this the right way",
-            "why_this_matters": "Learning the method protects you in exams and builds real understanding.",
-            "sections": [
-                {"type":"refusal","title":"Why I can’t do that","content": refusal_reason},
-                {"type":"next_step","title":"What I can do instead","content":"Share the full question (or what you tried). I’ll teach the correct method with an exam-safe visual and common traps."}
-            ],
-            "providers_used": [],
-            "meta": {"request_id": rid, "mode": getattr(ctx,'answer_mode','tutor'), "verified": False}
-        }
-        out["answer"] = _plain_text_from_sections(out.get("title",""), out.get("why_this_matters",""), out.get("sections",[]))
-        try:
-            out["blueprint"] = _build_blueprint(out, ctx)
-        except Exception:
-            out["blueprint"] = None
-        return out
+def _refusal_answer(ctx: RequestContext, rid: str, refusal_reason: str) -> Dict[str, Any]:
+    out = {
+        "title": "Let’s do this the right way",
+        "why_this_matters": "Learning the method protects you in exams and builds real understanding.",
+        "sections": [
+            {"type":"refusal","title":"Why I can’t do that","content": refusal_reason},
+            {"type":"next_step","title":"What I can do instead","content":"Share the full question (or what you tried). I’ll teach the correct method with an exam-safe visual and common traps."}
+        ],
+        "providers_used": [],
+        "meta": {"request_id": rid, "mode": getattr(ctx,'answer_mode','tutor'), "verified": False}
+    }
+    out["answer"] = _plain_text_from_sections(out.get("title",""), out.get("why_this_matters",""), out.get("sections",[]))
+    try:
+        out["blueprint"] = _build_blueprint(out, ctx)
+    except Exception:
+        out["blueprint"] = None
+    return out
+
 
+@dataclass
+class _Plan:
+    profile: AcademicProfile
+    mode: Mode
+    difficulty: Difficulty
+    timeout_s: int
+    system: str
+    user: str
+    # Picked once per request (model_health state may change mid-solve)
+    writer_provider: str = "gemini"
+    writer: str = ""
+
+    def use_claude_writer(self) -> bool:
+        return self.writer_provider == "claude"
+
+    def writer_model(self) -> str:
+        return self.writer or _gemini_model_for(self.mode, self.difficulty)
+
+
+def _pick_writer(profile: AcademicProfile, mode: Mode, difficulty: Difficulty) -> Tuple[str, str]:
+    """(provider, model) for the writer call."""
+    if difficulty == Difficulty.EXTREME and profile == AcademicProfile.COMPETITIVE_MENTOR and CLAUDE_API_KEY:
+        claude = CLAUDE_WRITER_MODEL or CLAUDE_MODEL or "claude-sonnet-4-5"
+        if model_health.allow("claude", claude):
+            return "claude", claude
+    return "gemini", _gemini_model_for(mode, difficulty)
+
+
+def _plan_for(ctx: RequestContext) -> _Plan:
     profile = select_profile(ctx)
     mode = ctx.mode()
     difficulty = estimate_difficulty(ctx.question, profile)
-    timeout_s = _timeout_for(difficulty)
+    writer_provider, writer = _pick_writer(profile, mode, difficulty)
+    return _Plan(
+        profile=profile,
+        mode=mode,
+        difficulty=difficulty,
+        timeout_s=_timeout_for(difficulty, writer, mode),
+        system=_system_prompt(profile, mode, ctx),
+        user=_user_prompt(ctx),
+        writer_provider=writer_provider,
+        writer=writer,
+    )
 
-    system = _system_prompt(profile, mode, ctx)
-    user = _user_prompt(ctx)
 
-    providers_used: List[str] = []
-    draft_text: str = ""
+# -----------------------------
+# Writer hedging
+# -----------------------------
+# The writer chain is the planned writer, then GEMINI_FALLBACK_MODELS. A
+# call that hasn't answered by its model's observed p90 latency gets a backup
+# call to the next model; the first valid JSON wins and the rest are
+# cancelled. A failed call fails over at once. plan.timeout_s bounds the
+# whole chain, not each attempt.
+
+_WRITER_LATENCY_MIN_SAMPLES = 20
+_WRITER_STATS: Dict[str, int] = {"calls": 0, "hedges": 0, "failovers": 0, "backup_won": 0, "deadline": 0}
+
+
+@dataclass(frozen=True)
+class _WriterCall:
+    provider: str  # gemini|claude
+    model: str
+
+    async def run(self, plan: _Plan, timeout_s: float) -> str:
+        if self.provider == "claude":
+            return await _claude_json(self.model, plan.system, plan.user, timeout_s)
+        return await _gemini_generate(self.model, plan.system, plan.user, timeout_s)
+
+
+def _record_writer_latency(model: str, mode: Mode, seconds: float) -> None:
+    _LATENCY.record(f"writer:{model}", seconds)
+    _LATENCY.record(f"writer:{model}:{mode.value}", seconds)
+
+
+def _hedge_delay(model: str) -> float:
+    """Seconds to wait on `model` before firing a backup call."""
+    if not WRITER_HEDGE_ENABLED:
+        return float("inf")
+    q = None
+    if _LATENCY.count(f"writer:{model}") >= _WRITER_LATENCY_MIN_SAMPLES:
+        q = _LATENCY.quantile_s(f"writer:{model}", WRITER_HEDGE_QUANTILE)
+    return max(WRITER_HEDGE_MIN_DELAY_S, WRITER_HEDGE_DELAY_S if q is None else q)
+
+
+def _writer_chain(plan: _Plan, include_primary: bool = True) -> List[_WriterCall]:
+    """Planned writer, then the fallbacks whose circuit is not open."""
+    chain: List[_WriterCall] = []
+    if include_primary:
+        chain.append(_WriterCall(plan.writer_provider, plan.writer_model()))
+    fallbacks = [_WriterCall("gemini", m) for m in dict.fromkeys(GEMINI_FALLBACK_MODELS or [])]
+    for call in fallbacks:
+        if call not in chain and model_health.allow(call.provider, call.model):
+            chain.append(call)
+    if not chain and fallbacks:
+        chain.append(fallbacks[0])  # every circuit open: still try one
+    return chain
+
+
+async def _hedged_write(plan: _Plan, providers_used: List[str], chain: List[_WriterCall], deadline: float) -> str:
+    """First valid writer JSON from `chain` by `deadline` (monotonic), or ""."""
+    queue = list(chain)
+    pending: Dict["asyncio.Task[str]", Tuple[_WriterCall, float]] = {}
+    next_hedge = 0.0
+    try:
+        while queue or pending:
+            now = time.monotonic()
+            if now >= deadline:
+                _WRITER_STATS["deadline"] += 1
+                logger.warning("Writer chain ran out of time (%s in flight)", len(pending))
+                return ""
+            if queue and now >= next_hedge:
+                if pending:
+                    _WRITER_STATS["hedges"] += 1
+                call = queue.pop(0)
+                _WRITER_STATS["calls"] += 1
+                task = asyncio.ensure_future(call.run(plan, max(0.1, deadline - now)))
+                pending[task] = (call, now)
+                next_hedge = now + _hedge_delay(call.model)
+                continue
+            wake = min(deadline, next_hedge) if queue else deadline
+            done, _ = await asyncio.wait(
+                set(pending), timeout=max(0.0, wake - now), return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                call, started = pending.pop(task)
+                try:
+                    text = task.result()
+                    _json_extract(text)
+                except Exception as e:
+                    logger.warning("Writer %s failed: %s", call.model, str(e)[:200])
+                    _WRITER_STATS["failovers"] += 1
+                    next_hedge = 0.0
+                    continue
+                _record_writer_latency(call.model, plan.mode, time.monotonic() - started)
+                if call != chain[0]:
+                    _WRITER_STATS["backup_won"] += 1
+                providers_used.append(call.provider)
+                return text
+        return ""
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def _writer_stream(plan: _Plan) -> Tuple[str, AsyncIterator[str]]:
+    """(provider, text deltas) for the planned writer.
+
+    Streaming can't be hedged token by token, so the stream stands in for
+    the first call of the chain: it raises if the writer's circuit opened
+    since planning, and fails once it is silent for the writer's hedge delay
+    (before the first token or between tokens). Callers then hand over to
+    the hedged fallback chain (`_fallback_write`) with the budget left.
+    """
+    model = plan.writer_model()
+    if model_health.is_open(plan.writer_provider, model):
+        raise RuntimeError(f"circuit open for {model}")
+    stall_s = _hedge_delay(model)
+    if plan.use_claude_writer():
+        return "claude", _claude_stream(model, plan.system, plan.user, plan.timeout_s, stall_s)
+    return "gemini", _gemini_stream(model, plan.system, plan.user, plan.timeout_s, stall_s)
 
-    # Writer routing
+
+async def _write_with_fallbacks(plan: _Plan, providers_used: List[str]) -> str:
+    """Writer call (non-streaming): hedged over the fallback chain."""
+    return await _hedged_write(plan, providers_used, _writer_chain(plan), time.monotonic() + plan.timeout_s)
+
+
+async def _fallback_write(plan: _Plan, providers_used: List[str], deadline: Optional[float] = None) -> str:
+    # Fallback attempt: Gemini fallbacks (after the streaming writer failed)
+    if deadline is None:
+        deadline = time.monotonic() + plan.timeout_s
+    return await _hedged_write(plan, providers_used, _writer_chain(plan, include_primary=False), deadline)
+
+
+def _unavailable_answer(rid: str, plan: _Plan, providers_used: List[str]) -> Dict[str, Any]:
+    # deterministic fallback
+    return {
+        "title": "Unable to generate right now",
+        "why_this_matters": "Network/provider issue — here’s a safe fallback explanation.",
+        "sections": [
+            {"type": "definition", "title": "What you can do", "content": "Please try again in a moment. If the issue persists, contact support."}
+        ],
+        "providers_used": providers_used,
+        "meta": {
+            "request_id": rid,
+            "mode": plan.mode.value,
+            "profile": plan.profile.value,
+            "difficulty": plan.difficulty.value,
+            "verified": False,
+        }
+    }
+
+
+def _repair_model() -> str:
+    # Use Gemini Pro-ish for repair
+    return os.getenv("GEMINI_REPAIR_MODEL", "gemini-2.5-flash")
+
+
+def _verifier_model() -> str:
+    return OPENAI_VERIFIER_MODEL or OPENAI_MODEL or "o3-mini"
+
+
+async def _verdict(ctx: RequestContext, plan: _Plan, checked: Dict[str, Any], user: str) -> Tuple[Dict[str, Any], bool]:
+    """(verdict, from_cache) for `checked`; a cached verdict skips the verifier call."""
+    model = _verifier_model()
+    cache_key = verdict_cache.key(
+        checked, ctx.subject, ctx.class_level, ctx.exam_mode, ctx.board, plan.mode.value, model
+    )
+    cached = await verdict_cache.aget(cache_key)
+    if cached is not None:
+        return cached, True
+    chk_text = await _openai_json(
+        model,
+        _checker_system(),
+        user,
+        _adaptive_timeout(f"openai:{model}", min(plan.timeout_s, 35)),
+    )
+    chk = _json_extract(chk_text)
+    await verdict_cache.aput(cache_key, chk)
+    return chk, False
+
+
+async def _verify_sequential(
+    ctx: RequestContext, plan: _Plan, draft: Dict[str, Any], providers_used: List[str], stage_ms: Dict[str, float]
+) -> Tuple[Dict[str, Any], bool, List[str]]:
+    """Whole-draft verification, then (if flagged) one whole-draft repair."""
+    verified = False
+    verification_notes: List[str] = []
+    t0 = time.monotonic()
     try:
-        if difficulty == Difficulty.EXTREME and profile == AcademicProfile.COMPETITIVE_MENTOR and CLAUDE_API_KEY:
-            # Claude writer for extreme (deep reasoning), then Gemini can be used later if needed
-            draft_text = await _claude_json(CLAUDE_WRITER_MODEL or CLAUDE_MODEL or "claude-sonnet-4-5", system, user, timeout_s)
-            providers_used.append("claude")
+        chk, cached = await _verdict(ctx, plan, draft, _checker_user(draft, ctx))
+        stage_ms["verify"] = (time.monotonic() - t0) * 1000
+        if not cached:
+            providers_used.append("openai")
+        if chk.get("ok") is True:
+            verified = True
         else:
-            model = _gemini_model_for(mode, difficulty)
-            draft_text = await _gemini_generate(model, system, user, timeout_s)
+            verification_notes = (chk.get("issues") or [])[:8]
+            fix = (chk.get("fix_instructions") or [])[:8]
+            # One repair pass with same writer (Gemini preferred for formatting)
+            repair_user = json.dumps(
+                {"draft": draft, "fix_instructions": fix, "instruction": "Regenerate corrected JSON only."},
+                ensure_ascii=False,
+            )
+            t1 = time.monotonic()
+            repair_model = _repair_model()
+            repair_timeout = _adaptive_timeout(f"gemini:{repair_model}", plan.timeout_s)
+            repaired_text = await _gemini_generate(repair_model, plan.system, repair_user, repair_timeout)
+            stage_ms["repair"] = (time.monotonic() - t1) * 1000
             providers_used.append("gemini")
+            draft = _json_extract(repaired_text)
+            verified = True  # verified-after-fix (best effort)
     except Exception as e:
-        logger.exception("Writer failed: %s", e)
-        # Fallback attempt: Gemini fallbacks
-        for m in (GEMINI_FALLBACK_MODELS or []):
-            try:
-                draft_text = await _gemini_generate(m, system, user, timeout_s)
-                providers_used.append("gemini")
-                break
-            except Exception:
+        logger.warning("Verifier failed: %s", str(e)[:200])
+    return draft, verified, verification_notes
+
+
+class _SectionVerifier:
+    """Pipelined verification: sections are checked while the writer streams.
+
+    Completed sections are buffered and sent to the verifier in groups of
+    PIPELINED_VERIFY_GROUP_SIZE, one call per group, as soon as a group is
+    full. `finish` flushes the last partial group once the draft is done,
+    waits for the outstanding verdicts and regenerates only the flagged
+    groups, in parallel.
+
+    A group is keyed and checked only once the answer title is known (the
+    streamed header, else the final draft), so its verdict key and prompt do
+    not depend on stream timing.
+    """
+
+    def __init__(self, ctx: RequestContext, plan: _Plan) -> None:
+        self._ctx = ctx
+        self._plan = plan
+        self._sem = asyncio.Semaphore(max(1, PIPELINED_VERIFY_CONCURRENCY))
+        self._group_size = max(1, PIPELINED_VERIFY_GROUP_SIZE)
+        self._buffer: List[Tuple[int, Dict[str, Any]]] = []
+        self._checks: List[Tuple[List[Tuple[int, Dict[str, Any]]], "asyncio.Future[Dict[str, Any]]"]] = []
+        self._called = False  # any verdict not served from the cache
+        self.title = ""
+        self._titled = asyncio.Event()
+
+    def set_title(self, title: str) -> None:
+        """Answer title from the streamed header; releases the waiting checks."""
+        if title:
+            self.title = title
+            self._titled.set()
+
+    def submit(self, index: int, section: Dict[str, Any]) -> None:
+        if not isinstance(section, dict) or section.get("type") == "header":
+            return
+        self._buffer.append((index, section))
+        if len(self._buffer) >= self._group_size:
+            self._dispatch()
+
+    def _dispatch(self) -> None:
+        group, self._buffer = self._buffer, []
+        if group:
+            self._checks.append((group, asyncio.ensure_future(self._check(group))))
+
+    async def _check(self, group: List[Tuple[int, Dict[str, Any]]]) -> Dict[str, Any]:
+        await self._titled.wait()
+        # Keyed on everything the checker prompt shows except the indices (the
+        # board and the rest of the context are part of the key itself)
+        checked = {"question": self._ctx.question, "answer_title": self.title, "sections": [sec for _, sec in group]}
+        async with self._sem:
+            chk, cached = await _verdict(
+                self._ctx, self._plan, checked, _section_checker_user(group, self.title, self._ctx)
+            )
+        if not cached:
+            self._called = True
+        return chk
+
+    async def _repair(self, sections: List[Dict[str, Any]], fix: List[str]) -> List[Dict[str, Any]]:
+        model = _repair_model()
+        text = await _gemini_generate(
+            model,
+            self._plan.system,
+            _section_repair_user(sections, fix),
+            _adaptive_timeout(f"gemini:{model}", self._plan.timeout_s),
+        )
+        obj = _json_extract(text)
+        new = obj.get("sections") if isinstance(obj.get("sections"), list) else [obj]
+        if len(new) != len(sections) or any(
+            not isinstance(sec, dict) or not set(sec) - {"type", "title"} for sec in new
+        ):
+            raise ValueError("Repair did not return the sections it was given.")
+        for old, sec in zip(sections, new):
+            sec.setdefault("type", old.get("type"))
+        return new
+
+    def reset(self) -> None:
+        """Drop every pending check (writer restarted, or the solve is over)."""
+        for _, fut in self._checks:
+            fut.cancel()
+        self._checks.clear()
+        self._buffer.clear()
+        # A restarted writer may title its answer differently
+        self.title = ""
+        self._titled.clear()
+
+    async def finish(
+        self, draft: Dict[str, Any], providers_used: List[str], stage_ms: Dict[str, float]
+    ) -> Tuple[Dict[str, Any], bool, List[str]]:
+        sections = list(draft.get("sections") or [])
+        self.title = self.title or str(draft.get("title") or "")
+        self._titled.set()
+        # Keep the groups the final draft still has as-is; sections the
+        # stream did not deliver (batch fallback, parser miss) are regrouped
+        kept = []
+        for group, fut in self._checks:
+            if all(i < len(sections) and sections[i] == sec for i, sec in group):
+                kept.append((group, fut))
+            else:
+                fut.cancel()
+        self._checks = kept
+        covered = {i for group, _ in kept for i, _ in group}
+        self._buffer = []
+        for i, sec in enumerate(sections):
+            if i not in covered:
+                self.submit(i, sec)
+        self._dispatch()
+
+        t0 = time.monotonic()
+        verdicts = await asyncio.gather(*[fut for _, fut in self._checks], return_exceptions=True)
+        stage_ms["verify"] = (time.monotonic() - t0) * 1000
+
+        ok = True
+        notes: List[str] = []
+        flagged: List[Tuple[List[int], List[str]]] = []
+        for (group, _), chk in zip(self._checks, verdicts):
+            indices = [i for i, _ in group]
+            if not isinstance(chk, dict):
+                ok = False
+                logger.warning("Section verifier failed (sections %s): %s", indices, str(chk)[:200])
                 continue
+            if chk.get("ok") is not True:
+                notes.extend(str(x) for x in (chk.get("issues") or []))
+                flagged.append((indices, [str(x) for x in (chk.get("fix_instructions") or [])][:8]))
+        if self._called:
+            providers_used.append("openai")
+
+        if flagged:
+            t1 = time.monotonic()
+            repaired = await asyncio.gather(
+                *[self._repair([sections[i] for i in indices], fix) for indices, fix in flagged],
+                return_exceptions=True,
+            )
+            stage_ms["repair"] = (time.monotonic() - t1) * 1000
+            for (indices, _), new in zip(flagged, repaired):
+                if isinstance(new, list):
+                    for i, sec in zip(indices, new):
+                        sections[i] = sec
+                else:
+                    ok = False
+                    logger.warning("Section repair failed (sections %s): %s", indices, str(new)[:200])
+            providers_used.append("gemini")
 
-    if not draft_text:
-        # deterministic fallback
-        return {
-            "title": "Unable to generate right now",
-            "why_this_matters": "Network/provider issue — here’s a safe fallback explanation.",
-            "sections": [
-                {"type": "definition", "title": "What you can do", "content": "Please try again in a moment. If the issue persists, contact support."}
-            ],
-            "providers_used": providers_used,
-            "meta": {
-                "request_id": rid,
-                "mode": mode.value,
-                "profile": profile.value,
-                "difficulty": difficulty.value,
-                "verified": False,
-            }
-        }
+        out = dict(draft)
+        out["sections"] = sections
+        return out, ok and bool(self._checks), notes[:8]
+
+
+def _pipelined(plan: _Plan) -> bool:
+    return bool(
+        PIPELINED_VERIFY_ENABLED
+        and plan.difficulty in {Difficulty.HARD, Difficulty.EXTREME}
+        and _should_verify(plan.profile, plan.mode, plan.difficulty)
+        and OPENAI_API_KEY
+    )
 
+
+async def _finalize(
+    ctx: RequestContext,
+    rid: str,
+    plan: _Plan,
+    draft_text: str,
+    providers_used: List[str],
+    stage_ms: Optional[Dict[str, float]] = None,
+    verifier: Optional[_SectionVerifier] = None,
+) -> Dict[str, Any]:
+    """Verify (if needed), stamp meta and build the renderer payload."""
     draft = _json_extract(draft_text)
+    stage_ms = stage_ms if stage_ms is not None else {}
 
     # Verify if needed
     verified = False
     verification_notes: List[str] = []
-    if _should_verify(profile, mode, difficulty) and OPENAI_API_KEY:
-        try:
-            chk_text = await _openai_json(
-                OPENAI_VERIFIER_MODEL or OPENAI_MODEL or "o3-mini",
-                _checker_system(),
-                _checker_user(draft, ctx),
-                min(timeout_s, 35),
-            )
-            chk = _json_extract(chk_text)
-            if chk.get("ok") is True:
-                verified = True
-                providers_used.append("openai")
-            else:
-                verification_notes = (chk.get("issues") or [])[:8]
-                fix = (chk.get("fix_instructions") or [])[:8]
-                # One repair pass with same writer (Gemini preferred for formatting)
-                repair_user = json.dumps(
-                    {"draft": draft, "fix_instructions": fix, "instruction": "Regenerate corrected JSON only."},
-                    ensure_ascii=False,
-                )
-                # Use Gemini Pro-ish for repair
-                repair_model = os.getenv("GEMINI_REPAIR_MODEL", "gemini-2.5-flash")
-                repaired_text = await _gemini_generate(repair_model, system, repair_user, timeout_s)
-                providers_used.append("openai")
-                providers_used.append("gemini")
-                draft = _json_extract(repaired_text)
-                verified = True  # verified-after-fix (best effort)
-        except Exception as e:
-            logger.warning("Verifier failed: %s", str(e)[:200])
+    if _should_verify(plan.profile, plan.mode, plan.difficulty) and OPENAI_API_KEY:
+        if verifier is not None:
+            draft, verified, verification_notes = await verifier.finish(draft, providers_used, stage_ms)
+        else:
+            draft, verified, verification_notes = await _verify_sequential(ctx, plan, draft, providers_used, stage_ms)
 
     # Stamp meta & normalize for frontend
     out: Dict[str, Any] = dict(draft)
@@ -592,11 +1218,15 @@ async def _generate(ctx: RequestContext) -> Dict[str, Any]:
     out["providers_used"] = list(dict.fromkeys(providers_used))
     out["meta"] = {
         "request_id": rid,
-        "mode": mode.value,
-        "profile": profile.value,
-        "difficulty": difficulty.value,
+        "mode": plan.mode.value,
+        "profile": plan.profile.value,
+        "difficulty": plan.difficulty.value,
         "verified": bool(verified),
         "verification_notes": verification_notes,
+        "pipelined": verifier is not None,
+        # Time each stage added to the response (verify: waiting on verdicts
+        # after the writer finished; pipelined checks overlap the writer)
+        "stage_ms": {k: int(round(v)) for k, v in stage_ms.items()},
         "models": {
             "gemini_primary": GEMINI_PRIMARY_MODEL,
             "openai_verifier": OPENAI_VERIFIER_MODEL or OPENAI_MODEL,
@@ -613,8 +1243,161 @@ async def _generate(ctx: RequestContext) -> Dict[str, Any]:
     return out
 
 
+async def _generate(ctx: RequestContext) -> Dict[str, Any]:
+    rid = ctx.request_id or str(uuid.uuid4())
+    # v1.1 Refusal & Redirection (trust-first)
+    refusal_reason = _should_refuse(ctx.question)
+    if refusal_reason:
+        return _refusal_answer(ctx, rid, refusal_reason)
+
+    await model_health.refresh()
+    plan = _plan_for(ctx)
+    providers_used: List[str] = []
+
+    stage_ms: Dict[str, float] = {}
+
+    # Writer routing
+    if not _pipelined(plan):
+        t0 = time.monotonic()
+        draft_text = await _write_with_fallbacks(plan, providers_used)
+        stage_ms["writer"] = (time.monotonic() - t0) * 1000
+        if not draft_text:
+            return _unavailable_answer(rid, plan, providers_used)
+        return await _finalize(ctx, rid, plan, draft_text, providers_used, stage_ms)
+
+    verifier = _SectionVerifier(ctx, plan)
+    try:
+        t0 = time.monotonic()
+        draft_text = await _stream_write_checked(plan, providers_used, verifier)
+        stage_ms["writer"] = (time.monotonic() - t0) * 1000
+        if not draft_text:
+            return _unavailable_answer(rid, plan, providers_used)
+        return await _finalize(ctx, rid, plan, draft_text, providers_used, stage_ms, verifier)
+    finally:
+        verifier.reset()
+
+
+async def _stream_write_checked(plan: _Plan, providers_used: List[str], verifier: _SectionVerifier) -> str:
+    """Streaming writer for `_generate`: each section goes to the verifier as it completes."""
+    parser = _SectionStreamParser()
+    n_sections = 0
+    started = time.monotonic()
+    try:
+        provider, deltas = _writer_stream(plan)
+        async for delta in deltas:
+            sections = parser.feed(delta)
+            head = parser.header()
+            if head:
+                verifier.set_title(head.get("title", ""))
+            for s in sections:
+                verifier.submit(n_sections, s)
+                n_sections += 1
+        _json_extract(parser.buf)
+        providers_used.append(provider)
+        _record_writer_latency(plan.writer_model(), plan.mode, time.monotonic() - started)
+        return parser.buf
+    except Exception as e:
+        logger.warning("Streaming writer failed (%s); using batch fallbacks", str(e)[:200] or type(e).__name__)
+        verifier.reset()
+        return await _fallback_write(plan, providers_used, started + plan.timeout_s)
+
+
+async def stream_generate(ctx: RequestContext) -> AsyncIterator[Dict[str, Any]]:
+    """Streaming variant of `_generate`.
+
+    Yields event dicts `{"event": name, "data": payload}`:
+    - start:   plan summary (mode/profile/difficulty)
+    - delta:   raw writer token text, forwarded as it arrives
+    - header:  title + why_this_matters, once they are complete
+    - section: each completed section with its blueprint card
+    - restart: the writer stream broke; discard sections received so far
+    - done:    the full answer, identical in shape to `_generate`
+
+    When verification applies, streamed sections are marked provisional; the
+    `done` payload is authoritative.
+    """
+    rid = ctx.request_id or str(uuid.uuid4())
+    refusal_reason = _should_refuse(ctx.question)
+    if refusal_reason:
+        yield {"event": "done", "data": _refusal_answer(ctx, rid, refusal_reason)}
+        return
+
+    await model_health.refresh()
+    plan = _plan_for(ctx)
+    provisional = bool(_should_verify(plan.profile, plan.mode, plan.difficulty) and OPENAI_API_KEY)
+    verifier = _SectionVerifier(ctx, plan) if _pipelined(plan) else None
+    yield {
+        "event": "start",
+        "data": {
+            "request_id": rid,
+            "mode": plan.mode.value,
+            "profile": plan.profile.value,
+            "difficulty": plan.difficulty.value,
+            "provisional": provisional,
+        },
+    }
+
+    try:
+        providers_used: List[str] = []
+        stage_ms: Dict[str, float] = {}
+        parser = _SectionStreamParser()
+        n_sections = 0
+        started = time.monotonic()
+        deadline = started + plan.timeout_s
+        try:
+            provider, deltas = _writer_stream(plan)
+            async for delta in deltas:
+                yield {"event": "delta", "data": {"text": delta}}
+                sections = parser.feed(delta)
+                head = parser.header()
+                if head:
+                    if verifier is not None:
+                        verifier.set_title(head.get("title", ""))
+                    yield {"event": "header", "data": head}
+                for s in sections:
+                    if verifier is not None:
+                        verifier.submit(n_sections, s)
+                    yield {
+                        "event": "section",
+                        "data": {"index": n_sections, "section": s, "card": _section_card(s), "provisional": provisional},
+                    }
+                    n_sections += 1
+            # A truncated/malformed stream is a writer failure, not a draft
+            _json_extract(parser.buf)
+            providers_used.append(provider)
+            draft_text = parser.buf
+            _record_writer_latency(plan.writer_model(), plan.mode, time.monotonic() - started)
+        except Exception as e:
+            logger.warning("Streaming writer failed (%s); using batch fallbacks", str(e)[:200] or type(e).__name__)
+            if verifier is not None:
+                verifier.reset()
+            if parser.buf:
+                yield {"event": "restart", "data": {"reason": "writer_stream_failed"}}
+            # Same overall budget as the batch writer: fallbacks get what is left
+            draft_text = await _fallback_write(plan, providers_used, deadline)
+        stage_ms["writer"] = (time.monotonic() - started) * 1000
+
+        if not draft_text:
+            yield {"event": "done", "data": _unavailable_answer(rid, plan, providers_used)}
+            return
+        yield {"event": "done", "data": await _finalize(ctx, rid, plan, draft_text, providers_used, stage_ms, verifier)}
+    finally:
+        # Client gone or solve over: no verdict is needed any more
+        if verifier is not None:
+            verifier.reset()
+
+
+async def agenerate_learning_answer(ctx: RequestContext) -> Dict[str, Any]:
+    """Async entrypoint used by FastAPI routers (runs on the server loop)."""
+    return await _generate(ctx)
+
+
 def generate_learning_answer(ctx: RequestContext) -> Dict[str, Any]:
-    """Sync wrapper used by FastAPI routers."""
+    """Sync wrapper for scripts/tests.
+
+    Do not call from inside the server: the Gemini async channel is bound to
+    the loop that first used it, and this wrapper spins up a fresh loop.
+    """
     try:
         return asyncio.run(_generate(ctx))
     except RuntimeError:
@@ -626,8 +1409,7 @@ def generate_learning_answer(ctx: RequestContext) -> Dict[str, Any]:
             loop.close()
 # --- Backward compatibility for router.py ---
 
-async def solve(question: str, context: dict = None, user_tier: str = "free", answer_mode: str = "tutor", **_kwargs):
-    """Async entrypoint used by router.py (positional args compatible)."""
+def _legacy_context(question: str, context: Optional[dict], user_tier: str, answer_mode: str) -> RequestContext:
     ctx = RequestContext(
         request_id=str(uuid.uuid4()),
         question=question or "",
@@ -639,11 +1421,46 @@ async def solve(question: str, context: dict = None, user_tier: str = "free", an
     for k in ["board","class_level","subject","chapter","exam_mode","language","study_mode"]:
         if k in c and getattr(ctx, k, "") in ("", None):
             setattr(ctx, k, c.get(k) or "")
-    return await _generate(ctx)
+    return ctx
+
+async def solve(question: str, context: dict = None, user_tier: str = "free", answer_mode: str = "tutor", **_kwargs):
+    """Async entrypoint used by router.py (positional args compatible)."""
+    return await _generate(_legacy_context(question, context, user_tier, answer_mode))
+
+def solve_stream(question: str, context: dict = None, user_tier: str = "free", answer_mode: str = "tutor", **_kwargs) -> AsyncIterator[Dict[str, Any]]:
+    """Streaming twin of `solve` (same arguments); see `stream_generate`."""
+    return stream_generate(_legacy_context(question, context, user_tier, answer_mode))
 
 
 def get_orchestrator_stats():
     return {
         "engine": "one-brain",
-        "status": "ok"
+        "status": "ok",
+        "writer": {
+            **_WRITER_STATS,
+        },
+        "model_health": model_health.snapshot(),
+        "verdict_cache": verdict_cache.stats(),
+    }
+
+
+def latency_snapshot(with_buckets: bool = False) -> Dict[str, Any]:
+    """Latency histograms (this worker) and the timeouts derived from them."""
+    hists = _LATENCY.snapshot(with_buckets=with_buckets)
+    timeouts: Dict[str, Any] = {}
+    hedge: Dict[str, Any] = {}
+    for name in hists:
+        if not name.startswith("writer:"):
+            continue
+        timeouts[name] = _adaptive_timeout(name, 0) or None
+        parts = name.split(":")
+        if len(parts) == 2 and WRITER_HEDGE_ENABLED:
+            hedge[parts[1]] = round(_hedge_delay(parts[1]), 2)
+    return {
+        "window_s": LATENCY_HISTOGRAM_WINDOW_S,
+        "adaptive_timeouts": bool(ADAPTIVE_TIMEOUT_ENABLED),
+        "min_samples": ADAPTIVE_TIMEOUT_MIN_SAMPLES,
+        "histograms": hists,
+        "timeout_s": timeouts,
+        "hedge_delay_s": hedge,
     }
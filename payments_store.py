@@ -14,6 +14,7 @@ Stores
 
 from __future__ import annotations
 
+import asyncio
 import logging
 import os
 from datetime import datetime, timedelta, timezone
@@ -22,11 +23,12 @@ from typing import Any, Dict, Optional
 from sqlalchemy import text
 from sqlalchemy.engine import Engine
 from shared_engine import get_engine as _shared_get_engine
+from shared_engine import get_async_engine
+import account_cache
+import schema_ready
 
 logger = logging.getLogger("knoweasy-engine-api.payments")
 
-_TABLES_READY: bool = False
-
 def get_engine_safe() -> Optional[Engine]:
     """Public, best-effort engine accessor for other modules (billing_store, etc.)."""
     try:
@@ -41,15 +43,11 @@ def _get_engine():
     return _shared_get_engine()
 
 def ensure_tables() -> None:
-    global _TABLES_READY
-    if _TABLES_READY:
-        return
+    # No engine yet (or env missing): schema_ready doesn't cache that, so the next call retries.
+    schema_ready.ensure("payments", _create_tables)
 
-    eng = _get_engine()
-    if eng is None:
-        # DB not ready yet (or env missing). Do NOT lock this forever; allow retry on next call.
-        return
 
+def _create_tables(conn) -> None:
     ddl = [
         """
         CREATE TABLE IF NOT EXISTS subscriptions (
@@ -86,87 +84,126 @@ def ensure_tables() -> None:
         "CREATE INDEX IF NOT EXISTS idx_payments_user_created ON payments(user_id, created_at DESC);",
     ]
 
-    try:
-        with eng.begin() as conn:
-            for stmt in ddl:
+    for stmt in ddl:
+        conn.execute(text(stmt))
+    # --- lightweight schema repair (idempotent) ---
+    # Older DBs may have subscriptions/payments tables missing columns.
+    # We repair using ALTER TABLE ... ADD COLUMN IF NOT EXISTS (Postgres-safe).
+    repairs = [
+        "ALTER TABLE IF EXISTS subscriptions ADD COLUMN IF NOT EXISTS plan TEXT NOT NULL DEFAULT 'free';",
+        "ALTER TABLE IF EXISTS subscriptions ADD COLUMN IF NOT EXISTS billing_cycle TEXT;",
+        "ALTER TABLE IF EXISTS subscriptions ADD COLUMN IF NOT EXISTS status TEXT NOT NULL DEFAULT 'active';",
+        "ALTER TABLE IF EXISTS subscriptions ADD COLUMN IF NOT EXISTS starts_at TIMESTAMPTZ NOT NULL DEFAULT NOW();",
+        "ALTER TABLE IF EXISTS subscriptions ADD COLUMN IF NOT EXISTS expires_at TIMESTAMPTZ;",
+        "ALTER TABLE IF EXISTS subscriptions ADD COLUMN IF NOT EXISTS created_at TIMESTAMPTZ NOT NULL DEFAULT NOW();",
+        "ALTER TABLE IF EXISTS subscriptions ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW();",
+        "ALTER TABLE IF EXISTS payments ADD COLUMN IF NOT EXISTS plan TEXT;",
+        "ALTER TABLE IF EXISTS payments ADD COLUMN IF NOT EXISTS payment_type TEXT DEFAULT 'subscription';",
+        "ALTER TABLE IF EXISTS payments ADD COLUMN IF NOT EXISTS billing_cycle TEXT;",
+        "ALTER TABLE IF EXISTS payments ADD COLUMN IF NOT EXISTS booster_sku TEXT;",
+        "ALTER TABLE IF EXISTS payments ADD COLUMN IF NOT EXISTS amount_paise INT;",
+        "ALTER TABLE IF EXISTS payments ADD COLUMN IF NOT EXISTS currency TEXT DEFAULT 'INR';",
+        "ALTER TABLE IF EXISTS payments ADD COLUMN IF NOT EXISTS razorpay_order_id TEXT;",
+        "ALTER TABLE IF EXISTS payments ADD COLUMN IF NOT EXISTS razorpay_payment_id TEXT;",
+        "ALTER TABLE IF EXISTS payments ADD COLUMN IF NOT EXISTS razorpay_signature TEXT;",
+        "ALTER TABLE IF EXISTS payments ADD COLUMN IF NOT EXISTS status TEXT DEFAULT 'created';",
+        "ALTER TABLE IF EXISTS payments ADD COLUMN IF NOT EXISTS created_at TIMESTAMPTZ NOT NULL DEFAULT NOW();",
+    ]
+    for stmt in repairs:
+        try:
+            with conn.begin_nested():
                 conn.execute(text(stmt))
-            # --- lightweight schema repair (idempotent) ---
-            # Older DBs may have subscriptions/payments tables missing columns.
-            # We repair using ALTER TABLE ... ADD COLUMN IF NOT EXISTS (Postgres-safe).
-            repairs = [
-                "ALTER TABLE IF EXISTS subscriptions ADD COLUMN IF NOT EXISTS plan TEXT NOT NULL DEFAULT 'free';",
-                "ALTER TABLE IF EXISTS subscriptions ADD COLUMN IF NOT EXISTS billing_cycle TEXT;",
-                "ALTER TABLE IF EXISTS subscriptions ADD COLUMN IF NOT EXISTS status TEXT NOT NULL DEFAULT 'active';",
-                "ALTER TABLE IF EXISTS subscriptions ADD COLUMN IF NOT EXISTS starts_at TIMESTAMPTZ NOT NULL DEFAULT NOW();",
-                "ALTER TABLE IF EXISTS subscriptions ADD COLUMN IF NOT EXISTS expires_at TIMESTAMPTZ;",
-                "ALTER TABLE IF EXISTS subscriptions ADD COLUMN IF NOT EXISTS created_at TIMESTAMPTZ NOT NULL DEFAULT NOW();",
-                "ALTER TABLE IF EXISTS subscriptions ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW();",
-                "ALTER TABLE IF EXISTS payments ADD COLUMN IF NOT EXISTS plan TEXT;",
-                "ALTER TABLE IF EXISTS payments ADD COLUMN IF NOT EXISTS payment_type TEXT DEFAULT 'subscription';",
-                "ALTER TABLE IF EXISTS payments ADD COLUMN IF NOT EXISTS billing_cycle TEXT;",
-                "ALTER TABLE IF EXISTS payments ADD COLUMN IF NOT EXISTS booster_sku TEXT;",
-                "ALTER TABLE IF EXISTS payments ADD COLUMN IF NOT EXISTS amount_paise INT;",
-                "ALTER TABLE IF EXISTS payments ADD COLUMN IF NOT EXISTS currency TEXT DEFAULT 'INR';",
-                "ALTER TABLE IF EXISTS payments ADD COLUMN IF NOT EXISTS razorpay_order_id TEXT;",
-                "ALTER TABLE IF EXISTS payments ADD COLUMN IF NOT EXISTS razorpay_payment_id TEXT;",
-                "ALTER TABLE IF EXISTS payments ADD COLUMN IF NOT EXISTS razorpay_signature TEXT;",
-                "ALTER TABLE IF EXISTS payments ADD COLUMN IF NOT EXISTS status TEXT DEFAULT 'created';",
-                "ALTER TABLE IF EXISTS payments ADD COLUMN IF NOT EXISTS created_at TIMESTAMPTZ NOT NULL DEFAULT NOW();",
-            ]
-            for stmt in repairs:
-                try:
-                    conn.execute(text(stmt))
-                except Exception:
-                    # Non-fatal: if table doesn't exist yet or dialect doesn't support IF EXISTS/IF NOT EXISTS
-                    logger.debug("payments_store schema repair skipped: %s", stmt, exc_info=True)
+        except Exception:
+            # Non-fatal: if table doesn't exist yet or dialect doesn't support IF EXISTS/IF NOT EXISTS
+            logger.debug("payments_store schema repair skipped: %s", stmt, exc_info=True)
 
-    except Exception:
-        logger.exception("payments_store.ensure_tables failed (non-fatal)")
 
-    _TABLES_READY = True
+_SUBSCRIPTION_SQL = """
+    SELECT plan, billing_cycle, status, starts_at, expires_at, created_at
+    FROM subscriptions
+    WHERE user_id=:user_id
+    LIMIT 1
+"""
+
+
+def _free_subscription() -> Dict[str, Any]:
+    return {"plan": "free", "billing_cycle": None, "status": "active", "expires_at": None}
+
+
+def _subscription_from_row(row: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    if not row:
+        return _free_subscription()
+
+    expires_at = row.get("expires_at")
+    if expires_at is not None:
+        if expires_at.tzinfo is None:
+            expires_at = expires_at.replace(tzinfo=timezone.utc)
+        if expires_at <= datetime.now(timezone.utc):
+            return {"plan": "free", "billing_cycle": None, "status": "expired", "expires_at": expires_at}
+
+    return {
+        "plan": row.get("plan") or "free",
+        "billing_cycle": row.get("billing_cycle"),
+        "status": row.get("status") or "active",
+        "starts_at": row.get("starts_at"),
+        "created_at": row.get("created_at"),
+        "expires_at": expires_at,
+    }
+
+
+def _subscription_valid_until(sub: Dict[str, Any]) -> Optional[datetime]:
+    # A paid plan is only good until it expires; Free has no end.
+    return sub.get("expires_at") if sub.get("status") == "active" else None
+
+
+def _cache_subscription(user_id: int, ver: Optional[int], sub: Dict[str, Any]) -> Dict[str, Any]:
+    account_cache.put("sub", user_id, ver, sub, valid_until=_subscription_valid_until(sub))
+    return sub
+
+
+async def _acache_subscription(user_id: int, ver: Optional[int], sub: Dict[str, Any]) -> Dict[str, Any]:
+    await account_cache.aput("sub", user_id, ver, sub, valid_until=_subscription_valid_until(sub))
+    return sub
 
 
 def get_subscription(user_id: int) -> Dict[str, Any]:
     """Return current subscription info; if none, return Free."""
+    cached = account_cache.get("sub", user_id)
+    if cached is not None:
+        return cached
     ensure_tables()
     eng = _get_engine()
     if eng is None:
-        return {"plan": "free", "billing_cycle": None, "status": "active", "expires_at": None}
+        return _free_subscription()
 
     try:
+        ver = account_cache.version(user_id)
         with eng.begin() as conn:
-            row = conn.execute(
-                text(
-                    """
-                    SELECT plan, billing_cycle, status, starts_at, expires_at, created_at
-                    FROM subscriptions
-                    WHERE user_id=:user_id
-                    LIMIT 1
-                    """
-                ),
-                {"user_id": int(user_id)},
-            ).mappings().first()
-            if not row:
-                return {"plan": "free", "billing_cycle": None, "status": "active", "expires_at": None}
-
-            expires_at = row.get("expires_at")
-            if expires_at is not None:
-                if expires_at.tzinfo is None:
-                    expires_at = expires_at.replace(tzinfo=timezone.utc)
-                if expires_at <= datetime.now(timezone.utc):
-                    return {"plan": "free", "billing_cycle": None, "status": "expired", "expires_at": expires_at}
-
-            return {
-                "plan": row.get("plan") or "free",
-                "billing_cycle": row.get("billing_cycle"),
-                "status": row.get("status") or "active",
-                "starts_at": row.get("starts_at"),
-                "created_at": row.get("created_at"),
-                "expires_at": expires_at,
-            }
+            row = conn.execute(text(_SUBSCRIPTION_SQL), {"user_id": int(user_id)}).mappings().first()
+        return _cache_subscription(user_id, ver, _subscription_from_row(row))
     except Exception:
         logger.exception("get_subscription failed")
-        return {"plan": "free", "billing_cycle": None, "status": "active", "expires_at": None}
+        return _free_subscription()
+
+
+async def aget_subscription(user_id: int) -> Dict[str, Any]:
+    """get_subscription() for async callers (asyncpg; thread fallback)."""
+    aeng = get_async_engine()
+    if aeng is None:
+        return await asyncio.to_thread(get_subscription, user_id)
+    cached = await account_cache.aget("sub", user_id)
+    if cached is not None:
+        return cached
+    ensure_tables()
+
+    try:
+        ver = await account_cache.aversion(user_id)
+        async with aeng.connect() as conn:
+            row = (await conn.execute(text(_SUBSCRIPTION_SQL), {"user_id": int(user_id)})).mappings().first()
+        return await _acache_subscription(user_id, ver, _subscription_from_row(row))
+    except Exception:
+        logger.exception("aget_subscription failed")
+        return _free_subscription()
 
 
 def upsert_subscription(user_id: int, plan: str, duration_days: int, billing_cycle: str | None = None) -> Dict[str, Any]:
@@ -242,6 +279,7 @@ def upsert_subscription(user_id: int, plan: str, duration_days: int, billing_cyc
                     "expires_at": expires_at,
                 },
             )
+        account_cache.invalidate(user_id)
         return {"plan": plan, "billing_cycle": billing_cycle, "status": "active", "expires_at": expires_at}
     except Exception:
         logger.exception("upsert_subscription failed")
@@ -19,7 +19,7 @@ import logging
 
 from typing import Any, Dict, Optional
 
-from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi import APIRouter, Body, Depends, Header, HTTPException
 
 from auth_store import session_user
 
@@ -264,6 +264,8 @@ def events_track(payload: Dict[str, Any], u: Dict[str, Any] = Depends(get_curren
             meta=meta,
             duration_sec=duration_sec,
             value_num=value_num,
+            client_event_id=payload.get("client_event_id"),
+            ts=payload.get("ts"),
         )
         return {"ok": True}
     except ValueError as e:
@@ -271,4 +273,29 @@ def events_track(payload: Dict[str, Any], u: Dict[str, Any] = Depends(get_curren
         raise HTTPException(status_code=400, detail=str(e))
     except Exception:
         # Swallow all other errors (e.g. DB unavailable) and return ok
-        return {"ok": True}
\ No newline at end of file
+        return {"ok": True}
+
+
+@router.post("/events/batch")
+def events_batch(payload: Any = Body(...), u: Dict[str, Any] = Depends(get_current_user)):
+    """
+    Batched event tracking for high-frequency events (heartbeats, durations).
+
+    Body: {"events": [{event_type, meta?, duration_sec?, value_num?,
+    client_event_id?, ts?}, ...]} or a bare array. `client_event_id` makes
+    retries safe; `ts` (ISO-8601 or epoch s/ms) is used when recent. A
+    retry keeps the created_at of the first attempt (pinned in Redis for
+    EVENTS_DEDUPE_TTL_SECONDS); without Redis, retries on a partitioned
+    events table are deduped only when they resend the same `ts`.
+    Same failure policy as /events/track: only a malformed batch is a 400.
+    """
+    items = payload.get("events") if isinstance(payload, dict) else payload
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail="events must be a list")
+    try:
+        return phase1_store.track_events(_uid(u), items)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception:
+        logger.exception("events batch failed")
+        return {"ok": True}
@@ -15,6 +15,9 @@ Notes
 * We intentionally keep tables small and flexible so we can evolve without
   migrations becoming painful.
 * Analytics are derived from lightweight event tracking (events table).
+  The parent summary reads per-day rollups (event_rollups_daily), kept up
+  to date by the events INSERT itself (see db._INSERT_WRAP), plus one
+  recent-events query, so its cost doesn't grow with event history.
 * Parents can only access students that are explicitly linked.
 """
 
@@ -33,7 +36,9 @@ from sqlalchemy import (
     BigInteger,
     Column,
     DateTime,
+    Date,
     ForeignKey,
+    Index,
     Integer,
     MetaData,
     String,
@@ -42,13 +47,20 @@ from sqlalchemy import (
     UniqueConstraint,
     and_,
     func,
+    inspect,
     select,
     literal,
+    or_,
+    text,
 )
 from sqlalchemy.engine import Engine
 from sqlalchemy.exc import SQLAlchemyError
 
 import redis_store
+import schema_ready
+import write_behind
+from config import EVENTS_BATCH_MAX_ITEMS, EVENTS_CLIENT_TS_MAX_AGE_SECONDS, EVENTS_DEDUPE_TTL_SECONDS
+from db import db_insert_rows
 from shared_engine import get_engine as _shared_get_engine
 
 logger = logging.getLogger(__name__)
@@ -110,9 +122,37 @@ events = Table(
     Column("meta_json", Text, nullable=False, default="{}"),
     Column("duration_sec", Integer, nullable=True),
     Column("value_num", Integer, nullable=True),
+    Column("client_event_id", String(64), nullable=True),
     Column("created_at", DateTime(timezone=True), nullable=False, server_default=func.now()),
 )
 
+# Every analytics read filters user_id + created_at (sometimes event_type).
+Index("ix_events_user_created", events.c.user_id, events.c.created_at.desc())
+Index("ix_events_user_type_created", events.c.user_id, events.c.event_type, events.c.created_at)
+
+# Dedupe for batched/retried client events; events without an id are never deduped.
+Index(
+    "uq_events_user_client_event",
+    events.c.user_id,
+    events.c.client_event_id,
+    unique=True,
+    postgresql_where=events.c.client_event_id.isnot(None),
+)
+
+# One row per student/day (UTC)/event type; maintained on ingest.
+event_rollups_daily = Table(
+    "event_rollups_daily",
+    metadata,
+    Column("user_id", BigInteger, primary_key=True),
+    Column("day", Date, primary_key=True),
+    Column("event_type", String(64), primary_key=True),
+    Column("count", Integer, nullable=False, default=0),
+    Column("duration_sum", BigInteger, nullable=False, default=0),
+    Column("value_sum", BigInteger, nullable=False, default=0),
+    Column("value_count", Integer, nullable=False, default=0),
+    Column("updated_at", DateTime(timezone=True), nullable=False, server_default=func.now()),
+)
+
 
 
 
@@ -124,16 +164,35 @@ def ensure_tables() -> bool:
     """Ensure Phase-1 tables exist when DB is available.
 
     Returns True if DB tables were ensured, False if DB is unavailable.
+    `create_all` (and its catalog introspection) runs once per process;
+    after that this is a dict lookup.
     """
-    engine = _get_engine()
-    if engine is None:
-        return False
-    try:
-        metadata.create_all(engine)
-        return True
-    except Exception as e:
-        logger.exception("Phase-1 ensure_tables failed; continuing with Redis fallback. Error: %s", e)
-        return False
+    return schema_ready.ensure("phase1", _create_tables)
+
+
+def _create_tables(conn) -> None:
+    had_rollups = inspect(conn).has_table("event_rollups_daily")
+    metadata.create_all(conn)
+    if conn.dialect.name != "postgresql":
+        return
+    if not had_rollups:
+        n = rebuild_event_rollups(conn=conn)
+        logger.info("event_rollups_daily backfilled (%s rows)", n)
+    # create_all doesn't touch existing tables. On a large events table,
+    # build the indexes first with `python events_maintenance.py indexes`
+    # (CONCURRENTLY); these are then no-ops instead of blocking inserts.
+    repairs = [
+        "ALTER TABLE events ADD COLUMN IF NOT EXISTS client_event_id VARCHAR(64)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_events_user_client_event ON events (user_id, client_event_id) WHERE client_event_id IS NOT NULL",
+        "CREATE INDEX IF NOT EXISTS ix_events_user_created ON events (user_id, created_at DESC)",
+        "CREATE INDEX IF NOT EXISTS ix_events_user_type_created ON events (user_id, event_type, created_at)",
+    ]
+    for stmt in repairs:
+        try:
+            with conn.begin_nested():
+                conn.execute(text(stmt))
+        except Exception:
+            logger.debug("phase1_store schema repair skipped: %s", stmt, exc_info=True)
 
 
 # -------------------------
@@ -700,60 +759,286 @@ def list_parent_students(parent_user_id: int) -> List[Dict[str, Any]]:
         out.append(d)
     return out
 
+_EVENT_COUNTER_TTL = 30 * 24 * 3600
+
+
+def _event_counter_key(user_id: int, event_type: str) -> str:
+    # Hash per user/event type: count, duration_count, duration_sum, value_sum, value_count
+    return f"events:{int(user_id)}:{event_type}"
+
+
+def _event_row(user_id: int, item: Dict[str, Any], now: datetime) -> Dict[str, Any]:
+    """Validate one tracked event into an `events` row. Raises ValueError."""
+    et = (item.get("event_type") or "").strip()[:64]
+    if not et:
+        raise ValueError("event_type is required")
+    duration_sec = item.get("duration_sec")
+    value_num = item.get("value_num")
+    cid = str(item.get("client_event_id") or item.get("id") or "").strip()[:64] or None
+
+    # Client timestamps (batched/offline events) are trusted only within a window.
+    created_at = now
+    raw_ts = item.get("ts") or item.get("client_ts")
+    if raw_ts:
+        try:
+            if isinstance(raw_ts, (int, float)):
+                ts = datetime.fromtimestamp(float(raw_ts) / (1000.0 if raw_ts > 1e11 else 1.0), tz=timezone.utc)
+            else:
+                ts = datetime.fromisoformat(str(raw_ts).replace("Z", "+00:00"))
+                if ts.tzinfo is None:
+                    ts = ts.replace(tzinfo=timezone.utc)
+            if now - timedelta(seconds=EVENTS_CLIENT_TS_MAX_AGE_SECONDS) <= ts <= now + timedelta(minutes=5):
+                created_at = ts
+        except Exception:
+            pass
+
+    return {
+        "user_id": int(user_id),
+        "event_type": et,
+        "meta_json": json.dumps(item.get("meta") or {}),
+        "duration_sec": int(duration_sec) if duration_sec is not None else None,
+        "value_num": float(value_num) if value_num is not None else None,
+        "client_event_id": cid,
+        "created_at": created_at,
+    }
+
+
+def _redis_count_events(rows: List[Dict[str, Any]]) -> Dict[str, int]:
+    """Redis fallback: one pipeline of HINCRBY/EXPIRE per call. Returns counts per event type."""
+    r = _r()
+    counts: Dict[str, int] = {}
+    if not r or not rows:
+        return counts
+    try:
+        pipe = r.pipeline(transaction=False)
+        touched: Dict[str, str] = {}
+        for row in rows:
+            key = _event_counter_key(row["user_id"], row["event_type"])
+            pipe.hincrby(key, "count", 1)
+            if row["duration_sec"] is not None:
+                pipe.hincrby(key, "duration_count", 1)
+                pipe.hincrby(key, "duration_sum", int(row["duration_sec"]))
+            if row["value_num"] is not None:
+                pipe.hincrby(key, "value_sum", int(row["value_num"]))
+                pipe.hincrby(key, "value_count", 1)
+            touched[key] = row["event_type"]
+        for key in touched:
+            pipe.expire(key, _EVENT_COUNTER_TTL)
+            pipe.hget(key, "count")
+        res = pipe.execute()
+        totals = res[len(res) - 2 * len(touched):][1::2]
+        for et, v in zip(touched.values(), totals):
+            counts[et] = int(v or 0)
+    except Exception:
+        logger.warning("Redis event counters failed", exc_info=True)
+    return counts
+
+
+def _redis_dedupe(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Drop rows whose client_event_id was already counted (Redis fallback only)."""
+    r = _r()
+    keyed = [row for row in rows if row["client_event_id"]]
+    if not r or not keyed:
+        return rows
+    try:
+        pipe = r.pipeline(transaction=False)
+        for row in keyed:
+            pipe.set(f"evdedupe:{row['user_id']}:{row['client_event_id']}", "1", nx=True, ex=EVENTS_DEDUPE_TTL_SECONDS)
+        fresh = {id(row) for row, ok in zip(keyed, pipe.execute()) if ok}
+    except Exception:
+        return rows
+    return [row for row in rows if not row["client_event_id"] or id(row) in fresh]
+
+
+def _pin_created_at(rows: List[Dict[str, Any]]) -> None:
+    """Give every retry of a client_event_id the created_at of its first sighting.
+
+    On a partitioned events table the dedupe index includes created_at
+    (events_maintenance), so a retry stamped with a later server time would
+    be inserted again. The first created_at per (user, client_event_id) is
+    kept in Redis for EVENTS_DEDUPE_TTL_SECONDS; without Redis, retries
+    only match when the client sends the same `ts`.
+    """
+    r = _r()
+    keyed = [row for row in rows if row["client_event_id"]]
+    if not r or not keyed:
+        return
+    try:
+        pipe = r.pipeline(transaction=False)
+        for row in keyed:
+            key = f"evts:{row['user_id']}:{row['client_event_id']}"
+            pipe.set(key, row["created_at"].isoformat(), nx=True, ex=EVENTS_DEDUPE_TTL_SECONDS)
+            pipe.get(key)
+        firsts = pipe.execute()[1::2]
+    except Exception:
+        logger.warning("Redis event created_at pinning failed", exc_info=True)
+        return
+    for row, first in zip(keyed, firsts):
+        if first:
+            try:
+                row["created_at"] = datetime.fromisoformat(first)
+            except (TypeError, ValueError):
+                pass
+
+
+def _store_event_rows(rows: List[Dict[str, Any]]) -> None:
+    """Queue rows for the batched writer; inline multi-row INSERT if it isn't running."""
+    _pin_created_at(rows)
+    pending = [row for row in rows if not write_behind.enqueue("events", row)]
+    if pending:
+        db_insert_rows("events", pending)
+
+
 def track_event(
     user_id: int,
     event_type: str,
     meta: Optional[Dict[str, Any]] = None,
     duration_sec: Optional[int] = None,
     value_num: Optional[int] = None,
+    client_event_id: Optional[str] = None,
+    ts: Any = None,
 ) -> Dict[str, Any]:
-    et = (event_type or "").strip()[:64]
-    if not et:
-        raise ValueError("event_type is required")
-
     engine = _get_engine()
     now = _utcnow()
+    row = _event_row(
+        user_id,
+        {
+            "event_type": event_type,
+            "meta": meta,
+            "duration_sec": duration_sec,
+            "value_num": value_num,
+            "client_event_id": client_event_id,
+            "ts": ts,
+        },
+        now,
+    )
+    et = row["event_type"]
 
     if engine is None:
-        # Redis fallback: keep lightweight counters for 30 days
-        ttl = 30 * 24 * 3600
-        base = f"events:{int(user_id)}:{et}"
-        count = _redis_incr(base + ":count", ttl)
-        if duration_sec is not None:
-            _redis_incr(base + ":duration_sec", ttl)  # count occurrences
-            r = _r()
-            if r:
-                try:
-                    r.incrby(base + ":duration_sum", int(duration_sec))
-                    r.expire(base + ":duration_sum", ttl)
-                except Exception:
-                    pass
-        if value_num is not None:
-            r = _r()
-            if r:
-                try:
-                    r.incrby(base + ":value_sum", int(value_num))
-                    r.expire(base + ":value_sum", ttl)
-                    r.incrby(base + ":value_count", 1)
-                    r.expire(base + ":value_count", ttl)
-                except Exception:
-                    pass
+        # Redis fallback: lightweight counters for 30 days
+        rows = _redis_dedupe([row])
+        count = _redis_count_events(rows).get(et, 0) if rows else 0
         return {"ok": True, "stored": "redis", "event_type": et, "count_30d": count, "ts": now.isoformat()}
 
     ensure_tables()
-    payload = {
-        "user_id": int(user_id),
-        "event_type": et,
-        "meta_json": json.dumps(meta or {}),
-        "duration_sec": int(duration_sec) if duration_sec is not None else None,
-        "value_num": float(value_num) if value_num is not None else None,
-        "created_at": now,
-    }
+    _store_event_rows([row])
+    return {"ok": True, "stored": "db", "event_type": et, "ts": now.isoformat()}
 
-    with engine.begin() as conn:
-        conn.execute(events.insert().values(**payload))
 
-    return {"ok": True, "stored": "db", "event_type": et, "ts": now.isoformat()}
+def track_events(user_id: int, items: List[Any]) -> Dict[str, Any]:
+    """Store a batch of events (/events/batch).
+
+    Invalid items are counted as rejected instead of failing the batch;
+    repeated `client_event_id`s (client retries) are dropped.
+    """
+    if len(items) > EVENTS_BATCH_MAX_ITEMS:
+        raise ValueError(f"too many events (max {EVENTS_BATCH_MAX_ITEMS})")
+    now = _utcnow()
+    rows: List[Dict[str, Any]] = []
+    seen = set()
+    rejected = duplicates = 0
+    for item in items:
+        try:
+            if not isinstance(item, dict):
+                raise ValueError("event must be an object")
+            row = _event_row(user_id, item, now)
+        except (TypeError, ValueError):
+            rejected += 1
+            continue
+        cid = row["client_event_id"]
+        if cid:
+            if cid in seen:
+                duplicates += 1
+                continue
+            seen.add(cid)
+        rows.append(row)
+
+    engine = _get_engine()
+    if engine is None:
+        fresh = _redis_dedupe(rows)
+        duplicates += len(rows) - len(fresh)
+        _redis_count_events(fresh)
+        return {"ok": True, "stored": "redis", "accepted": len(fresh), "duplicates": duplicates, "rejected": rejected}
+
+    ensure_tables()
+    # Cross-request duplicates are dropped by ON CONFLICT on the unique index.
+    _store_event_rows(rows)
+    return {"ok": True, "stored": "db", "accepted": len(rows), "duplicates": duplicates, "rejected": rejected}
+
+_ROLLUP_REBUILD_SQL = """
+    INSERT INTO event_rollups_daily
+        (user_id, day, event_type, count, duration_sum, value_sum, value_count, updated_at)
+    SELECT user_id, (created_at AT TIME ZONE 'UTC')::date, event_type,
+           COUNT(*), COALESCE(SUM(duration_sec), 0), COALESCE(SUM(value_num), 0), COUNT(value_num), NOW()
+    FROM events
+    WHERE created_at >= :since {user_filter}
+    GROUP BY 1, 2, 3
+"""
+
+
+def rebuild_event_rollups(days: int = 31, user_id: Optional[int] = None, conn=None) -> int:
+    """Recompute rollups from raw events for the last `days` UTC days.
+
+    Used to backfill when the rollup table is first created, and to repair
+    drift by hand. Blocks event inserts (SHARE lock) while it runs.
+    Returns the number of rollup rows written.
+    """
+    if conn is None:
+        engine = _get_engine()
+        if engine is None:
+            return 0
+        ensure_tables()
+        with engine.begin() as c:
+            return rebuild_event_rollups(days, user_id, conn=c)
+
+    since_day = _utcnow().date() - timedelta(days=max(1, int(days)) - 1)
+    since = datetime(since_day.year, since_day.month, since_day.day, tzinfo=timezone.utc)
+    params: Dict[str, Any] = {"since": since, "since_day": since_day}
+    user_filter = ""
+    if user_id is not None:
+        user_filter = "AND user_id = :user_id"
+        params["user_id"] = int(user_id)
+    conn.execute(text("LOCK TABLE events IN SHARE MODE"))
+    conn.execute(text(f"DELETE FROM event_rollups_daily WHERE day >= :since_day {user_filter}"), params)
+    res = conn.execute(text(_ROLLUP_REBUILD_SQL.format(user_filter=user_filter)), params)
+    return int(res.rowcount or 0)
+
+
+def _raw_rollups(conn, student_user_id: int, since_7d_day, since_30d_day) -> List[Dict[str, Any]]:
+    """Rollup-shaped rows computed from raw events.
+
+    Rollups are maintained on Postgres only (db._INSERT_WRAP); other
+    dialects (SQLite in dev/tests) aggregate the same window here.
+    """
+    ev = events.c
+    since_30d = datetime(since_30d_day.year, since_30d_day.month, since_30d_day.day, tzinfo=timezone.utc)
+    since_7d = datetime(since_7d_day.year, since_7d_day.month, since_7d_day.day, tzinfo=timezone.utc)
+    rows = conn.execute(
+        select(ev.created_at, ev.event_type, ev.duration_sec, ev.value_num).where(
+            and_(
+                ev.user_id == student_user_id,
+                ev.created_at >= since_30d,
+                or_(ev.created_at >= since_7d, ev.event_type == "test_submitted"),
+            )
+        )
+    ).mappings().all()
+    out: Dict[Tuple[Any, str], Dict[str, Any]] = {}
+    for r in rows:
+        created_at = r["created_at"]
+        if created_at.tzinfo is None:
+            created_at = created_at.replace(tzinfo=timezone.utc)
+        day = created_at.astimezone(timezone.utc).date()
+        agg = out.setdefault(
+            (day, r["event_type"]),
+            {"day": day, "event_type": r["event_type"], "count": 0, "duration_sum": 0, "value_sum": 0, "value_count": 0},
+        )
+        agg["count"] += 1
+        agg["duration_sum"] += int(r["duration_sec"] or 0)
+        if r["value_num"] is not None:
+            agg["value_sum"] += int(r["value_num"])
+            agg["value_count"] += 1
+    return list(out.values())
+
 
 def analytics_summary(parent_user_id: int, student_user_id: int) -> Dict[str, Any]:
     """Return read-only analytics summary for a linked student."""
@@ -763,11 +1048,19 @@ def analytics_summary(parent_user_id: int, student_user_id: int) -> Dict[str, An
     if engine is None:
         # Redis fallback summary (Phase-1 stability). Minimal but useful.
         def _sum_for(et: str) -> Dict[str, int]:
-            base = f"events:{int(student_user_id)}:{et}"
+            base = _event_counter_key(student_user_id, et)
+            h: Dict[str, Any] = {}
+            r = _r()
+            if r:
+                try:
+                    h = r.hgetall(base) or {}
+                except Exception:
+                    h = {}
+            # Plus the pre-hash string counters until they expire
             return {
-                "count_30d": _redis_get_int(base + ":count"),
-                "value_sum": _redis_get_int(base + ":value_sum"),
-                "value_count": _redis_get_int(base + ":value_count"),
+                "count_30d": int(h.get("count") or 0) + _redis_get_int(base + ":count"),
+                "value_sum": int(h.get("value_sum") or 0) + _redis_get_int(base + ":value_sum"),
+                "value_count": int(h.get("value_count") or 0) + _redis_get_int(base + ":value_count"),
             }
 
         tests = _sum_for("test_submitted")
@@ -799,39 +1092,26 @@ def analytics_summary(parent_user_id: int, student_user_id: int) -> Dict[str, An
 
     # Access control is enforced by router before calling this.
     now = _utcnow()
-    since_7d = now - timedelta(days=7)
-    since_30d = now - timedelta(days=30)
-
-    with engine.begin() as conn:
-        # Time spent (we accept any event with duration_sec; product can standardize later)
-        time_7d = conn.execute(
-            select(func.coalesce(func.sum(events.c.duration_sec), 0)).where(
-                and_(events.c.user_id == student_user_id, events.c.created_at >= since_7d)
-            )
-        ).scalar_one()
-
-        active_days_7d = conn.execute(
-            select(func.count(func.distinct(func.date(events.c.created_at)))).where(
-                and_(events.c.user_id == student_user_id, events.c.created_at >= since_7d)
-            )
-        ).scalar_one()
-
-        # Tests: we treat event_type='test_submitted' with value_num as score %.
-        tests_30d = conn.execute(
-            select(func.count()).where(
-                and_(events.c.user_id == student_user_id, events.c.created_at >= since_30d, events.c.event_type == "test_submitted")
-            )
-        ).scalar_one()
-
-        avg_score_30d = conn.execute(
-            select(func.avg(events.c.value_num)).where(
-                and_(events.c.user_id == student_user_id, events.c.created_at >= since_30d, events.c.event_type == "test_submitted")
-            )
-        ).scalar()
-
-        last_active = conn.execute(
-            select(func.max(events.c.created_at)).where(events.c.user_id == student_user_id)
-        ).scalar()
+    today = now.date()
+    since_7d_day = today - timedelta(days=6)
+    since_30d_day = today - timedelta(days=29)
+    ru = event_rollups_daily.c
+
+    with engine.connect() as conn:
+        # Rollups: every event type for the last 7 days, tests for the last 30
+        # (at most a few dozen rows whatever the history length).
+        if conn.dialect.name != "postgresql":
+            rollups = _raw_rollups(conn, student_user_id, since_7d_day, since_30d_day)
+        else:
+            rollups = conn.execute(
+                select(ru.day, ru.event_type, ru.count, ru.duration_sum, ru.value_sum, ru.value_count).where(
+                    and_(
+                        ru.user_id == student_user_id,
+                        ru.day >= since_30d_day,
+                        or_(ru.day >= since_7d_day, ru.event_type == "test_submitted"),
+                    )
+                )
+            ).mappings().all()
 
         # `events` stores metadata in `meta_json` (JSON). Older deployments used `meta` or had no meta column at all.
         # IMPORTANT: SQLAlchemy column objects do NOT support truthy checks.
@@ -848,6 +1128,19 @@ def analytics_summary(parent_user_id: int, student_user_id: int) -> Dict[str, An
             .limit(25)
         ).mappings().all()
 
+    # Time spent (we accept any event with duration_sec; product can standardize later)
+    week = [r for r in rollups if r["day"] >= since_7d_day]
+    time_7d = sum(int(r["duration_sum"] or 0) for r in week)
+    active_days_7d = len({r["day"] for r in week if r["count"]})
+
+    # Tests: we treat event_type='test_submitted' with value_num as score %.
+    tests = [r for r in rollups if r["event_type"] == "test_submitted"]
+    tests_30d = sum(int(r["count"] or 0) for r in tests)
+    value_count = sum(int(r["value_count"] or 0) for r in tests)
+    avg_score_30d = (sum(int(r["value_sum"] or 0) for r in tests) / value_count) if value_count else None
+
+    last_active = recent[0].get("created_at") if recent else None
+
     # Minimal strengths/weaknesses placeholder: derived from meta.subject + value_num score.
     # This gives a "Silicon Valley" feel without needing a full test engine yet.
     subj_scores: Dict[str, List[int]] = {}
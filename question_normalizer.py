@@ -0,0 +1,223 @@
+"""question_normalizer.py — Canonical form of a student question for caching.
+
+"What is photosynthesis?", "what is photosynthesis" and "Explain
+photosynthesis pls" should share one cache entry. The pipeline:
+1. Unicode NFKC + casefold (also folds full-width digits, ligatures).
+2. Numbers canonicalized (thousand separators, leading/trailing zeros,
+   bare decimals, small number words) so "2.50" == "2.5", ".5" == "0.5"
+   and "two" == "2".
+3. Punctuation dropped; math symbols (+ - * / = ^ < > %), grouping
+   brackets, "|", "°", ":", primes (f'(x)), factorial / "!=" "!" and a
+   "." between two letters (a.b) kept as tokens.
+4. Leading request phrases ("what is", "explain", "tell me about") and
+   filler ("pls", "kindly", "sir") stripped, plus English articles in
+   prose. "a"/"an"/"the" stay when they may be a variable: written "A",
+   after punctuation or an operator, or before a single letter or a
+   function name ("a, b, c", "a.b", "differentiate a sin x").
+
+Numbers and operators are never removed, so "2+3" and "2+4" stay distinct,
+and neither is grouping, so "(a+b)^2" and "a+b^2" do too.
+
+Also provides a 64-bit SimHash over word shingles for the optional
+near-duplicate index in solve_cache.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import re
+import unicodedata
+from typing import List, Tuple
+
+_NUMBER_WORDS = {
+    "zero": "0", "one": "1", "two": "2", "three": "3", "four": "4", "five": "5",
+    "six": "6", "seven": "7", "eight": "8", "nine": "9", "ten": "10",
+    "eleven": "11", "twelve": "12", "twenty": "20", "hundred": "100",
+}
+
+# Stripped only at the start (possibly repeated: "please explain what is ...").
+_LEADING_PHRASES = [
+    "can you please explain", "can you explain", "could you explain", "please explain",
+    "what do you mean by", "what is meant by", "what is", "what are", "whats",
+    "tell me about", "tell me", "explain", "define", "describe", "give me", "write about",
+]
+
+_FILLER = {
+    "pls", "plz", "please", "kindly", "sir", "maam", "madam", "ji", "bro", "yaar",
+    "hi", "hello", "hey", "thanks", "thank", "thx", "ok", "okay",
+}
+
+# Dropped only in prose; see _is_prose_article.
+_ARTICLES = {"a", "an", "the"}
+
+_MATH_FUNCTIONS = {
+    "sin", "cos", "tan", "cot", "sec", "cosec", "csc", "arcsin", "arccos", "arctan",
+    "sinh", "cosh", "tanh", "log", "ln", "exp", "sqrt", "lim", "det", "max", "min",
+}
+
+_MATH_SYMBOLS = set("+-*/=^<>%×÷√π")
+# Structure that changes a formula's meaning; always its own token.
+_GROUPING = set("()[]{}|")
+_CLOSERS = set(")]}|")
+# Units and ratios ("sin 30°", "2:3")
+_MATH_PUNCT = set("°:")
+_PRIME = "′"
+# Everything number_signature and the article rule treat as math.
+_MATH_TOKENS = _MATH_SYMBOLS | _GROUPING | _MATH_PUNCT | {"!", "'", "."}
+# Placeholders: a capital "A" (a variable, not an article) and dropped punctuation
+_UPPER_A = "\ue000"
+_BREAK = "\x00"
+_UPPER_A_RE = re.compile(r"(?<![^\W_])A(?![\w'’])")
+
+# A prime follows a lone letter ("f'(x)", "y''") and is not a contraction.
+_PRIME_RE = re.compile(r"(?<![^\W_])([^\W\d_])('+)(?![^\W\d_])")
+
+# Bare decimals (".5") only where the dot does not end a word ("fig.5")
+_NUM_RE = re.compile(r"\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:\.\d+)?|(?<!\w)\.\d+")
+_SUPERSCRIPT_RE = re.compile("[⁰¹²³⁴⁵⁶⁷⁸⁹]+")
+_SUPERSCRIPT_DIGITS = str.maketrans("⁰¹²³⁴⁵⁶⁷⁸⁹", "0123456789")
+
+
+def _canon_number(m: "re.Match[str]") -> str:
+    s = m.group(0).replace(",", "")
+    if "." in s:
+        whole, frac = s.split(".", 1)
+        whole = whole.lstrip("0") or "0"
+        frac = frac.rstrip("0")
+        return f"{whole}.{frac}" if frac else whole
+    return s.lstrip("0") or "0"
+
+
+def _strip_leading(text: str) -> str:
+    changed = True
+    while changed:
+        changed = False
+        for p in _LEADING_PHRASES:
+            if text == p:
+                return ""
+            if text.startswith(p + " "):
+                text = text[len(p) + 1:]
+                changed = True
+                break
+        if text.split(" ", 1)[0] in _FILLER:
+            parts = text.split(" ", 1)
+            text = parts[1] if len(parts) > 1 else ""
+            changed = bool(text)
+    return text
+
+
+def _split(text: str) -> List[str]:
+    """Split on whitespace/punctuation; math symbols become their own tokens.
+
+    Works per character category so Indic combining marks stay attached.
+    A '.' between two digits is kept (decimals), one between two letters is
+    a token (a.b). '!' is kept after a number, a closing bracket or a single
+    letter (factorial) and before '=' (!=); elsewhere it is sentence
+    punctuation. Other dropped punctuation leaves a _BREAK token behind for
+    the article rule.
+    """
+    tokens: List[str] = []
+    cur: List[str] = []
+    n = len(text)
+    for i, ch in enumerate(text):
+        cat = unicodedata.category(ch)
+        if ch == "." and cur and cur[-1].isdigit() and i + 1 < n and text[i + 1].isdigit():
+            cur.append(ch)
+            continue
+        if ch == "." and len(cur) == 1 and cur[0].isalpha() and text[i + 1:i + 2].isalpha():
+            tokens += [cur[0], ch]
+            cur = []
+            continue
+        if ch == "!":
+            prev = "".join(cur) if cur else (tokens[-1] if tokens and i and not text[i - 1].isspace() else "")
+            factorial = prev[:1].isdigit() or prev in _CLOSERS or (len(prev) == 1 and prev.isalpha())
+            if factorial or text[i + 1:i + 2] == "=":
+                if cur:
+                    tokens.append("".join(cur))
+                    cur = []
+                tokens.append(ch)
+            else:
+                if cur:
+                    tokens.append("".join(cur))
+                    cur = []
+                tokens.append(_BREAK)
+            continue
+        if ch in _MATH_SYMBOLS or ch in _GROUPING or ch in _MATH_PUNCT or ch == _PRIME or cat == "Sm":
+            if cur:
+                tokens.append("".join(cur))
+                cur = []
+            tokens.append("'" if ch == _PRIME else ch)
+        elif cat[0] in ("L", "M", "N") or ch == "_" or ch == _UPPER_A:
+            cur.append(ch)
+        else:
+            # whitespace, punctuation, emoji, other symbols
+            if cur:
+                tokens.append("".join(cur))
+                cur = []
+            if not ch.isspace():
+                tokens.append(_BREAK)
+    if cur:
+        tokens.append("".join(cur))
+    return tokens
+
+
+def _is_prose_article(tokens: List[str], i: int) -> bool:
+    """True if the article at tokens[i] can be dropped (it is not a variable)."""
+    prev = tokens[i - 1] if i > 0 else ""
+    nxt = tokens[i + 1] if i + 1 < len(tokens) else ""
+    if prev == _BREAK or prev in _MATH_TOKENS:
+        return False
+    return nxt[:1].isalpha() and len(nxt) > 1 and nxt not in _MATH_FUNCTIONS
+
+
+def normalize_tokens(question: str) -> List[str]:
+    text = _SUPERSCRIPT_RE.sub(lambda m: "^" + m.group(0).translate(_SUPERSCRIPT_DIGITS), str(question or ""))
+    text = _UPPER_A_RE.sub(_UPPER_A, unicodedata.normalize("NFKC", text)).casefold()
+    text = text.replace("’", "'").replace("'s ", " ")
+    text = _PRIME_RE.sub(lambda m: m.group(1) + _PRIME * len(m.group(2)), text).replace("'", "")
+    text = _NUM_RE.sub(_canon_number, text)
+    tokens = [_NUMBER_WORDS.get(t, t) for t in _split(text)]
+    kept = [
+        "a" if t == _UPPER_A else t
+        for i, t in enumerate(tokens)
+        if t != _BREAK and not (t in _ARTICLES and _is_prose_article(tokens, i))
+    ]
+    return [t for t in _strip_leading(" ".join(kept)).split(" ") if t and t not in _FILLER]
+
+
+def normalize_question(question: str) -> str:
+    """Canonical string for cache keys. Falls back to the folded raw text
+    if normalization strips everything (e.g. "what is?")."""
+    toks = normalize_tokens(question)
+    if toks:
+        return " ".join(toks)
+    return unicodedata.normalize("NFKC", str(question or "")).casefold().strip()
+
+
+def number_signature(tokens: List[str]) -> str:
+    """Short hash of numbers, operators and grouping in order. Near-duplicates
+    must match it."""
+    sig = " ".join(t for t in tokens if t[0].isdigit() or t in _MATH_TOKENS)
+    return hashlib.sha1(sig.encode("utf-8")).hexdigest()[:8]
+
+
+def simhash64(tokens: List[str]) -> int:
+    """64-bit SimHash over unigrams (weight 1) and word bigrams (weight 2)."""
+    feats: List[Tuple[str, int]] = [(t, 1) for t in tokens]
+    feats += [(f"{a} {b}", 2) for a, b in zip(tokens, tokens[1:])]
+    if not feats:
+        return 0
+    v = [0] * 64
+    for f, w in feats:
+        h = int.from_bytes(hashlib.blake2b(f.encode("utf-8"), digest_size=8).digest(), "big")
+        for i in range(64):
+            v[i] += w if (h >> i) & 1 else -w
+    out = 0
+    for i in range(64):
+        if v[i] > 0:
+            out |= 1 << i
+    return out
+
+
+def hamming64(a: int, b: int) -> int:
+    return bin((a ^ b) & 0xFFFFFFFFFFFFFFFF).count("1")
@@ -4,25 +4,88 @@ FIX: The old in-memory _BUCKETS dict only worked with a single worker.
 With UVICORN_WORKERS=4, each worker had its own bucket → rate limits
 were effectively divided by 4 (useless).
 
-This module provides a single function `is_allowed(ip)` that:
-1. Uses Redis atomically (INCR + EXPIRE) — works across all workers
-2. Falls back to in-memory ONLY if Redis is completely unavailable
-3. In-memory fallback is per-worker aware (divides limit by worker count)
+Algorithm: GCRA (generic cell rate algorithm). Each key stores one number,
+its "theoretical arrival time"; a limit of `rate` per `window_s` with
+`burst` allows burst+1 back-to-back requests and then one every
+window_s/rate seconds. Unlike the old fixed per-minute buckets there is no
+window edge where 2x the limit gets through.
+
+- `check(limits)` tests several keys (IP, user, route class) in ONE Redis
+  round-trip: a Lua script loaded once and called with EVALSHA. Either all
+  keys admit the request (and all are charged) or none is charged and the
+  longest retry-after comes back.
+- `acheck(limits)` is the same check on the async Redis client, for routes
+  that must not block the event loop on the round-trip.
+- Routes that authenticate charge the per-IP limit alone first (it needs
+  no lookup) and the user/route-class limits after auth
+  (`limits_for(..., include_ip=False)`), so unknown tokens are refused
+  before they cost a session lookup. That makes two round-trips, so the
+  all-or-nothing guarantee holds per call: a request the second call
+  refuses gets its IP charge back with `arefund(...)`.
+- If Redis is unavailable: an in-worker token bucket per key, with the rate
+  and burst divided by the worker count.
+- `is_allowed(ip)` is kept for callers that only need the per-IP yes/no.
+
+Env (read per call, like before): RATE_LIMIT_PER_MINUTE, RATE_LIMIT_BURST,
+RATE_LIMIT_WINDOW_SECONDS (per IP), RATE_LIMIT_USER_PER_MINUTE,
+RATE_LIMIT_USER_BURST (per signed-in user), RATE_LIMIT_STREAM_PER_MINUTE,
+RATE_LIMIT_STREAM_BURST (route class "stream"; 0 disables a limit).
 """
 
 from __future__ import annotations
 
+import math
 import os
+import threading
 import time
 import logging
-from typing import Dict, Tuple
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
 
-from redis_store import incr_with_ttl as redis_incr_with_ttl
+from redis_store import get_aredis, get_redis
 
 logger = logging.getLogger("knoweasy.rate_limiter")
 
-# In-memory fallback (only used if Redis is totally dead)
-_BUCKETS: Dict[str, Tuple[float, int]] = {}
+# KEYS[i]: GCRA state (theoretical arrival time, ms) for limit i
+# ARGV[1]: cost (negative: refund); ARGV[2i], ARGV[2i+1]: emission interval and burst tolerance (ms)
+# Returns {allowed, retry_after_ms, index of the limit that refused (0 if none)}
+_GCRA_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local cost = tonumber(ARGV[1])
+local tats = {}
+local retry = 0
+local refused = 0
+for i = 1, #KEYS do
+  local interval = tonumber(ARGV[2 * i])
+  local tolerance = tonumber(ARGV[2 * i + 1])
+  local tat = tonumber(redis.call('GET', KEYS[i]) or now)
+  if tat < now then tat = now end
+  local new_tat = tat + interval * cost
+  local wait = new_tat - now - (tolerance + interval)
+  if wait > 0 then
+    if refused == 0 then refused = i end
+    if wait > retry then retry = wait end
+  end
+  tats[i] = new_tat
+end
+if refused > 0 then
+  return {0, retry, refused}
+end
+for i = 1, #KEYS do
+  redis.call('SET', KEYS[i], string.format('%d', tats[i]), 'PX', math.max(1, tats[i] - now))
+end
+return {1, 0, 0}
+"""
+
+_script = None
+_script_lock = threading.Lock()
+# redis.asyncio Script, bound to the async client it was registered on
+_ascript: Optional[Tuple[object, object]] = None
+
+# In-memory fallback (only used if Redis is totally dead): key -> (tokens, last refill)
+_BUCKETS: Dict[str, Tuple[float, float]] = {}
+_BUCKETS_LOCK = threading.Lock()
 _BUCKET_CLEANUP_COUNTER = 0
 
 
@@ -36,43 +99,202 @@ def _env_int(key: str, default: int) -> int:
         return default
 
 
-def is_allowed(ip: str) -> bool:
-    """Check if IP is within rate limit. Returns True if allowed."""
-    limit = _env_int("RATE_LIMIT_PER_MINUTE", 60) + _env_int("RATE_LIMIT_BURST", 10)
-    window_s = _env_int("RATE_LIMIT_WINDOW_SECONDS", 60)
+@dataclass(frozen=True)
+class Limit:
+    """`rate` requests per `window_s`, plus `burst` back-to-back extra."""
+    key: str
+    rate: int
+    window_s: int = 60
+    burst: int = 0
+
+    @property
+    def interval_ms(self) -> int:
+        return max(1, int(round(self.window_s * 1000 / max(1, self.rate))))
+
+    @property
+    def tolerance_ms(self) -> int:
+        return self.interval_ms * max(0, self.burst)
+
+
+@dataclass(frozen=True)
+class Decision:
+    allowed: bool
+    retry_after_s: float = 0.0
+    limited_by: Optional[str] = None
+
+
+def ip_limit(ip: str) -> Limit:
+    return Limit(
+        key=f"rl:ip:{ip}",
+        rate=_env_int("RATE_LIMIT_PER_MINUTE", 60),
+        window_s=_env_int("RATE_LIMIT_WINDOW_SECONDS", 60),
+        burst=_env_int("RATE_LIMIT_BURST", 10),
+    )
+
+
+def limits_for(
+    ip: str,
+    user_id: Optional[int] = None,
+    route_class: Optional[str] = None,
+    include_ip: bool = True,
+) -> List[Limit]:
+    """The limits one request is charged against (disabled ones left out).
+
+    include_ip=False: the per-IP limit was already charged (before auth).
+    """
+    out = [ip_limit(ip)] if include_ip else []
+    if user_id is not None:
+        out.append(Limit(
+            key=f"rl:user:{int(user_id)}",
+            rate=_env_int("RATE_LIMIT_USER_PER_MINUTE", 30),
+            burst=_env_int("RATE_LIMIT_USER_BURST", 5),
+        ))
+    if route_class == "stream":
+        who = f"u{int(user_id)}" if user_id is not None else f"ip{ip}"
+        out.append(Limit(
+            key=f"rl:route:stream:{who}",
+            rate=_env_int("RATE_LIMIT_STREAM_PER_MINUTE", 20),
+            burst=_env_int("RATE_LIMIT_STREAM_BURST", 3),
+        ))
+    return [lim for lim in out if lim.rate > 0]
+
+
+def _script_args(limits: Sequence[Limit], cost: int) -> List[int]:
+    args: List[int] = [int(cost)]
+    for lim in limits:
+        args += [lim.interval_ms, lim.tolerance_ms]
+    return args
+
 
-    now = time.time()
-    bucket = int(now // window_s)
-    redis_key = f"rl:{ip}:{bucket}"
+def _decision(limits: Sequence[Limit], result: Sequence) -> Decision:
+    allowed, retry_ms, refused = result
+    if int(allowed):
+        return Decision(True)
+    return Decision(False, int(retry_ms) / 1000.0, limits[int(refused) - 1].key)
 
-    # Try Redis first (works across all workers)
-    rc = redis_incr_with_ttl(redis_key, window_s)
-    if rc is not None:
-        return rc <= limit
 
-    # Fallback: in-memory (per-worker, so divide limit by worker count)
-    workers = _env_int("UVICORN_WORKERS", 4)
-    per_worker_limit = max(5, limit // max(1, workers))
+def _redis_check(r, limits: Sequence[Limit], cost: int) -> Decision:
+    global _script
+    if _script is None:
+        with _script_lock:
+            if _script is None:
+                # redis-py Script: EVALSHA, re-sends the body only after NOSCRIPT
+                _script = r.register_script(_GCRA_LUA)
+    result = _script(keys=[lim.key for lim in limits], args=_script_args(limits, cost), client=r)
+    return _decision(limits, result)
+
+
+async def _aredis_check(r, limits: Sequence[Limit], cost: int) -> Decision:
+    global _ascript
+    if _ascript is None or _ascript[0] is not r:
+        _ascript = (r, r.register_script(_GCRA_LUA))
+    script = _ascript[1]
+    result = await script(keys=[lim.key for lim in limits], args=_script_args(limits, cost))
+    return _decision(limits, result)
+
+
+def _memory_check(limits: Sequence[Limit], cost: int) -> Decision:
+    """Token bucket per key; per-worker, so rate and burst are split across workers."""
+    workers = max(1, _env_int("UVICORN_WORKERS", 4))
+    now = time.monotonic()
 
     global _BUCKET_CLEANUP_COUNTER
-    _BUCKET_CLEANUP_COUNTER += 1
-    if _BUCKET_CLEANUP_COUNTER % 100 == 0:
-        _cleanup_stale_buckets(now, window_s)
+    with _BUCKETS_LOCK:
+        _BUCKET_CLEANUP_COUNTER += 1
+        if _BUCKET_CLEANUP_COUNTER % 100 == 0:
+            _cleanup_stale_buckets(now)
+
+        refill: List[Tuple[str, float]] = []
+        retry, refused = 0.0, None
+        for lim in limits:
+            per_s = lim.rate / max(1, lim.window_s) / workers
+            capacity = max(1.0, (lim.burst + 1) / workers)
+            tokens, last = _BUCKETS.get(lim.key, (capacity, now))
+            tokens = min(capacity, tokens + (now - last) * per_s)
+            if tokens < cost:
+                wait = (cost - tokens) / per_s
+                if refused is None:
+                    refused = lim.key
+                retry = max(retry, wait)
+            refill.append((lim.key, tokens))
+
+        if refused is not None:
+            for key, tokens in refill:
+                _BUCKETS[key] = (tokens, now)
+            return Decision(False, retry, refused)
+        for key, tokens in refill:
+            _BUCKETS[key] = (tokens - cost, now)
+    return Decision(True)
+
+
+def check(limits: Sequence[Limit], cost: int = 1) -> Decision:
+    """Charge one request against every limit, atomically; see module doc."""
+    if not limits:
+        return Decision(True)
+    r = get_redis()
+    if r is not None:
+        try:
+            return _redis_check(r, limits, cost)
+        except Exception as e:
+            logger.warning("Redis rate limit check failed, using in-memory fallback: %s", e)
+    return _memory_check(limits, cost)
+
 
-    start, count = _BUCKETS.get(ip, (now, 0))
-    if now - start >= window_s:
-        start, count = now, 0
+async def acheck(limits: Sequence[Limit], cost: int = 1) -> Decision:
+    """check() without blocking the event loop on the Redis round-trip."""
+    if not limits:
+        return Decision(True)
+    r = get_aredis()
+    if r is not None:
+        try:
+            return await _aredis_check(r, limits, cost)
+        except Exception as e:
+            logger.warning("Redis rate limit check failed, using in-memory fallback: %s", e)
+    return _memory_check(limits, cost)
+
+
+async def arefund(limits: Sequence[Limit], cost: int = 1) -> None:
+    """Give back a charge made by an earlier acheck() that the request did not use.
+
+    Same script with a negative cost: each key's arrival time moves back by
+    one emission interval (never below now, i.e. never beyond a full burst).
+    """
+    limits = [lim for lim in limits if lim.rate > 0]
+    if not limits:
+        return
+    r = get_aredis()
+    if r is not None:
+        try:
+            await _aredis_check(r, limits, -cost)
+            return
+        except Exception as e:
+            logger.warning("Redis rate limit refund failed, using in-memory fallback: %s", e)
+    _memory_refund(limits, cost)
+
+
+def _memory_refund(limits: Sequence[Limit], cost: int) -> None:
+    workers = max(1, _env_int("UVICORN_WORKERS", 4))
+    with _BUCKETS_LOCK:
+        for lim in limits:
+            entry = _BUCKETS.get(lim.key)
+            if entry is None:
+                continue  # full bucket
+            capacity = max(1.0, (lim.burst + 1) / workers)
+            _BUCKETS[lim.key] = (min(capacity, entry[0] + cost), entry[1])
+
+
+def is_allowed(ip: str) -> bool:
+    """Check if IP is within rate limit. Returns True if allowed."""
+    return check([ip_limit(ip)]).allowed
 
-    if count >= per_worker_limit:
-        _BUCKETS[ip] = (start, count)
-        return False
 
-    _BUCKETS[ip] = (start, count + 1)
-    return True
+def _cleanup_stale_buckets(now: float) -> None:
+    """Remove idle entries to prevent memory leak in fallback mode (a full bucket == no entry)."""
+    stale = [key for key, (_, last) in _BUCKETS.items() if now - last > 600]
+    for key in stale:
+        _BUCKETS.pop(key, None)
 
 
-def _cleanup_stale_buckets(now: float, window_s: int) -> None:
-    """Remove stale entries to prevent memory leak in fallback mode."""
-    stale = [ip for ip, (start, _) in _BUCKETS.items() if now - start > window_s * 2]
-    for ip in stale:
-        _BUCKETS.pop(ip, None)
+def retry_after_header(decision: Decision) -> Dict[str, str]:
+    """`Retry-After` (whole seconds, at least 1) for a refused Decision."""
+    return {"Retry-After": str(max(1, int(math.ceil(decision.retry_after_s))))}
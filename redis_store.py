@@ -1,49 +1,409 @@
 # redis_store.py
+"""Shared Redis clients and small helpers.
+
+Every caller treats `get_redis()` returning None as "Redis disabled" and
+falls back (DB, in-process caches, local rate limits). That is also how a
+Redis outage is handled:
+
+- Clients share one sized, blocking connection pool per worker (text and
+  bytes) with explicit connect/read timeouts and no client-side retries,
+  so one slow command costs at most REDIS_SOCKET_TIMEOUT_S.
+- A circuit breaker watches every connection: after
+  REDIS_CB_FAILURE_THRESHOLD consecutive connection/timeout errors it opens
+  and `get_redis()`/`get_redis_bytes()` return None for REDIS_CB_COOLDOWN_S.
+  Then a single probe is let through; success closes it, failure re-opens.
+- Pub/sub (local_cache invalidations) gets its own client without a read
+  timeout: idle subscriptions must not count as failures.
+- Async routes use `get_aredis()`/`get_aredis_bytes()` (redis.asyncio, same
+  pool settings, same breaker) and the `a*` helpers, so a Redis round-trip
+  no longer blocks the event loop. Async clients belong to the loop that
+  created them; a new loop (tests, scripts) gets its own.
+
+`redis_health()` reports the breaker state.
+"""
 from __future__ import annotations
 
+import asyncio
 import json
 import logging
-from typing import Any, Dict, Optional, Tuple
+import threading
+import time
+import zlib
+from typing import Any, Callable, Dict, Optional, Tuple
 
-from config import REDIS_URL
+from config import (
+    REDIS_URL,
+    REDIS_CODEC_COMPRESS_MIN_BYTES,
+    REDIS_CODEC_ZSTD_LEVEL,
+    REDIS_CONNECT_TIMEOUT_S,
+    REDIS_SOCKET_TIMEOUT_S,
+    REDIS_MAX_CONNECTIONS,
+    REDIS_POOL_TIMEOUT_S,
+    REDIS_HEALTH_CHECK_INTERVAL_S,
+    REDIS_CB_FAILURE_THRESHOLD,
+    REDIS_CB_COOLDOWN_S,
+)
+
+try:
+    import orjson  # type: ignore
+except Exception:  # pragma: no cover
+    orjson = None  # type: ignore
+
+try:
+    import zstandard  # type: ignore
+except Exception:  # pragma: no cover
+    zstandard = None  # type: ignore
 
 logger = logging.getLogger("knoweasy-engine-api")
 
 _redis_client = None
+_redis_bytes_client = None
+_redis_pubsub_client = None
+_client_lock = threading.Lock()
+# decode_responses -> (event loop, redis.asyncio client)
+_async_clients: Dict[bool, Tuple[Any, Any]] = {}
+
+
+# -----------------------------
+# Circuit breaker
+# -----------------------------
+
+class _Breaker:
+    """Consecutive-failure breaker: closed -> open (cool-down) -> half-open probe."""
+
+    def __init__(self, threshold: int, cooldown_s: float) -> None:
+        self.threshold = max(1, int(threshold))
+        self.cooldown_s = max(0.1, float(cooldown_s))
+        self.state = "closed"
+        self.failures = 0
+        self.open_until = 0.0
+        self.probe_until = 0.0
+        self.trips = 0
+        self.fast_fails = 0
+        self.last_error: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        now = time.monotonic()
+        with self._lock:
+            if self.state == "open" and now >= self.open_until:
+                self.state = "half_open"
+                self.probe_until = 0.0
+            if self.state == "half_open" and now >= self.probe_until:
+                # One caller probes; the others keep failing fast until it reports
+                self.probe_until = now + REDIS_CONNECT_TIMEOUT_S + REDIS_SOCKET_TIMEOUT_S + 1.0
+                return True
+            if self.state == "closed":
+                return True
+            self.fast_fails += 1
+            return False
+
+    def success(self) -> None:
+        if self.state == "closed" and not self.failures:
+            return
+        with self._lock:
+            if self.state != "closed":
+                logger.info("Redis circuit closed")
+            self.state = "closed"
+            self.failures = 0
+
+    def failure(self, err: BaseException) -> None:
+        with self._lock:
+            self.failures += 1
+            self.last_error = f"{type(err).__name__}: {err}"[:200]
+            if self.state == "half_open" or (self.state == "closed" and self.failures >= self.threshold):
+                self.state = "open"
+                self.open_until = time.monotonic() + self.cooldown_s
+                self.trips += 1
+                logger.warning(
+                    "Redis circuit open for %.1fs after %s failures (%s)",
+                    self.cooldown_s, self.failures, self.last_error,
+                )
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "open_for_s": round(max(0.0, self.open_until - time.monotonic()), 2) if self.state == "open" else 0.0,
+                "trips": self.trips,
+                "fast_fails": self.fast_fails,
+                "last_error": self.last_error,
+            }
+
+
+_BREAKER = _Breaker(REDIS_CB_FAILURE_THRESHOLD, REDIS_CB_COOLDOWN_S)
+
+
+def _breaker_connection_class(base: type) -> type:
+    """Subclass the pool's connection class (TCP, TLS or unix) to feed the breaker."""
+    import redis  # type: ignore
+
+    errors = (redis.ConnectionError, redis.TimeoutError)
+
+    def failed(e: BaseException) -> None:
+        # The same error passes through several layers (handshake, connect,
+        # send); count it once.
+        if getattr(e, "_ke_breaker_counted", False):
+            return
+        try:
+            e._ke_breaker_counted = True  # type: ignore[attr-defined]
+        except Exception:
+            pass
+        _BREAKER.failure(e)
+
+    class _BreakerConnection(base):  # type: ignore[misc, valid-type]
+        def connect_check_health(self, *args, **kwargs):
+            try:
+                return super().connect_check_health(*args, **kwargs)
+            except errors as e:
+                failed(e)
+                raise
+
+        def send_packed_command(self, *args, **kwargs):
+            try:
+                return super().send_packed_command(*args, **kwargs)
+            except errors as e:
+                failed(e)
+                raise
+
+        def read_response(self, *args, **kwargs):
+            try:
+                out = super().read_response(*args, **kwargs)
+            except errors as e:
+                failed(e)
+                raise
+            _BREAKER.success()
+            return out
+
+    _BreakerConnection.__name__ = f"Breaker{base.__name__}"
+    return _BreakerConnection
+
+
+def _abreaker_connection_class(base: type) -> type:
+    """_breaker_connection_class for redis.asyncio connections."""
+    import redis  # type: ignore
+
+    errors = (redis.ConnectionError, redis.TimeoutError, asyncio.TimeoutError)
+
+    def failed(e: BaseException) -> None:
+        if getattr(e, "_ke_breaker_counted", False):
+            return
+        try:
+            e._ke_breaker_counted = True  # type: ignore[attr-defined]
+        except Exception:
+            pass
+        _BREAKER.failure(e)
+
+    class _ABreakerConnection(base):  # type: ignore[misc, valid-type]
+        async def connect_check_health(self, *args, **kwargs):
+            try:
+                return await super().connect_check_health(*args, **kwargs)
+            except errors as e:
+                failed(e)
+                raise
+
+        async def send_packed_command(self, *args, **kwargs):
+            try:
+                return await super().send_packed_command(*args, **kwargs)
+            except errors as e:
+                failed(e)
+                raise
+
+        async def read_response(self, *args, **kwargs):
+            try:
+                out = await super().read_response(*args, **kwargs)
+            except errors as e:
+                failed(e)
+                raise
+            _BREAKER.success()
+            return out
+
+    _ABreakerConnection.__name__ = f"ABreaker{base.__name__}"
+    return _ABreakerConnection
+
+
+def _make_client(decode_responses: bool):
+    import redis  # type: ignore
+
+    pool = redis.BlockingConnectionPool.from_url(
+        REDIS_URL,
+        decode_responses=decode_responses,
+        max_connections=max(1, REDIS_MAX_CONNECTIONS),
+        timeout=REDIS_POOL_TIMEOUT_S,
+        socket_connect_timeout=REDIS_CONNECT_TIMEOUT_S,
+        socket_timeout=REDIS_SOCKET_TIMEOUT_S,
+        socket_keepalive=True,
+        health_check_interval=REDIS_HEALTH_CHECK_INTERVAL_S,
+    )
+    pool.connection_class = _breaker_connection_class(pool.connection_class)
+    return redis.Redis(connection_pool=pool)
 
 
 def get_redis():
     """
     Lazy Redis client creation.
     If REDIS_URL is not set, returns None (feature disabled).
+    Also None while the circuit breaker is open.
     """
     global _redis_client
     if not REDIS_URL:
         return None
+    if not _BREAKER.allow():
+        return None
 
     if _redis_client is not None:
         return _redis_client
 
+    with _client_lock:
+        if _redis_client is None:
+            try:
+                _redis_client = _make_client(decode_responses=True)
+            except Exception as e:
+                logger.warning("Redis init failed (disabled): %s", e)
+                return None
+    return _redis_client
+
+
+def get_redis_bytes():
+    """Like get_redis(), but returns raw bytes (for packed values)."""
+    global _redis_bytes_client
+    if not REDIS_URL:
+        return None
+    if not _BREAKER.allow():
+        return None
+
+    if _redis_bytes_client is not None:
+        return _redis_bytes_client
+
+    with _client_lock:
+        if _redis_bytes_client is None:
+            try:
+                _redis_bytes_client = _make_client(decode_responses=False)
+            except Exception as e:
+                logger.warning("Redis (bytes) init failed (disabled): %s", e)
+                return None
+    return _redis_bytes_client
+
+
+def _make_async_client(decode_responses: bool):
+    import redis.asyncio as aredis  # type: ignore
+
+    pool = aredis.BlockingConnectionPool.from_url(
+        REDIS_URL,
+        decode_responses=decode_responses,
+        max_connections=max(1, REDIS_MAX_CONNECTIONS),
+        timeout=REDIS_POOL_TIMEOUT_S,
+        socket_connect_timeout=REDIS_CONNECT_TIMEOUT_S,
+        socket_timeout=REDIS_SOCKET_TIMEOUT_S,
+        socket_keepalive=True,
+        health_check_interval=REDIS_HEALTH_CHECK_INTERVAL_S,
+    )
+    pool.connection_class = _abreaker_connection_class(pool.connection_class)
+    return aredis.Redis(connection_pool=pool)
+
+
+def _async_client(decode_responses: bool):
+    if not REDIS_URL:
+        return None
+    if not _BREAKER.allow():
+        return None
     try:
-        import redis  # type: ignore
-        _redis_client = redis.Redis.from_url(REDIS_URL, decode_responses=True)
-        return _redis_client
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+    cur = _async_clients.get(decode_responses)
+    if cur is not None and cur[0] is loop:
+        return cur[1]
+    try:
+        client = _make_async_client(decode_responses)
     except Exception as e:
-        logger.warning("Redis init failed (disabled): %s", e)
-        _redis_client = None
+        logger.warning("Redis (async) init failed (disabled): %s", e)
+        return None
+    _async_clients[decode_responses] = (loop, client)
+    return client
+
+
+def get_aredis():
+    """redis.asyncio twin of get_redis() for the running event loop."""
+    return _async_client(True)
+
+
+def get_aredis_bytes():
+    """redis.asyncio twin of get_redis_bytes() for the running event loop."""
+    return _async_client(False)
+
+
+async def aclose_redis() -> None:
+    """Close this loop's async pools (lifespan shutdown)."""
+    loop = asyncio.get_running_loop()
+    for decode, (owner, client) in list(_async_clients.items()):
+        if owner is loop:
+            _async_clients.pop(decode, None)
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.debug("Redis async client close failed: %s", e)
+
+
+def get_redis_pubsub():
+    """Client for long-lived subscriptions: no read timeout, not breaker-gated."""
+    global _redis_pubsub_client
+    if not REDIS_URL:
+        return None
+    with _client_lock:
+        if _redis_pubsub_client is None:
+            try:
+                import redis  # type: ignore
+                _redis_pubsub_client = redis.Redis.from_url(
+                    REDIS_URL,
+                    decode_responses=True,
+                    socket_connect_timeout=REDIS_CONNECT_TIMEOUT_S,
+                    socket_keepalive=True,
+                    health_check_interval=REDIS_HEALTH_CHECK_INTERVAL_S,
+                )
+            except Exception as e:
+                logger.warning("Redis (pubsub) init failed (disabled): %s", e)
+                return None
+    return _redis_pubsub_client
+
+
+def _pool_stats(client) -> Optional[Dict[str, Any]]:
+    pool = getattr(client, "connection_pool", None)
+    if pool is None:
+        return None
+    try:
+        if hasattr(pool, "_available_connections"):
+            # redis.asyncio pool
+            idle = len(pool._available_connections)
+            return {"max": int(pool.max_connections), "created": idle + len(pool._in_use_connections), "idle": idle}
+        return {
+            "max": int(pool.max_connections),
+            "created": len(getattr(pool, "_connections", []) or []),
+            "idle": sum(1 for c in list(getattr(pool, "pool").queue) if c is not None),
+        }
+    except Exception:
         return None
 
 
 def redis_health() -> Dict[str, Any]:
+    if not REDIS_URL:
+        return {"enabled": False, "connected": False}
+    breaker = _BREAKER.snapshot()
     r = get_redis()
     if not r:
-        return {"enabled": False, "connected": False}
+        return {"enabled": True, "connected": False, "reason": "circuit open", "breaker": breaker}
 
+    pools = {"text": _pool_stats(_redis_client), "bytes": _pool_stats(_redis_bytes_client)}
+    for decode, (_, client) in list(_async_clients.items()):
+        pools["async_text" if decode else "async_bytes"] = _pool_stats(client)
     try:
         pong = r.ping()
-        return {"enabled": True, "connected": bool(pong)}
+        return {"enabled": True, "connected": bool(pong), "breaker": _BREAKER.snapshot(), "pools": pools}
     except Exception as e:
-        return {"enabled": True, "connected": False, "reason": str(e)}
+        return {"enabled": True, "connected": False, "reason": str(e), "breaker": _BREAKER.snapshot(), "pools": pools}
 
 
 def get_json(key: str) -> Optional[Dict[str, Any]]:
@@ -113,3 +473,264 @@ def incr_with_ttl(key: str, ttl_seconds: int) -> Optional[int]:
     except Exception as e:
         logger.warning("Redis incr_with_ttl failed: %s", e)
         return None
+
+
+# -----------------------------
+# Packed values (large cached blobs)
+# -----------------------------
+# Layout: 1 version byte + payload.
+#   0x01  JSON bytes (orjson when installed)
+#   0x02  zstd(JSON bytes)
+#   0x03  zlib(JSON bytes)  -- used when zstandard is not installed
+# Anything else is a legacy plain-JSON value written by setex_json.
+# Values smaller than REDIS_CODEC_COMPRESS_MIN_BYTES are not compressed.
+
+_CODEC_RAW = 0x01
+_CODEC_ZSTD = 0x02
+_CODEC_ZLIB = 0x03
+
+_zstd_c = zstandard.ZstdCompressor(level=REDIS_CODEC_ZSTD_LEVEL) if zstandard else None
+_zstd_d = zstandard.ZstdDecompressor() if zstandard else None
+
+
+def _json_dumps_bytes(value: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value, default=str, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(value, ensure_ascii=False, default=str, separators=(",", ":")).encode("utf-8")
+
+
+def _json_loads(raw: Any) -> Any:
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def encode_value(value: Any) -> bytes:
+    body = _json_dumps_bytes(value)
+    if len(body) < REDIS_CODEC_COMPRESS_MIN_BYTES:
+        return bytes([_CODEC_RAW]) + body
+    if _zstd_c is not None:
+        return bytes([_CODEC_ZSTD]) + _zstd_c.compress(body)
+    return bytes([_CODEC_ZLIB]) + zlib.compress(body, 6)
+
+
+def decode_value(raw: Any) -> Any:
+    """Decode a packed value; legacy JSON (str or bytes) is accepted as-is."""
+    if raw is None:
+        return None
+    if isinstance(raw, str):
+        return _json_loads(raw)
+    tag = raw[0] if raw else 0
+    if tag == _CODEC_RAW:
+        return _json_loads(raw[1:])
+    if tag == _CODEC_ZSTD:
+        if _zstd_d is None:
+            raise RuntimeError("zstandard not installed; cannot decode packed value")
+        return _json_loads(_zstd_d.decompress(raw[1:]))
+    if tag == _CODEC_ZLIB:
+        return _json_loads(zlib.decompress(raw[1:]))
+    return _json_loads(raw)
+
+
+def get_packed(key: str) -> Optional[Dict[str, Any]]:
+    return get_packed_ttl(key)[0]
+
+
+def get_packed_ttl(key: str) -> Tuple[Optional[Dict[str, Any]], Optional[int]]:
+    """GET + TTL in one round-trip for a packed (or legacy JSON) value."""
+    r = get_redis_bytes()
+    if not r:
+        return None, None
+    try:
+        pipe = r.pipeline(transaction=False)
+        pipe.get(key)
+        pipe.ttl(key)
+        raw, ttl = pipe.execute()
+        if not raw:
+            return None, None
+        return decode_value(raw), (int(ttl) if ttl is not None and int(ttl) > 0 else None)
+    except Exception as e:
+        logger.warning("Redis get_packed failed: %s", e)
+        return None, None
+
+
+def setex_packed(key: str, ttl_seconds: int, value: Dict[str, Any]) -> bool:
+    r = get_redis_bytes()
+    if not r:
+        return False
+    try:
+        r.setex(key, int(ttl_seconds), encode_value(value))
+        return True
+    except Exception as e:
+        logger.warning("Redis setex_packed failed: %s", e)
+        return False
+
+
+# -----------------------------
+# Async twins (redis.asyncio; same keys, same codec)
+# -----------------------------
+
+async def aget_json(key: str) -> Optional[Dict[str, Any]]:
+    r = get_aredis()
+    if not r:
+        return None
+    try:
+        raw = await r.get(key)
+        if not raw:
+            return None
+        return json.loads(raw)
+    except Exception as e:
+        logger.warning("Redis aget_json failed: %s", e)
+        return None
+
+
+async def asetex_json(key: str, ttl_seconds: int, value: Dict[str, Any]) -> bool:
+    r = get_aredis()
+    if not r:
+        return False
+    try:
+        await r.setex(key, int(ttl_seconds), json.dumps(value, ensure_ascii=False))
+        return True
+    except Exception as e:
+        logger.warning("Redis asetex_json failed: %s", e)
+        return False
+
+
+async def asetnx_ex(key: str, ttl_seconds: int, value: str = "1") -> bool:
+    """setnx_ex() for async callers."""
+    r = get_aredis()
+    if not r:
+        return False
+    try:
+        return bool(await r.set(key, value, nx=True, ex=int(ttl_seconds)))
+    except Exception as e:
+        logger.warning("Redis asetnx_ex failed: %s", e)
+        return False
+
+
+async def aincr_with_ttl(key: str, ttl_seconds: int) -> Optional[int]:
+    """incr_with_ttl() for async callers (same INCR + TTL-if-missing semantics)."""
+    r = get_aredis()
+    if not r:
+        return None
+    try:
+        pipe = r.pipeline()
+        pipe.incr(key)
+        pipe.ttl(key)
+        count, current_ttl = await pipe.execute()
+        if current_ttl is None or current_ttl < 0:
+            await r.expire(key, int(ttl_seconds))
+        return int(count)
+    except Exception as e:
+        logger.warning("Redis aincr_with_ttl failed: %s", e)
+        return None
+
+
+async def aget_packed(key: str) -> Optional[Dict[str, Any]]:
+    r = get_aredis_bytes()
+    if not r:
+        return None
+    try:
+        raw = await r.get(key)
+        return decode_value(raw) if raw else None
+    except Exception as e:
+        logger.warning("Redis aget_packed failed: %s", e)
+        return None
+
+
+async def aget_packed_ttl(key: str) -> Tuple[Optional[Dict[str, Any]], Optional[int]]:
+    """get_packed_ttl() for async callers."""
+    r = get_aredis_bytes()
+    if not r:
+        return None, None
+    try:
+        pipe = r.pipeline(transaction=False)
+        pipe.get(key)
+        pipe.ttl(key)
+        raw, ttl = await pipe.execute()
+        if not raw:
+            return None, None
+        return decode_value(raw), (int(ttl) if ttl is not None and int(ttl) > 0 else None)
+    except Exception as e:
+        logger.warning("Redis aget_packed failed: %s", e)
+        return None, None
+
+
+async def asetex_packed(key: str, ttl_seconds: int, value: Dict[str, Any]) -> bool:
+    r = get_aredis_bytes()
+    if not r:
+        return False
+    try:
+        await r.setex(key, int(ttl_seconds), encode_value(value))
+        return True
+    except Exception as e:
+        logger.warning("Redis asetex_packed failed: %s", e)
+        return False
+
+
+# -----------------------------
+# Token-checked leases (singleflight leader, idempotency lock)
+# -----------------------------
+
+# Compare-and-expire / compare-and-delete: only the holder touches its lease.
+_RENEW_LEASE_LUA = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('expire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+_RELEASE_LEASE_LUA = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+async def akeep_lease(
+    key: str,
+    token: str,
+    ttl_seconds: int,
+    max_seconds: float,
+    on_renew: Optional[Callable[[], None]] = None,
+) -> None:
+    """Renew `key` (held with value `token`) every third of its TTL.
+
+    Run as a task and cancel it when the work is done. Stops on its own after
+    `max_seconds` (a holder lost without releasing) or when the lease is
+    found taken over. Renewal errors are retried on the next tick.
+    """
+    interval = max(1.0, ttl_seconds / 3.0)
+    stop_at = time.monotonic() + max(ttl_seconds, max_seconds)
+    while time.monotonic() < stop_at:
+        await asyncio.sleep(interval)
+        r = get_aredis()
+        if not r:
+            continue
+        try:
+            if not await r.eval(_RENEW_LEASE_LUA, 1, key, token, int(ttl_seconds)):
+                logger.warning("Redis lease %s was lost", key)
+                return
+        except Exception as e:
+            logger.debug("Redis lease renewal failed for %s: %s", key, e)
+            continue
+        if on_renew is not None:
+            on_renew()
+
+
+async def arelease_lease(key: str, token: str) -> None:
+    """Delete `key` if it still holds `token` (worst case it expires)."""
+    r = get_aredis()
+    if not r:
+        return
+    try:
+        await r.eval(_RELEASE_LEASE_LUA, 1, key, token)
+        return
+    except Exception as e:
+        logger.debug("Redis lease release failed for %s: %s", key, e)
+    try:
+        # Scripting unavailable: non-atomic fallback
+        if await r.get(key) == token:
+            await r.delete(key)
+    except Exception:
+        pass
@@ -8,10 +8,11 @@ import time
 import os
 import asyncio
 import uuid
+from dataclasses import dataclass, field
 from typing import Dict, Tuple
 
 from fastapi import APIRouter, Request, Header, HTTPException
-from fastapi.responses import JSONResponse, Response
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 import logging
 from datetime import datetime, timedelta
 
@@ -29,18 +30,24 @@ from config import (
     OPENAI_MODEL,
 )
 from schemas import SolveRequest, SolveResponse
-from orchestrator import solve, get_orchestrator_stats
-from db import db_log_solve, db_log_ai_usage, db_add_chat_history, db_list_chat_history, db_clear_chat_history, db_get_memory_cards, db_upsert_memory_card, db_reset_memory_cards
+from orchestrator import solve, solve_stream, get_orchestrator_stats
+from db import db_log_solve, db_log_ai_usage, db_clear_chat_history, db_upsert_memory_card, db_reset_memory_cards
+from db import adb_add_chat_history, adb_list_chat_history, adb_get_memory_cards
 
-from redis_store import get_json as redis_get_json
-from redis_store import setex_json as redis_setex_json
+from redis_store import get_aredis
 from redis_store import incr_with_ttl as redis_incr_with_ttl
-from rate_limiter import is_allowed as rate_limit_check
-from redis_store import setnx_ex as redis_setnx_ex
-
-from auth_store import session_user
-from payments_store import get_subscription
+from rate_limiter import acheck as rate_limit_acheck, arefund as rate_limit_arefund, ip_limit, limits_for, retry_after_header, Decision
+from redis_store import asetnx_ex as redis_asetnx_ex
+import idempotency
+import singleflight
+import solve_cache
+import write_behind
+from question_normalizer import normalize_question
+
+from auth_store import asession_user, session_cache_stats
+from payments_store import aget_subscription
 import billing_store
+import account_cache
 
 from pdf_service import render_learning_object_pdf
 
@@ -116,9 +123,30 @@ def _client_ip(req: Request) -> str:
     return "unknown"
 
 
-def _rate_limit_ok(ip: str) -> bool:
-    """Check rate limit via Redis-first rate limiter (multi-worker safe)."""
-    return rate_limit_check(ip)
+async def _rate_limit(
+    ip: str,
+    user_ctx: dict | None = None,
+    route_class: str | None = None,
+    include_ip: bool = True,
+) -> Decision:
+    """Per-IP, per-user and per-route-class limits in one check (multi-worker safe)."""
+    user_id = int(user_ctx["user_id"]) if user_ctx else None
+    return await rate_limit_acheck(limits_for(ip, user_id, route_class, include_ip=include_ip))
+
+
+def _rate_limited(trace_id: str, decision: Decision) -> JSONResponse:
+    logger.warning(f"⚠️ [{trace_id}] Rate limited: {decision.limited_by} (retry in {decision.retry_after_s:.1f}s)")
+    failure = _safe_failure(
+        "Too many requests right now. Please try again in a minute 😊",
+        "RATE_LIMITED",
+        trace_id
+    )
+    failure.meta["retry_after_s"] = round(decision.retry_after_s, 3)
+    return JSONResponse(
+        status_code=429,
+        content=failure.model_dump(),
+        headers=retry_after_header(decision),
+    )
 
 
 
@@ -140,7 +168,7 @@ def _safe_failure(message: str, code: str, request_id: str = "") -> SolveRespons
 
 
 def _cache_key(payload: dict) -> str:
-    """Generate stable cache key"""
+    """Generate stable cache key (question normalized: case, punctuation, filler)"""
     normalized = {
         "board": (payload.get("board") or "").strip().lower(),
         "class": str(payload.get("class_") or payload.get("class_level") or payload.get("class") or "").strip(),
@@ -150,12 +178,24 @@ def _cache_key(payload: dict) -> str:
         "answer_mode": _normalize_answer_mode(payload.get("answer_mode") or payload.get("mode") or ""),
         "language": (payload.get("language") or "en").strip().lower(),
         "study_mode": (payload.get("study_mode") or "chat").strip().lower(),
-        "question": (payload.get("question") or "").strip(),
+        "question": normalize_question(payload.get("question") or ""),
     }
     blob = json.dumps(normalized, sort_keys=True, ensure_ascii=False)
     return f"cache:solve:{hashlib.sha256(blob.encode()).hexdigest()[:32]}"
 
 
+def _cache_scope(payload: dict) -> str:
+    """Near-duplicate matching scope: only answers for the same board/class/subject/mode/language."""
+    scope = "|".join([
+        (payload.get("board") or "").strip().lower(),
+        str(payload.get("class_") or payload.get("class_level") or payload.get("class") or "").strip(),
+        (payload.get("subject") or "").strip().lower(),
+        _normalize_answer_mode(payload.get("answer_mode") or payload.get("mode") or ""),
+        (payload.get("language") or "en").strip().lower(),
+    ])
+    return hashlib.sha256(scope.encode()).hexdigest()[:16]
+
+
 def _normalize_answer_mode(v: str) -> str:
     m = str(v or "").strip().lower()
     if not m:
@@ -293,6 +333,8 @@ def _format_response(result: dict, request_id: str) -> dict:
             flags.append(f"AI_{p.upper()}")
     if result.get("cached"):
         flags.append("CACHED")
+    if result.get("coalesced"):
+        flags.append("COALESCED")
     
     return {
         "final_answer": answer,
@@ -317,6 +359,7 @@ def _format_response(result: dict, request_id: str) -> dict:
             "confidence_label": result.get("confidence_label"),
             "verified": bool(result.get("verified")),
             "verifier_provider": result.get("verifier_provider"),
+            "coalesced": bool(result.get("coalesced")),
         }
     }
 
@@ -527,20 +570,20 @@ async def export_pdf(request: Request):
 # CHAT HISTORY + LEARNING MEMORY (Chat AI only by default; Luma can also store)
 # ============================================================================
 
-def _require_auth_user(request: Request) -> dict:
+async def _require_auth_user(request: Request) -> dict:
     auth_header = (request.headers.get("authorization") or "").strip()
     if not auth_header.lower().startswith("bearer "):
         raise HTTPException(status_code=401, detail="AUTH_REQUIRED")
     token = auth_header.split(" ", 1)[1].strip()
-    return session_user(token)
+    return await asession_user(token)
 
 
 @router.get("/history/list")
 async def history_list(request: Request, limit: int = 30):
     """List recent chat history for the logged-in user."""
     try:
-        user_ctx = _require_auth_user(request)
-        items = db_list_chat_history(int(user_ctx["user_id"]), limit=limit)
+        user_ctx = await _require_auth_user(request)
+        items = await adb_list_chat_history(int(user_ctx["user_id"]), limit=limit)
         return {"ok": True, "items": items}
     except HTTPException as e:
         raise e
@@ -552,7 +595,7 @@ async def history_list(request: Request, limit: int = 30):
 async def history_clear(request: Request):
     """Clear all chat history for the logged-in user."""
     try:
-        user_ctx = _require_auth_user(request)
+        user_ctx = await _require_auth_user(request)
         db_clear_chat_history(int(user_ctx["user_id"]))
         return {"ok": True}
     except HTTPException as e:
@@ -565,8 +608,8 @@ async def history_clear(request: Request):
 async def memory_cards(request: Request):
     """Return compressed learning memory cards (opt-in feature)."""
     try:
-        user_ctx = _require_auth_user(request)
-        cards = db_get_memory_cards(int(user_ctx["user_id"]))
+        user_ctx = await _require_auth_user(request)
+        cards = await adb_get_memory_cards(int(user_ctx["user_id"]))
         return {"ok": True, "cards": cards}
     except HTTPException as e:
         raise e
@@ -578,7 +621,7 @@ async def memory_cards(request: Request):
 async def memory_reset(request: Request):
     """Reset (delete) learning memory cards for the logged-in user."""
     try:
-        user_ctx = _require_auth_user(request)
+        user_ctx = await _require_auth_user(request)
         db_reset_memory_cards(int(user_ctx["user_id"]))
         return {"ok": True}
     except HTTPException as e:
@@ -592,30 +635,44 @@ async def memory_reset(request: Request):
 # MAIN SOLVE ENDPOINT
 # ============================================================================
 
-@router.post("/solve", response_model=SolveResponse)
-async def solve_route(
-    req: SolveRequest,
-    request: Request,
-    x_ke_key: str | None = Header(default=None, alias="X-KE-KEY"),
-):
-    """
-    Main AI solve endpoint - Production Grade
-    
-    Features:
-    - Request tracing via request_id
-    - Rate limiting (Redis + in-memory fallback)
-    - Auth validation
-    - Caching with TTL
-    - Credit billing
-    - Comprehensive logging
+@dataclass
+class _SolveState:
+    """Per-request state shared by /solve and /solve/stream."""
+    trace_id: str
+    start_time: float
+    user_ctx: dict | None = None
+    sub: dict | None = None
+    payload: dict = field(default_factory=dict)
+    context: dict = field(default_factory=dict)
+    req_answer_mode: str = "step_by_step"
+    client_request_id: str | None = None
+    cache_key: str = ""
+    planned_units: int = 0
+    planned_plan: str | None = None
+    reservation_id: str | None = None
+    route_class: str | None = None
+    idem: idempotency.Claim | None = None
+
+
+def _out_of_credits(trace_id: str) -> JSONResponse:
+    return JSONResponse(
+        status_code=402,
+        content=_safe_failure(
+            "You have used all your AI credits. Please buy a Booster Pack or upgrade your plan.",
+            "OUT_OF_CREDITS",
+            trace_id
+        ).model_dump(),
+    )
+
+
+async def _solve_preflight(req: SolveRequest, request: Request, x_ke_key: str | None, st: _SolveState):
+    """Admission for a solve: key, rate limit, auth, idempotency, cache, credits.
+
+    Returns a ready response (error, idempotent replay or cache hit) or None
+    when the caller should go on and run the orchestrator.
     """
-    
-    # Generate request ID for tracing
-    trace_id = _generate_request_id()
-    start_time = time.perf_counter()
-    
-    logger.info(f"📥 [{trace_id}] New /solve request from {_client_ip(request)}")
-    
+    trace_id = st.trace_id
+
     # API key validation (optional guardrail)
     if KE_API_KEY:
         if not x_ke_key or x_ke_key.strip() != KE_API_KEY:
@@ -629,31 +686,21 @@ async def solve_route(
                 ).model_dump(),
             )
 
-    # Rate limiting
+    # Per-IP rate limit first: it needs no lookup, so a flood of bad or
+    # unknown tokens is refused before it reaches the session store
     ip = _client_ip(request)
-    if not _rate_limit_ok(ip):
-        logger.warning(f"⚠️ [{trace_id}] Rate limited: {ip}")
-        return JSONResponse(
-            status_code=429,
-            content=_safe_failure(
-                "Too many requests right now. Please try again in a minute 😊",
-                "RATE_LIMITED",
-                trace_id
-            ).model_dump(),
-        )
+    decision = await _rate_limit(ip)
+    if not decision.allowed:
+        return _rate_limited(trace_id, decision)
 
     # Auth handling
     auth_header = (request.headers.get("authorization") or "").strip()
-    user_ctx = None
-    sub = None
-    wallet = None
-    credits_units_charged = 0
 
     if auth_header.lower().startswith("bearer "):
         token = auth_header.split(" ", 1)[1].strip()
         try:
-            user_ctx = session_user(token)
-            logger.info(f"👤 [{trace_id}] Authenticated user: {user_ctx.get('user_id')}")
+            st.user_ctx = await asession_user(token)
+            logger.info(f"👤 [{trace_id}] Authenticated user: {st.user_ctx.get('user_id')}")
         except Exception as e:
             logger.warning(f"🔒 [{trace_id}] Auth failed: {e}")
             return JSONResponse(
@@ -664,46 +711,66 @@ async def solve_route(
                     trace_id
                 ).model_dump(),
             )
-        
+
+    # Then the user and route-class limits (the IP was charged above)
+    decision = await _rate_limit(ip, st.user_ctx, st.route_class, include_ip=False)
+    if not decision.allowed:
+        # Refused here: the request never ran, so its IP token is given back
+        await rate_limit_arefund([ip_limit(ip)])
+        return _rate_limited(trace_id, decision)
+
+    if st.user_ctx:
         try:
-            sub = get_subscription(int(user_ctx["user_id"]))
+            st.sub = await aget_subscription(int(st.user_ctx["user_id"]))
         except Exception:
-            sub = None
+            st.sub = None
+
+    user_ctx = st.user_ctx
 
     # Payload and context (auto-detect friendly; selectors may be empty)
-    payload = req.model_dump()
-    context = _extract_context(payload)
+    st.payload = payload = req.model_dump()
+    st.context = context = _extract_context(payload)
     req_answer_mode = _normalize_answer_mode(payload.get("answer_mode") or payload.get("mode") or "")
     req_answer_mode, safety_note = _apply_age_safety(req_answer_mode, context)
+    st.req_answer_mode = req_answer_mode
     if safety_note:
         context["_safety_note"] = safety_note
 
-    # Idempotency handling
-    client_request_id = (getattr(req, "request_id", None) or "").strip() or None
+    # Idempotency: replay a stored response, or wait for the request that is
+    # still running it (never solve and bill the same request_id twice)
+    st.client_request_id = client_request_id = (getattr(req, "request_id", None) or "").strip() or None
     if client_request_id:
-        rid_key = f"rid:solve:{client_request_id}"
-        prior = redis_get_json(rid_key)
-        if prior and isinstance(prior, dict) and prior.get("final_answer"):
+        prior, st.idem = await idempotency.begin(client_request_id)
+        if prior is not None:
             logger.info(f"♻️ [{trace_id}] Returning idempotent cached response")
             return SolveResponse(**prior)
-
-        try:
-            lock_key = f"lock:rid:solve:{client_request_id}"
-            got_lock = redis_setnx_ex(lock_key, 30, "1")
-            if not got_lock:
-                await asyncio.sleep(0.35)
-                prior2 = redis_get_json(rid_key)
-                if prior2 and isinstance(prior2, dict) and prior2.get("final_answer"):
-                    return SolveResponse(**prior2)
-        except Exception:
-            pass
+        if st.idem is None:
+            logger.warning(f"⏳ [{trace_id}] request_id still in progress after waiting")
+            return JSONResponse(
+                status_code=409,
+                content=_safe_failure(
+                    "Still working on your previous request. Please try again in a moment 😊",
+                    "REQUEST_IN_PROGRESS",
+                    trace_id
+                ).model_dump(),
+                headers={"Retry-After": "2"},
+            )
 
     # Cache check
-    cache_key = _cache_key(payload)
-    cached = redis_get_json(cache_key)
+    st.cache_key = cache_key = _cache_key(payload)
+    cached, needs_refresh = await solve_cache.alookup(cache_key)
+    similar = False
+    if not cached:
+        # Optional near-duplicate match (SEMANTIC_CACHE_ENABLED)
+        alt_key = await solve_cache.afind_similar(_cache_scope(payload), str(req.question or ""))
+        if alt_key and alt_key != cache_key:
+            cached, _ = await solve_cache.alookup(alt_key)
+            similar = bool(cached)
     
     if cached:
-        logger.info(f"⚡ [{trace_id}] Cache HIT")
+        logger.info(f"⚡ [{trace_id}] Cache HIT{' (similar)' if similar else ''}{' (refreshing)' if needs_refresh else ''}")
+        if needs_refresh:
+            await _schedule_refresh(st, req)
         
         try:
             db_log_solve(req=req, out=cached, latency_ms=0, error=None)
@@ -712,6 +779,8 @@ async def solve_route(
 
         cached_flags = list(cached.get("flags", []) or [])
         cached_flags.append("CACHED")
+        if similar:
+            cached_flags.append("CACHED_SIMILAR")
         if user_ctx:
             cached_flags.append("AUTH")
 
@@ -740,217 +809,364 @@ async def solve_route(
         )
 
     # Billing pre-check
-    planned_units = 0
-    planned_plan = None
-
     if user_ctx:
         try:
-            planned_plan = (((sub or {}).get("plan") or "free") if isinstance(sub, dict) else "free").lower().strip() or "free"
+            sub = st.sub
+            st.planned_plan = (((sub or {}).get("plan") or "free") if isinstance(sub, dict) else "free").lower().strip() or "free"
             q = (req.question or "").strip()
             planned_units = 120 + max(0, len(q) // 20)
-            planned_units = max(60, min(600, int(planned_units)))
+            st.planned_units = max(60, min(600, int(planned_units)))
 
             try:
-                w_preview = billing_store.get_wallet(int(user_ctx["user_id"]), planned_plan)
-                total_preview = int(w_preview.get("included_credits_balance") or 0) + int(w_preview.get("booster_credits_balance") or 0)
-                if total_preview < int(planned_units):
-                    logger.warning(f"💰 [{trace_id}] Insufficient credits")
-                    return JSONResponse(
-                        status_code=402,
-                        content=_safe_failure(
-                            "You have used all your AI credits. Please buy a Booster Pack or upgrade your plan.",
-                            "OUT_OF_CREDITS",
-                            trace_id
-                        ).model_dump(),
-                    )
-            except ValueError:
-                return JSONResponse(
-                    status_code=402,
-                    content=_safe_failure(
-                        "You have used all your AI credits. Please buy a Booster Pack or upgrade your plan.",
-                        "OUT_OF_CREDITS",
-                        trace_id
-                    ).model_dump(),
+                # Hold the planned units now; _finish_solve settles the hold
+                held = await billing_store.areserve_credits(
+                    int(user_ctx["user_id"]),
+                    st.planned_plan,
+                    int(st.planned_units),
+                    meta={"route": "/solve", "request_id": trace_id},
                 )
+                st.reservation_id = held.get("reservation_id")
+            except ValueError:
+                logger.warning(f"💰 [{trace_id}] Insufficient credits")
+                return _out_of_credits(trace_id)
             except Exception:
-                planned_units = 0
-                planned_plan = None
+                st.planned_units = 0
+                st.planned_plan = None
         except Exception:
-            planned_units = 0
-            planned_plan = None
+            st.planned_units = 0
+            st.planned_plan = None
 
-    # ========================================================================
-    # EXECUTE AI SOLVE
-    # ========================================================================
-    
+    return None
+
+
+async def _release_hold(st: _SolveState) -> None:
+    """Give back the admission hold of a solve that produced no answer."""
+    rid, st.reservation_id = st.reservation_id, None
+    if rid:
+        await billing_store.arelease_reservation(rid, meta={"request_id": st.trace_id})
+
+
+_RELEASE_TASKS: set[asyncio.Task] = set()
+
+
+async def _release_claim(st: _SolveState) -> None:
+    """Drop the idempotency lock without a response (duplicates solve themselves)."""
+    claim, st.idem = st.idem, None
+    if claim is not None:
+        await claim.release()
+
+
+def _release_hold_later(st: _SolveState) -> None:
+    """_release_hold (and the idempotency lock) from a cancelled context."""
+    claim, st.idem = st.idem, None
+    if claim is not None:
+        claim.release_later()
+    if not st.reservation_id:
+        return
     try:
+        task = asyncio.get_running_loop().create_task(_release_hold(st))
+    except RuntimeError:
+        return  # no loop: the expiry sweep releases it
+    _RELEASE_TASKS.add(task)
+    task.add_done_callback(_RELEASE_TASKS.discard)
+
+
+def _cacheable_out(raw_result: dict, trace_id: str, question: str, context: dict, answer_mode: str) -> dict:
+    out = _format_response(raw_result, trace_id)
+
+    # Phase-4: deterministic Answer-as-Learning-Object wrapper
+    try:
+        out["learning_object"] = _build_learning_object(
+            question=question,
+            answer=out.get("final_answer", ""),
+            context=context,
+            answer_mode=answer_mode,
+        )
+    except Exception:
+        # Fail-safe: never break /solve due to wrapper
+        out["learning_object"] = None
+    return out
+
+
+_REFRESH_TASKS: set[asyncio.Task] = set()
+
+
+async def _schedule_refresh(st: _SolveState, req: SolveRequest) -> None:
+    """Re-solve a stale/early-expiring cache entry in the background.
+
+    At most one refresh per key: a local task-name check inside the worker
+    and a short Redis lock across workers. No billing or history: nobody
+    asked for this answer, we are keeping the cache warm.
+    """
+    key = st.cache_key
+    if not key or any(t.get_name() == key for t in _REFRESH_TASKS):
+        return
+    if get_aredis() and not await redis_asetnx_ex(f"lock:refresh:{key}", 120, "1"):
+        return
+    task = asyncio.create_task(
+        _refresh_cache_entry(
+            key,
+            str(req.question or "").strip(),
+            dict(st.context),
+            _determine_user_tier(st.user_ctx, st.sub),
+            st.req_answer_mode,
+        ),
+        name=key,
+    )
+    _REFRESH_TASKS.add(task)
+    task.add_done_callback(_REFRESH_TASKS.discard)
+
+
+async def _refresh_cache_entry(key: str, question: str, context: dict, user_tier: str, answer_mode: str) -> None:
+    trace_id = _generate_request_id()
+    t0 = time.perf_counter()
+
+    async def _run() -> dict:
         async with _SOLVE_SEM:
-            question = str(req.question or "").strip()
-            # context already prepared above (auto-detect friendly)
-            user_tier = _determine_user_tier(user_ctx, sub)
-            
-            logger.info(f"🤖 [{trace_id}] Calling orchestrator | tier={user_tier} | mode={context.get('study_mode')}")
-            
-            # Call the orchestrator (properly awaited)
-            raw_result = await solve(question, context, user_tier)
-            
-            # Format response
-            out = _format_response(raw_result, trace_id)
-
-            # Phase-4: deterministic Answer-as-Learning-Object wrapper
-            try:
-                out["learning_object"] = _build_learning_object(
-                    question=question,
-                    answer=out.get("final_answer", ""),
-                    context=context,
-                    answer_mode=req_answer_mode,
-                )
-            except Exception:
-                # Fail-safe: never break /solve due to wrapper
-                out["learning_object"] = None
-            
+            return await solve(question, context, user_tier)
 
-            # Phase-4B: Store chat history (trust-first; disabled for private_session)
-            try:
-                if user_ctx and (not bool(getattr(req, "private_session", False))) and out.get("final_answer"):
-                    surface = (getattr(req, "surface", None) or context.get("study_mode") or "chat_ai")
-                    db_add_chat_history(
-                        user_id=int(user_ctx["user_id"]),
-                        surface=str(surface or "chat_ai")[:20],
-                        question=question,
-                        learning_object=out.get("learning_object"),
-                        mode=req_answer_mode,
-                        language=context.get("language"),
-                    )
-            except Exception:
-                pass
+    try:
+        raw_result, _ = await singleflight.do(f"{key}:{user_tier}", _run)
+        out = _cacheable_out(raw_result, trace_id, question, context, answer_mode)
+        # Never replace a good stale answer with an error message
+        if out.get("final_answer") and "AI_ERROR" not in (out.get("flags") or []):
+            await solve_cache.asetex(key, SOLVE_CACHE_TTL_SECONDS, out, compute_s=time.perf_counter() - t0)
+            logger.info(f"♻️ [{trace_id}] Cache refreshed | {int((time.perf_counter() - t0) * 1000)}ms")
+    except Exception as e:
+        logger.warning(f"[{trace_id}] Background cache refresh failed: {e}")
+
+
+async def _finish_solve(st: _SolveState, req: SolveRequest, raw_result: dict) -> SolveResponse:
+    """Post-orchestrator work: history, logging, cache, billing, telemetry, idempotency."""
+    trace_id = st.trace_id
+    user_ctx = st.user_ctx
+    context = st.context
+    req_answer_mode = st.req_answer_mode
+    planned_plan = st.planned_plan
+    planned_units = st.planned_units
+    question = str(req.question or "").strip()
+    wallet = None
+    credits_units_charged = 0
 
-            # Phase-4B: Update compressed learning memory cards (opt-in)
-            try:
-                if user_ctx and bool(getattr(req, "memory_opt_in", False)) and (not bool(getattr(req, "private_session", False))):
-                    _update_learning_memory_cards(int(user_ctx["user_id"]), context, question)
-            except Exception:
-                pass
+    # Format response (+ learning object); this is also what gets cached
+    out = _cacheable_out(raw_result, trace_id, question, context, req_answer_mode)
 
-        latency_ms = int((time.perf_counter() - start_time) * 1000)
-        logger.info(f"✅ [{trace_id}] Solve complete | {latency_ms}ms | strategy={raw_result.get('ai_strategy')}")
+    # Phase-4B: Store chat history (trust-first; disabled for private_session)
+    try:
+        if user_ctx and (not bool(getattr(req, "private_session", False))) and out.get("final_answer"):
+            surface = (getattr(req, "surface", None) or context.get("study_mode") or "chat_ai")
+            await adb_add_chat_history(
+                user_id=int(user_ctx["user_id"]),
+                surface=str(surface or "chat_ai")[:20],
+                question=question,
+                learning_object=out.get("learning_object"),
+                mode=req_answer_mode,
+                language=context.get("language"),
+            )
+    except Exception:
+        pass
+
+    # Phase-4B: Update compressed learning memory cards (opt-in)
+    try:
+        if user_ctx and bool(getattr(req, "memory_opt_in", False)) and (not bool(getattr(req, "private_session", False))):
+            _update_learning_memory_cards(int(user_ctx["user_id"]), context, question)
+    except Exception:
+        pass
+
+    latency_ms = int((time.perf_counter() - st.start_time) * 1000)
+    logger.info(f"✅ [{trace_id}] Solve complete | {latency_ms}ms | strategy={raw_result.get('ai_strategy')}")
 
-        # Log to database
+    # Log to database
+    try:
+        db_log_solve(req=req, out=out, latency_ms=latency_ms, error=None)
+    except Exception:
+        pass
+
+    # Cache successful response (the flight leader already did for coalesced solves)
+    if isinstance(out, dict) and out.get("final_answer") and not raw_result.get("coalesced"):
         try:
-            db_log_solve(req=req, out=out, latency_ms=latency_ms, error=None)
+            await solve_cache.asetex(st.cache_key, SOLVE_CACHE_TTL_SECONDS, out, compute_s=latency_ms / 1000.0)
+            await solve_cache.aindex_similar(_cache_scope(st.payload), st.cache_key, question)
         except Exception:
             pass
 
-        # Cache successful response
-        if isinstance(out, dict) and out.get("final_answer"):
+    # Billing: settle the admission hold (charge on success, refund the rest)
+    billing_meta = {
+        "route": "/solve",
+        "request_id": trace_id,
+        "ai_strategy": raw_result.get("ai_strategy"),
+        "subject": req.subject,
+        "board": req.board,
+    }
+    charge_directly = 0
+    if st.reservation_id:
+        used = (raw_result.get("credits_used") or planned_units) if isinstance(out, dict) and out.get("final_answer") else 0
+        rid, st.reservation_id = st.reservation_id, None
+        wallet_out = await billing_store.asettle_reservation(rid, int(used), meta=billing_meta)
+        if wallet_out.get("ok"):
+            wallet = wallet_out
+            credits_units_charged = int(wallet_out.get("consumed") or 0)
+            logger.info(f"💳 [{trace_id}] Credits charged: {credits_units_charged}")
+        elif used:
+            # Hold expired (the sweeper refunded it) or the settle failed: the
+            # answer is still served, so charge it like an unreserved solve
+            logger.warning(f"💳 [{trace_id}] Credit hold {rid} was not settled; charging directly")
+            charge_directly = int(used)
+    elif user_ctx and planned_plan and planned_units and isinstance(out, dict) and out.get("final_answer"):
+        # No hold was taken (DB unavailable at admission): charge directly
+        charge_directly = int(raw_result.get("credits_used") or planned_units)
+    if charge_directly and user_ctx and planned_plan:
+        actual_credits = charge_directly
+        try:
+            wallet_out = await billing_store.aconsume_credits(
+                int(user_ctx["user_id"]),
+                planned_plan,
+                int(actual_credits),
+                meta=billing_meta,
+            )
+            wallet = wallet_out
+            credits_units_charged = int(wallet_out.get("consumed") or actual_credits)
+            logger.info(f"💳 [{trace_id}] Credits charged: {credits_units_charged}")
+        except ValueError:
+            credits_units_charged = 0
             try:
-                redis_setex_json(cache_key, SOLVE_CACHE_TTL_SECONDS, out)
+                wallet = await billing_store.aget_wallet(int(user_ctx["user_id"]), planned_plan)
             except Exception:
-                pass
+                wallet = None
+        except Exception:
+            credits_units_charged = 0
 
-        # Billing: Deduct credits on success
-        if user_ctx and planned_plan and planned_units and isinstance(out, dict) and out.get("final_answer"):
-            actual_credits = raw_result.get("credits_used") or planned_units
-            try:
-                wallet_out = billing_store.consume_credits(
-                    int(user_ctx["user_id"]),
-                    planned_plan,
-                    int(actual_credits),
-                    meta={
-                        "route": "/solve",
-                        "request_id": trace_id,
-                        "ai_strategy": raw_result.get("ai_strategy"),
-                        "subject": req.subject,
-                        "board": req.board,
-                    },
-                )
-                wallet = wallet_out
-                credits_units_charged = int(wallet_out.get("consumed") or actual_credits)
-                logger.info(f"💳 [{trace_id}] Credits charged: {credits_units_charged}")
-            except ValueError:
-                credits_units_charged = 0
-                try:
-                    wallet = billing_store.get_wallet(int(user_ctx["user_id"]), planned_plan)
-                except Exception:
-                    wallet = None
-            except Exception:
-                credits_units_charged = 0
+    # Telemetry logging
+    try:
+        q = (req.question or "")
+        question_len = len(q)
+        ans = str(out.get("final_answer", "") or "")
+        answer_len = len(ans)
+        tokens_in = _estimate_tokens_from_chars(question_len)
+        tokens_out = _estimate_tokens_from_chars(answer_len)
+        tokens_total = raw_result.get("tokens_used") or (tokens_in + tokens_out)
+        provider = raw_result.get("provider") or "gemini"
+        
+        # Coalesced followers reused the leader's provider call
+        cost_usd = 0.0 if raw_result.get("coalesced") else _estimate_cost_usd(provider, tokens_total)
+        
+        db_log_ai_usage({
+            "user_id": int(user_ctx["user_id"]) if user_ctx else None,
+            "role": (user_ctx.get("role") if user_ctx else None),
+            "plan": planned_plan,
+            "request_type": "TEXT",
+            "credit_bucket": int(planned_units) if planned_units else 0,
+            "credits_charged": credits_units_charged,
+            "model_primary": provider,
+            "ai_strategy": raw_result.get("ai_strategy"),
+            "cache_hit": bool(raw_result.get("coalesced")),
+            "tokens_in": tokens_in,
+            "tokens_out": tokens_out,
+            "estimated_cost_usd": cost_usd,
+            "estimated_cost_inr": _usd_to_inr(cost_usd),
+            "latency_ms": latency_ms,
+            "status": "SUCCESS" if ans else "FAILED",
+            "question_len": question_len,
+            "answer_len": answer_len,
+            "error": None,
+        })
+    except Exception:
+        pass
 
-        # Telemetry logging
+    # Build final response
+    final_flags = list(out.get("flags", []) or [])
+    if user_ctx:
+        final_flags.append("AUTH")
+
+    # Add AI metadata to meta for frontend
+    meta = out.get("meta") or {}
+    meta["billing"] = {
+        "user_id": int(user_ctx["user_id"]) if user_ctx else None,
+        "plan": planned_plan,
+        "credits_units_charged": credits_units_charged,
+        "wallet": wallet,
+        "served_from_cache": False,
+    }
+
+    resp = SolveResponse(
+        final_answer=out.get("final_answer", ""),
+        steps=out.get("steps", []),
+        assumptions=out.get("assumptions", []),
+        confidence=float(out.get("confidence", 0.85)),
+        flags=final_flags,
+        safe_note=out.get("safe_note") or context.get("_safety_note"),
+        blueprint=out.get("blueprint"),
+        learning_object={"blueprint": out.get("blueprint")} if out.get("blueprint") else None,
+        meta=meta,
+    )
+
+    # Save for idempotency (and wake duplicates waiting on this request_id)
+    claim, st.idem = st.idem, None
+    if claim is not None:
         try:
-            q = (req.question or "")
-            question_len = len(q)
-            ans = str(out.get("final_answer", "") or "")
-            answer_len = len(ans)
-            tokens_in = _estimate_tokens_from_chars(question_len)
-            tokens_out = _estimate_tokens_from_chars(answer_len)
-            tokens_total = raw_result.get("tokens_used") or (tokens_in + tokens_out)
-            provider = raw_result.get("provider") or "gemini"
-            
-            cost_usd = _estimate_cost_usd(provider, tokens_total)
-            
-            db_log_ai_usage({
-                "user_id": int(user_ctx["user_id"]) if user_ctx else None,
-                "role": (user_ctx.get("role") if user_ctx else None),
-                "plan": planned_plan,
-                "request_type": "TEXT",
-                "credit_bucket": int(planned_units) if planned_units else 0,
-                "credits_charged": credits_units_charged,
-                "model_primary": provider,
-                "ai_strategy": raw_result.get("ai_strategy"),
-                "cache_hit": False,
-                "tokens_in": tokens_in,
-                "tokens_out": tokens_out,
-                "estimated_cost_usd": cost_usd,
-                "estimated_cost_inr": _usd_to_inr(cost_usd),
-                "latency_ms": latency_ms,
-                "status": "SUCCESS" if ans else "FAILED",
-                "question_len": question_len,
-                "answer_len": answer_len,
-                "error": None,
-            })
+            await claim.complete(resp.model_dump())
         except Exception:
             pass
 
-        # Build final response
-        final_flags = list(out.get("flags", []) or [])
-        if user_ctx:
-            final_flags.append("AUTH")
+    return resp
 
-        # Add AI metadata to meta for frontend
-        meta = out.get("meta") or {}
-        meta["billing"] = {
-            "user_id": int(user_ctx["user_id"]) if user_ctx else None,
-            "plan": planned_plan,
-            "credits_units_charged": credits_units_charged,
-            "wallet": wallet,
-            "served_from_cache": False,
-        }
 
-        resp = SolveResponse(
-            final_answer=out.get("final_answer", ""),
-            steps=out.get("steps", []),
-            assumptions=out.get("assumptions", []),
-            confidence=float(out.get("confidence", 0.85)),
-            flags=final_flags,
-            safe_note=out.get("safe_note") or context.get("_safety_note"),
-            blueprint=out.get("blueprint"),
-            learning_object={"blueprint": out.get("blueprint")} if out.get("blueprint") else None,
-            meta=meta,
-        )
+@router.post("/solve", response_model=SolveResponse)
+async def solve_route(
+    req: SolveRequest,
+    request: Request,
+    x_ke_key: str | None = Header(default=None, alias="X-KE-KEY"),
+):
+    """
+    Main AI solve endpoint - Production Grade
+    
+    Features:
+    - Request tracing via request_id
+    - Rate limiting (Redis + in-memory fallback)
+    - Auth validation
+    - Caching with TTL
+    - Credit billing
+    - Comprehensive logging
+    """
+    
+    # Generate request ID for tracing
+    st = _SolveState(trace_id=_generate_request_id(), start_time=time.perf_counter())
+    trace_id = st.trace_id
+    
+    logger.info(f"📥 [{trace_id}] New /solve request from {_client_ip(request)}")
 
-        # Save for idempotency
-        if client_request_id and resp.final_answer:
-            try:
-                rid_key = f"rid:solve:{client_request_id}"
-                redis_setex_json(rid_key, 10 * 60, resp.model_dump())
-            except Exception:
-                pass
+    early = await _solve_preflight(req, request, x_ke_key, st)
+    if early is not None:
+        await _release_claim(st)
+        return early
+
+    # ========================================================================
+    # EXECUTE AI SOLVE
+    # ========================================================================
+    
+    try:
+        question = str(req.question or "").strip()
+        # context already prepared above (auto-detect friendly)
+        user_tier = _determine_user_tier(st.user_ctx, st.sub)
 
-        return resp
+        async def _run() -> dict:
+            # Only the flight leader takes a solve slot; followers just wait.
+            async with _SOLVE_SEM:
+                logger.info(f"🤖 [{trace_id}] Calling orchestrator | tier={user_tier} | mode={st.context.get('study_mode')}")
+                return await solve(question, st.context, user_tier)
+
+        # Identical in-flight solves (same cache key + tier) share one provider call
+        raw_result, role = await singleflight.do(_flight_key(st, user_tier), _run)
+        if role != "leader":
+            logger.info(f"🔗 [{trace_id}] Coalesced onto in-flight solve ({role})")
+            raw_result = {**raw_result, "coalesced": True}
+
+        return await _finish_solve(st, req, raw_result)
 
     except asyncio.TimeoutError:
         logger.error(f"⏱️ [{trace_id}] Semaphore timeout")
+        await _release_hold(st)
+        await _release_claim(st)
         return JSONResponse(
             status_code=503,
             content=_safe_failure(
@@ -961,7 +1177,9 @@ async def solve_route(
         )
     except Exception as e:
         logger.error(f"❌ [{trace_id}] Error: {e}")
-        
+        await _release_hold(st)
+        await _release_claim(st)
+
         try:
             db_log_solve(req=req, out=None, latency_ms=None, error=str(e))
         except Exception:
@@ -972,6 +1190,111 @@ async def solve_route(
             "SERVER_ERROR",
             trace_id
         )
+    except BaseException:
+        # Client disconnected mid-solve
+        _release_hold_later(st)
+        raise
+
+
+def _flight_key(st: _SolveState, user_tier: str) -> str:
+    """Single-flight key: the solve cache key plus tier (tier picks the models)."""
+    return f"{st.cache_key}:{user_tier}"
+
+
+def _sse(event: str, data: dict) -> str:
+    """Encode one Server-Sent Event frame (single-line JSON data)."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+_SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+@router.post("/solve/stream")
+async def solve_stream_route(
+    req: SolveRequest,
+    request: Request,
+    x_ke_key: str | None = Header(default=None, alias="X-KE-KEY"),
+):
+    """Streaming /solve over Server-Sent Events.
+
+    Same admission, billing and caching as /solve. Events:
+    `start`, `delta` (writer tokens), `header`, `section` (one per completed
+    section, with its blueprint card), `restart`, then a final `done` whose
+    data is the full SolveResponse. Errors before streaming starts return the
+    usual JSON error response; errors mid-stream emit `error`.
+    """
+    st = _SolveState(trace_id=_generate_request_id(), start_time=time.perf_counter(), route_class="stream")
+    trace_id = st.trace_id
+
+    logger.info(f"📥 [{trace_id}] New /solve/stream request from {_client_ip(request)}")
+
+    early = await _solve_preflight(req, request, x_ke_key, st)
+    if early is not None:
+        await _release_claim(st)
+    if isinstance(early, SolveResponse):
+        # Idempotent replay / cache hit: a one-frame stream
+        async def _replay():
+            yield _sse("done", early.model_dump())
+        return StreamingResponse(_replay(), media_type="text/event-stream", headers=_SSE_HEADERS)
+    if early is not None:
+        return early
+
+    async def _events():
+        flight = None
+        try:
+            raw_result: dict = {}
+            question = str(req.question or "").strip()
+            user_tier = _determine_user_tier(st.user_ctx, st.sub)
+            flight = await singleflight.begin(_flight_key(st, user_tier))
+            if flight.is_leader:
+                async with _SOLVE_SEM:
+                    logger.info(f"🤖 [{trace_id}] Streaming orchestrator | tier={user_tier} | mode={st.context.get('study_mode')}")
+                    async for ev in solve_stream(question, st.context, user_tier):
+                        if ev.get("event") == "done":
+                            raw_result = ev.get("data") or {}
+                            continue
+                        yield _sse(ev.get("event") or "message", ev.get("data") or {})
+                await flight.finish(raw_result)
+            else:
+                # Someone is already solving this exact question: no token
+                # stream to relay, so wait for their result and send `done`.
+                async def _run() -> dict:
+                    async with _SOLVE_SEM:
+                        return await solve(question, st.context, user_tier)
+
+                yield _sse("start", {"request_id": trace_id, "coalesced": True})
+                raw_result, role = await flight.wait(_run)
+                if role != "leader":
+                    logger.info(f"🔗 [{trace_id}] Coalesced onto in-flight solve ({role})")
+                    raw_result = {**raw_result, "coalesced": True}
+            flight = None
+            # Billing, caching and history run once the provider stream has ended
+            resp = await _finish_solve(st, req, raw_result)
+            yield _sse("done", resp.model_dump())
+        except BaseException as e:
+            # Client disconnects surface here too; release any followers first
+            if flight is not None and flight.is_leader:
+                flight.fail(e)
+            if not isinstance(e, Exception):
+                _release_hold_later(st)
+                raise
+            logger.error(f"❌ [{trace_id}] Stream error: {e}")
+            await _release_hold(st)
+            await _release_claim(st)
+            try:
+                db_log_solve(req=req, out=None, latency_ms=None, error=str(e))
+            except Exception:
+                pass
+            yield _sse(
+                "error",
+                _safe_failure(
+                    "Luma had a small hiccup while solving. Please try again in a few seconds 😊",
+                    "SERVER_ERROR",
+                    trace_id
+                ).model_dump(),
+            )
+
+    return StreamingResponse(_events(), media_type="text/event-stream", headers=_SSE_HEADERS)
 
 
 # ============================================================================
@@ -993,6 +1316,6 @@ async def ai_stats():
     """Get AI orchestrator statistics (for monitoring)"""
     try:
         stats = get_orchestrator_stats()
-        return {"status": "ok", "stats": stats}
+        return {"status": "ok", "stats": stats, "singleflight": singleflight.stats(), "idempotency": idempotency.stats(), "solve_cache": solve_cache.stats(), "write_behind": write_behind.stats(), "sessions": session_cache_stats(), "accounts": account_cache.stats()}
     except Exception as e:
         return {"status": "error", "error": str(e)}
@@ -0,0 +1,101 @@
+"""schema_ready.py — Run each store's DDL once per process.
+
+Every store module used to call its own `ensure_tables()` on the request
+path. Some were memoized, some (phase1_store) ran `metadata.create_all`
+and its catalog introspection on every call, and at boot the 4 uvicorn
+workers raced each other through the same CREATE/ALTER statements.
+
+Now each store hands its DDL to `ensure(name, apply)`:
+- `apply(conn)` runs inside one transaction that first takes a Postgres
+  advisory transaction lock, so concurrent workers run DDL one at a time
+  (the later ones find everything IF NOT EXISTS and finish quickly);
+- success is cached for the life of the process: later calls are a dict
+  lookup;
+- a failure is cached too and retried at most every
+  SCHEMA_RETRY_SECONDS, so a DB outage doesn't turn every request into a
+  DDL attempt;
+- without a configured engine nothing is cached (the DB may appear later).
+
+`status()` is reported under "schema" in /health.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from config import SCHEMA_RETRY_SECONDS
+from shared_engine import get_engine
+
+logger = logging.getLogger("knoweasy.schema_ready")
+
+# Arbitrary, fixed: every worker and every store serializes on this one key.
+_ADVISORY_LOCK_KEY = 0x6B65_5343  # "keSC"
+
+_STATE: Dict[str, Dict[str, Any]] = {}
+_lock = threading.Lock()
+
+
+def is_ready(name: str) -> bool:
+    return bool(_STATE.get(name, {}).get("ready"))
+
+
+def ensure(name: str, apply: Callable[[Connection], None]) -> bool:
+    """Run `apply(conn)` once for `name`. True when the schema is in place."""
+    st = _STATE.get(name)
+    if st is not None and (st["ready"] or time.monotonic() < st["retry_at"]):
+        return bool(st["ready"])
+
+    with _lock:
+        st = _STATE.get(name)
+        if st is not None and (st["ready"] or time.monotonic() < st["retry_at"]):
+            return bool(st["ready"])
+
+        engine = get_engine()
+        if engine is None:
+            return False
+
+        t0 = time.perf_counter()
+        try:
+            with engine.begin() as conn:
+                if conn.dialect.name == "postgresql":
+                    conn.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": _ADVISORY_LOCK_KEY})
+                apply(conn)
+        except Exception as e:
+            logger.exception("schema %s not ready; retrying in %ss", name, SCHEMA_RETRY_SECONDS)
+            _STATE[name] = {
+                "ready": False,
+                "error": str(e)[:300],
+                "ms": int((time.perf_counter() - t0) * 1000),
+                "at": datetime.now(timezone.utc).isoformat(),
+                "retry_at": time.monotonic() + max(1, SCHEMA_RETRY_SECONDS),
+            }
+            return False
+
+        ms = int((time.perf_counter() - t0) * 1000)
+        _STATE[name] = {
+            "ready": True,
+            "error": None,
+            "ms": ms,
+            "at": datetime.now(timezone.utc).isoformat(),
+            "retry_at": 0.0,
+        }
+        logger.info("schema %s ready (%sms)", name, ms)
+        return True
+
+
+def status() -> Dict[str, Any]:
+    modules = {
+        name: {k: v for k, v in st.items() if k != "retry_at"}
+        for name, st in sorted(_STATE.items())
+    }
+    return {
+        "ready": bool(modules) and all(m["ready"] for m in modules.values()),
+        "modules": modules,
+    }
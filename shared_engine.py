@@ -5,13 +5,23 @@ each created their own Engine with default pool_size=5. That meant 4 × 15 = 60
 connections — enough to exhaust Render Postgres limits instantly under load.
 
 Now every module imports `get_engine()` from here. ONE pool, properly tuned.
+
+`get_async_engine()` is the asyncpg counterpart for code running on the
+event loop (solve admission, chat history). Both pools count against the
+Postgres connection limit, so they split one per-worker budget:
+DB_POOL_SIZE + DB_MAX_OVERFLOW is the total, the async pool takes
+DB_ASYNC_POOL_SIZE / DB_ASYNC_MAX_OVERFLOW of it (default: a quarter of
+each) and the sync pool the rest. asyncpg is optional: without it the sync
+pool keeps the whole budget, `get_async_engine()` returns None and the
+async store helpers run their sync twin in a worker thread.
 """
 
 from __future__ import annotations
 
 import os
 import logging
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
 
 from sqlalchemy import create_engine, text
 from sqlalchemy.engine import Engine
@@ -19,6 +29,8 @@ from sqlalchemy.engine import Engine
 logger = logging.getLogger("knoweasy.shared_engine")
 
 _ENGINE: Optional[Engine] = None
+_ASYNC_ENGINE: Any = None
+_ASYNC_DISABLED: bool = False
 
 
 def _env_int(key: str, default: int) -> int:
@@ -39,6 +51,30 @@ def _clean_sslmode(raw: Optional[str]) -> Optional[str]:
     return v if v in allowed else None
 
 
+def _asyncpg_available() -> bool:
+    if _ASYNC_DISABLED:
+        return False
+    try:
+        import asyncpg  # type: ignore  # noqa: F401
+    except Exception:
+        return False
+    return True
+
+
+def _pool_sizes(kind: str) -> Tuple[int, int]:
+    """(pool_size, max_overflow) for the "sync" or "async" pool; see module doc."""
+    size = _env_int("DB_POOL_SIZE", 10)
+    overflow = _env_int("DB_MAX_OVERFLOW", 20)
+    async_size = min(size - 1, _env_int("DB_ASYNC_POOL_SIZE", max(1, size // 4)))
+    async_overflow = min(overflow, _env_int("DB_ASYNC_MAX_OVERFLOW", overflow // 4))
+    async_size = max(1, async_size)
+    if kind == "async":
+        return async_size, max(0, async_overflow)
+    if not _asyncpg_available():
+        return size, overflow
+    return max(1, size - async_size), max(0, overflow - async_overflow)
+
+
 def get_engine() -> Optional[Engine]:
     """Return the ONE shared SQLAlchemy engine, or None if DB is disabled/unconfigured."""
     global _ENGINE
@@ -57,26 +93,101 @@ def get_engine() -> Optional[Engine]:
             connect_args = {"sslmode": sslmode}
 
     try:
+        pool_size, max_overflow = _pool_sizes("sync")
         _ENGINE = create_engine(
             url,
             pool_pre_ping=True,
-            pool_size=_env_int("DB_POOL_SIZE", 10),
-            max_overflow=_env_int("DB_MAX_OVERFLOW", 20),
+            pool_size=pool_size,
+            max_overflow=max_overflow,
             pool_recycle=_env_int("DB_POOL_RECYCLE", 1800),
             pool_timeout=_env_int("DB_POOL_TIMEOUT", 30),
             connect_args=connect_args,
         )
-        logger.info(
-            "Shared DB engine created (pool_size=%d, max_overflow=%d)",
-            _env_int("DB_POOL_SIZE", 10),
-            _env_int("DB_MAX_OVERFLOW", 20),
-        )
+        logger.info("Shared DB engine created (pool_size=%d, max_overflow=%d)", pool_size, max_overflow)
         return _ENGINE
     except Exception:
         logger.exception("Failed to create shared DB engine")
         return None
 
 
+def _async_url(url: str) -> Tuple[str, Dict[str, Any]]:
+    """postgres[ql][+driver]://... -> postgresql+asyncpg://..., sslmode moved to connect_args."""
+    parts = urlsplit(url)
+    scheme = "postgresql+asyncpg"
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    sslmode = None
+    kept = []
+    for k, v in query:
+        if k.lower() == "sslmode":
+            sslmode = _clean_sslmode(v)
+        else:
+            kept.append((k, v))
+    if sslmode is None:
+        sslmode = _clean_sslmode(os.getenv("DB_SSLMODE"))
+    connect_args: Dict[str, Any] = {}
+    if sslmode and sslmode != "disable":
+        # asyncpg accepts libpq sslmode names for `ssl`
+        connect_args["ssl"] = sslmode
+    return urlunsplit((scheme, parts.netloc, parts.path, urlencode(kept), parts.fragment)), connect_args
+
+
+def get_async_engine():
+    """Return the shared AsyncEngine (asyncpg), or None if DB is off or asyncpg is missing."""
+    global _ASYNC_ENGINE, _ASYNC_DISABLED
+
+    url = (os.getenv("DATABASE_URL") or "").strip()
+    if not url or _ASYNC_DISABLED:
+        return None
+
+    if _ASYNC_ENGINE is not None:
+        return _ASYNC_ENGINE
+
+    try:
+        import asyncpg  # type: ignore  # noqa: F401
+        from sqlalchemy.ext.asyncio import create_async_engine
+    except Exception:
+        logger.warning("asyncpg not installed; async DB helpers will use the sync engine in threads")
+        _ASYNC_DISABLED = True
+        return None
+
+    try:
+        async_url, connect_args = _async_url(url)
+        pool_size, max_overflow = _pool_sizes("async")
+        _ASYNC_ENGINE = create_async_engine(
+            async_url,
+            pool_pre_ping=True,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_recycle=_env_int("DB_POOL_RECYCLE", 1800),
+            pool_timeout=_env_int("DB_POOL_TIMEOUT", 30),
+            connect_args=connect_args,
+        )
+        logger.info("Shared async DB engine created (pool_size=%d, max_overflow=%d)", pool_size, max_overflow)
+        return _ASYNC_ENGINE
+    except Exception:
+        logger.exception("Failed to create shared async DB engine")
+        _ASYNC_DISABLED = True
+        return None
+
+
+async def dispose_async_engine() -> None:
+    global _ASYNC_ENGINE
+    if _ASYNC_ENGINE is not None:
+        try:
+            await _ASYNC_ENGINE.dispose()
+        finally:
+            _ASYNC_ENGINE = None
+
+
+def _pool_stats(pool: Any) -> Dict[str, Any]:
+    return {
+        "pool_size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+    }
+
+
 def db_health() -> Dict[str, Any]:
     engine = get_engine()
     if engine is None:
@@ -84,14 +195,9 @@ def db_health() -> Dict[str, Any]:
     try:
         with engine.connect() as conn:
             conn.execute(text("SELECT 1"))
-        pool = engine.pool
-        return {
-            "enabled": True,
-            "connected": True,
-            "pool_size": pool.size(),
-            "checked_in": pool.checkedin(),
-            "checked_out": pool.checkedout(),
-            "overflow": pool.overflow(),
-        }
+        out: Dict[str, Any] = {"enabled": True, "connected": True, **_pool_stats(engine.pool)}
+        if _ASYNC_ENGINE is not None:
+            out["async_pool"] = _pool_stats(_ASYNC_ENGINE.pool)
+        return out
     except Exception as e:
         return {"enabled": True, "connected": False, "reason": str(e)}
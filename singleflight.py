@@ -0,0 +1,250 @@
+"""singleflight.py — Coalesce identical in-flight solves.
+
+When a question is shared in a class group, dozens of students submit the
+same text within seconds. Every one of them misses the solve cache and,
+without coalescing, every one of them pays the provider.
+
+Two layers:
+1. In-worker: the first request for a key registers an asyncio.Future;
+   later requests in the same worker simply await it.
+2. Cross-worker: the worker-local representative takes a Redis lease
+   (SET NX EX). The lease holder runs the orchestrator and publishes the
+   raw result under a short-lived key; other workers short-poll that key
+   with backoff. If the lease disappears without a result (leader died) a
+   waiter takes over; if waiting exceeds the budget it runs the solve itself.
+   The leader renews its lease (compare-and-expire) every third of its TTL
+   while it works, so a slow writer/verify/repair chain never lets a
+   follower take over and pay the provider again.
+
+If Redis is disabled or failing, only layer 1 applies. Never raises on
+Redis errors. All Redis I/O is on the async client; the lease is released
+from a task so `fail` stays synchronous (it runs while a task is being
+cancelled).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+import redis_store
+from config import (
+    SINGLEFLIGHT_HOLD_MAX_SECONDS,
+    SINGLEFLIGHT_LEASE_SECONDS,
+    SINGLEFLIGHT_RESULT_SECONDS,
+    SINGLEFLIGHT_WAIT_SECONDS,
+)
+
+logger = logging.getLogger("knoweasy.singleflight")
+
+
+LEASE_TTL_S = SINGLEFLIGHT_LEASE_SECONDS
+RESULT_TTL_S = SINGLEFLIGHT_RESULT_SECONDS
+WAIT_TIMEOUT_S = SINGLEFLIGHT_WAIT_SECONDS
+
+_POLL_MIN_S = 0.1
+_POLL_MAX_S = 1.0
+
+_LOCAL: Dict[str, "asyncio.Future[Dict[str, Any]]"] = {}
+# Lease releases in flight (kept referenced until they finish)
+_RELEASES: Set["asyncio.Task[None]"] = set()
+_STATS: Dict[str, int] = {
+    "leader": 0,
+    "local_follower": 0,
+    "remote_follower": 0,
+    "takeover": 0,
+    "wait_timeout": 0,
+    "renewals": 0,
+}
+
+def _count_renewal() -> None:
+    _STATS["renewals"] += 1
+
+
+def _lease_key(key: str) -> str:
+    return f"sf:lease:{key}"
+
+
+def _result_key(key: str) -> str:
+    return f"sf:result:{key}"
+
+
+async def _atry_lease(key: str) -> Optional[str]:
+    """Return a lease token if we lead, None if another worker leads.
+
+    Redis disabled/failing counts as leading (local coalescing only).
+    """
+    token = uuid.uuid4().hex
+    r = redis_store.get_aredis()
+    if not r:
+        return token
+    try:
+        if await r.set(_lease_key(key), token, nx=True, ex=int(LEASE_TTL_S)):
+            return token
+        return None
+    except Exception as e:
+        logger.warning("singleflight lease failed (running locally): %s", e)
+        return token
+
+
+def _schedule_release(key: str, token: str) -> None:
+    """Release the lease in a task: callers may be resolving from a cancelled
+    task or a closing generator, where an await would not run to completion."""
+    try:
+        task = asyncio.get_running_loop().create_task(redis_store.arelease_lease(_lease_key(key), token))
+    except RuntimeError:
+        return  # no loop: the lease expires after LEASE_TTL_S
+    _RELEASES.add(task)
+    task.add_done_callback(_RELEASES.discard)
+
+
+async def _alease_held(key: str) -> bool:
+    r = redis_store.get_aredis()
+    if not r:
+        return False
+    try:
+        return bool(await r.exists(_lease_key(key)))
+    except Exception:
+        return False
+
+
+class Flight:
+    """One participant's view of a coalesced call.
+
+    Exactly one Flight per key and worker is the local representative
+    (`_owner`); it is either the leader or the remote follower and always
+    resolves the worker-local future. Everyone else is a local follower.
+    """
+
+    def __init__(self, key: str, fut: "asyncio.Future[Dict[str, Any]]", owner: bool, token: Optional[str]) -> None:
+        self.key = key
+        self._fut = fut
+        self._owner = owner
+        self._token = None
+        self._renewer: Optional["asyncio.Task[None]"] = None
+        self._hold(token)
+
+    def _hold(self, token: Optional[str]) -> None:
+        """Take ownership of the lease `token` and keep it alive."""
+        self._token = token
+        if token and self._owner and redis_store.get_aredis():
+            self._renewer = asyncio.get_running_loop().create_task(
+                redis_store.akeep_lease(
+                    _lease_key(self.key), token, int(LEASE_TTL_S), SINGLEFLIGHT_HOLD_MAX_SECONDS, _count_renewal
+                )
+            )
+
+    @property
+    def is_leader(self) -> bool:
+        return bool(self._owner and self._token)
+
+    async def finish(self, result: Dict[str, Any]) -> None:
+        """Leader: publish the result to local and remote followers."""
+        if self._token:
+            # Publish before the lease goes: a follower that sees neither takes over
+            await redis_store.asetex_packed(_result_key(self.key), RESULT_TTL_S, result)
+        self._resolve(result=result)
+
+    def fail(self, exc: BaseException) -> None:
+        """Leader: release followers; cancelled leaders let a follower retry."""
+        self._resolve(exc=exc)
+
+    def _resolve(self, result: Optional[Dict[str, Any]] = None, exc: Optional[BaseException] = None) -> None:
+        if not self._owner:
+            return
+        if self._renewer is not None:
+            self._renewer.cancel()
+            self._renewer = None
+        if self._token:
+            _schedule_release(self.key, self._token)
+            self._token = None
+        if _LOCAL.get(self.key) is self._fut:
+            _LOCAL.pop(self.key, None)
+        if self._fut.done():
+            return
+        if exc is None:
+            self._fut.set_result(result or {})
+        elif not isinstance(exc, Exception):
+            # Cancelled / disconnected leader: followers start a fresh flight.
+            self._fut.cancel()
+        else:
+            self._fut.set_exception(exc)
+            self._fut.exception()  # mark retrieved; followers re-raise it themselves
+
+    async def wait(self, fn: Callable[[], Awaitable[Dict[str, Any]]]) -> Tuple[Dict[str, Any], str]:
+        """Follower: wait for the leader's result (falls back to running `fn`)."""
+        if not self._owner:
+            await asyncio.wait({self._fut})
+            if self._fut.cancelled():
+                # Leader's client went away mid-solve: start a fresh flight.
+                return await do(self.key, fn)
+            return self._fut.result(), "local"
+        try:
+            result, role = await self._await_remote(fn)
+        except BaseException as e:
+            self._resolve(exc=e)
+            raise
+        self._resolve(result=result)
+        return result, role
+
+    async def _await_remote(self, fn: Callable[[], Awaitable[Dict[str, Any]]]) -> Tuple[Dict[str, Any], str]:
+        deadline = time.monotonic() + max(1, WAIT_TIMEOUT_S)
+        delay = _POLL_MIN_S
+        while time.monotonic() < deadline:
+            res = await redis_store.aget_packed(_result_key(self.key))
+            if isinstance(res, dict):
+                _STATS["remote_follower"] += 1
+                return res, "remote"
+            if not await _alease_held(self.key):
+                token = await _atry_lease(self.key)
+                if token:
+                    # Leader vanished without a result: take over.
+                    _STATS["takeover"] += 1
+                    self._hold(token)
+                    result = await fn()
+                    await redis_store.asetex_packed(_result_key(self.key), RESULT_TTL_S, result)
+                    return result, "leader"
+            await asyncio.sleep(delay)
+            delay = min(_POLL_MAX_S, delay * 1.6)
+        _STATS["wait_timeout"] += 1
+        logger.warning("singleflight wait timed out for %s; solving locally", self.key)
+        return await fn(), "leader"
+
+
+async def begin(key: str) -> Flight:
+    """Join the flight for `key`. Check `Flight.is_leader` to see who runs it."""
+    fut = _LOCAL.get(key)
+    if fut is not None and not fut.done():
+        _STATS["local_follower"] += 1
+        return Flight(key, fut, owner=False, token=None)
+
+    fut = asyncio.get_running_loop().create_future()
+    _LOCAL[key] = fut
+    token = await _atry_lease(key)
+    if token:
+        _STATS["leader"] += 1
+    return Flight(key, fut, owner=True, token=token)
+
+
+async def do(key: str, fn: Callable[[], Awaitable[Dict[str, Any]]]) -> Tuple[Dict[str, Any], str]:
+    """Run `fn` at most once per key across workers.
+
+    Returns (result, role) where role is "leader", "local" or "remote".
+    """
+    flight = await begin(key)
+    if not flight.is_leader:
+        return await flight.wait(fn)
+    try:
+        result = await fn()
+    except BaseException as e:
+        flight.fail(e)
+        raise
+    await flight.finish(result)
+    return result, "leader"
+
+
+def stats() -> Dict[str, Any]:
+    return {**_STATS, "in_flight_local": len(_LOCAL)}
@@ -0,0 +1,325 @@
+"""solve_cache.py — Two-tier cache for /solve responses.
+
+L1: per-worker LocalCache (byte-bounded LRU/TTL, pub/sub invalidated).
+L2: Redis (shared across workers).
+
+Reads try L1 first and promote L2 hits into L1 with the remaining Redis
+TTL, so hot questions (NCERT examples, shared homework) stay in process.
+
+Entries are stored in an envelope with a soft and a hard TTL:
+- before the soft TTL the answer is fresh;
+- between soft and hard it is served stale and the caller schedules one
+  background refresh;
+- XFetch-style probabilistic early expiry starts refreshes slightly before
+  the soft TTL (earlier for answers that were slow to compute), so popular
+  entries are renewed one at a time instead of expiring together.
+Redis only expires at the hard TTL. Legacy un-enveloped entries are fresh.
+
+`alookup`/`asetex`/`afind_similar`/`aindex_similar` are the same reads and
+writes on the async Redis client (the /solve routes use those); the sync
+ones stay for threads and scripts.
+
+Optional near-duplicate index (SEMANTIC_CACHE_ENABLED): the normalized
+question's 64-bit SimHash is split into 4 bands of 16 bits, each a Redis
+set per scope (board/class/subject/answer_mode/language). Any two hashes
+within 3 bits share at least one band, so a lookup reads 4 small sets and
+checks Hamming distance. Candidates must also have identical numbers and
+operators, so "2+3" never answers "2+4".
+"""
+
+from __future__ import annotations
+
+import json
+import math
+import random
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import redis_store
+from config import (
+    SEMANTIC_CACHE_ENABLED,
+    SEMANTIC_CACHE_MAX_HAMMING,
+    SEMANTIC_CACHE_MIN_TOKENS,
+    SOLVE_CACHE_HARD_TTL_SECONDS,
+    SOLVE_CACHE_XFETCH_BETA,
+    SOLVE_L1_MAX_BYTES,
+    SOLVE_L1_TTL_SECONDS,
+)
+from local_cache import LocalCache, apublish
+from question_normalizer import hamming64, normalize_tokens, number_signature, simhash64
+
+_L1 = LocalCache("solve", SOLVE_L1_MAX_BYTES, SOLVE_L1_TTL_SECONDS)
+
+_STATS: Dict[str, int] = {"l1_hits": 0, "l2_hits": 0, "misses": 0, "stale_hits": 0, "early_refresh": 0, "similar_hits": 0}
+
+_ENVELOPE = "_swr"
+
+
+def _unwrap(entry: Any) -> Tuple[Optional[Dict[str, Any]], bool]:
+    """(value, needs_refresh) for a stored entry."""
+    if not isinstance(entry, dict):
+        return None, False
+    env = entry.get(_ENVELOPE)
+    if not isinstance(env, dict):
+        return entry, False  # legacy entry: plain SolveResponse dict
+    value = entry.get("value")
+    if not isinstance(value, dict):
+        return None, False
+    now = time.time()
+    soft_at = float(env.get("created_at") or 0) + float(env.get("soft_ttl") or 0)
+    if now >= soft_at:
+        _STATS["stale_hits"] += 1
+        return value, True
+    delta = max(0.0, float(env.get("compute_s") or 0))
+    if delta and SOLVE_CACHE_XFETCH_BETA > 0:
+        # XFetch: now - delta * beta * ln(U) >= expiry, U in (0, 1]
+        if now - delta * SOLVE_CACHE_XFETCH_BETA * math.log(1.0 - random.random()) >= soft_at:
+            _STATS["early_refresh"] += 1
+            return value, True
+    return value, False
+
+
+def lookup(key: str) -> Tuple[Optional[Dict[str, Any]], bool]:
+    """(cached SolveResponse dict or None, needs_refresh). Treat value as read-only."""
+    entry = _L1.get(key)
+    if entry is not None:
+        _STATS["l1_hits"] += 1
+        return _unwrap(entry)
+    entry, ttl = redis_store.get_packed_ttl(key)
+    if entry is not None:
+        _STATS["l2_hits"] += 1
+        _L1.set(key, entry, ttl_s=ttl, broadcast=False)
+        return _unwrap(entry)
+    _STATS["misses"] += 1
+    return None, False
+
+
+async def alookup(key: str) -> Tuple[Optional[Dict[str, Any]], bool]:
+    """lookup() with the L2 read on the async Redis client."""
+    entry = _L1.get(key)
+    if entry is not None:
+        _STATS["l1_hits"] += 1
+        return _unwrap(entry)
+    entry, ttl = await redis_store.aget_packed_ttl(key)
+    if entry is not None:
+        _STATS["l2_hits"] += 1
+        _L1.set(key, entry, ttl_s=ttl, broadcast=False)
+        return _unwrap(entry)
+    _STATS["misses"] += 1
+    return None, False
+
+
+def get(key: str) -> Optional[Dict[str, Any]]:
+    return lookup(key)[0]
+
+
+def _envelope(ttl_seconds: int, value: Dict[str, Any], compute_s: float) -> Tuple[Dict[str, Any], int]:
+    soft = max(1, int(ttl_seconds))
+    hard = max(soft, int(SOLVE_CACHE_HARD_TTL_SECONDS))
+    entry = {
+        _ENVELOPE: {"created_at": time.time(), "soft_ttl": soft, "compute_s": round(float(compute_s or 0), 3)},
+        "value": value,
+    }
+    return entry, hard
+
+
+def setex(key: str, ttl_seconds: int, value: Dict[str, Any], compute_s: float = 0.0) -> None:
+    """Store with soft TTL `ttl_seconds`; Redis keeps it until the hard TTL.
+
+    `compute_s` is how long the answer took to produce (drives XFetch).
+    """
+    entry, hard = _envelope(ttl_seconds, value, compute_s)
+    redis_store.setex_packed(key, hard, entry)
+    _l1_store(key, entry, hard)
+
+
+async def asetex(key: str, ttl_seconds: int, value: Dict[str, Any], compute_s: float = 0.0) -> None:
+    """setex() with the L2 write on the async Redis client."""
+    entry, hard = _envelope(ttl_seconds, value, compute_s)
+    await redis_store.asetex_packed(key, hard, entry)
+    if _l1_store(key, entry, hard, broadcast=False):
+        await apublish(_L1.namespace, key)
+
+
+def _l1_store(key: str, entry: Dict[str, Any], hard: int, broadcast: bool = True) -> bool:
+    # Callers keep mutating their dict (billing meta etc.): cache a private copy.
+    try:
+        blob = json.dumps(entry, ensure_ascii=False, default=str)
+        _L1.set(key, json.loads(blob), ttl_s=hard, size=len(blob.encode("utf-8")), broadcast=broadcast)
+        return True
+    except Exception:
+        return False
+
+
+_LSH_BANDS = 4
+_LSH_BITS = 16
+
+
+def _band_keys(scope: str, h: int) -> List[str]:
+    mask = (1 << _LSH_BITS) - 1
+    return [f"sdx:{scope}:{i}:{(h >> (i * _LSH_BITS)) & mask:04x}" for i in range(_LSH_BANDS)]
+
+
+def _signature(question: str) -> Optional[Tuple[int, str]]:
+    toks = normalize_tokens(question)
+    if len(toks) < max(1, SEMANTIC_CACHE_MIN_TOKENS):
+        return None
+    return simhash64(toks), number_signature(toks)
+
+
+def _index_member(question: str, key: str) -> Optional[Tuple[int, str]]:
+    sig = _signature(question)
+    if sig is None:
+        return None
+    h, numsig = sig
+    return h, f"{h:016x}|{numsig}|{key}"
+
+
+def index_similar(scope: str, key: str, question: str) -> None:
+    """Register a cached answer in the near-duplicate index."""
+    if not SEMANTIC_CACHE_ENABLED:
+        return
+    r = redis_store.get_redis()
+    found = _index_member(question, key)
+    if not r or found is None:
+        return
+    h, member = found
+    try:
+        pipe = r.pipeline(transaction=False)
+        for bk in _band_keys(scope, h):
+            pipe.sadd(bk, member)
+            pipe.expire(bk, int(SOLVE_CACHE_HARD_TTL_SECONDS))
+        pipe.execute()
+    except Exception:
+        pass
+
+
+async def aindex_similar(scope: str, key: str, question: str) -> None:
+    """index_similar() on the async Redis client."""
+    if not SEMANTIC_CACHE_ENABLED:
+        return
+    r = redis_store.get_aredis()
+    found = _index_member(question, key)
+    if not r or found is None:
+        return
+    h, member = found
+    try:
+        pipe = r.pipeline(transaction=False)
+        for bk in _band_keys(scope, h):
+            pipe.sadd(bk, member)
+            pipe.expire(bk, int(SOLVE_CACHE_HARD_TTL_SECONDS))
+        await pipe.execute()
+    except Exception:
+        pass
+
+
+def _candidates(members: Any, h: int, numsig: str) -> List[Tuple[int, str, str]]:
+    """Index members close enough to (h, numsig), nearest first."""
+    candidates: List[Tuple[int, str, str]] = []
+    for m in members:
+        try:
+            hx, ns, key = str(m).split("|", 2)
+            d = hamming64(h, int(hx, 16))
+        except Exception:
+            continue
+        if ns == numsig and d <= SEMANTIC_CACHE_MAX_HAMMING:
+            candidates.append((d, key, m))
+    candidates.sort()
+    return candidates
+
+
+def _first_alive(candidates: List[Tuple[int, str, str]], alive: List[Any]) -> Tuple[Optional[str], List[str]]:
+    """(nearest candidate whose answer still exists, members to drop)."""
+    dead = [m for (_, _, m), ok in zip(candidates, alive) if not ok]
+    for (_, key, _), ok in zip(candidates, alive):
+        if ok:
+            _STATS["similar_hits"] += 1
+            return key, dead
+    return None, dead
+
+
+def find_similar(scope: str, question: str) -> Optional[str]:
+    """Cache key of the closest indexed near-duplicate, or None."""
+    if not SEMANTIC_CACHE_ENABLED:
+        return None
+    r = redis_store.get_redis()
+    sig = _signature(question)
+    if not r or sig is None:
+        return None
+    h, numsig = sig
+    bands = _band_keys(scope, h)
+    try:
+        pipe = r.pipeline(transaction=False)
+        for bk in bands:
+            pipe.smembers(bk)
+        candidates = _candidates(set().union(*pipe.execute()), h, numsig)
+        if not candidates:
+            return None
+
+        # Drop index members whose answers have expired since they were indexed.
+        pipe = r.pipeline(transaction=False)
+        for _, key, _ in candidates:
+            pipe.exists(key)
+        found, dead = _first_alive(candidates, pipe.execute())
+        if dead:
+            pipe = r.pipeline(transaction=False)
+            for bk in bands:
+                pipe.srem(bk, *dead)
+            pipe.execute()
+        return found
+    except Exception:
+        return None
+
+
+async def afind_similar(scope: str, question: str) -> Optional[str]:
+    """find_similar() on the async Redis client (the /solve routes use this)."""
+    if not SEMANTIC_CACHE_ENABLED:
+        return None
+    r = redis_store.get_aredis()
+    sig = _signature(question)
+    if not r or sig is None:
+        return None
+    h, numsig = sig
+    bands = _band_keys(scope, h)
+    try:
+        pipe = r.pipeline(transaction=False)
+        for bk in bands:
+            pipe.smembers(bk)
+        candidates = _candidates(set().union(*await pipe.execute()), h, numsig)
+        if not candidates:
+            return None
+
+        pipe = r.pipeline(transaction=False)
+        for _, key, _ in candidates:
+            pipe.exists(key)
+        found, dead = _first_alive(candidates, await pipe.execute())
+        if dead:
+            pipe = r.pipeline(transaction=False)
+            for bk in bands:
+                pipe.srem(bk, *dead)
+            await pipe.execute()
+        return found
+    except Exception:
+        return None
+
+
+def invalidate(key: str) -> None:
+    r = redis_store.get_redis()
+    if r:
+        try:
+            r.delete(key)
+        except Exception:
+            pass
+    _L1.delete(key)
+
+
+def stats() -> Dict[str, Any]:
+    lookups = _STATS["l1_hits"] + _STATS["l2_hits"] + _STATS["misses"]
+    return {
+        **_STATS,
+        "lookups": lookups,
+        "l1_hit_ratio": round(_STATS["l1_hits"] / lookups, 4) if lookups else 0.0,
+        "l2_hit_ratio": round(_STATS["l2_hits"] / lookups, 4) if lookups else 0.0,
+        "hit_ratio": round((_STATS["l1_hits"] + _STATS["l2_hits"]) / lookups, 4) if lookups else 0.0,
+        "l1": _L1.stats(),
+    }
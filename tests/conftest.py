@@ -0,0 +1,41 @@
+import os
+import sys
+
+import pytest
+
+# Modules live at the repo root (flat layout, run as `uvicorn main:app`)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("AUTH_SECRET_KEY", "test-secret")
+
+
+def _use_database(monkeypatch, url):
+    import schema_ready
+    import shared_engine
+
+    monkeypatch.setenv("DATABASE_URL", url)
+    monkeypatch.setattr(shared_engine, "_ENGINE", None)
+    monkeypatch.setattr(shared_engine, "_ASYNC_ENGINE", None)
+    monkeypatch.setattr(shared_engine, "_ASYNC_DISABLED", False)
+    monkeypatch.setattr(schema_ready, "_STATE", {})
+    engine = shared_engine.get_engine()
+    assert engine is not None
+    return engine
+
+
+@pytest.fixture
+def pg_engine(monkeypatch):
+    """Shared engine on TEST_DATABASE_URL, a scratch Postgres database
+    (e.g. postgresql+psycopg2://postgres@127.0.0.1:5432/knoweasy_test); skipped without it."""
+    url = os.getenv("TEST_DATABASE_URL")
+    if not url:
+        pytest.skip("TEST_DATABASE_URL not set")
+    engine = _use_database(monkeypatch, url)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def sqlite_engine(monkeypatch, tmp_path):
+    engine = _use_database(monkeypatch, f"sqlite:///{tmp_path / 'test.db'}")
+    yield engine
+    engine.dispose()
@@ -0,0 +1,80 @@
+"""account_cache: hits are checked against the version counter (sync and async)."""
+
+import asyncio
+
+import pytest
+
+import account_cache
+import redis_store
+
+
+@pytest.fixture
+def redis_pair(monkeypatch):
+    """Sync and async fakeredis clients over one server, text and bytes."""
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(redis_store, "get_redis", lambda: fakeredis.FakeRedis(server=server, decode_responses=True))
+    monkeypatch.setattr(redis_store, "get_redis_bytes", lambda: fakeredis.FakeRedis(server=server))
+    monkeypatch.setattr(
+        redis_store, "get_aredis", lambda: fakeredis.aioredis.FakeRedis(server=server, decode_responses=True)
+    )
+    monkeypatch.setattr(redis_store, "get_aredis_bytes", lambda: fakeredis.aioredis.FakeRedis(server=server))
+    account_cache._CACHE.clear()
+    yield server
+    account_cache._CACHE.clear()
+
+
+def test_put_then_get(redis_pair):
+    ver = account_cache.version(11)
+    assert account_cache.put("sub", 11, ver, {"plan": "pro"})
+    assert account_cache.get("sub", 11) == {"plan": "pro"}
+    account_cache._CACHE.clear()
+    assert account_cache.get("sub", 11) == {"plan": "pro"}  # from Redis
+
+
+def test_entry_behind_the_counter_is_not_served(redis_pair):
+    # put() checked the version, then an invalidation (here: another worker's,
+    # whose L1 broadcast hasn't arrived) bumped the counter before the write
+    ver = account_cache.version(12)
+    account_cache.put("sub", 12, ver, {"plan": "pro"})
+    redis_store.get_redis().incr(account_cache._version_key(12))
+    assert account_cache.get("sub", 12) is None  # L1 entry is behind the counter
+    assert account_cache.get("sub", 12) is None  # and so is the Redis one
+    assert account_cache.stats()["stale"] >= 2
+
+
+def test_async_variants(redis_pair):
+    async def run():
+        ver = await account_cache.aversion(13)
+        assert await account_cache.aput("wallet", 13, ver, {"included_credits_balance": 5})
+        assert await account_cache.aget("wallet", 13) == {"included_credits_balance": 5}
+        await account_cache.ainvalidate(13)
+        assert await account_cache.aget("wallet", 13) is None
+        # A read that started before the invalidation is not cached
+        assert not await account_cache.aput("wallet", 13, ver, {"included_credits_balance": 5})
+        assert account_cache.version(13) == ver + 1
+
+    asyncio.run(run())
+
+
+def test_async_invalidate_broadcasts_on_the_async_client(redis_pair, monkeypatch):
+    import local_cache
+
+    def blocking_publish(*_a, **_k):
+        raise AssertionError("sync PUBLISH on the event loop")
+
+    monkeypatch.setattr(local_cache, "_publish", blocking_publish)
+
+    async def run():
+        sub = redis_store.get_aredis().pubsub(ignore_subscribe_messages=True)
+        await sub.subscribe(local_cache.INVALIDATION_CHANNEL)
+        await account_cache.ainvalidate(14)
+        seen = set()
+        for _ in range(len(account_cache.KINDS) * 2):
+            m = await sub.get_message(timeout=0.2)
+            if m:
+                seen.add(local_cache.json.loads(m["data"])["key"])
+        await sub.aclose()
+        return seen
+
+    assert asyncio.run(run()) == {account_cache._key(k, 14) for k in account_cache.KINDS}
@@ -0,0 +1,109 @@
+import asyncio
+import random
+import time
+
+import pytest
+from sqlalchemy import text
+
+import billing_store
+import shared_engine
+
+
+@pytest.fixture
+def wallet(pg_engine):
+    """A fresh 'pro' wallet; yields (user_id, included balance)."""
+    user_id = random.randint(10**9, 2 * 10**9)  # INTEGER column
+    billing_store.ensure_tables()
+    included = billing_store.get_wallet(user_id, "pro")["included_credits_balance"]
+    assert included > 10
+    yield user_id, included
+    with pg_engine.begin() as conn:
+        for table in ("credit_reservations", "credit_ledger", "credit_wallets"):
+            conn.execute(text(f"DELETE FROM {table} WHERE user_id = :u"), {"u": user_id})
+
+
+def _balance(user_id):
+    billing_store.account_cache.invalidate(user_id)
+    w = billing_store.get_wallet(user_id, "pro")
+    return w["included_credits_balance"], w["booster_credits_balance"]
+
+
+def _ledger(pg_engine, user_id):
+    with pg_engine.connect() as conn:
+        return [
+            (r.event_type, r.units)
+            for r in conn.execute(
+                text("SELECT event_type, units FROM credit_ledger WHERE user_id = :u ORDER BY id"), {"u": user_id}
+            )
+        ]
+
+
+def test_reserve_then_settle_charges_only_what_was_used(pg_engine, wallet):
+    user_id, included = wallet
+    held = billing_store.reserve_credits(user_id, "pro", 5, meta={"route": "/solve"})
+    assert held["reservation_id"] and held["from_included"] == 5
+    assert _balance(user_id) == (included - 5, 0)
+
+    out = billing_store.settle_reservation(held["reservation_id"], 3)
+    assert out["ok"] and out["consumed"] == 3
+    assert _balance(user_id) == (included - 3, 0)
+    assert _ledger(pg_engine, user_id)[-1] == ("consume", -3)
+
+    # Settling twice is a no-op
+    assert billing_store.settle_reservation(held["reservation_id"], 3) == {"ok": False, "consumed": 0}
+    assert _balance(user_id) == (included - 3, 0)
+
+
+def test_holds_spill_into_booster_and_refund_to_their_bucket(pg_engine, wallet):
+    user_id, included = wallet
+    billing_store.grant_booster_credits(user_id, "pro", 5)
+    held = billing_store.reserve_credits(user_id, "pro", included + 3)
+    assert (held["from_included"], held["from_booster"]) == (included, 3)
+    assert _balance(user_id) == (0, 2)
+
+    # One unit unused: it goes back to the booster bucket it came from
+    out = billing_store.settle_reservation(held["reservation_id"], included + 2)
+    assert out["consumed"] == included + 2
+    assert _balance(user_id) == (0, 3)
+
+
+def test_release_refunds_everything(pg_engine, wallet):
+    user_id, included = wallet
+    held = billing_store.reserve_credits(user_id, "pro", 4)
+    assert billing_store.release_reservation(held["reservation_id"])["consumed"] == 0
+    assert _balance(user_id) == (included, 0)
+    assert [e for e in _ledger(pg_engine, user_id) if e[0] == "consume"] == []
+
+
+def test_insufficient_credits_hold_nothing(pg_engine, wallet):
+    user_id, included = wallet
+    with pytest.raises(ValueError):
+        billing_store.reserve_credits(user_id, "pro", included + 1)
+    assert _balance(user_id) == (included, 0)
+
+
+def test_expired_holds_are_refunded_once(pg_engine, wallet):
+    user_id, included = wallet
+    held = billing_store.reserve_credits(user_id, "pro", 6, ttl_s=1)
+    time.sleep(1.2)
+    swept = billing_store.release_expired_reservations()
+    assert swept["released"] >= 1
+    assert _balance(user_id) == (included, 0)
+    assert billing_store.release_expired_reservations()["released"] == 0
+    # The request finishing late finds nothing to settle (caller charges directly)
+    assert billing_store.settle_reservation(held["reservation_id"], 6)["ok"] is False
+    assert _balance(user_id) == (included, 0)
+
+
+def test_async_reserve_and_settle(pg_engine, wallet):
+    user_id, included = wallet
+
+    async def run():
+        held = await billing_store.areserve_credits(user_id, "pro", 5)
+        out = await billing_store.asettle_reservation(held["reservation_id"], 2)
+        await shared_engine.dispose_async_engine()
+        return held, out
+
+    held, out = asyncio.run(run())
+    assert held["reservation_id"] and out["ok"] and out["consumed"] == 2
+    assert _balance(user_id) == (included - 2, 0)
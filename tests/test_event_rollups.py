@@ -0,0 +1,97 @@
+import random
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import text
+
+import phase1_store
+from db import db_insert_rows
+
+
+def _ingest(user_id):
+    now = datetime.now(timezone.utc)
+    first = phase1_store.track_events(
+        user_id,
+        [
+            {"event_type": "test_submitted", "value_num": 80, "client_event_id": "c1", "ts": now.isoformat()},
+            {"event_type": "test_submitted", "value_num": 80, "client_event_id": "c1", "ts": now.isoformat()},
+            {"event_type": "study_session", "duration_sec": 600, "client_event_id": "c2"},
+        ],
+    )
+    assert first["accepted"] == 2 and first["duplicates"] == 1
+    # Client retry of an event stored by the previous request
+    phase1_store.track_events(
+        user_id, [{"event_type": "test_submitted", "value_num": 80, "client_event_id": "c1", "ts": now.isoformat()}]
+    )
+    phase1_store.track_event(user_id, "test_submitted", value_num=60)
+    phase1_store.track_event(user_id, "study_session", duration_sec=300)
+    # Outside both windows (older than a client ts is trusted, so written directly)
+    old = phase1_store._event_row(user_id, {"event_type": "test_submitted", "value_num": 10}, now - timedelta(days=40))
+    db_insert_rows("events", [old])
+
+
+def _cleanup(engine, user_id):
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM events WHERE user_id = :u"), {"u": user_id})
+        conn.execute(text("DELETE FROM event_rollups_daily WHERE user_id = :u"), {"u": user_id})
+
+
+def _rollups(engine, user_id):
+    with engine.connect() as conn:
+        rows = conn.execute(
+            text(
+                "SELECT event_type, SUM(count) AS n, SUM(duration_sum) AS d, SUM(value_sum) AS vs, SUM(value_count) AS vc "
+                "FROM event_rollups_daily WHERE user_id = :u GROUP BY event_type"
+            ),
+            {"u": user_id},
+        ).mappings().all()
+    return {r["event_type"]: (int(r["n"]), int(r["d"]), int(r["vs"]), int(r["vc"])) for r in rows}
+
+
+def _assert_summary(user_id):
+    summary = phase1_store.analytics_summary(0, user_id)
+    assert summary["tests_attempted_30d"] == 2
+    assert summary["avg_score_30d"] == pytest.approx(70)
+    assert summary["active_days_7d"] == 1
+
+
+def test_rollups_count_deduped_events_once_on_postgres(pg_engine):
+    user_id = random.randint(10**12, 2 * 10**12)
+    phase1_store.ensure_tables()
+    try:
+        _ingest(user_id)
+        expected = {
+            "test_submitted": (3, 0, 150, 3),  # c1 once, the 60, and the 40-day-old 10
+            "study_session": (2, 900, 0, 0),
+        }
+        assert _rollups(pg_engine, user_id) == expected
+        # Rebuilding from raw events gives the same numbers
+        phase1_store.rebuild_event_rollups(days=60, user_id=user_id)
+        assert _rollups(pg_engine, user_id) == expected
+        _assert_summary(user_id)
+    finally:
+        _cleanup(pg_engine, user_id)
+
+
+def test_summary_uses_raw_events_without_rollups(sqlite_engine):
+    user_id = 42
+    phase1_store.ensure_tables()
+    _ingest(user_id)
+    assert _rollups(sqlite_engine, user_id) == {}
+    _assert_summary(user_id)
+
+
+def test_retries_keep_the_first_created_at(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    r = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(phase1_store, "_r", lambda: r)
+    now = datetime.now(timezone.utc)
+    first = [phase1_store._event_row(7, {"event_type": "heartbeat", "client_event_id": "e1"}, now)]
+    retry = [
+        phase1_store._event_row(7, {"event_type": "heartbeat", "client_event_id": "e1"}, now + timedelta(seconds=30)),
+        phase1_store._event_row(7, {"event_type": "heartbeat"}, now + timedelta(seconds=30)),
+    ]
+    phase1_store._pin_created_at(first)
+    phase1_store._pin_created_at(retry)
+    assert retry[0]["created_at"] == now
+    assert retry[1]["created_at"] == now + timedelta(seconds=30)
@@ -0,0 +1,44 @@
+"""model_health: ranking of never-measured models and the sample window."""
+
+import pytest
+
+import model_health
+
+
+@pytest.fixture(autouse=True)
+def clean_snapshot(monkeypatch):
+    monkeypatch.setattr(model_health, "_SNAPSHOT", {})
+    monkeypatch.setattr(model_health, "MODEL_HEALTH_ENABLED", True)
+
+
+def _state(lat, err, n=20):
+    return {"n": n, "err": err, "lat": lat, "fails": 0, "open_until": 0.0, "win": model_health._now_ms()}
+
+
+def test_unknown_model_ranks_at_the_median_not_first():
+    model_health._SNAPSHOT["gemini:a"] = _state(1000.0, 0.4)  # degraded first choice
+    model_health._SNAPSHOT["gemini:b"] = _state(800.0, 0.0)
+    assert model_health.pick("gemini", ["a", "c", "b"]) == "b"
+
+
+def test_unknown_model_goes_between_better_and_worse_ones():
+    model_health._SNAPSHOT["gemini:a"] = _state(1000.0, 0.4)  # 2600
+    model_health._SNAPSHOT["gemini:b"] = _state(5000.0, 0.3)  # 11000
+    assert model_health._ranked("gemini", ["b", "c", "a"]) == ["a", "c", "b"]
+    model_health._SNAPSHOT["gemini:d"] = _state(2600.0, 0.0)  # ties with the median
+    assert model_health._ranked("gemini", ["c", "d", "a", "b"]) == ["d", "a", "c", "b"]
+
+
+def test_min_samples_counts_the_current_window_only(monkeypatch):
+    monkeypatch.setattr(model_health, "MODEL_CB_MIN_SAMPLES", 5)
+    monkeypatch.setattr(model_health, "MODEL_CB_CONSECUTIVE_FAILURES", 100)
+    monkeypatch.setattr(model_health, "MODEL_CB_ERROR_RATE", 0.3)
+    old = {"n": 1000, "err": 0.0, "lat": 500.0, "fails": 0, "open_until": 0.0,
+           "win": model_health._now_ms() - model_health.MODEL_CB_WINDOW_S * 1000.0 - 1}
+    st = model_health._apply_local(old, ok=False, latency_ms=0)
+    st = model_health._apply_local(st, ok=False, latency_ms=0)
+    # Error rate is over the limit, but only 2 calls in this window: still closed
+    assert st["n"] == 2 and st["err"] >= 0.3 and st["open_until"] == 0
+    for _ in range(3):
+        st = model_health._apply_local(st, ok=False, latency_ms=0)
+    assert st["open_until"] > 0
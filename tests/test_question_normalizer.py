@@ -0,0 +1,77 @@
+import pytest
+
+from question_normalizer import normalize_question, number_signature, normalize_tokens
+
+
+@pytest.mark.parametrize(
+    "a, b",
+    [
+        ("what is .5", "what is 0.5"),
+        ("what is 0.50", "what is .5"),
+        ("2.50 + 1", "2.5 + 1"),
+        ("1,000 + 2", "1000 + 2"),
+        ("007 * 3", "7 * 3"),
+        ("two plus three", "2 plus 3"),
+    ],
+)
+def test_equal_numbers_share_a_key(a, b):
+    assert normalize_question(a) == normalize_question(b)
+
+
+@pytest.mark.parametrize(
+    "a, b",
+    [
+        ("what is .5", "what is 5"),
+        ("what is 0.05", "what is 0.5"),
+        ("2+3", "2+4"),
+        ("1,000", "1.000"),
+    ],
+)
+def test_different_numbers_never_collide(a, b):
+    assert normalize_question(a) != normalize_question(b)
+    assert number_signature(normalize_tokens(a)) != number_signature(normalize_tokens(b))
+
+
+def test_dot_after_a_word_is_not_a_decimal():
+    assert normalize_question("fig.5") == "fig 5"
+
+
+@pytest.mark.parametrize(
+    "a, b",
+    [
+        ("(a+b)^2", "a+b^2"),
+        ("a/(b+c)", "a/b+c"),
+        ("What is 5!", "What is 5"),
+        ("find f'(x)", "find f(x)"),
+        ("a != b", "a = b"),
+        ("|x| + 1", "x + 1"),
+    ],
+)
+def test_grouping_and_math_punctuation_never_collide(a, b):
+    assert normalize_question(a) != normalize_question(b)
+    assert number_signature(normalize_tokens(a)) != number_signature(normalize_tokens(b))
+
+
+def test_sentence_punctuation_and_contractions_still_fold():
+    assert normalize_question("Explain photosynthesis!") == normalize_question("explain photosynthesis")
+    assert normalize_question("don't know") == "dont know"
+
+
+@pytest.mark.parametrize(
+    "a, b",
+    [
+        ("find a.b", "find b"),
+        ("Is A a subset of B", "is subset of b"),
+        ("a, b, c are sides", "b c are sides"),
+        ("Differentiate a sin x", "differentiate sin x"),
+        ("sin 30°", "sin 30"),
+        ("ratio 2:3", "ratio 2 3"),
+    ],
+)
+def test_articles_that_may_be_variables_are_kept(a, b):
+    assert normalize_question(a) != normalize_question(b)
+
+
+def test_prose_articles_are_still_dropped():
+    assert normalize_question("What is the theory of relativity?") == normalize_question("theory of relativity")
+    assert normalize_question("what is a photosynthesis") == "photosynthesis"
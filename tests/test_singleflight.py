@@ -0,0 +1,78 @@
+"""singleflight over the async Redis client: result published, lease released."""
+
+import asyncio
+
+import pytest
+
+import redis_store
+import singleflight
+
+
+@pytest.fixture
+def aredis(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(
+        redis_store, "get_aredis", lambda: fakeredis.aioredis.FakeRedis(server=server, decode_responses=True)
+    )
+    monkeypatch.setattr(redis_store, "get_aredis_bytes", lambda: fakeredis.aioredis.FakeRedis(server=server))
+    # The sync clients must not be touched from the event loop
+    monkeypatch.setattr(redis_store, "get_redis", lambda: pytest.fail("sync Redis used"))
+    monkeypatch.setattr(redis_store, "get_redis_bytes", lambda: pytest.fail("sync Redis used"))
+    return fakeredis.aioredis.FakeRedis(server=server)
+
+
+def test_leader_publishes_and_releases(aredis):
+    calls = []
+
+    async def solve():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"final_answer": "42"}
+
+    async def run():
+        results = await asyncio.gather(*[singleflight.do("k1", solve) for _ in range(5)])
+        await asyncio.gather(*singleflight._RELEASES)
+        return results
+
+    results = asyncio.run(run())
+    assert len(calls) == 1
+    assert sorted(role for _, role in results) == ["leader"] + ["local"] * 4
+    assert all(res == {"final_answer": "42"} for res, _ in results)
+
+    async def keys():
+        return await aredis.exists(singleflight._lease_key("k1")), await aredis.exists(singleflight._result_key("k1"))
+
+    assert asyncio.run(keys()) == (0, 1)
+
+
+def test_failed_leader_releases_the_lease(aredis):
+    async def boom():
+        raise RuntimeError("provider down")
+
+    async def run():
+        with pytest.raises(RuntimeError):
+            await singleflight.do("k2", boom)
+        await asyncio.gather(*singleflight._RELEASES)
+        return await aredis.exists(singleflight._lease_key("k2"))
+
+    assert asyncio.run(run()) == 0
+
+
+def test_slow_leader_keeps_its_lease(aredis, monkeypatch):
+    monkeypatch.setattr(singleflight, "LEASE_TTL_S", 2)
+    before = singleflight.stats()["renewals"]
+
+    async def slow():
+        await asyncio.sleep(3)  # longer than the lease TTL
+        held = await aredis.exists(singleflight._lease_key("k3"))
+        return {"final_answer": "42", "held": held}
+
+    async def run():
+        res, role = await singleflight.do("k3", slow)
+        await asyncio.gather(*singleflight._RELEASES)
+        return res, role
+
+    res, role = asyncio.run(run())
+    assert role == "leader" and res["held"] == 1
+    assert singleflight.stats()["renewals"] > before
@@ -0,0 +1,63 @@
+"""verdict_cache keys: everything the checker sees is part of the key."""
+
+import asyncio
+
+import orchestrator
+import verdict_cache
+
+SECTION = {"type": "explanation", "title": "Torque", "content": "tau = r x F"}
+
+
+def _key(draft, board="CBSE", subject="physics"):
+    return verdict_cache.key(draft, subject, "12", "JEE", board, "tutor", "o3-mini")
+
+
+def test_key_ignores_dict_order_but_not_context():
+    assert _key({"a": 1, "b": [1, 2]}) == _key({"b": [1, 2], "a": 1})
+    assert _key({"a": 1}) != _key({"a": 1}, board="ICSE")
+    assert _key({"a": 1}) != _key({"a": 1}, subject="maths")
+
+
+def test_section_checks_are_keyed_on_the_question(monkeypatch):
+    seen = []
+
+    async def fake_verdict(ctx, plan, checked, user):
+        seen.append(verdict_cache.key(checked, ctx.subject, ctx.class_level, ctx.exam_mode, ctx.board, "tutor", "m"))
+        return {"ok": True, "issues": [], "fix_instructions": []}, False
+
+    monkeypatch.setattr(orchestrator, "_verdict", fake_verdict)
+
+    async def check(question, board):
+        ctx = orchestrator.RequestContext(request_id="r", question=question, board=board, subject="physics")
+        verifier = orchestrator._SectionVerifier(ctx, plan=None)
+        verifier.set_title("Rolling motion")
+        await verifier._check([(0, SECTION)])
+
+    asyncio.run(check("Find the torque on the rod", "CBSE"))
+    asyncio.run(check("Find the torque on the rod", "CBSE"))
+    asyncio.run(check("Find the torque on the disc", "CBSE"))
+    asyncio.run(check("Find the torque on the rod", "ICSE"))
+    assert seen[0] == seen[1]
+    assert len(set(seen)) == 3
+
+
+def test_sections_before_the_header_wait_for_the_title(monkeypatch):
+    titles = []
+
+    async def fake_verdict(ctx, plan, checked, user):
+        titles.append(checked["answer_title"])
+        return {"ok": True, "issues": [], "fix_instructions": []}, False
+
+    monkeypatch.setattr(orchestrator, "_verdict", fake_verdict)
+
+    async def run():
+        ctx = orchestrator.RequestContext(request_id="r", question="Find the torque", board="CBSE", subject="physics")
+        verifier = orchestrator._SectionVerifier(ctx, plan=None)
+        early = asyncio.ensure_future(verifier._check([(0, SECTION)]))
+        await asyncio.sleep(0)
+        assert not titles  # not keyed while the title is unknown
+        verifier.set_title("Rolling motion")
+        await early
+
+    asyncio.run(run())
+    assert titles == ["Rolling motion"]
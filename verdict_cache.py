@@ -0,0 +1,102 @@
+"""verdict_cache.py — Verifier verdicts keyed by what was verified.
+
+The OpenAI verifier used to run on every HARD/EXTREME competitive draft,
+even when the draft was byte-identical to one already checked (a popular
+question whose cached answer expired, coalesced duplicates). A verdict
+only depends on the draft and the context it was judged in, so it is
+cached under a hash of:
+- the draft (or, for pipelined checks, a group of sections with the
+  question and the answer title) in canonical JSON form (sorted keys, no
+  whitespace);
+- subject, class_level, exam_mode, board and mode;
+- the verifier model.
+
+Stored: `ok`, `issues`, `fix_instructions`. Failed-verification verdicts
+are cached too, so the repair step gets its instructions without a second
+provider call. Entries never change for a given key, so the per-worker
+LocalCache tier is not invalidated across workers; Redis keeps them for
+VERDICT_CACHE_TTL_SECONDS. Never raises on Redis errors.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+from typing import Any, Dict, Optional
+
+import redis_store
+from config import (
+    VERDICT_CACHE_ENABLED,
+    VERDICT_CACHE_TTL_SECONDS,
+    VERDICT_L1_MAX_BYTES,
+    VERDICT_L1_TTL_SECONDS,
+)
+from local_cache import LocalCache
+
+# Bump when the checker prompt changes meaning: old verdicts stop matching.
+_VERSION = "v2"
+
+_L1 = LocalCache("verdict", VERDICT_L1_MAX_BYTES, VERDICT_L1_TTL_SECONDS)
+
+_STATS: Dict[str, int] = {"l1_hits": 0, "l2_hits": 0, "misses": 0, "stored": 0}
+
+
+def key(
+    draft: Dict[str, Any],
+    subject: str,
+    class_level: str,
+    exam_mode: str,
+    board: str,
+    mode: str,
+    model: str,
+) -> str:
+    """Cache key for one verifier call (draft is a dict; order of keys is irrelevant)."""
+    canonical = json.dumps(
+        [_VERSION, model, subject, class_level, exam_mode, board, mode, draft],
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+        default=str,
+    )
+    return "verdict:" + hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _clean(verdict: Any) -> Optional[Dict[str, Any]]:
+    if not isinstance(verdict, dict) or not isinstance(verdict.get("ok"), bool):
+        return None
+    return {
+        "ok": verdict["ok"],
+        "issues": [str(x) for x in (verdict.get("issues") or [])][:8],
+        "fix_instructions": [str(x) for x in (verdict.get("fix_instructions") or [])][:8],
+    }
+
+
+async def aget(cache_key: str) -> Optional[Dict[str, Any]]:
+    """Cached verdict (a fresh dict) or None."""
+    if not VERDICT_CACHE_ENABLED:
+        return None
+    entry = _L1.get(cache_key)
+    if entry is not None:
+        _STATS["l1_hits"] += 1
+        return _clean(entry)
+    entry = _clean(await redis_store.aget_packed(cache_key))
+    if entry is not None:
+        _STATS["l2_hits"] += 1
+        _L1.set(cache_key, entry, broadcast=False)
+        return _clean(entry)
+    _STATS["misses"] += 1
+    return None
+
+
+async def aput(cache_key: str, verdict: Dict[str, Any]) -> None:
+    """Store a parsed verdict; anything without a boolean `ok` is ignored."""
+    entry = _clean(verdict)
+    if not VERDICT_CACHE_ENABLED or entry is None:
+        return
+    _STATS["stored"] += 1
+    _L1.set(cache_key, entry, broadcast=False)
+    await redis_store.asetex_packed(cache_key, VERDICT_CACHE_TTL_SECONDS, entry)
+
+
+def stats() -> Dict[str, Any]:
+    return {**_STATS, "enabled": bool(VERDICT_CACHE_ENABLED), "l1": _L1.stats()}
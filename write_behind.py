@@ -0,0 +1,162 @@
+"""write_behind.py — Batched, off-loop inserts for telemetry and history rows.
+
+`db_log_solve`, `db_log_ai_usage` and `db_add_chat_history` used to open a
+transaction each, synchronously, inside the request. Now they enqueue a
+row here and return (so do phase1_store's /events/track and /events/batch);
+a background thread drains the queue in batches
+(WRITE_BEHIND_BATCH_ROWS rows or every WRITE_BEHIND_FLUSH_MS, whichever
+comes first) through one multi-row INSERT per table.
+
+- Memory is bounded: beyond WRITE_BEHIND_MAX_ROWS queued rows new rows are
+  dropped and counted (telemetry must never take the API down).
+- A failed batch is retried in halves (each half once), down to single
+  rows; only rows that fail on their own are dropped. If nothing gets in
+  (database down) the batch is dropped after a few single-row failures.
+  Nothing is retried in a loop.
+- Until `start()` runs (scripts, tests, lifespan not up) `enqueue` returns
+  False and callers write inline as before.
+- The lifespan calls `stop()`, which flushes everything still queued.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from config import WRITE_BEHIND_BATCH_ROWS, WRITE_BEHIND_FLUSH_MS, WRITE_BEHIND_MAX_ROWS
+
+logger = logging.getLogger("knoweasy.write_behind")
+
+Writer = Callable[[str, List[Dict[str, Any]]], None]
+
+_queue: Deque[Tuple[str, Dict[str, Any]]] = deque()
+_cond = threading.Condition()
+_writer: Optional[Writer] = None
+_thread: Optional[threading.Thread] = None
+_stopping = False
+
+_STATS: Dict[str, int] = {"enqueued": 0, "written": 0, "dropped": 0, "failed": 0, "batches": 0, "split": 0}
+
+
+def enqueue(table: str, row: Dict[str, Any]) -> bool:
+    """Queue one row. False means "not running, write it yourself"."""
+    if _writer is None or _stopping:
+        return False
+    with _cond:
+        if len(_queue) >= WRITE_BEHIND_MAX_ROWS:
+            _STATS["dropped"] += 1
+            if _STATS["dropped"] % 1000 == 1:
+                logger.warning("write-behind queue full; dropped %s rows so far", _STATS["dropped"])
+            return True
+        _queue.append((table, row))
+        _STATS["enqueued"] += 1
+        if len(_queue) >= WRITE_BEHIND_BATCH_ROWS:
+            _cond.notify()
+    return True
+
+
+def _take_batch() -> List[Tuple[str, Dict[str, Any]]]:
+    with _cond:
+        n = min(len(_queue), max(1, WRITE_BEHIND_BATCH_ROWS))
+        return [_queue.popleft() for _ in range(n)]
+
+
+# Single rows that may fail before any row of the batch got in; past that
+# the database is taken to be down and the rest of the batch is dropped.
+_MAX_LEADING_ROW_FAILURES = 3
+
+
+def _write_rows(table: str, rows: List[Dict[str, Any]], tally: Dict[str, int]) -> None:
+    """Insert `rows`; on failure retry in halves so one bad row costs only itself."""
+    if tally["bad"] >= _MAX_LEADING_ROW_FAILURES and not tally["ok"]:
+        _STATS["failed"] += len(rows)
+        return
+    try:
+        assert _writer is not None
+        _writer(table, rows)
+        _STATS["written"] += len(rows)
+        _STATS["batches"] += 1
+        tally["ok"] += len(rows)
+        return
+    except Exception as e:
+        if len(rows) == 1:
+            _STATS["failed"] += 1
+            tally["bad"] += 1
+            logger.warning("write-behind row dropped (table=%s): %s", table, str(e)[:200])
+            return
+        _STATS["split"] += 1
+        logger.debug("write-behind batch failed (table=%s rows=%s), retrying in halves: %s", table, len(rows), e)
+    mid = len(rows) // 2
+    _write_rows(table, rows[:mid], tally)
+    _write_rows(table, rows[mid:], tally)
+
+
+def _write(batch: List[Tuple[str, Dict[str, Any]]]) -> None:
+    by_table: Dict[str, List[Dict[str, Any]]] = {}
+    for table, row in batch:
+        by_table.setdefault(table, []).append(row)
+    for table, rows in by_table.items():
+        tally = {"ok": 0, "bad": 0}
+        _write_rows(table, rows, tally)
+        if tally["bad"] and not tally["ok"]:
+            logger.error("write-behind batch failed (table=%s rows=%s)", table, len(rows))
+
+
+def flush() -> int:
+    """Write everything queued right now (blocking). Returns rows taken."""
+    total = 0
+    while True:
+        batch = _take_batch()
+        if not batch:
+            return total
+        _write(batch)
+        total += len(batch)
+
+
+def _run() -> None:
+    interval = max(0.01, WRITE_BEHIND_FLUSH_MS / 1000.0)
+    while True:
+        with _cond:
+            if not _stopping and len(_queue) < WRITE_BEHIND_BATCH_ROWS:
+                _cond.wait(timeout=interval)
+            if _stopping:
+                return
+        flush()
+
+
+def start(writer: Writer) -> None:
+    """Start the background writer. `writer(table, rows)` does the INSERT."""
+    global _writer, _thread, _stopping
+    with _cond:
+        if _thread is not None and _thread.is_alive():
+            return
+        _writer = writer
+        _stopping = False
+        _thread = threading.Thread(target=_run, name="write-behind", daemon=True)
+        _thread.start()
+
+
+def stop(timeout_s: float = 10.0) -> int:
+    """Stop the thread and flush what is left. Returns rows flushed here."""
+    global _stopping, _thread, _writer
+    with _cond:
+        _stopping = True
+        _cond.notify_all()
+    t = _thread
+    if t is not None:
+        t.join(timeout=timeout_s)
+    t0 = time.monotonic()
+    n = flush() if _writer is not None else 0
+    logger.info("write-behind stopped; flushed %s rows in %.0fms", n, (time.monotonic() - t0) * 1000)
+    _thread = None
+    _writer = None
+    return n
+
+
+def stats() -> Dict[str, Any]:
+    with _cond:
+        depth = len(_queue)
+    return {**_STATS, "queued": depth, "running": bool(_thread is not None and _thread.is_alive())}